@@ -0,0 +1,105 @@
+"""
+How quickly a streamed turn stops when cancelled, and the model work it saves.
+
+Serves the stream view with ``MODEL_BACKEND=replay``, replaying
+``benchmarks/browser/long_transcript.json`` sped up by ``--speed``, and stops
+a turn after each of ``--stop-after`` seconds in two ways: a POST to
+``api/chat/cancel/`` from a second thread (as the Stop button does), and
+closing the response (as a client that goes away, with no grace period for
+it to reconnect). Reports the time from the
+stop to the end of the turn, when the session lock is free again, and the
+chunks of the reply that were never pulled from the model and the seconds
+of streaming they would have taken at the recorded pace, next to the full
+turn.
+
+    python -m benchmarks.cancellation --speed 4 --stop-after 0.5 1 2
+"""
+import argparse
+import logging
+import os
+import statistics
+import threading
+import time
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eda_project.settings.development')
+os.environ['MODEL_BACKEND'] = 'replay'
+os.environ['METRICS_ENABLED'] = 'false'
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import Client, override_settings  # noqa: E402
+
+from chat import views  # noqa: E402
+
+
+def _chunks(frame: bytes) -> int:
+    return frame.count(b'\n\n') - frame.count(b'"type": "done"') - frame.count(b'"type": "cancelled"')
+
+
+def full_turn(client: Client) -> tuple:
+    """Stream one turn to the end: (seconds, model chunks)."""
+    start = time.perf_counter()
+    response = client.post('/api/chat/stream/', {'message': 'Summarize this data'})
+    chunks = sum(_chunks(frame) for frame in response.streaming_content)
+    return time.perf_counter() - start, chunks
+
+
+def stopped_turn(client: Client, stop_after: float, how: str) -> tuple:
+    """Stream a turn and stop it after ``stop_after`` seconds: (seconds to stop, model chunks, cancelled event seen)."""
+    response = client.post('/api/chat/stream/', {'message': 'Summarize this data'})
+    frames = iter(response.streaming_content)
+    chunks = 0
+    start = time.perf_counter()
+    for frame in frames:
+        chunks += _chunks(frame)
+        if time.perf_counter() - start >= stop_after:
+            break
+    stopped = time.perf_counter()
+    cancelled = False
+    if how == 'request':
+        threading.Thread(target=client.post, args=('/api/chat/cancel/',)).start()
+        for frame in frames:
+            chunks += _chunks(frame)
+            cancelled = cancelled or b'"type": "cancelled"' in frame
+    else:
+        response.close()
+    # The turn has ended once the session lock is free
+    key = client.session[views.CHAT_SESSION_KEY]
+    with views.chat_sessions.lock(key):
+        elapsed = time.perf_counter() - stopped
+    return elapsed, chunks, cancelled
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--speed', type=float, default=4.0)
+    parser.add_argument('--stop-after', type=float, nargs='+', default=[0.5, 1.0, 2.0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    views.model_backend.speed = args.speed
+
+    # One frame per model chunk, so frames count the chunks pulled from the model
+    with override_settings(SSE_FLUSH_WINDOW=0, SSE_HEARTBEAT_INTERVAL=0, SSE_RESUME_GRACE=0):
+        full_seconds, full_chunks = full_turn(Client())
+        print(f"full turn: {full_chunks} chunks in {full_seconds:.2f} s ({full_seconds * args.speed:.1f} s at the recorded pace)")
+        print(f"{'stop':<11} {'after s':>8} {'stop ms mean':>13} {'stop ms max':>12} {'chunks':>7} {'saved %':>8} {'saved s':>8}")
+        for how in ('request', 'disconnect'):
+            for stop_after in args.stop_after:
+                results = [stopped_turn(Client(), stop_after, how) for _ in range(args.repeat)]
+                if how == 'request' and not all(cancelled for _, _, cancelled in results):
+                    raise RuntimeError("A cancelled turn did not end with a cancelled event")
+                stop_ms = [elapsed * 1000 for elapsed, _, _ in results]
+                chunks = statistics.mean(chunks for _, chunks, _ in results)
+                saved = max(full_seconds - stop_after, 0.0) * args.speed
+                print(
+                    f"{how:<11} {stop_after:8.2f} {statistics.mean(stop_ms):13.1f} {max(stop_ms):12.1f} "
+                    f"{chunks:7.0f} {(1 - chunks / full_chunks) * 100:8.1f} {saved:8.1f}"
+                )
+
+
+if __name__ == '__main__':
+    main()
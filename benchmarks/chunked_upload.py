@@ -0,0 +1,103 @@
+"""
+Throughput and memory of chunked uploads.
+
+Generates a CSV of each requested size, sends it to ``ChunkedUploadStore`` in
+parts read straight from disk (as the part view streams a request body), with
+one part at a time and with several in parallel, then reads the assembled
+file back and checks its digest. Reports throughput and the peak Python heap,
+which should stay at a few read buffers per part in flight whatever the size.
+
+    python -m benchmarks.chunked_upload --size-mb 64 256
+    python -m benchmarks.chunked_upload --parallel 8 --part-mb 4
+"""
+import argparse
+import hashlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.conversion import generate
+from chat.services.chunked_upload import ChunkedUploadStore
+from chat.services.conversion import CHUNK_SIZE
+
+
+class _PartReader(io.RawIOBase):
+    """Reads one part of a file, like a request body of that part."""
+
+    def __init__(self, path: str, offset: int, length: int):
+        self._file = open(path, 'rb')
+        self._file.seek(offset)
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        size = self._remaining if size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+def _digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run(store: ChunkedUploadStore, path: str, parallel: int) -> tuple:
+    """(seconds, peak traced bytes) to upload ``path`` in parts and read it back."""
+    size = os.path.getsize(path)
+    tracemalloc.start()
+    start = time.perf_counter()
+    upload = store.start('benchmark', os.path.basename(path), size)
+
+    def send(index: int) -> None:
+        with _PartReader(path, index * upload.part_size, upload.part_length(index)) as source:
+            store.write_part(upload, index, source)
+
+    with ThreadPoolExecutor(parallel) as pool:
+        list(pool.map(send, range(upload.part_count)))
+    with store.open(upload) as assembled:
+        digest = hashlib.sha256()
+        while chunk := assembled.read(CHUNK_SIZE):
+            digest.update(chunk)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    store.remove(upload)
+    assert digest.hexdigest() == _digest(path), "assembled file differs from the source"
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, nargs='+', default=[64, 256])
+    parser.add_argument('--part-mb', type=int, default=8)
+    parser.add_argument('--parallel', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ChunkedUploadStore(
+            directory=os.path.join(directory, 'uploads'),
+            part_size=args.part_mb * 1024 * 1024,
+            max_bytes=max(args.size_mb) * 2 * 1024 * 1024,
+        )
+        print(f"{'size MB':>8} {'parallel':>9} {'MB/s':>8} {'peak heap MB':>13}")
+        for size_mb in args.size_mb:
+            path = os.path.join(directory, f'{size_mb}.csv')
+            generate(path, 'csv', size_mb * 1024 * 1024)
+            for parallel in sorted({1, args.parallel}):
+                elapsed, peak = run(store, path, parallel)
+                print(f"{size_mb:8} {parallel:9} {os.path.getsize(path) / 1024 / 1024 / elapsed:8.0f} {peak / 1024 / 1024:13.2f}")
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Time to first chunk with the default HTTP client versus the shared keep-alive pool.
+
+Runs waves of concurrent streamed turns, each on a fresh session, against the
+fake Gemini server with a simulated handshake cost on every new connection
+(``--handshake-delay``, standing in for TCP and TLS round trips). With
+httpx's defaults only 20 idle connections are kept, so every wave above that
+concurrency opens new connections and pays the handshake again; ``HttpPool``
+keeps the whole wave's connections alive. Reports first-chunk latency,
+connections the server accepted and the pool's own counters.
+
+    python -m benchmarks.connection_pool --clients 64 --waves 5
+    python -m benchmarks.connection_pool --async
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+
+from google import genai  # noqa: E402
+
+from benchmarks.fake_gemini import FakeGeminiServer  # noqa: E402
+from benchmarks.stream_load import _percentile  # noqa: E402
+from chat.services import gemini  # noqa: E402
+from chat.services.transport import HttpPool  # noqa: E402
+
+
+def _turn() -> float:
+    session = gemini.GeminiChatSession(system_prompt="benchmark")
+    start = time.perf_counter()
+    first = None
+    for chunk in session.send_message_stream("hello"):
+        if chunk['type'] == 'error':
+            raise RuntimeError(chunk['content'])
+        first = first or time.perf_counter() - start
+    return first
+
+
+async def _aturn() -> float:
+    session = gemini.AsyncGeminiChatSession(system_prompt="benchmark")
+    start = time.perf_counter()
+    first = None
+    async for chunk in session.send_message_stream("hello"):
+        if chunk['type'] == 'error':
+            raise RuntimeError(chunk['content'])
+        first = first or time.perf_counter() - start
+    return first
+
+
+def run(clients: int, waves: int, pause: float, use_async: bool) -> list:
+    """First-chunk seconds of every turn, wave after wave."""
+    if use_async:
+        async def main():
+            results = []
+            for _ in range(waves):
+                results += await asyncio.gather(*(_aturn() for _ in range(clients)))
+                await asyncio.sleep(pause)
+            return results
+        return asyncio.run(main())
+    results = []
+    with ThreadPoolExecutor(clients) as pool:
+        for _ in range(waves):
+            results += pool.map(lambda _: _turn(), range(clients))
+            time.sleep(pause)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=64, help="Concurrent turns per wave")
+    parser.add_argument('--waves', type=int, default=5)
+    parser.add_argument('--pause', type=float, default=0.5, help="Seconds between waves")
+    parser.add_argument('--handshake-delay', type=float, default=0.1)
+    parser.add_argument('--async', dest='use_async', action='store_true', help="Use the async session")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with FakeGeminiServer(
+        chunks=5, chunk_delay=0.02, first_chunk_delay=0.2, handshake_delay=args.handshake_delay,
+    ) as server:
+        print(
+            f"{args.waves} waves of {args.clients} {'async' if args.use_async else 'sync'} turns, "
+            f"{args.handshake_delay * 1000:.0f} ms per new connection"
+        )
+        print(f"{'client':>12} {'ttfc p50':>9} {'ttfc p95':>9} {'connections':>12} pool stats")
+        pool = HttpPool(max_connections=args.clients)
+        for name in ('default', 'shared pool'):
+            options = pool.http_options(base_url=server.base_url) if name == 'shared pool' else None
+            gemini.client = genai.Client(api_key='fake-key', http_options=options) if options else server.client()
+            accepted = server.connections_accepted
+            first = run(args.clients, args.waves, args.pause, args.use_async)
+            stats = pool.stats()['async' if args.use_async else 'sync'] if options else '-'
+            print(
+                f"{name:>12} {_percentile(first, 50) * 1000:9.0f} {_percentile(first, 95) * 1000:9.0f} "
+                f"{server.connections_accepted - accepted:12} {stats}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Memory and throughput benchmark for the streaming CSV conversion pipeline.
+
+Generates synthetic inputs of the requested size in a temp directory, converts
+each one with ``convert_to_csv_stream`` into a file on disk, and reports
+throughput (untraced run) and peak Python heap (``tracemalloc`` run). Peak
+memory should stay flat as ``--size-mb`` grows.
+
+    python -m benchmarks.conversion --size-mb 128
+    python -m benchmarks.conversion --size-mb 16 --formats xlsx
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+
+from chat.services.conversion import convert_to_csv_stream  # noqa: E402
+
+FORMATS = ('csv', 'tsv', 'txt', 'json', 'ndjson', 'xlsx')
+
+
+def _record(i: int) -> dict:
+    return {"id": i, "city": f"city_{i % 97}", "value": i * 0.25, "note": "lorem ipsum dolor sit amet"}
+
+
+def generate(path: str, fmt: str, size_bytes: int) -> int:
+    """Write a synthetic ``fmt`` file of roughly ``size_bytes``; returns the row count."""
+    rows = 0
+    if fmt == 'xlsx':
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(list(_record(0)))
+        # xlsx compresses well; approximate the uncompressed sheet size instead
+        while rows * 80 < size_bytes:
+            sheet.append(list(_record(rows).values()))
+            rows += 1
+        workbook.save(path)
+        return rows
+
+    with open(path, 'w', encoding='utf-8', newline='') as out:
+        if fmt == 'json':
+            out.write('[')
+        elif fmt in ('csv', 'tsv', 'txt'):
+            sep = '\t' if fmt == 'tsv' else ','
+            out.write(sep.join(_record(0)) + '\n')
+        while out.tell() < size_bytes:
+            record = _record(rows)
+            if fmt == 'json':
+                out.write((',' if rows else '') + json.dumps(record))
+            elif fmt == 'ndjson':
+                out.write(json.dumps(record) + '\n')
+            else:
+                out.write(sep.join(str(v) for v in record.values()) + '\n')
+            rows += 1
+        if fmt == 'json':
+            out.write(']')
+    return rows
+
+
+def convert(path: str, fmt: str, out_path: str) -> None:
+    ext = '.jsonl' if fmt == 'ndjson' else f'.{fmt}'
+    with open(path, 'rb') as source, open(out_path, 'wb') as target:
+        convert_to_csv_stream(source, f'input{ext}', target)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=128, help='input size per format')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=[f for f in FORMATS if f != 'xlsx'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'format':>7} {'input MB':>9} {'rows':>10} {'MB/s':>8} {'peak heap MB':>13}")
+        for fmt in args.formats:
+            path = os.path.join(tmp, f'input.{fmt}')
+            out_path = os.path.join(tmp, 'output.csv')
+            rows = generate(path, fmt, args.size_mb * 1024 * 1024)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+
+            start = time.perf_counter()
+            convert(path, fmt, out_path)
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            convert(path, fmt, out_path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f"{fmt:>7} {size_mb:9.1f} {rows:10d} {size_mb / elapsed:8.1f} {peak / (1024 * 1024):13.2f}")
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+A minimal local stand-in for the Gemini REST API, used by the benchmarks.
+
+It answers ``:streamGenerateContent`` requests with a fixed number of SSE text
+chunks paced by a configurable delay, and ``:generateContent`` with a single
+response, which is enough for ``genai.Client`` to drive ``GeminiChatSession``
+and ``AsyncGeminiChatSession`` without network access. The server runs on its
+own asyncio loop in a background thread so it never competes with the code
+under test for a worker thread.
+
+    with FakeGeminiServer(chunks=20, chunk_delay=0.05) as server:
+        client = server.client()
+"""
+import asyncio
+import json
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from google import genai
+from google.genai import types
+
+
+@dataclass
+class FakeGeminiConfig:
+    chunks: int = 20
+    chunk_delay: float = 0.05
+    first_chunk_delay: float = 0.2
+    chunk_text: str = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+    # Stand-in for the TCP and TLS handshake round trips a real new connection costs
+    handshake_delay: float = 0.0
+
+
+def _chunk_payload(text: str, finish: bool) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate], "modelVersion": "fake"}
+
+
+class FakeGeminiServer:
+    """Fake Gemini HTTP server on 127.0.0.1, usable as a context manager."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **config):
+        self.host = host
+        self.port = port
+        self.config = FakeGeminiConfig(**config)
+        self.requests_served = 0
+        self.connections_accepted = 0
+        # Body size of each request served, in order
+        self.request_bytes: list[int] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def client(self, **http_options) -> genai.Client:
+        """Build a genai client that talks to this server."""
+        return genai.Client(
+            api_key="fake-key",
+            http_options=types.HttpOptions(base_url=self.base_url, **http_options),
+        )
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread = threading.Thread(target=self._run, name="fake-gemini", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections_accepted += 1
+        try:
+            if self.config.handshake_delay:
+                await asyncio.sleep(self.config.handshake_delay)
+            # HTTP/1.1 keep-alive: serve requests until the client hangs up
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length:
+                    await reader.readexactly(length)
+                self.requests_served += 1
+                self.request_bytes.append(length)
+                await self.respond(target, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, target: str, writer: asyncio.StreamWriter) -> None:
+        """Write the response for one request. Subclasses override this to inject behaviour."""
+        if ":streamGenerateContent" in target:
+            await self.stream_chunks(writer)
+        else:
+            payload = _chunk_payload(self.config.chunk_text * self.config.chunks, finish=True)
+            await self.send_json(writer, payload)
+
+    async def send_json(self, writer: asyncio.StreamWriter, payload: dict, status: str = "200 OK") -> None:
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def stream_chunks(self, writer: asyncio.StreamWriter) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        await asyncio.sleep(self.config.first_chunk_delay)
+        for i in range(self.config.chunks):
+            if i:
+                await asyncio.sleep(self.config.chunk_delay)
+            frame = f"data: {json.dumps(_chunk_payload(self.config.chunk_text, i == self.config.chunks - 1))}\r\n\r\n".encode()
+            writer.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
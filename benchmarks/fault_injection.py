@@ -0,0 +1,162 @@
+"""
+Chat turns against a fault-injecting fake Gemini server.
+
+The server fails a share of streamed requests the way the real API does
+under load: 503 "overloaded" and 429 rate-limit errors, connections dropped
+before any response, and streams whose first chunk stalls for seconds.
+Turns run concurrently through ``GeminiChatSession`` with the call policy
+disabled (one attempt, no hedging) and enabled, and the script reports
+success rate, time to first chunk and what the policy did. A final phase
+fails every request to show the circuit breaker failing fast.
+
+    python -m benchmarks.fault_injection --turns 200 --concurrency 16
+    python -m benchmarks.fault_injection --async
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+
+from benchmarks.fake_gemini import FakeGeminiServer  # noqa: E402
+from chat.services import gemini  # noqa: E402
+from chat.services.resilience import CallPolicy, CircuitBreaker, RetryPolicy  # noqa: E402
+
+ERRORS = {
+    503: {"error": {"code": 503, "message": "The model is overloaded. Please try again later.", "status": "UNAVAILABLE"}},
+    429: {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"}},
+}
+
+
+class FaultyGeminiServer(FakeGeminiServer):
+    """Fake Gemini server that fails or stalls a configurable share of streamed requests."""
+
+    def __init__(self, error_rate=0.0, drop_rate=0.0, stall_rate=0.0, stall=3.0, seed=0, **config):
+        super().__init__(**config)
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.faults = {'error': 0, 'drop': 0, 'stall': 0}
+        self._rng = random.Random(seed)
+
+    async def respond(self, target, writer):
+        if ":streamGenerateContent" not in target:
+            return await super().respond(target, writer)
+        roll = self._rng.random()
+        if roll < self.error_rate:
+            self.faults['error'] += 1
+            code = self._rng.choice(list(ERRORS))
+            status = "503 Service Unavailable" if code == 503 else "429 Too Many Requests"
+            return await self.send_json(writer, ERRORS[code], status=status)
+        roll -= self.error_rate
+        if roll < self.drop_rate:
+            self.faults['drop'] += 1
+            writer.transport.abort()
+            return
+        roll -= self.drop_rate
+        if roll < self.stall_rate:
+            self.faults['stall'] += 1
+            await asyncio.sleep(self.stall)
+        await self.stream_chunks(writer)
+
+
+def _turn(policy: CallPolicy) -> tuple:
+    """One streamed turn on a fresh session: (succeeded, seconds to first chunk or to the error)."""
+    session = gemini.GeminiChatSession(system_prompt="benchmark", call_policy=policy)
+    start = time.perf_counter()
+    first = None
+    for chunk in session.send_message_stream("Summarize this data"):
+        if chunk['type'] == 'error':
+            return False, time.perf_counter() - start
+        first = first or time.perf_counter() - start
+    return first is not None, first
+
+
+async def _aturn(policy: CallPolicy) -> tuple:
+    session = gemini.AsyncGeminiChatSession(system_prompt="benchmark", call_policy=policy)
+    start = time.perf_counter()
+    first = None
+    async for chunk in session.send_message_stream("Summarize this data"):
+        if chunk['type'] == 'error':
+            return False, time.perf_counter() - start
+        first = first or time.perf_counter() - start
+    return first is not None, first
+
+
+def run(server: FaultyGeminiServer, policy: CallPolicy, turns: int, concurrency: int, use_async: bool) -> list:
+    # A fresh client per run: its async connection pool belongs to the event loop of the run that used it
+    gemini.client = server.client()
+    if use_async:
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited():
+                async with semaphore:
+                    return await _aturn(policy)
+            return await asyncio.gather(*(limited() for _ in range(turns)))
+        return asyncio.run(main())
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(lambda _: _turn(policy), range(turns)))
+
+
+def report(name: str, results: list, server: FaultyGeminiServer, requests: int, policy: CallPolicy) -> None:
+    ok = [seconds for succeeded, seconds in results if succeeded]
+    failed = [seconds for succeeded, seconds in results if not succeeded]
+    quantiles = statistics.quantiles(ok, n=20) if len(ok) > 1 else [0.0] * 19
+    print(
+        f"{name:>18} {len(ok) / len(results):8.1%} {quantiles[9] * 1000:8.0f} {quantiles[18] * 1000:8.0f} "
+        f"{statistics.mean(failed) * 1000 if failed else 0:10.0f} {server.requests_served - requests:9} "
+        f"{json.dumps({k: v for k, v in policy.stats().items() if k not in ('active_calls', 'rejected_calls')})}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--error-rate', type=float, default=0.2, help="Share of requests answered with 503 or 429")
+    parser.add_argument('--drop-rate', type=float, default=0.05, help="Share of connections dropped before a response")
+    parser.add_argument('--stall-rate', type=float, default=0.1, help="Share of streams whose first chunk stalls")
+    parser.add_argument('--stall', type=float, default=3.0, help="Stall length in seconds")
+    parser.add_argument('--hedge-after', type=float, default=0.6)
+    parser.add_argument('--async', dest='use_async', action='store_true', help="Use the async session")
+    args = parser.parse_args()
+    # Every injected fault is logged by the session; only the summary is of interest here
+    logging.disable(logging.CRITICAL)
+
+    server = FaultyGeminiServer(
+        error_rate=args.error_rate, drop_rate=args.drop_rate, stall_rate=args.stall_rate, stall=args.stall,
+        chunks=10, chunk_delay=0.02, first_chunk_delay=0.2,
+    )
+    policies = {
+        'no policy': CallPolicy(retry=RetryPolicy(max_attempts=1), breaker=CircuitBreaker(failure_threshold=10 ** 9)),
+        'retries': CallPolicy(retry=RetryPolicy(base_delay=0.1), breaker=CircuitBreaker(failure_threshold=10 ** 9)),
+        'retries + hedging': CallPolicy(
+            retry=RetryPolicy(base_delay=0.1), breaker=CircuitBreaker(failure_threshold=10 ** 9), hedge_after=args.hedge_after,
+        ),
+    }
+    with server:
+        print(f"{args.turns} turns, {args.concurrency} concurrent, {'async' if args.use_async else 'sync'} sessions")
+        print(f"{'policy':>18} {'success':>8} {'p50 ms':>8} {'p95 ms':>8} {'failed ms':>10} {'requests':>9} policy stats")
+        for name, policy in policies.items():
+            requests = server.requests_served
+            report(name, run(server, policy, args.turns, args.concurrency, args.use_async), server, requests, policy)
+
+        # Full outage: the breaker opens after a few failures and later turns fail without calling Gemini
+        server.error_rate, server.drop_rate, server.stall_rate = 1.0, 0.0, 0.0
+        for name, threshold in [('outage, no breaker', 10 ** 9), ('outage, breaker', 5)]:
+            policy = CallPolicy(retry=RetryPolicy(base_delay=0.1), breaker=CircuitBreaker(failure_threshold=threshold))
+            requests = server.requests_served
+            report(name, run(server, policy, args.turns // 2, args.concurrency, args.use_async), server, requests, policy)
+        print(f"faults injected: {server.faults}")
+
+
+if __name__ == '__main__':
+    main()
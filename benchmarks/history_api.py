@@ -0,0 +1,91 @@
+"""
+Size and serialization time of the chat history API as a conversation grows.
+
+Grows one session turn by turn (code, a long execution output, a plot and a
+prose answer per turn, compacted after each as in the app, with a budget
+large enough to keep every turn) and, at each of ``--turns``, compares the
+previous whole-history response (every ``Content`` through
+``to_json_dict()``, plots inlined) with the paginated one: the first page
+cold, the same page again from the per-turn cache, and the delta a polling
+client fetches after one more turn (``since`` the previous ``next``).
+
+    python -m benchmarks.history_api --turns 10 50 100
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from google.genai import types
+
+from chat.services.backends import ReplayBackend
+from chat.services.gemini import GeminiChatSession
+from chat.services.history import HistoryCompactor
+from chat.services.history_pages import DEFAULT_PAGE_TURNS
+from chat.services.image_store import ImageStore
+
+PLOT_BYTES = 30_000
+OUTPUT = "\n".join(f"{i:>6} {i * 0.37:>12.4f} {'category_' + str(i % 17):>14}" for i in range(100))
+
+
+def add_turn(session: GeminiChatSession, turn: int) -> None:
+    """Append one EDA turn to the session's history and compact it, as after a live turn."""
+    history = session.get_history() + [
+        types.Content(role="user", parts=[types.Part(text=f"Question {turn} about the data")]),
+        types.Content(role="model", parts=[
+            types.Part(executable_code=types.ExecutableCode(language="PYTHON", code="print(df.describe())")),
+            types.Part(code_execution_result=types.CodeExecutionResult(outcome="OUTCOME_OK", output=OUTPUT)),
+            types.Part(inline_data=types.Blob(mime_type="image/png", data=os.urandom(PLOT_BYTES))),
+            types.Part(text="The distribution is right-skewed with a long upper tail. " * 8),
+        ]),
+    ]
+    session._chat = session._create_chat(history)
+    session._compact_history()
+
+
+def _timed(fn) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, len(result.encode() if isinstance(result, str) else result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, nargs='+', default=[10, 50, 100])
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as directory:
+        session = GeminiChatSession(
+            system_prompt="benchmark",
+            image_store=ImageStore(directory=directory),
+            history_compactor=HistoryCompactor(token_budget=10 ** 9, max_turns=10 ** 6),
+            backend=ReplayBackend([[]]),
+        )
+        print(
+            f"{'turns':>6} {'full ms':>8} {'full KB':>8} {'page cold ms':>13} {'page warm ms':>13} "
+            f"{'page KB':>8} {'delta ms':>9} {'delta KB':>9}"
+        )
+        turn = 0
+        for target in sorted(args.turns):
+            while turn < target - 1:
+                add_turn(session, turn)
+                turn += 1
+            session.history_pages._encoded.clear()
+            full = _timed(lambda: json.dumps([content.to_json_dict() for content in session.get_history()]))
+            cold = _timed(lambda: session.history_page(limit=DEFAULT_PAGE_TURNS))
+            warm = _timed(lambda: session.history_page(limit=DEFAULT_PAGE_TURNS))
+            # A polling client that has seen every turn so far fetches the next one
+            add_turn(session, turn)
+            delta = _timed(lambda: session.history_page(since=turn))
+            turn += 1
+            print(
+                f"{turn:6} {full[0]:8.1f} {full[1] / 1024:8.0f} {cold[0]:13.2f} {warm[0]:13.2f} "
+                f"{cold[1] / 1024:8.0f} {delta[0]:9.2f} {delta[1] / 1024:9.1f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
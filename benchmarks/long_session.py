@@ -0,0 +1,88 @@
+"""
+Per-turn request size and latency over a long chat session.
+
+Drives one ``GeminiChatSession`` through many streamed turns against a fake
+Gemini server whose replies look like an EDA turn (code, a long execution
+output, a plot and a prose answer), with a file attached to every message.
+Reports request body size and turn latency at intervals, with history
+compaction at the configured budget and with compaction effectively disabled.
+
+    python -m benchmarks.long_session --turns 60
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+
+from google.genai import types  # noqa: E402
+
+from benchmarks.fake_gemini import FakeGeminiServer, _chunk_payload  # noqa: E402
+from chat.services import gemini  # noqa: E402
+from chat.services.history import DEFAULT_MAX_TURNS, DEFAULT_TOKEN_BUDGET, HistoryCompactor  # noqa: E402
+from chat.services.session_files import SessionFile  # noqa: E402
+
+PLOT = base64.b64encode(os.urandom(60_000)).decode()
+OUTPUT = "\n".join(f"{i:>6} {i * 0.37:>12.4f} {'category_' + str(i % 17):>14}" for i in range(400))
+
+
+class EdaTurnServer(FakeGeminiServer):
+    """Streams a code, output, plot and text reply for every turn."""
+
+    async def respond(self, target, writer):
+        if ":streamGenerateContent" not in target:
+            return await super().respond(target, writer)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        parts = [
+            {"executableCode": {"language": "PYTHON", "code": "df = pd.read_csv('input_file_0.csv')\nprint(df.describe())"}},
+            {"codeExecutionResult": {"outcome": "OUTCOME_OK", "output": OUTPUT}},
+            {"inlineData": {"mimeType": "image/png", "data": PLOT}},
+            {"text": "The distribution is right-skewed with a long upper tail. " * 8},
+        ]
+        for i, part in enumerate(parts):
+            payload = _chunk_payload("", finish=i == len(parts) - 1)
+            payload["candidates"][0]["content"]["parts"] = [part]
+            if i == len(parts) - 1:
+                payload["usageMetadata"] = {"promptTokenCount": 0, "candidatesTokenCount": 0}
+            frame = f"data: {json.dumps(payload)}\r\n\r\n".encode()
+            writer.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def run(server: EdaTurnServer, turns: int, compactor: HistoryCompactor) -> list:
+    session = gemini.GeminiChatSession(system_prompt="benchmark", history_compactor=compactor)
+    uploaded = types.File(name="files/data", uri=f"{server.base_url}/files/data", mime_type="text/csv")
+    files = [SessionFile(file=uploaded, name="data.csv")]
+    results = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        for _ in session.send_message_with_files_stream(f"Question {turn}: what stands out?", files):
+            pass
+        results.append((server.request_bytes[-1], time.perf_counter() - start))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=60)
+    parser.add_argument('--budget', type=int, default=DEFAULT_TOKEN_BUDGET, help="History token budget")
+    parser.add_argument('--max-turns', type=int, default=DEFAULT_MAX_TURNS, help="History turn cap")
+    args = parser.parse_args()
+
+    with EdaTurnServer(first_chunk_delay=0) as server:
+        gemini.client = server.client()
+        compacted = run(server, args.turns, HistoryCompactor(token_budget=args.budget, max_turns=args.max_turns))
+        uncompacted = run(server, args.turns, HistoryCompactor(token_budget=10 ** 12, max_turns=10 ** 6))
+
+    print(f"{'turn':>5} {'compacted KB':>13} {'ms':>7} {'full history KB':>16} {'ms':>7}")
+    step = max(args.turns // 10, 1)
+    for turn in [*range(0, args.turns, step), args.turns - 1]:
+        (small, small_s), (big, big_s) = compacted[turn], uncompacted[turn]
+        print(f"{turn + 1:>5} {small / 1024:13.1f} {small_s * 1000:7.1f} {big / 1024:16.1f} {big_s * 1000:7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Microbenchmark for server-side rendering of non-streamed responses.
+
+Builds realistic multi-part responses (markdown write-ups with tables, LaTeX
+and fenced code, interleaved with code and output parts) and times
+``render_html_response`` three ways: the previous implementation (a fresh
+``markdown2.markdown`` call per part, ``+=`` assembly), the memoized renderer
+with a cold cache, and the memoized renderer re-rendering the same history.
+
+    python -m benchmarks.markdown_render --responses 20 --repeat 5
+"""
+import argparse
+import random
+import time
+
+import markdown2
+from google.genai import types
+
+from benchmarks.stream_transcript import _section
+from chat.utils import markdown
+from chat.utils.markdown import render_html_response, replace_input_file_names
+
+FILE_NAMES = {'input_file_0.csv': 'data.csv'}
+
+CODE = """import pandas as pd
+df = pd.read_csv('input_file_0.csv')
+df['{column}_z'] = (df['{column}'] - df['{column}'].mean()) / df['{column}'].std()
+print(df['{column}_z'].describe())
+"""
+
+
+def build_response(rng: random.Random, index: int, sections: int = 4) -> list:
+    """One agent turn: a few code/output rounds, then a markdown write-up per section."""
+    parts = []
+    for i in range(sections):
+        column = rng.choice(['consumption', 'temperature', 'price'])
+        parts.append(types.Part(executable_code=types.ExecutableCode(code=CODE.format(column=column), language='PYTHON')))
+        parts.append(types.Part(code_execution_result=types.CodeExecutionResult(
+            outcome='OUTCOME_OK',
+            output="\n".join(f"{name:<8}{rng.uniform(0, 1000):>12.3f}" for name in ['count', 'mean', 'std', 'min', 'max']),
+        )))
+        parts.append(types.Part(text=_section(rng, index * sections + i)))
+    return parts
+
+
+def render_uncached(bot_response: list, file_names: dict | None = None) -> str:
+    """The renderer before memoization, kept here as the baseline."""
+    bot_response_html = ""
+    for part in bot_response:
+        if part.text:
+            bot_response_html += markdown2.markdown(
+                part.text,
+                extras=['fenced-code-blocks', 'code-friendly', 'tables', "latex"]
+            )
+        elif part.executable_code:
+            code = replace_input_file_names(part.executable_code.code, file_names)
+            highlighted = markdown2.markdown("```python\n" + code + "\n```", extras=['fenced-code-blocks', 'code-friendly'])
+            bot_response_html += f"<br/>Python Code:{highlighted}<br/>"
+        elif part.code_execution_result:
+            bot_response_html += f"<br/>Code Output:<pre>{replace_input_file_names(part.code_execution_result.output, file_names)}</pre><br/>"
+    return bot_response_html
+
+
+def _time(render, responses: list, repeat: int, before=None) -> float:
+    """Best-of-``repeat`` milliseconds to render every response once."""
+    best = float('inf')
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        for response in responses:
+            render(response, FILE_NAMES)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--responses', type=int, default=20, help="Responses in the simulated history")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    responses = [build_response(rng, i) for i in range(args.responses)]
+    parts = sum(len(r) for r in responses)
+
+    def clear():
+        markdown.render_markdown.cache_clear()
+        markdown.highlight_code.cache_clear()
+
+    for response in responses:
+        assert render_html_response(response, FILE_NAMES) == render_uncached(response, FILE_NAMES)
+
+    # markdown2's latex extra leaks escaped code spans into a class-level dict, which slows every
+    # later conversion; start each baseline run from a clean slate as a fresh process would
+    baseline = _time(render_uncached, responses, args.repeat, before=markdown2.Latex.code_blocks.clear)
+    cold = _time(render_html_response, responses, args.repeat, before=clear)
+    warm = _time(render_html_response, responses, args.repeat)
+
+    print(f"{args.responses} responses, {parts} parts")
+    print(f"{'renderer':>22} {'total ms':>10} {'ms/response':>12} {'speed-up':>9}")
+    for name, ms in [('uncached (before)', baseline), ('memoized, cold cache', cold), ('memoized, history', warm)]:
+        print(f"{name:>22} {ms:10.1f} {ms / args.responses:12.2f} {baseline / ms:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
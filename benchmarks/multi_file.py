@@ -0,0 +1,85 @@
+"""
+Time to add several datasets to a conversation, one after another versus in parallel.
+
+Generates ``--files`` inputs of ``--size-mb`` each in a mix of formats and
+uploads them with ``GeminiChatSession.upload_files``, first with one upload
+worker and then with ``--workers``. Conversion and profiling run for real;
+the upload to Gemini goes to a replay backend that reads the converted CSV
+and waits as long as sending it at ``--upload-mbps`` would take.
+
+    python -m benchmarks.multi_file --files 4 --size-mb 32
+    python -m benchmarks.multi_file --upload-mbps 20 --workers 2
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.conversion import generate
+from chat.services.backends import ReplayBackend
+from chat.services.gemini import GeminiChatSession
+from chat.services.session_files import DEFAULT_UPLOAD_WORKERS
+
+FORMATS = ('csv', 'ndjson', 'tsv', 'json')
+
+
+class _SlowUploadBackend(ReplayBackend):
+    """Replay backend whose uploads take as long as the bytes would at ``mbps`` megabits per second."""
+
+    def __init__(self, mbps: float):
+        super().__init__([[]])
+        self.mbps = mbps
+
+    def upload_file(self, file, config):
+        size = 0
+        while chunk := file.read(1024 * 1024):
+            size += len(chunk)
+        time.sleep(size * 8 / (self.mbps * 1_000_000))
+        file.seek(0)
+        return super().upload_file(file, config)
+
+
+def run(paths: list, workers: int, mbps: float) -> float:
+    """Seconds for one ``upload_files`` call with ``workers`` upload workers."""
+    session = GeminiChatSession(
+        system_prompt="benchmark", backend=_SlowUploadBackend(mbps), max_files=len(paths), upload_workers=workers,
+    )
+    handles = [open(path, 'rb') for path in paths]
+    try:
+        start = time.perf_counter()
+        session.upload_files([(handle, os.path.basename(path)) for handle, path in zip(handles, paths)])
+        return time.perf_counter() - start
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--size-mb', type=int, default=32, help="Size of each input")
+    parser.add_argument('--workers', type=int, default=DEFAULT_UPLOAD_WORKERS)
+    parser.add_argument('--upload-mbps', type=float, default=100.0, help="Simulated upload bandwidth")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(args.files):
+            fmt = FORMATS[i % len(FORMATS)]
+            path = os.path.join(directory, f'dataset_{i}.{"jsonl" if fmt == "ndjson" else fmt}')
+            generate(path, fmt, args.size_mb * 1024 * 1024)
+            paths.append(path)
+
+        print(f"{args.files} files of {args.size_mb} MB, uploads at {args.upload_mbps:g} Mbit/s")
+        print(f"{'workers':>8} {'seconds':>8} {'speed-up':>9}")
+        sequential = None
+        for workers in (1, args.workers):
+            elapsed = run(paths, workers, args.upload_mbps)
+            sequential = sequential or elapsed
+            print(f"{workers:8} {elapsed:8.2f} {sequential / elapsed:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Cold and cached opening questions on the same dataset.
+
+Runs a few sessions that all ask the same opening questions about one
+dataset against the fake Gemini server, with the response cache enabled.
+The first session's turns are live model runs and are stored; later
+sessions replay them. Reports turn latency, how many model requests were
+made and the cache counters, at the recorded pace and with instant replay.
+
+    python -m benchmarks.response_cache --sessions 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+
+from google.genai import types  # noqa: E402
+
+from benchmarks.fake_gemini import FakeGeminiServer  # noqa: E402
+from chat.services import gemini  # noqa: E402
+from chat.services.image_store import ImageStore  # noqa: E402
+from chat.services.response_cache import ResponseCache  # noqa: E402
+from chat.services.session_files import SessionFile  # noqa: E402
+
+QUESTIONS = ["Summarize this data", "Show correlations between the numeric columns"]
+
+
+def run(server: FakeGeminiServer, sessions: int, replay_speed: float) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(directory=os.path.join(directory, 'responses'))
+        images = ImageStore(directory=os.path.join(directory, 'images'))
+        uploaded = types.File(name="files/data", uri=f"{server.base_url}/files/data", mime_type="text/csv")
+        files = [SessionFile(file=uploaded, name="data.csv", digest="0" * 64)]
+        served = server.requests_served
+        print(f"replay speed {replay_speed:g}")
+        print(f"{'session':>8} {'turn ms':>24} {'model requests':>15}")
+        for i in range(sessions):
+            session = gemini.GeminiChatSession(
+                system_prompt="benchmark", image_store=images, response_cache=cache, replay_speed=replay_speed,
+            )
+            timings = []
+            for question in QUESTIONS:
+                # Users rarely type an opening question the same way twice
+                message = f"  {question.upper() if i % 2 else question}  "
+                start = time.perf_counter()
+                chunks = list(session.send_message_with_files_stream(message, files))
+                assert chunks and not any(chunk['type'] == 'error' for chunk in chunks), chunks
+                timings.append(f"{(time.perf_counter() - start) * 1000:.0f}")
+            print(f"{i + 1:>8} {' / '.join(timings):>24} {server.requests_served - served:>15}")
+            served = server.requests_served
+        print(f"cache: {cache.stats()}\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=5)
+    parser.add_argument('--chunks', type=int, default=20)
+    parser.add_argument('--chunk-delay', type=float, default=0.05)
+    args = parser.parse_args()
+
+    with FakeGeminiServer(chunks=args.chunks, chunk_delay=args.chunk_delay) as server:
+        gemini.client = server.client()
+        for replay_speed in (1.0, 0.0):
+            run(server, args.sessions, replay_speed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Size, parse time and accuracy of the sample sent to the model for large datasets.
+
+Generates a CSV of each requested size whose columns lead ``DatasetSampler``
+to each method (``--methods``): a timestamp column for ``time``, a skewed
+low-cardinality category for ``stratified``, neither for ``reservoir``.
+Each is stored in a ``DatasetStore`` and sampled. Reports the time to
+sample, the CSV the model receives next to the full one, how long pandas
+takes to parse each (the sandbox re-parses the file on every code
+execution), and how far the sample's mean of ``value`` is from the exact
+mean shipped with it.
+
+    python -m benchmarks.sampling --size-mb 64 256
+    python -m benchmarks.sampling --methods stratified --rows 50000
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from chat.services.dataset_store import DatasetStore
+from chat.services.sampling import DEFAULT_TARGET_ROWS, DatasetSampler, write_sample_csv
+
+METHODS = ('reservoir', 'stratified', 'time')
+CATEGORIES = ['retail', 'online', 'wholesale', 'partner', 'refund']
+
+
+def generate(path: str, method: str, size_bytes: int, seed: int = 0) -> int:
+    """Write a synthetic CSV of roughly ``size_bytes`` that samples with ``method``; returns the row count."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    rows = 0
+    with open(path, 'w', encoding='utf-8', newline='') as out:
+        while out.tell() < size_bytes:
+            n = 100_000
+            frame = {'id': np.arange(rows, rows + n)}
+            if method == 'time':
+                frame['ts'] = pd.Timestamp('2020-01-01') + pd.to_timedelta(rows + np.arange(n), unit='min')
+            if method == 'stratified':
+                frame['channel'] = rng.choice(CATEGORIES, n, p=[0.6, 0.3, 0.0995, 0.0004, 0.0001])
+            frame['value'] = rng.lognormal(3, 1, n).round(2)
+            frame['note'] = 'lorem ipsum dolor sit amet'
+            pd.DataFrame(frame).to_csv(out, header=rows == 0, index=False)
+            rows += n
+    return rows
+
+
+def _parse_seconds(source) -> float:
+    import pandas as pd
+    start = time.perf_counter()
+    pd.read_csv(source)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, nargs='+', default=[64, 256])
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS))
+    parser.add_argument('--rows', type=int, default=DEFAULT_TARGET_ROWS, help="Target sample rows")
+    args = parser.parse_args()
+
+    sampler = DatasetSampler(threshold_bytes=1, target_rows=args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        store = DatasetStore(directory=os.path.join(directory, 'store'))
+        print(
+            f"{'method':>10} {'full MB':>8} {'rows':>10} {'sample s':>9} {'sample MB':>10} "
+            f"{'sample rows':>12} {'parse full s':>13} {'parse sample s':>15} {'mean error':>11}"
+        )
+        for size_mb in args.size_mb:
+            for method in args.methods:
+                path = os.path.join(directory, f'{method}-{size_mb}.csv')
+                rows = generate(path, method, size_mb * 1024 * 1024)
+                with open(path, 'rb') as source:
+                    store.ingest_csv(method, source)
+
+                start = time.perf_counter()
+                sample = sampler.sample(lambda: store.iter_batches(method))
+                elapsed = time.perf_counter() - start
+                assert sample.method == method, f"expected a {method} sample, got {sample.method}"
+
+                csv = io.BytesIO()
+                write_sample_csv(sample, csv)
+                # The stratified sample over-represents rare channels, so weight it back by their exact counts
+                if method == 'stratified':
+                    frame = sample.table.to_pandas()
+                    weights = frame['channel'].map({g['value']: g['rows'] / g['sample_rows'] for g in sample.groups})
+                    estimate = (frame['value'] * weights).sum() / weights.sum()
+                else:
+                    estimate = np.nanmean(sample.table.column('value').to_numpy(zero_copy_only=False))
+                exact = sample.aggregates['value']['mean']
+                print(
+                    f"{method:>10} {os.path.getsize(path) / 1024 / 1024:8.0f} {rows:10} {elapsed:9.2f} "
+                    f"{len(csv.getvalue()) / 1024 / 1024:10.1f} {sample.sample_rows:12} {_parse_seconds(path):13.2f} "
+                    f"{_parse_seconds(io.BytesIO(csv.getvalue())):15.2f} {abs(estimate - exact) / exact:10.2%}"
+                )
+                store.remove(method)
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
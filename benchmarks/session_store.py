@@ -0,0 +1,130 @@
+"""
+Cost of keeping conversations in the shared session store.
+
+Builds ``--sessions`` conversations of ``--turns`` EDA turns each (code, a
+long execution output, a plot and a prose answer) with an uploaded file, and
+measures what a request pays: the stamp lookup that tells a worker its copy
+is current, saving the state after a turn, and rebuilding a session from the
+store (what a worker does on first access, and what every request would do
+without the stamp check). Plots are kept in the image store and referenced
+by digest, as in the app. Then compares writing every session's save in
+write-behind batches against one transaction per save.
+
+    python -m benchmarks.session_store --sessions 200 --turns 10
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from google.genai import types
+
+from chat.services.backends import ReplayBackend
+from chat.services.gemini import GeminiChatSession
+from chat.services.image_store import ImageStore
+from chat.services.registry import SessionRegistry
+from chat.services.session_files import SessionFile
+from chat.services.session_store import SessionStore, encode_state
+
+PLOT_BYTES = 30_000
+OUTPUT = "\n".join(f"{i:>6} {i * 0.37:>12.4f} {'category_' + str(i % 17):>14}" for i in range(100))
+
+
+def new_session(image_store: ImageStore) -> GeminiChatSession:
+    return GeminiChatSession(system_prompt="benchmark", image_store=image_store, backend=ReplayBackend([[]]))
+
+
+def build_session(turns: int, image_store: ImageStore) -> GeminiChatSession:
+    """A session with one uploaded file and ``turns`` turns of history, each with its own plot."""
+    session = new_session(image_store)
+    file = types.File(name="files/data", uri="https://example.invalid/files/data", mime_type="text/csv")
+    columns = [f"column_{i}" for i in range(20)]
+    session.files = [SessionFile(file=file, name="data.csv", digest="0" * 64, columns=columns, description="x" * 4000)]
+    session.last_files = list(session.files)
+    session.dataset_profile = session.files[0].description
+    history = []
+    for turn in range(turns):
+        session.conversation.append(f"question {turn}")
+        session.turn_tokens.append(2000)
+        history.append(types.Content(role="user", parts=[types.Part(text=f"Question {turn} about the data")]))
+        history.append(types.Content(role="model", parts=[
+            types.Part(executable_code=types.ExecutableCode(language="PYTHON", code="print(df.describe())")),
+            types.Part(code_execution_result=types.CodeExecutionResult(outcome="OUTCOME_OK", output=OUTPUT)),
+            types.Part(inline_data=types.Blob(mime_type="image/png", data=os.urandom(PLOT_BYTES))),
+            types.Part(text="The distribution is right-skewed with a long upper tail. " * 8),
+        ]))
+    session._chat = session._create_chat(history)
+    return session
+
+
+def _median_ms(samples: list) -> float:
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--turns', type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as directory:
+        image_store = ImageStore(directory=os.path.join(directory, 'images'))
+        session = build_session(args.turns, image_store)
+        state = session.to_state()
+        print(f"{args.sessions} sessions of {args.turns} turns, {len(encode_state(state)) / 1024:.0f} KB stored each")
+
+        # A long interval so only the explicit flushes below write
+        store = SessionStore(path=os.path.join(directory, 'sessions.sqlite3'), flush_interval=3600, max_pending=10 ** 9)
+        keys = [uuid.uuid4().hex for _ in range(args.sessions)]
+
+        saves = []
+        for key in keys:
+            start = time.perf_counter()
+            store.save(key, uuid.uuid4().hex, session.to_state())
+            saves.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        store.flush()
+        batched = time.perf_counter() - start
+
+        through = 0.0
+        for key in keys:
+            store.save(key, uuid.uuid4().hex, session.to_state())
+            start = time.perf_counter()
+            store.flush()
+            through += time.perf_counter() - start
+
+        lookups = []
+        for key in keys:
+            start = time.perf_counter()
+            store.stamp(key)
+            lookups.append(time.perf_counter() - start)
+
+        registry = SessionRegistry(factory=lambda: new_session(image_store), store=store)
+        restores = []
+        for key in keys:
+            start = time.perf_counter()
+            registry.get(key)
+            restores.append(time.perf_counter() - start)
+        current = []
+        for key in keys:
+            start = time.perf_counter()
+            registry.get(key)
+            current.append(time.perf_counter() - start)
+
+    print(f"{'per request':<36} {'median ms':>10}")
+    print(f"{'save after a turn (request path)':<36} {_median_ms(saves):10.3f}")
+    print(f"{'stamp lookup':<36} {_median_ms(lookups):10.3f}")
+    print(f"{'get, copy current':<36} {_median_ms(current):10.3f}")
+    print(f"{'get, restore from the store':<36} {_median_ms(restores):10.3f}")
+    print()
+    print(f"{'writing every save':<36} {'total s':>10} {'saves/s':>10}")
+    print(f"{'write-behind, one batch':<36} {batched:10.3f} {args.sessions / batched:10.0f}")
+    print(f"{'one transaction per save':<36} {through:10.3f} {args.sessions / through:10.0f}")
+
+
+if __name__ == '__main__':
+    main()
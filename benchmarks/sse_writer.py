@@ -0,0 +1,81 @@
+"""
+Writes, bytes and added latency of the chat SSE writer.
+
+Replays the first ``--events`` chunks of ``benchmarks/browser/long_transcript.json``
+at its recorded pace (text deltas about 25 ms apart, with code, results and
+plots between them) through an ``SSEWriter`` per configuration: every delta
+in its own frame, coalesced with each ``--windows`` flush window, and
+coalesced and gzip-compressed. Reports the writes (each a separate flush to
+the socket), the bytes sent, and how long each chunk waited between arriving
+from the model and going out. The configurations run side by side, so the
+replay takes as long as one.
+
+    python -m benchmarks.sse_writer --events 400 --windows 0.03 0.04 0.05
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+from chat.utils.sse import SSEWriter
+
+TRANSCRIPT = os.path.join(os.path.dirname(__file__), 'browser', 'long_transcript.json')
+
+
+def load_events(count: int) -> list:
+    """(seconds since the start, chunk) for the first ``count`` chunks of the transcript."""
+    with open(TRANSCRIPT) as f:
+        entries = json.load(f)
+    return [(entry['t'] / 1000, entry['event']) for entry in entries[:count] if entry['event']['type'] != 'done']
+
+
+def run(events: list, writer: SSEWriter, result: dict) -> None:
+    arrived = []
+
+    def chunks():
+        start = time.monotonic()
+        for offset, chunk in events:
+            time.sleep(max(start + offset - time.monotonic(), 0.0))
+            arrived.append(time.monotonic())
+            yield dict(chunk)
+
+    delays = []
+    for _ in writer.stream(chunks()):
+        # Everything the writer has taken in is out with this write
+        now = time.monotonic()
+        delays.extend(now - arrived[i] for i in range(len(delays), writer.chunks))
+    result.update(writes=writer.writes, bytes=writer.bytes_sent, delays=delays)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=400)
+    parser.add_argument('--windows', type=float, nargs='+', default=[0.03, 0.04, 0.05])
+    args = parser.parse_args()
+
+    events = load_events(args.events)
+    configs = [('every delta', SSEWriter(flush_window=0, heartbeat_interval=0))]
+    configs += [(f'window {w * 1000:.0f} ms', SSEWriter(flush_window=w)) for w in args.windows]
+    configs += [(f'window {w * 1000:.0f} ms, gzip', SSEWriter(flush_window=w, encoding='gzip')) for w in args.windows]
+
+    results = [{} for _ in configs]
+    threads = [threading.Thread(target=run, args=(events, writer, result)) for (_, writer), result in zip(configs, results)]
+    print(f"{len(events)} chunks over {events[-1][0]:.1f} s")
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{'writer':<22} {'writes':>7} {'KB sent':>8} {'wait mean ms':>13} {'wait max ms':>12}")
+    for (name, _), result in zip(configs, results):
+        delays = result['delays']
+        print(
+            f"{name:<22} {result['writes']:7} {result['bytes'] / 1024:8.1f} "
+            f"{statistics.mean(delays) * 1000:13.1f} {max(delays) * 1000:12.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
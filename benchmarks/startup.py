@@ -0,0 +1,119 @@
+"""
+Cold-start benchmark with an import-time budget.
+
+Starts fresh interpreters that load the WSGI application and serve one page,
+with warm-up on load disabled (imports happen on the first request, as in a
+worker without preloading) and enabled (imports happen while loading, as in
+a preloading gunicorn master). Reports the median load time and first
+request time of each mode and the modules that cost the most to import.
+
+The run fails when a cold worker needs more than ``--budget-ms`` to load and
+serve its first page, when a warmed-up worker takes more than
+``--warm-budget-ms`` for its first page, or when serving a page without
+warm-up imports the data libraries or creates the Gemini client, which should
+only happen on first use.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --budget-ms 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported lazily by the services; a plain page must not load them
+LAZY_MODULES = ('pandas', 'numpy', 'pyarrow', 'openpyxl')
+
+PROBE = f"""
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+start = time.perf_counter()
+from eda_project.wsgi import application
+loaded = time.perf_counter()
+environ = {{'PATH_INFO': '/about/', 'HTTP_HOST': '127.0.0.1'}}
+setup_testing_defaults(environ)
+statuses = []
+body = b''.join(application(environ, lambda status, headers: statuses.append(status)))
+served = time.perf_counter()
+from chat.services import gemini
+print(json.dumps({{
+    'load_ms': (loaded - start) * 1000,
+    'first_request_ms': (served - loaded) * 1000,
+    'status': statuses[0],
+    'lazy_loaded': [name for name in {LAZY_MODULES!r} if name in sys.modules],
+    'client_created': gemini.client is not None,
+}}))
+"""
+
+
+def probe(warm_up: bool, importtime: bool = False) -> tuple:
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'eda_project.settings.development',
+        'WARM_UP_ON_LOAD': 'true' if warm_up else 'false',
+        'GOOGLE_API_KEY': os.environ.get('GOOGLE_API_KEY', 'fake-key'),
+    }
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', PROBE]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def top_imports(stderr: str, count: int) -> list:
+    """(self ms, cumulative ms, module) of the imports with the highest self time."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(own) / 1000, int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="Slowest imports to list")
+    parser.add_argument('--budget-ms', type=float, default=2500, help="Cold load plus first request")
+    parser.add_argument('--warm-budget-ms', type=float, default=250, help="First request after warm-up")
+    args = parser.parse_args()
+
+    failures = []
+    medians = {}
+    print(f"{'mode':>8} {'load ms':>9} {'first request ms':>17} {'total ms':>9}")
+    for mode, warm_up in (('cold', False), ('warm', True)):
+        runs = [probe(warm_up)[0] for _ in range(args.runs)]
+        load = statistics.median(run['load_ms'] for run in runs)
+        first = statistics.median(run['first_request_ms'] for run in runs)
+        medians[mode] = (load, first)
+        print(f"{mode:>8} {load:9.0f} {first:17.0f} {load + first:9.0f}")
+        if any(run['status'] != '200 OK' for run in runs):
+            failures.append(f"{mode} first request returned {runs[0]['status']}")
+        if not warm_up:
+            lazy = sorted({name for run in runs for name in run['lazy_loaded']})
+            if lazy:
+                failures.append(f"a page without warm-up imported {', '.join(lazy)}")
+            if any(run['client_created'] for run in runs):
+                failures.append("the Gemini client was created before first use")
+
+    print(f"\nslowest imports on a cold start ({'self':>6} / {'total':>6} ms):")
+    for own, cumulative, name in top_imports(probe(False, importtime=True)[1], args.top):
+        print(f"  {name:<40} {own:6.0f} / {cumulative:6.0f}")
+
+    cold_total = sum(medians['cold'])
+    if cold_total > args.budget_ms:
+        failures.append(f"cold start took {cold_total:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    if medians['warm'][1] > args.warm_budget_ms:
+        failures.append(
+            f"first request after warm-up took {medians['warm'][1]:.0f} ms, over the {args.warm_budget_ms:.0f} ms budget"
+        )
+    if failures:
+        print("\n" + "\n".join(f"FAIL: {failure}" for failure in failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
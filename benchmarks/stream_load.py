@@ -0,0 +1,117 @@
+"""
+Load benchmark comparing sync and async streaming concurrency.
+
+Runs N concurrent streamed chat turns against a local fake Gemini server, once
+through ``GeminiChatSession`` on a fixed pool of threads (standing in for
+gunicorn sync workers, each pinned for a whole turn) and once through
+``AsyncGeminiChatSession`` on a single event loop. Reports wall time,
+time-to-first-chunk and turn latency percentiles for both.
+
+    python -m benchmarks.stream_load --clients 200 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+
+from chat.services import gemini  # noqa: E402
+from benchmarks.fake_gemini import FakeGeminiServer  # noqa: E402
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _report(label: str, wall: float, first_chunk: list[float], latency: list[float]) -> dict:
+    result = {
+        "mode": label,
+        "clients": len(latency),
+        "wall_s": wall,
+        "ttfc_p50_s": _percentile(first_chunk, 50),
+        "ttfc_p95_s": _percentile(first_chunk, 95),
+        "latency_p50_s": _percentile(latency, 50),
+        "latency_p95_s": _percentile(latency, 95),
+        "turns_per_s": len(latency) / wall,
+    }
+    print(
+        f"{label:>5}: {result['clients']} turns in {wall:6.2f}s "
+        f"({result['turns_per_s']:7.1f} turns/s) | "
+        f"first chunk p50 {result['ttfc_p50_s']:.3f}s p95 {result['ttfc_p95_s']:.3f}s | "
+        f"turn p50 {result['latency_p50_s']:.3f}s p95 {result['latency_p95_s']:.3f}s"
+    )
+    return result
+
+
+def run_sync(clients: int, workers: int) -> dict:
+    start = time.perf_counter()
+
+    def turn():
+        session = gemini.GeminiChatSession(system_prompt="benchmark")
+        first = None
+        for chunk in session.send_message_stream("hello"):
+            if chunk["type"] == "error":
+                raise RuntimeError(chunk["content"])
+            if first is None:
+                first = time.perf_counter() - start
+        return first, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda _: turn(), range(clients)))
+    wall = time.perf_counter() - start
+    return _report("sync", wall, [r[0] for r in results], [r[1] for r in results])
+
+
+async def _run_async(clients: int) -> dict:
+    start = time.perf_counter()
+
+    async def turn():
+        session = gemini.AsyncGeminiChatSession(system_prompt="benchmark")
+        first = None
+        async for chunk in session.send_message_stream("hello"):
+            if chunk["type"] == "error":
+                raise RuntimeError(chunk["content"])
+            if first is None:
+                first = time.perf_counter() - start
+        return first, time.perf_counter() - start
+
+    results = await asyncio.gather(*(turn() for _ in range(clients)))
+    wall = time.perf_counter() - start
+    return _report("async", wall, [r[0] for r in results], [r[1] for r in results])
+
+
+def run_async(clients: int) -> dict:
+    return asyncio.run(_run_async(clients))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200, help="concurrent streamed turns")
+    parser.add_argument("--workers", type=int, default=4, help="sync worker threads (gunicorn sync workers)")
+    parser.add_argument("--chunks", type=int, default=10, help="chunks per streamed turn")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between chunks")
+    parser.add_argument("--first-chunk-delay", type=float, default=0.2, help="seconds before the first chunk")
+    parser.add_argument("--skip-sync", action="store_true", help="only run the async path")
+    args = parser.parse_args()
+
+    with FakeGeminiServer(
+        chunks=args.chunks, chunk_delay=args.chunk_delay, first_chunk_delay=args.first_chunk_delay
+    ) as server:
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        gemini.client = server.client(client_args={"limits": limits}, async_client_args={"limits": limits})
+        ideal = args.first_chunk_delay + args.chunk_delay * (args.chunks - 1)
+        print(f"{args.clients} clients, ideal turn latency {ideal:.2f}s")
+        results = [] if args.skip_sync else [run_sync(args.clients, args.workers)]
+        results.append(run_async(args.clients))
+    if len(results) == 2:
+        print(f"async/sync throughput: {results[1]['turns_per_s'] / results[0]['turns_per_s']:.1f}x")
+        print(f"async turn latency p50 {results[1]['latency_p50_s']:.3f}s vs ideal {ideal:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
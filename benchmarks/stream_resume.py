@@ -0,0 +1,130 @@
+"""
+Resuming a chat stream after its connection drops, against asking again.
+
+Serves the stream view with ``MODEL_BACKEND=replay``, replaying
+``benchmarks/browser/long_transcript.json`` sped up by ``--speed``. For each
+of ``--drop-after`` seconds into a turn, the client's connection is closed,
+and after ``--blip`` seconds it reconnects with ``Last-Event-ID``. Reports
+the events the reconnect was sent (those missed during the blip from the
+turn's buffer, then the rest live), the time from the reconnect to its
+first event, when the answer was complete, and what asking again after
+the blip would have cost (the blip plus a whole new turn). Each resumed
+answer is checked against an uninterrupted one, and the conversation must
+hold a single turn: the model was only asked once.
+
+    python -m benchmarks.stream_resume --speed 4 --drop-after 0.5 2 --blip 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eda_project.settings.development')
+os.environ['MODEL_BACKEND'] = 'replay'
+os.environ['METRICS_ENABLED'] = 'false'
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import Client  # noqa: E402
+
+from chat import views  # noqa: E402
+
+
+class Reader:
+    """Parses SSE frames as the browser does, keeping the answer's text and the last event ID."""
+
+    def __init__(self):
+        self.text = ''
+        self.last_event_id = None
+        self.events = 0
+        self.done = False
+
+    def feed(self, frame: bytes) -> None:
+        for event in frame.decode().split('\n\n'):
+            data = None
+            for line in event.split('\n'):
+                if line.startswith('data: '):
+                    data = json.loads(line[6:])
+                elif line.startswith('id: '):
+                    self.last_event_id = line[4:]
+            if data is None:
+                continue
+            self.events += 1
+            if data['type'] == 'text':
+                self.text += data['content']
+            self.done = self.done or data['type'] == 'done'
+
+
+def full_turn() -> tuple:
+    """An uninterrupted turn: (seconds, text)."""
+    reader = Reader()
+    start = time.perf_counter()
+    for frame in Client().post('/api/chat/stream/', {'message': 'Summarize this data'}).streaming_content:
+        reader.feed(frame)
+    return time.perf_counter() - start, reader.text
+
+
+def resumed_turn(drop_after: float, blip: float) -> dict:
+    client = Client()
+    reader = Reader()
+    start = time.perf_counter()
+    response = client.post('/api/chat/stream/', {'message': 'Summarize this data'})
+    for frame in response.streaming_content:
+        reader.feed(frame)
+        if time.perf_counter() - start >= drop_after:
+            break
+    # The turn runs on without a client, into its buffer
+    response.close()
+    time.sleep(blip)
+
+    before = reader.events
+    reconnected = time.perf_counter()
+    first = None
+    response = client.post('/api/chat/stream/', HTTP_LAST_EVENT_ID=reader.last_event_id)
+    for frame in response.streaming_content:
+        first = first or time.perf_counter() - reconnected
+        reader.feed(frame)
+    complete = time.perf_counter() - start
+    session = views.chat_sessions.get(client.session[views.CHAT_SESSION_KEY])
+    return {
+        'text': reader.text,
+        'done': reader.done,
+        'first_ms': first * 1000,
+        'complete': complete,
+        'resumed_events': reader.events - before,
+        'turns': sum(1 for content in session.get_history() if content.role == 'user'),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--speed', type=float, default=4.0)
+    parser.add_argument('--drop-after', type=float, nargs='+', default=[0.5, 2.0])
+    parser.add_argument('--blip', type=float, default=0.5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    views.model_backend.speed = args.speed
+
+    full_seconds, full_text = full_turn()
+    print(f"full turn: {full_seconds:.2f} s")
+    print(
+        f"{'drop s':>7} {'blip s':>7} {'resumed events':>15} {'first ms':>9} {'complete s':>11} "
+        f"{'ask again s':>12} {'same text':>10} {'model turns':>12}"
+    )
+    for drop_after in args.drop_after:
+        result = resumed_turn(drop_after, args.blip)
+        if not result['done']:
+            raise RuntimeError("The resumed stream did not finish")
+        print(
+            f"{drop_after:7.2f} {args.blip:7.2f} {result['resumed_events']:15} {result['first_ms']:9.1f} "
+            f"{result['complete']:11.2f} {drop_after + args.blip + full_seconds:12.2f} "
+            f"{str(result['text'] == full_text):>10} {result['turns']:12}"
+        )
+
+
+if __name__ == '__main__':
+    main()
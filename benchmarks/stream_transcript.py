@@ -0,0 +1,173 @@
+"""
+Record or synthesize a chat stream transcript for the browser rendering benchmark.
+
+A transcript is the list of SSE events a bot reply produced, each with its
+arrival time in milliseconds. ``benchmarks/browser/stream_render.html`` replays
+it through the streaming renderer.
+
+    # Record a reply from a running server (optionally uploading a dataset first)
+    python -m benchmarks.stream_transcript --url http://localhost:8000 \\
+        --upload "static/demo/CONED Natural Gas Data.csv" --out benchmarks/browser/long_transcript.json
+
+    # Regenerate the synthetic long transcript shipped with the benchmark
+    python -m benchmarks.stream_transcript --synthetic --out benchmarks/browser/long_transcript.json
+"""
+import argparse
+import base64
+import http.cookiejar
+import json
+import os
+import random
+import struct
+import time
+import urllib.parse
+import urllib.request
+import uuid
+import zlib
+
+DEFAULT_MESSAGE = "Please analyze this file and provide a summary of the data."
+
+
+def record(url: str, message: str, upload: str | None = None) -> list:
+    """Send ``message`` to a running server's stream endpoint and record every SSE event."""
+    cookies = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+    opener.open(f"{url}/chat/").read()
+    csrf_token = next(cookie.value for cookie in cookies if cookie.name == 'csrftoken')
+
+    if upload:
+        boundary = uuid.uuid4().hex
+        with open(upload, 'rb') as f:
+            content = f.read()
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="csrfmiddlewaretoken"\r\n\r\n{csrf_token}\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{os.path.basename(upload)}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+        request = urllib.request.Request(
+            f"{url}/api/chat/upload/",
+            data=body,
+            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        )
+        print(json.loads(opener.open(request).read()))
+
+    data = urllib.parse.urlencode({'message': message, 'csrfmiddlewaretoken': csrf_token}).encode()
+    events = []
+    start = time.perf_counter()
+    with opener.open(urllib.request.Request(f"{url}/api/chat/stream/", data=data)) as response:
+        for line in response:
+            line = line.decode().rstrip('\n')
+            if line.startswith('data: '):
+                events.append({"t": round((time.perf_counter() - start) * 1000, 1), "event": json.loads(line[6:])})
+    return events
+
+
+def _png(width: int, height: int, seed: int) -> str:
+    """A small solid-colour PNG, base64 encoded like the images in the stream."""
+    rng = random.Random(seed)
+    pixel = bytes(rng.randrange(256) for _ in range(3))
+    raw = b''.join(b'\x00' + pixel * width for _ in range(height))
+
+    def chunk(kind: bytes, payload: bytes) -> bytes:
+        return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+    png = (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw))
+        + chunk(b'IEND', b'')
+    )
+    return base64.b64encode(png).decode()
+
+
+def _section(rng: random.Random, i: int) -> str:
+    """One markdown section in the style of the agent's analysis write-ups."""
+    column = rng.choice(['consumption', 'temperature', 'price', 'usage_therms', 'customers'])
+    mean, std = rng.uniform(10, 500), rng.uniform(1, 80)
+    lines = [
+        f"## {i}. Distribution of `{column}`",
+        "",
+        f"The `{column}` column has a mean of **{mean:.2f}** and a standard deviation of {std:.2f}. "
+        f"Assuming approximate normality, about 95% of values fall within $\\mu \\pm 1.96\\sigma$, "
+        f"i.e. between {mean - 1.96 * std:.1f} and {mean + 1.96 * std:.1f}. "
+        "Values outside this band are candidates for closer inspection rather than automatic removal.",
+        "",
+        "$$z_i = \\frac{x_i - \\bar{x}}{s}$$",
+        "",
+        "Key observations:",
+        "",
+    ]
+    lines += [f"- Observation {j + 1}: the {rng.choice(['upper', 'lower'])} tail of `{column}` "
+              f"contains {rng.randint(1, 300)} rows with $|z| > {rng.choice([2, 2.5, 3])}$" for j in range(4)]
+    lines += ["", "| Statistic | Value |", "|---|---|"]
+    lines += [f"| {name} | {rng.uniform(0, 1000):.3f} |" for name in ['min', 'p25', 'median', 'p75', 'max']]
+    lines += [
+        "",
+        "```python",
+        f"df['{column}_z'] = (df['{column}'] - df['{column}'].mean()) / df['{column}'].std()",
+        f"outliers = df[df['{column}_z'].abs() > 3]",
+        "```",
+        "",
+        f"Overall, `{column}` is {rng.choice(['right-skewed', 'roughly symmetric', 'bimodal'])}, "
+        "which should be kept in mind when choosing a model or transformation.",
+        "",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def synthesize(sections: int = 80, seed: int = 0, interval_ms: float = 25) -> list:
+    """
+    Build a long reply that interleaves streamed markdown (headings, lists, tables,
+    inline and display LaTeX, fenced code) with code, result and image events.
+    """
+    rng = random.Random(seed)
+    events = []
+    t = 0.0
+
+    def emit(event: dict) -> None:
+        nonlocal t
+        t += rng.uniform(0.5, 1.5) * interval_ms
+        events.append({"t": round(t, 1), "event": event})
+
+    for i in range(1, sections + 1):
+        text = _section(rng, i)
+        pos = 0
+        while pos < len(text):
+            size = rng.randint(20, 160)
+            emit({"type": "text", "content": text[pos:pos + size]})
+            pos += size
+        if i % 4 == 0:
+            emit({"type": "code", "content": "import matplotlib.pyplot as plt\n"
+                                             f"df.hist(bins=50)\nplt.savefig('section_{i}.png')\nprint(df.describe())"})
+            emit({"type": "result", "content": "\n".join(
+                f"{name:<8}" + "".join(f"{rng.uniform(0, 1000):>12.3f}" for _ in range(4))
+                for name in ['count', 'mean', 'std', 'min', 'max'])})
+            emit({"type": "image", "content": _png(320, 240, i)})
+    emit({"type": "done"})
+    return events
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--url', help="Base URL of a running server to record from")
+    source.add_argument('--synthetic', action='store_true', help="Generate a synthetic transcript")
+    parser.add_argument('--message', default=DEFAULT_MESSAGE)
+    parser.add_argument('--upload', help="Dataset to upload before sending the message")
+    parser.add_argument('--sections', type=int, default=80, help="Markdown sections in a synthetic transcript")
+    parser.add_argument('--out', default=os.path.join('benchmarks', 'browser', 'long_transcript.json'))
+    args = parser.parse_args()
+
+    if args.synthetic:
+        events = synthesize(args.sections)
+    else:
+        events = record(args.url.rstrip('/'), args.message, args.upload)
+    with open(args.out, 'w') as f:
+        json.dump(events, f)
+    text = sum(len(e["event"].get("content", "")) for e in events if e["event"]["type"] == "text")
+    print(f"Wrote {len(events)} events ({text:,} chars of text) to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
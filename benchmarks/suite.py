@@ -0,0 +1,227 @@
+"""
+Offline benchmark suite with stored baselines.
+
+Runs the app end to end without network access or an API key: the views are
+served with ``MODEL_BACKEND=replay``, so every chat turn replays the recorded
+stream in ``benchmarks/browser/long_transcript.json`` (text, code, results
+and plots). The cases are:
+
+* conversion: streaming CSV conversion throughput (MB/s)
+* sse: SSE events per second from the stream view with instant replay, every
+  text delta in its own frame (no coalescing window)
+* e2e: upload then a streamed turn for N concurrent clients at a sped-up
+  recorded pace (time to first event and turn latency percentiles)
+* memory: Python heap held per chat session after a few turns
+
+Results are compared with ``benchmarks/baselines.json`` and the run fails
+when any metric is worse than its baseline by more than ``--threshold``.
+Baselines are specific to the machine they were recorded on; re-record them
+with ``--update-baseline`` on the machine that runs the comparison.
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --cases sse e2e --clients 64
+    python -m benchmarks.suite --update-baseline
+"""
+import argparse
+import atexit
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eda_project.settings.development')
+os.environ['MODEL_BACKEND'] = 'replay'
+os.environ['METRICS_ENABLED'] = 'false'
+# Stores of the run's own, so earlier runs' sessions and datasets don't weigh on this one
+_data = tempfile.mkdtemp(prefix='eda-bench-')
+atexit.register(shutil.rmtree, _data, True)
+os.environ['CHAT_SESSION_STORE_PATH'] = os.path.join(_data, 'sessions.sqlite3')
+for name in ('DATASET_STORE_DIR', 'IMAGE_STORE_DIR', 'CHUNKED_UPLOAD_DIR', 'RESPONSE_CACHE_DIR'):
+    os.environ[name] = os.path.join(_data, name.lower())
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import Client, override_settings  # noqa: E402
+
+from benchmarks.conversion import generate  # noqa: E402
+from chat import views  # noqa: E402
+from chat.services.conversion import convert_to_csv_stream  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+CASES = ('conversion', 'sse', 'e2e', 'memory')
+
+# Whether a larger value of each metric is an improvement or a regression
+HIGHER_IS_BETTER = {'conversion_mb_per_s', 'sse_events_per_s'}
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _dataset(rows: int = 2000) -> bytes:
+    lines = ["id,city,value"] + [f"{i},city_{i % 37},{i * 0.25}" for i in range(rows)]
+    return "\n".join(lines).encode()
+
+
+def _stream_turn(client: Client, message: str) -> tuple:
+    """POST a message to the stream view and read every event: (seconds to first event, seconds, events)."""
+    start = time.perf_counter()
+    response = client.post('/api/chat/stream/', {'message': message})
+    first = None
+    events = 0
+    for frame in response.streaming_content:
+        first = first or time.perf_counter() - start
+        events += frame.count(b'\n\n')
+        if b'"type": "error"' in frame:
+            raise RuntimeError(frame.decode())
+    return first, time.perf_counter() - start, events
+
+
+def _upload(client: Client, data: bytes) -> None:
+    upload = io.BytesIO(data)
+    upload.name = 'data.csv'
+    response = client.post('/api/chat/upload/', {'file': upload})
+    if response.status_code != 200:
+        raise RuntimeError(response.content.decode())
+
+
+def bench_conversion(args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'input.csv')
+        generate(path, 'csv', args.conversion_mb * 1024 * 1024)
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        with open(path, 'rb') as source, open(os.path.join(directory, 'output.csv'), 'w+b') as target:
+            convert_to_csv_stream(source, 'input.csv', target)
+        elapsed = time.perf_counter() - start
+    return {'conversion_mb_per_s': size / 1024 / 1024 / elapsed}
+
+
+def bench_sse(args) -> dict:
+    views.model_backend.speed = 0
+    client = Client()
+    events = 0
+    start = time.perf_counter()
+    # Coalescing would merge most of an instant replay into a few frames; count one per model chunk
+    with override_settings(SSE_FLUSH_WINDOW=0, SSE_HEARTBEAT_INTERVAL=0):
+        for i in range(args.sse_turns):
+            events += _stream_turn(client, f"Question {i}")[2]
+    return {'sse_events_per_s': events / (time.perf_counter() - start)}
+
+
+def bench_e2e(args) -> dict:
+    views.model_backend.speed = args.replay_speed
+    data = _dataset()
+
+    def client_turn(_) -> tuple:
+        client = Client()
+        _upload(client, data)
+        first, elapsed, _ = _stream_turn(client, "Summarize this data")
+        return first, elapsed
+
+    with ThreadPoolExecutor(args.clients) as pool:
+        results = list(pool.map(client_turn, range(args.clients)))
+    first = [r[0] for r in results]
+    turns = [r[1] for r in results]
+    return {
+        'e2e_first_event_p50_ms': _percentile(first, 50) * 1000,
+        'e2e_first_event_p95_ms': _percentile(first, 95) * 1000,
+        'e2e_turn_p50_ms': _percentile(turns, 50) * 1000,
+        'e2e_turn_p95_ms': _percentile(turns, 95) * 1000,
+    }
+
+
+def bench_memory(args) -> dict:
+    views.model_backend.speed = 0
+    data = _dataset()
+    clients = [Client() for _ in range(args.memory_sessions + 1)]
+    # The first session pays for lazy imports and shared caches, which later sessions don't add to
+    warmup = clients.pop()
+    _upload(warmup, data)
+    _stream_turn(warmup, "Warm up")
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for client in clients:
+        _upload(client, data)
+        for i in range(args.memory_turns):
+            _stream_turn(client, f"Question {i}")
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {'memory_kb_per_session': held / 1024 / len(clients)}
+
+
+BENCHMARKS = {
+    'conversion': bench_conversion,
+    'sse': bench_sse,
+    'e2e': bench_e2e,
+    'memory': bench_memory,
+}
+
+
+def compare(results: dict, baselines: dict, threshold: float) -> list:
+    """Print each metric against its baseline; returns the names of metrics that regressed."""
+    regressions = []
+    print(f"{'metric':>26} {'value':>10} {'baseline':>10} {'change':>8}")
+    for name, value in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            print(f"{name:>26} {value:10.1f} {'-':>10} {'-':>8}")
+            continue
+        change = value / baseline - 1
+        worse = -change if name in HIGHER_IS_BETTER else change
+        flag = ''
+        if worse > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:>26} {value:10.1f} {baseline:10.1f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES))
+    parser.add_argument('--conversion-mb', type=int, default=32)
+    parser.add_argument('--sse-turns', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=32, help="Concurrent clients in the e2e case")
+    parser.add_argument('--replay-speed', type=float, default=20.0, help="Recorded pace multiplier in the e2e case")
+    parser.add_argument('--memory-sessions', type=int, default=20)
+    parser.add_argument('--memory-turns', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed regression against the baseline")
+    parser.add_argument('--baselines', default=BASELINES)
+    parser.add_argument('--update-baseline', action='store_true', help="Record this run's results as the baselines")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    results = {}
+    for case in args.cases:
+        results.update(BENCHMARKS[case](args))
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    if args.update_baseline:
+        baselines.update({name: round(value, 1) for name, value in results.items()})
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baselines written to {args.baselines}")
+
+    regressions = compare(results, baselines, args.threshold)
+    if regressions:
+        print(f"Regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
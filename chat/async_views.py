@@ -0,0 +1,216 @@
+"""
+Async versions of the chat API views, used when the app is served over ASGI.
+
+Each streamed turn is a task on the event loop rather than a blocked worker
+thread, so one process can hold many concurrent SSE streams; its response
+follows the turn's event buffer.
+The page, history and error views are shared with the sync views module.
+"""
+import asyncio
+import functools
+import logging
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, HttpRequest, StreamingHttpResponse
+from django.shortcuts import render
+from django.views.decorators.http import require_http_methods
+
+from .services import metrics
+from .services.chunked_upload import UploadError
+from .services.session_files import sandbox_names
+from .services.turn_buffer import ResumeError, turn_id_of
+from .views import (
+    chat_sessions, chunked_uploads, _log_trace, _open_chunked_uploads, _render_bot_response, _session_key,
+    _sse_writer, _uploaded_response,
+)
+from .utils.sse import format_sse, sse_response
+
+logger = logging.getLogger(__name__)
+
+# Streamed turns running on the event loop, referenced until they finish
+_running_turns = set()
+
+
+@require_http_methods(["POST"])
+async def get_chat_response(request: HttpRequest) -> HttpResponse:
+    message = request.POST.get('message')
+    if not message:
+        return HttpResponse("No message provided", status=400)
+
+    key = _session_key(request)
+
+    logger.debug(f"User message: {message}")
+
+    async with chat_sessions.asession(key) as session:
+        # Attach the uploaded files this message is about (the code execution sandbox needs them each turn)
+        files = session.select_files(message)
+        if files:
+            bot_response = await session.send_message_with_files(message, files)
+        else:
+            bot_response = await session.send_message(message)
+        await chat_sessions.asave(key)
+
+    bot_response_html = _render_bot_response(session, bot_response, sandbox_names(files))
+    _log_trace(session)
+
+    return render(request, 'chat/bot_message.html', {
+        'bot_response_html': bot_response_html,
+    })
+
+
+@require_http_methods(["POST"])
+async def stream_chat_response(request: HttpRequest) -> StreamingHttpResponse:
+    """
+    Stream chat responses using Server-Sent Events (SSE) from the event loop.
+    With a Last-Event-ID header, resume the latest turn's stream after that event instead.
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        return await _resume_stream(request, last_event_id)
+
+    message = request.POST.get('message')
+    if not message:
+        async def error_stream():
+            yield format_sse({'type': 'error', 'content': 'No message provided'})
+            yield format_sse({'type': 'done'})
+        return sse_response(error_stream())
+
+    key = _session_key(request)
+    writer = _sse_writer(request)
+    # Events are recorded with IDs, so a client whose connection drops can resume the stream
+    buffer = await asyncio.to_thread(chat_sessions.open_turn_buffer, key)
+    grace = settings.SSE_RESUME_GRACE
+
+    logger.debug(f"Streaming user message: {message}")
+
+    async def run_turn():
+        try:
+            # Hold this user's session for the whole turn so overlapping messages can't interleave history
+            async with chat_sessions.asession(key) as session:
+                await stream_turn(session)
+        except Exception as e:
+            # The session couldn't be loaded or saved; a turn that started has already finished its buffer
+            logger.error(f"Streaming error: {str(e)}")
+            if not buffer.finished:
+                buffer.append({'type': 'error', 'content': str(e)})
+                buffer.append({'type': 'done'})
+                buffer.finish()
+
+    async def stream_turn(session):
+        start = time.perf_counter()
+        # Stopped by api/chat/cancel/, or when no client has followed the stream for SSE_RESUME_GRACE seconds
+        cancellation = chat_sessions.begin_turn(key)
+        try:
+            # Attach the uploaded files this message is about (the code execution sandbox needs them each turn)
+            files = session.select_files(message)
+            # The writer replaces input_file_0.csv, ... with the actual filenames in content
+            writer.file_names = buffer.file_names = sandbox_names(files)
+            if files:
+                stream = session.send_message_with_files_stream(message, files, cancellation)
+            else:
+                stream = session.send_message_stream(message, cancellation)
+
+            async for chunk in stream:
+                buffer.append(chunk)
+                if buffer.abandoned(grace):
+                    cancellation.cancel('disconnect')
+            if cancellation.reason is not None:
+                buffer.append({'type': 'cancelled'})
+
+            # Signal completion
+            buffer.append({'type': 'done'})
+
+        except Exception as e:
+            logger.error(f"Streaming error: {str(e)}")
+            buffer.append({'type': 'error', 'content': str(e)})
+            buffer.append({'type': 'done'})
+        finally:
+            buffer.finish()
+            chat_sessions.end_turn(key, cancellation)
+            await chat_sessions.asave(key)
+            metrics.observe('sse_turn', time.perf_counter() - start, session.last_trace)
+            _log_trace(session)
+
+    # The turn runs as a task of its own and the response follows its buffer, so a client
+    # going away (which cancels the response) leaves the turn running for a reconnect
+    events = buffer.afollow(on_end=functools.partial(chat_sessions.release_turn_buffer, key, buffer))
+    task = asyncio.ensure_future(run_turn())
+    _running_turns.add(task)
+    task.add_done_callback(_running_turns.discard)
+    return writer.response(events)
+
+
+async def _resume_stream(request: HttpRequest, last_event_id: str) -> StreamingHttpResponse:
+    """Async version of views._resume_stream."""
+    key = _session_key(request)
+    buffer = await asyncio.to_thread(chat_sessions.turn_buffer, key, turn_id_of(last_event_id))
+    writer = _sse_writer(request)
+    try:
+        if buffer is None:
+            raise ResumeError("The response is no longer available to resume")
+        events = buffer.afollow(last_event_id, functools.partial(chat_sessions.release_turn_buffer, key, buffer))
+    except ResumeError as e:
+        logger.info(f"Could not resume stream: {e}")
+        error = str(e)
+
+        async def error_stream():
+            yield {'type': 'error', 'content': error}
+            yield {'type': 'done'}
+        return writer.response(error_stream())
+    writer.file_names = buffer.file_names
+    return writer.response(events)
+
+
+@require_http_methods(["POST"])
+async def upload_file(request: HttpRequest) -> HttpResponse:
+    """Async version of views.upload_file."""
+    try:
+        files = request.FILES.getlist('file')
+        if not files:
+            return JsonResponse({"error": "No file provided"}, status=400)
+
+        key = _session_key(request)
+
+        metrics.BYTES.inc(sum(file.size for file in files), kind='upload')
+        async with chat_sessions.asession(key) as session:
+            await session.upload_files([(file.file, file.name) for file in files])
+            await chat_sessions.asave(key)
+        _log_trace(session)
+
+        return _uploaded_response(session, [file.name for file in files])
+    except Exception as e:
+        logger.error(f"Error uploading file: {e}")
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+@require_http_methods(["POST"])
+async def complete_chunked_upload(request: HttpRequest, upload_id: str) -> JsonResponse:
+    """Async version of views.complete_chunked_upload."""
+    return await _complete_chunked_uploads(request, [upload_id])
+
+
+@require_http_methods(["POST"])
+async def complete_chunked_uploads(request: HttpRequest) -> JsonResponse:
+    """Async version of views.complete_chunked_uploads."""
+    return await _complete_chunked_uploads(request, request.POST.getlist('upload_id'))
+
+
+async def _complete_chunked_uploads(request: HttpRequest, upload_ids: list[str]) -> JsonResponse:
+    key = _session_key(request)
+    with ExitStack() as stack:
+        try:
+            opened = _open_chunked_uploads(key, upload_ids, stack)
+        except UploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        try:
+            async with chat_sessions.asession(key) as session:
+                await session.upload_files([(file, upload.filename) for upload, file in opened])
+                await chat_sessions.asave(key)
+        except Exception as e:
+            logger.error(f"Error uploading file: {e}")
+            return JsonResponse({"error": str(e)}, status=400)
+    for upload, _ in opened:
+        chunked_uploads.remove(upload)
+    _log_trace(session)
+    return _uploaded_response(session, [upload.filename for upload, _ in opened])
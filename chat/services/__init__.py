@@ -1,3 +1,15 @@
-from .gemini import GeminiChatSession
+from importlib import import_module
 
-__all__ = ['GeminiChatSession']
+# Loaded on first access, so importing a light submodule (conversion, metrics) doesn't pull in google-genai
+_EXPORTS = {
+    'GeminiChatSession': '.gemini',
+    'SessionRegistry': '.registry',
+}
+
+__all__ = ['GeminiChatSession', 'SessionRegistry']
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
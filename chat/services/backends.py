@@ -0,0 +1,243 @@
+import asyncio
+import base64
+import datetime
+import itertools
+import json
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, BinaryIO, Iterator, List, Optional, Tuple
+
+from google.genai import types
+
+from .conversion import CHUNK_SIZE
+from .history import estimate_tokens
+
+# Stand-in for plots recorded by digest only (1x1 transparent PNG)
+PLACEHOLDER_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+# A recorded turn: (seconds since the request, response part) in stream order
+RecordedTurn = List[Tuple[float, types.Part]]
+
+
+class ModelBackend(ABC):
+    """
+    Where a GeminiChatSession sends its model calls and file uploads.
+
+    Chats returned by ``create_chat`` behave like ``google.genai`` chats:
+    ``send_message``, ``send_message_stream`` and ``get_history(curated=...)``,
+    recording a turn in the history once its response is complete. Async
+    chats are the same with coroutine methods, like ``client.aio.chats``.
+    """
+
+    @abstractmethod
+    def create_chat(self, model: str, config: types.GenerateContentConfig, history: Optional[List[types.Content]] = None) -> Any:
+        ...
+
+    @abstractmethod
+    def create_async_chat(self, model: str, config: types.GenerateContentConfig, history: Optional[List[types.Content]] = None) -> Any:
+        ...
+
+    @abstractmethod
+    def upload_file(self, file: BinaryIO, config: types.UploadFileConfig) -> types.File:
+        ...
+
+
+def _event_part(event: dict) -> Optional[types.Part]:
+    """Rebuild the response part a recorded SSE event came from."""
+    kind = event.get("type")
+    if kind == "text":
+        return types.Part(text=event["content"])
+    if kind == "code":
+        return types.Part(executable_code=types.ExecutableCode(code=event["content"], language="PYTHON"))
+    if kind == "result":
+        return types.Part(code_execution_result=types.CodeExecutionResult(outcome="OUTCOME_OK", output=event["content"]))
+    if kind == "image":
+        data = base64.b64decode(event["content"]) if event.get("content") else PLACEHOLDER_PNG
+        return types.Part(inline_data=types.Blob(data=data, mime_type="image/png"))
+    return None
+
+
+def load_transcript(path: str) -> List[RecordedTurn]:
+    """
+    Load the turns of a transcript recorded by ``benchmarks/stream_transcript.py``:
+    a JSON list of SSE events with arrival times in milliseconds, turns ending at 'done' events.
+    """
+    with open(path) as f:
+        events = json.load(f)
+    turns: List[RecordedTurn] = []
+    current: RecordedTurn = []
+    start = 0.0
+    for entry in events:
+        event = entry["event"]
+        if event.get("type") == "done":
+            if current:
+                turns.append(current)
+            current = []
+            start = entry["t"]
+            continue
+        part = _event_part(event)
+        if part is not None:
+            current.append(((entry["t"] - start) / 1000, part))
+    if current:
+        turns.append(current)
+    if not turns:
+        raise ValueError(f"No turns recorded in {path}")
+    return turns
+
+
+def _user_content(message: Any) -> types.Content:
+    messages = message if isinstance(message, list) else [message]
+    return types.Content(role="user", parts=[
+        types.Part.from_text(text=m) if isinstance(m, str) else m for m in messages
+    ])
+
+
+class ReplayBackend(ModelBackend):
+    """
+    Offline backend that answers every message by replaying a recorded turn.
+
+    Turns are used in rotation. Timing follows the recording, divided by
+    ``speed`` (0 replays without waiting), unless ``first_chunk_delay`` and
+    ``chunk_delay`` fix it. Uploads read the whole file and return a local
+    handle. Responses carry rough token counts so usage metrics move too.
+    """
+
+    def __init__(
+        self,
+        turns: List[RecordedTurn],
+        speed: float = 1.0,
+        first_chunk_delay: Optional[float] = None,
+        chunk_delay: Optional[float] = None,
+    ):
+        if not turns:
+            raise ValueError("ReplayBackend needs at least one recorded turn")
+        self.turns = turns
+        self.speed = speed
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.uploads = 0
+        self._rotation = itertools.cycle(turns)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_transcript(cls, path: str, **kwargs) -> "ReplayBackend":
+        return cls(load_transcript(path), **kwargs)
+
+    def next_turn(self) -> RecordedTurn:
+        with self._lock:
+            return next(self._rotation)
+
+    def schedule(self, turn: RecordedTurn) -> Iterator[Tuple[float, types.Part]]:
+        """Yield (delay before the chunk, part) for each part of a turn."""
+        previous = 0.0
+        for i, (offset, part) in enumerate(turn):
+            if self.first_chunk_delay is not None and i == 0:
+                delay = self.first_chunk_delay
+            elif self.chunk_delay is not None and i > 0:
+                delay = self.chunk_delay
+            else:
+                delay = (offset - previous) / self.speed if self.speed > 0 else 0.0
+            previous = offset
+            yield max(delay, 0.0), part
+
+    def create_chat(self, model, config, history=None) -> "ReplayChat":
+        return ReplayChat(self, history)
+
+    def create_async_chat(self, model, config, history=None) -> "AsyncReplayChat":
+        return AsyncReplayChat(self, history)
+
+    def upload_file(self, file: BinaryIO, config: types.UploadFileConfig) -> types.File:
+        size = 0
+        while chunk := file.read(CHUNK_SIZE):
+            size += len(chunk)
+        self.uploads += 1
+        file_id = uuid.uuid4().hex
+        return types.File(
+            name=f"files/{file_id}",
+            uri=f"replay://files/{file_id}",
+            mime_type=config.mime_type,
+            display_name=config.display_name,
+            size_bytes=size,
+            expiration_time=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48),
+        )
+
+
+class ReplayChat:
+    """Chat on a ReplayBackend, with the ``google.genai`` sync chat interface."""
+
+    def __init__(self, backend: ReplayBackend, history: Optional[List[types.Content]] = None):
+        self.backend = backend
+        self._history: List[types.Content] = list(history or [])
+
+    def get_history(self, curated: bool = False) -> List[types.Content]:
+        return list(self._history)
+
+    def _response(self, parts: List[types.Part], user: types.Content, turn: Optional[List[types.Part]] = None) -> types.GenerateContentResponse:
+        """A response carrying ``parts``; ``turn`` (every part of the reply) marks it the last one."""
+        usage = None
+        if turn is not None:
+            usage = types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=sum(estimate_tokens(content) for content in [*self._history, user]),
+                candidates_token_count=estimate_tokens(types.Content(role="model", parts=turn)),
+            )
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(
+                content=types.Content(role="model", parts=parts),
+                finish_reason=types.FinishReason.STOP if turn is not None else None,
+            )],
+            usage_metadata=usage,
+        )
+
+    def _record(self, user: types.Content, parts: List[types.Part]) -> None:
+        self._history += [user, types.Content(role="model", parts=parts)]
+
+    def send_message_stream(self, message: Any) -> Iterator[types.GenerateContentResponse]:
+        user = _user_content(message)
+        turn = self.backend.next_turn()
+        parts = []
+        for i, (delay, part) in enumerate(self.backend.schedule(turn)):
+            if delay:
+                time.sleep(delay)
+            parts.append(part)
+            yield self._response([part], user, parts if i == len(turn) - 1 else None)
+        self._record(user, parts)
+
+    def send_message(self, message: Any) -> types.GenerateContentResponse:
+        user = _user_content(message)
+        schedule = list(self.backend.schedule(self.backend.next_turn()))
+        time.sleep(sum(delay for delay, _ in schedule))
+        parts = [part for _, part in schedule]
+        response = self._response(parts, user, parts)
+        self._record(user, parts)
+        return response
+
+
+class AsyncReplayChat(ReplayChat):
+    """Chat on a ReplayBackend, with the ``google.genai`` async chat interface."""
+
+    async def send_message_stream(self, message: Any) -> AsyncIterator[types.GenerateContentResponse]:
+        user = _user_content(message)
+        turn = self.backend.next_turn()
+
+        async def stream():
+            parts = []
+            for i, (delay, part) in enumerate(self.backend.schedule(turn)):
+                if delay:
+                    await asyncio.sleep(delay)
+                parts.append(part)
+                yield self._response([part], user, parts if i == len(turn) - 1 else None)
+            self._record(user, parts)
+        return stream()
+
+    async def send_message(self, message: Any) -> types.GenerateContentResponse:
+        user = _user_content(message)
+        schedule = list(self.backend.schedule(self.backend.next_turn()))
+        await asyncio.sleep(sum(delay for delay, _ in schedule))
+        parts = [part for _, part in schedule]
+        response = self._response(parts, user, parts)
+        self._record(user, parts)
+        return response
@@ -0,0 +1,52 @@
+import threading
+import time
+from typing import Optional
+
+# How often (seconds) a worker asks the session store whether another worker was told to cancel its turns
+DEFAULT_POLL_INTERVAL = 0.25
+
+
+class TurnCancelled(Exception):
+    """Raised inside a streamed turn at the first chunk boundary after it was cancelled."""
+
+
+class Cancellation:
+    """
+    Cooperative cancellation of one streamed turn.
+
+    The turn checks ``cancelled`` between chunks and, once it is set, stops
+    pulling from the model (closing the upstream stream) and records the reply
+    so far. ``cancel`` may be called from any thread, and checking is only a
+    flag read, so it is cheap on the event loop; a cancel requested on another
+    worker is passed on by the registry's poller thread (``SessionRegistry``).
+
+    ``reason`` is None until the turn is cancelled, then ``request`` (the cancel
+    endpoint) or ``disconnect`` (the client went away).
+    """
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        # Wall-clock start of the turn; only cancel requests made after it are for this turn
+        self.started_at = time.time()
+        # When this worker learned of the cancellation, for the time it takes the turn to stop
+        self.requested_at: Optional[float] = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = 'request') -> None:
+        """Cancel the turn; later calls keep the first reason."""
+        if not self._event.is_set():
+            self.reason = reason
+            self.requested_at = time.monotonic()
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        """
+        Raises:
+            TurnCancelled: If the turn has been cancelled
+        """
+        if self.cancelled:
+            raise TurnCancelled(self.reason)
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional
+
+from .conversion import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Unfinished uploads are deleted after this many seconds without a new part
+DEFAULT_TTL = 24 * 60 * 60
+
+_UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+_CHECKSUM_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+_META = 'meta.json'
+_DATA = 'data'
+_PARTS = 'parts'
+
+
+class UploadError(ValueError):
+    """A chunked upload request that can't be accepted; the message is safe to show the client."""
+
+
+@dataclass
+class ChunkedUpload:
+    upload_id: str
+    owner: str
+    filename: str
+    size: int
+    part_size: int
+    created_at: float
+
+    @property
+    def part_count(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    def part_length(self, index: int) -> int:
+        if index == self.part_count - 1:
+            return self.size - index * self.part_size
+        return self.part_size
+
+
+class ChunkedUploadStore:
+    """
+    Resumable uploads received as fixed-size parts, assembled on disk.
+
+    ``start`` reserves a file of the announced size; each part is streamed
+    from the request straight into its offset in that file, so parts may
+    arrive in any order and in parallel, and a part is only recorded once its
+    length and (when the client sends one) sha256 checksum match. ``status``
+    lists the recorded parts so an interrupted upload resumes with the rest,
+    and ``open`` hands out the assembled file once every part is in. Memory
+    use is one read buffer per part in flight, whatever the file size.
+
+    Uploads live in a directory shared by the workers on a host, so parts of
+    one upload may be handled by different workers.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        part_size: int = DEFAULT_PART_SIZE,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'eda-uploads')
+        os.makedirs(self.directory, exist_ok=True)
+        self.part_size = part_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _path(self, upload_id: str, *names: str) -> str:
+        return os.path.join(self.directory, upload_id, *names)
+
+    def start(self, owner: str, filename: str, size: int) -> ChunkedUpload:
+        """
+        Begin an upload of ``size`` bytes.
+
+        Args:
+            owner: Key of the session the upload belongs to; other sessions can't touch it
+            filename: Original file name, used for format detection when the upload completes
+            size: Total size in bytes
+
+        Returns:
+            The new upload, whose ``part_size`` the client must split the file by
+        """
+        if size <= 0:
+            raise UploadError("The file is empty")
+        if size > self.max_bytes:
+            raise UploadError(f"The file is larger than the {self.max_bytes // (1024 * 1024)} MB limit")
+        self.remove_expired()
+
+        upload = ChunkedUpload(
+            upload_id=uuid.uuid4().hex,
+            owner=owner,
+            filename=os.path.basename(filename) or 'upload',
+            size=size,
+            part_size=self.part_size,
+            created_at=time.time(),
+        )
+        os.makedirs(self._path(upload.upload_id, _PARTS))
+        with open(self._path(upload.upload_id, _DATA), 'wb') as f:
+            f.truncate(size)
+        with open(self._path(upload.upload_id, _META), 'w') as f:
+            json.dump(upload.__dict__, f)
+        logger.info(f"Started chunked upload {upload.upload_id}: {upload.filename}, {size} bytes in {upload.part_count} parts")
+        return upload
+
+    def get(self, upload_id: str, owner: str) -> ChunkedUpload:
+        if not _UPLOAD_ID_PATTERN.match(upload_id):
+            raise UploadError("Unknown upload")
+        try:
+            with open(self._path(upload_id, _META)) as f:
+                upload = ChunkedUpload(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            raise UploadError("Unknown upload")
+        if upload.owner != owner:
+            raise UploadError("Unknown upload")
+        return upload
+
+    def write_part(self, upload: ChunkedUpload, index: int, source: BinaryIO, checksum: Optional[str] = None) -> None:
+        """
+        Stream one part from ``source`` into place.
+
+        Args:
+            upload: Upload the part belongs to
+            index: Zero-based part number
+            source: Readable stream of the part's bytes, e.g. the request body
+            checksum: Hex sha256 of the part, verified before the part is recorded
+        """
+        if not 0 <= index < upload.part_count:
+            raise UploadError(f"Part {index} is out of range")
+        if checksum is not None:
+            checksum = checksum.lower()
+            if not _CHECKSUM_PATTERN.match(checksum):
+                raise UploadError("Malformed part checksum")
+
+        expected = upload.part_length(index)
+        digest = hashlib.sha256()
+        written = 0
+        with open(self._path(upload.upload_id, _DATA), 'r+b') as target:
+            target.seek(index * upload.part_size)
+            while written <= expected and (chunk := source.read(min(CHUNK_SIZE, expected + 1 - written))):
+                if written + len(chunk) <= expected:
+                    target.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+        if written != expected:
+            raise UploadError(f"Part {index} should be {expected} bytes, got {written if written <= expected else 'more'}")
+        if checksum is not None and digest.hexdigest() != checksum:
+            raise UploadError(f"Part {index} failed its checksum")
+
+        marker = self._path(upload.upload_id, _PARTS, str(index))
+        with open(marker, 'w') as f:
+            f.write(digest.hexdigest())
+        os.utime(self._path(upload.upload_id, _META))
+
+    def received_parts(self, upload: ChunkedUpload) -> List[int]:
+        try:
+            return sorted(int(name) for name in os.listdir(self._path(upload.upload_id, _PARTS)) if name.isdigit())
+        except FileNotFoundError:
+            return []
+
+    def open(self, upload: ChunkedUpload) -> BinaryIO:
+        """The assembled file, once every part has been received."""
+        missing = upload.part_count - len(self.received_parts(upload))
+        if missing:
+            raise UploadError(f"{missing} part(s) still missing")
+        return open(self._path(upload.upload_id, _DATA), 'rb')
+
+    def remove(self, upload: ChunkedUpload) -> None:
+        shutil.rmtree(self._path(upload.upload_id), ignore_errors=True)
+
+    def remove_expired(self) -> None:
+        """Delete uploads that haven't received a part within the TTL."""
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_dir() and os.path.getmtime(os.path.join(entry.path, _META)) < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                continue
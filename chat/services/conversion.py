@@ -0,0 +1,332 @@
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Iterable, Iterator, Optional
+
+from .metrics import BYTES, span
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {'.csv', '.tsv', '.json', '.jsonl', '.ndjson', '.xlsx', '.xls', '.txt'}
+MIME_TYPES = {
+    '.csv': 'text/csv',
+    '.tsv': 'text/tab-separated-values',
+    '.json': 'application/json',
+    '.jsonl': 'application/x-ndjson',
+    '.ndjson': 'application/x-ndjson',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.xls': 'application/vnd.ms-excel',
+    '.txt': 'text/plain',
+}
+
+CHUNK_SIZE = 64 * 1024
+# Converted output stays in memory up to this size, then spills to a temp file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def convert_to_csv(file_content: bytes, filename: str) -> tuple[bytes, str]:
+    """
+    Convert various file formats to CSV for Gemini processing.
+
+    Args:
+        file_content: Raw file bytes
+        filename: Original filename to determine format
+
+    Returns:
+        Tuple of (csv_bytes, original_extension)
+    """
+    output, ext = convert_to_csv_stream(io.BytesIO(file_content), filename)
+    with output:
+        return output.read(), ext
+
+
+def convert_to_csv_stream(source: BinaryIO, filename: str, target: Optional[BinaryIO] = None) -> tuple[BinaryIO, str]:
+    """
+    Convert a file to CSV chunk by chunk, without holding the whole file in memory.
+
+    Args:
+        source: Binary file handle positioned at the start of the upload
+        filename: Original filename to determine format
+        target: Binary handle to write CSV into. Defaults to a spooled temp file
+
+    Returns:
+        Tuple of (target rewound to the start of the CSV, original_extension)
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+    if target is None:
+        target = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+b')
+    start = target.tell()
+
+    with span('conversion'):
+        if ext == '.csv':
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        elif ext == '.xlsx':
+            _write_rows(target, _iter_xlsx_rows(source))
+        elif ext == '.xls':
+            _write_xls(source, target)
+        else:
+            text = io.TextIOWrapper(source, encoding='utf-8', newline='')
+            try:
+                if ext == '.tsv':
+                    rows = csv.reader(text, delimiter='\t')
+                elif ext == '.txt':
+                    rows = _iter_txt_rows(text)
+                else:
+                    rows = _iter_json_rows(_iter_text_chunks(text))
+                _write_rows(target, rows)
+            finally:
+                # Leave the caller's handle open
+                text.detach()
+
+    BYTES.inc(target.tell() - start, kind='csv')
+    target.seek(start)
+    return target, ext
+
+
+def _write_rows(target: BinaryIO, rows: Iterable[Iterable[Any]]) -> None:
+    """Write rows to ``target`` as UTF-8 CSV through a buffered text layer."""
+    text = io.TextIOWrapper(target, encoding='utf-8', newline='')
+    try:
+        csv.writer(text).writerows(rows)
+        text.flush()
+    finally:
+        # Leave the caller's handle open
+        text.detach()
+
+
+def _iter_text_chunks(text: io.TextIOBase) -> Iterator[str]:
+    while True:
+        chunk = text.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_txt_rows(text: io.TextIOBase) -> Iterator[list[str]]:
+    """
+    Yield rows from a plain text file, sniffing the delimiter from the first line.
+    Leading and trailing blank lines are dropped.
+    """
+    first_line = ''
+    for line in text:
+        if line.strip():
+            first_line = line
+            break
+    if not first_line:
+        return
+
+    if '\t' in first_line:
+        delimiter = '\t'
+    elif ',' in first_line:
+        delimiter = ','
+    elif ';' in first_line:
+        delimiter = ';'
+    else:
+        # No delimiter: one column per line, holding back blank lines until we know they aren't trailing
+        pending_blank = 0
+        for line in _prepend(first_line.lstrip(), text):
+            line = line.rstrip('\r\n')
+            if not line.strip():
+                pending_blank += 1
+                continue
+            for _ in range(pending_blank):
+                yield ['']
+            pending_blank = 0
+            yield [line]
+        return
+
+    yield from csv.reader(_prepend(first_line.lstrip(), text), delimiter=delimiter)
+
+
+def _prepend(first: Any, rest: Iterable[Any]) -> Iterator[Any]:
+    yield first
+    yield from rest
+
+
+def _iter_json_values(chunks: Iterator[str]) -> Iterator[tuple[str, Any]]:
+    """
+    Incrementally decode JSON from text chunks.
+
+    Yields ``('item', value)`` for each element of a top-level array and
+    ``('value', value)`` for each top-level value otherwise, so that both
+    single documents and newline-delimited JSON stream through with only the
+    current element buffered. A value that doesn't fit in what has been read
+    is retried only after reading as much again, so even a single document
+    spanning the whole file is decoded in linear time.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill(size: int = 1) -> bool:
+        """Read chunks until at least ``size`` characters are unread, returning False if none could be read."""
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        read = []
+        missing = size - (len(buffer) - pos)
+        while not read or missing > 0:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                break
+            read.append(chunk)
+            missing -= len(chunk)
+        if not read:
+            return False
+        buffer = buffer[pos:] + ''.join(read)
+        pos = 0
+        return True
+
+    def skip_whitespace() -> bool:
+        """Advance past whitespace, returning False at end of input."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer):
+                return True
+            if not fill():
+                return False
+
+    def decode() -> Any:
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(buffer) or eof or isinstance(value, (dict, list, str)):
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            # Retrying after every chunk would decode a long value over and over (quadratic in its length)
+            if not fill(2 * (len(buffer) - pos)):
+                value, pos = decoder.raw_decode(buffer, pos)
+                return value
+
+    if not skip_whitespace():
+        return
+
+    if buffer[pos] == '[':
+        pos += 1
+        if skip_whitespace() and buffer[pos] == ']':
+            pos += 1
+        else:
+            while True:
+                if not skip_whitespace():
+                    raise json.JSONDecodeError("Unterminated array", buffer, pos)
+                yield 'item', decode()
+                if not skip_whitespace():
+                    raise json.JSONDecodeError("Unterminated array", buffer, pos)
+                if buffer[pos] == ',':
+                    pos += 1
+                elif buffer[pos] == ']':
+                    pos += 1
+                    break
+                else:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+        if skip_whitespace():
+            raise json.JSONDecodeError("Extra data", buffer, pos)
+        return
+
+    while skip_whitespace():
+        yield 'value', decode()
+
+
+def _iter_json_rows(chunks: Iterator[str]) -> Iterator[list[Any]]:
+    """
+    Yield CSV rows from a JSON array, a single JSON object, or NDJSON records.
+
+    Arrays of objects and NDJSON use the first record's keys as the header.
+    """
+    values = _iter_json_values(chunks)
+    first = next(values, None)
+    if first is None:
+        return
+    kind, value = first
+
+    if kind == 'value':
+        second = next(values, None)
+        if second is None:
+            # A single document (a top-level array comes as items)
+            if isinstance(value, dict):
+                yield list(value.keys())
+                yield list(value.values())
+            return
+        # Newline-delimited JSON: treat each value as a record
+        values = _prepend(second, values)
+
+    if isinstance(value, dict):
+        fieldnames = list(value.keys())
+        yield fieldnames
+        yield _dict_row(value, fieldnames)
+        for _, item in values:
+            yield _dict_row(item, fieldnames)
+    else:
+        yield value if isinstance(value, list) else [value]
+        for _, item in values:
+            yield item if isinstance(item, list) else [item]
+
+
+def _dict_row(record: Any, fieldnames: list[str]) -> list[Any]:
+    if not isinstance(record, dict):
+        raise ValueError(f"Expected a JSON object record, got {type(record).__name__}")
+    extra = record.keys() - set(fieldnames)
+    if extra:
+        raise ValueError(f"JSON record contains fields not in the first record: {', '.join(map(str, extra))}")
+    return [record.get(name, '') for name in fieldnames]
+
+
+def _excel_cell(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time(0):
+            return value.date().isoformat()
+        return value.isoformat(sep=' ')
+    return value
+
+
+def _iter_xlsx_rows(source: BinaryIO) -> Iterator[list[Any]]:
+    """
+    Yield rows from the first worksheet, streaming the sheet XML row by row.
+
+    Cells are written as stored (an integer stays one in a column with blanks, a date at midnight is
+    written as a date) and rows with no values are skipped, unlike the pandas DataFrame round-trip
+    .xls files still take, which turns such columns to floats and keeps blank rows as empty records.
+    """
+    try:
+        import openpyxl
+    except ImportError:
+        logger.error("openpyxl not available for Excel conversion")
+        raise ValueError("Excel file support requires pandas with openpyxl")
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            # Read-only mode pads short rows with None; skip rows that are entirely empty
+            if any(cell is not None for cell in row):
+                yield [_excel_cell(cell) for cell in row]
+    finally:
+        workbook.close()
+
+
+def _write_xls(source: BinaryIO, target: BinaryIO) -> None:
+    """Convert a legacy .xls workbook, which has no streaming reader and is read whole."""
+    try:
+        import pandas as pd
+        df = pd.read_excel(source)
+    except ImportError:
+        logger.error("pandas not available for Excel conversion")
+        raise ValueError("Excel file support requires pandas with openpyxl")
+    target.write(df.to_csv(index=False).encode('utf-8'))
@@ -0,0 +1,275 @@
+import bisect
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .dataset_store import DatasetStore, _require_pyarrow
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_ROWS = 50
+MAX_PAGE_ROWS = 1000
+# Datasets kept open (memory-mapped) and filtered/sorted row indexes kept per worker
+MAX_OPEN_DATASETS = 32
+MAX_CACHED_INDEXES = 64
+
+FILTER_OPS = ('eq', 'ne', 'lt', 'le', 'gt', 'ge', 'contains')
+NULL_OPS = ('null', 'notnull')
+_FILTER_PATTERN = re.compile(rf"^(.+?):({'|'.join(FILTER_OPS)}):(.*)$")
+_NULL_FILTER_PATTERN = re.compile(rf"^(.+):({'|'.join(NULL_OPS)})$")
+
+
+@dataclass(frozen=True)
+class RowFilter:
+    column: str
+    op: str
+    value: Optional[str] = None
+
+
+def parse_filter(text: str) -> RowFilter:
+    """
+    Parse a ``column:op:value`` filter, or ``column:null`` / ``column:notnull``.
+
+    Raises:
+        ValueError: If the filter isn't in a recognised form
+    """
+    match = _NULL_FILTER_PATTERN.match(text)
+    if match:
+        return RowFilter(match.group(1), match.group(2))
+    match = _FILTER_PATTERN.match(text)
+    if match:
+        return RowFilter(match.group(1), match.group(2), match.group(3))
+    raise ValueError(f"Invalid filter {text!r}, expected column:op:value with op one of {', '.join(FILTER_OPS + NULL_OPS)}")
+
+
+def parse_sort(text: str) -> Tuple[Tuple[str, str], ...]:
+    """Parse a comma-separated sort spec such as ``-price,name`` (``-`` for descending)."""
+    keys = []
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        if part.startswith('-'):
+            keys.append((part[1:], 'descending'))
+        else:
+            keys.append((part, 'ascending'))
+    return tuple(keys)
+
+
+@dataclass
+class _OpenDataset:
+    batches: List[Any]
+    table: Any
+    # Row number at which each record batch starts, plus the total row count
+    offsets: List[int]
+
+
+class DatasetQuery:
+    """
+    Paginated, projected, filtered and sorted reads over datasets in a ``DatasetStore``.
+
+    Unfiltered pages are located through a row-offset index over the stored
+    record batches, so only the batches covering the page are touched. A filter
+    or sort is evaluated once over the memory-mapped table into an array of
+    matching row numbers, which is cached so later pages of the same query are
+    just a ``take`` of the next slice.
+    """
+
+    def __init__(
+        self,
+        store: DatasetStore,
+        max_open: int = MAX_OPEN_DATASETS,
+        max_indexes: int = MAX_CACHED_INDEXES,
+    ):
+        self.store = store
+        self.max_open = max_open
+        self.max_indexes = max_indexes
+        self._open: "OrderedDict[str, _OpenDataset]" = OrderedDict()
+        self._indexes: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schema(self, digest: str) -> Dict[str, Any]:
+        """
+        Describe a stored dataset.
+
+        Returns:
+            Dict with the total ``rows`` and a ``columns`` list of names and Arrow types
+        """
+        dataset = self._dataset(digest)
+        return {
+            "rows": dataset.offsets[-1],
+            "columns": [{"name": field.name, "type": str(field.type)} for field in dataset.table.schema],
+        }
+
+    def rows(
+        self,
+        digest: str,
+        offset: int = 0,
+        limit: int = DEFAULT_PAGE_ROWS,
+        columns: Optional[Sequence[str]] = None,
+        filters: Sequence[RowFilter] = (),
+        sort: Sequence[Tuple[str, str]] = (),
+    ) -> Dict[str, Any]:
+        """
+        Read one page of a stored dataset.
+
+        Args:
+            digest: Content digest of the dataset
+            offset: Index of the first row of the page within the query result
+            limit: Maximum rows to return, capped at MAX_PAGE_ROWS
+            columns: Only return these columns, in this order
+            filters: Row filters, all of which must match
+            sort: (column, 'ascending' | 'descending') sort keys
+
+        Returns:
+            Dict with the ``total`` matching rows, the page ``offset``, ``columns``,
+            the original ``row_ids`` and the ``rows`` as lists of JSON-safe values
+
+        Raises:
+            KeyError: If the dataset isn't in the store
+            ValueError: If a column, filter or sort key is invalid
+        """
+        if offset < 0 or limit < 0:
+            raise ValueError("offset and limit must not be negative")
+        limit = min(limit, MAX_PAGE_ROWS)
+        dataset = self._dataset(digest)
+        names = dataset.table.schema.names
+        columns = list(columns) if columns else names
+        for name in [*columns, *(f.column for f in filters), *(key for key, _ in sort)]:
+            if name not in names:
+                raise ValueError(f"Unknown column {name!r}")
+
+        index = self._row_index(digest, dataset, tuple(filters), tuple(sort))
+        if index is None:
+            total = dataset.offsets[-1]
+            page, row_ids = self._slice(dataset, offset, limit), list(range(offset, min(offset + limit, total)))
+        else:
+            total = len(index)
+            positions = index.slice(offset, limit)
+            page, row_ids = dataset.table.take(positions), positions.to_pylist()
+
+        page = page.select(columns)
+        data = page.to_pydict()
+        return {
+            "total": total,
+            "offset": offset,
+            "columns": columns,
+            "row_ids": row_ids,
+            "rows": [[_json_value(value) for value in row] for row in zip(*(data[name] for name in columns))],
+        }
+
+    def _dataset(self, digest: str) -> _OpenDataset:
+        with self._lock:
+            dataset = self._open.get(digest)
+            if dataset is not None:
+                self._open.move_to_end(digest)
+                return dataset
+
+        if digest not in self.store:
+            raise KeyError(digest)
+        pa = _require_pyarrow()
+        reader = self.store.open(digest)
+        batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+        offsets = [0]
+        for batch in batches:
+            offsets.append(offsets[-1] + batch.num_rows)
+        dataset = _OpenDataset(
+            batches=batches,
+            table=pa.Table.from_batches(batches, schema=reader.schema),
+            offsets=offsets,
+        )
+
+        with self._lock:
+            self._open[digest] = dataset
+            while len(self._open) > self.max_open:
+                evicted, _ = self._open.popitem(last=False)
+                for key in [key for key in self._indexes if key[0] == evicted]:
+                    del self._indexes[key]
+        return dataset
+
+    @staticmethod
+    def _slice(dataset: _OpenDataset, offset: int, limit: int):
+        """Take rows [offset, offset + limit) using the batch offset index."""
+        pa = _require_pyarrow()
+        stop = min(offset + limit, dataset.offsets[-1])
+        pieces = []
+        i = bisect.bisect_right(dataset.offsets, offset) - 1
+        while offset < stop:
+            piece = dataset.batches[i].slice(offset - dataset.offsets[i], stop - offset)
+            pieces.append(piece)
+            offset += piece.num_rows
+            i += 1
+        return pa.Table.from_batches(pieces, schema=dataset.table.schema)
+
+    def _row_index(self, digest: str, dataset: _OpenDataset, filters: tuple, sort: tuple):
+        """Row numbers matching ``filters`` in ``sort`` order, or None when neither is given."""
+        if not filters and not sort:
+            return None
+        key = (digest, filters, sort)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+
+        index = _evaluate(dataset.table, filters, sort)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+
+def _evaluate(table: Any, filters: Sequence[RowFilter], sort: Sequence[Tuple[str, str]]):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if filters:
+        mask = None
+        for row_filter in filters:
+            column_mask = _filter_mask(table[row_filter.column], row_filter)
+            mask = column_mask if mask is None else pc.and_kleene(mask, column_mask)
+        index = pc.indices_nonzero(pc.fill_null(mask, False))
+    else:
+        index = pa.array(range(table.num_rows), type=pa.uint64())
+
+    if sort:
+        keys = [name for name, _ in sort]
+        subset = table.select(keys).take(index) if filters else table.select(keys)
+        order = pc.sort_indices(subset, sort_keys=list(sort))
+        index = index.take(order)
+    return index
+
+
+def _filter_mask(column: Any, row_filter: RowFilter):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if row_filter.op == 'null':
+        return pc.is_null(column)
+    if row_filter.op == 'notnull':
+        return pc.is_valid(column)
+    if row_filter.op == 'contains':
+        return pc.match_substring(pc.cast(column, pa.string()), row_filter.value, ignore_case=True)
+
+    try:
+        value = pa.scalar(row_filter.value).cast(column.type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        raise ValueError(f"Can't compare column {row_filter.column!r} ({column.type}) with {row_filter.value!r}")
+    compare = {
+        'eq': pc.equal,
+        'ne': pc.not_equal,
+        'lt': pc.less,
+        'le': pc.less_equal,
+        'gt': pc.greater,
+        'ge': pc.greater_equal,
+    }[row_filter.op]
+    return compare(column, value)
+
+
+def _json_value(value: Any) -> Any:
+    """NaN and infinities aren't valid JSON, so they are sent as null."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
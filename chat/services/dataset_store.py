@@ -0,0 +1,138 @@
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, BinaryIO, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bytes of CSV parsed per record batch when ingesting
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        logger.error("pyarrow not available for the dataset store")
+        raise ValueError("The dataset store requires pyarrow")
+
+
+class DatasetStore:
+    """
+    Local store of uploaded datasets as Arrow IPC files, keyed by content digest.
+
+    Files are written uncompressed in the IPC file format, so they can be memory
+    mapped and read without copying. Server-side analysis reads from here, with
+    column projection and predicate pushdown through ``scan``, instead of
+    re-parsing CSV text. CSV is only produced on demand by ``write_csv``.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'eda-datasets')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, f'{digest}.arrow')
+
+    def __contains__(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def ingest_csv(self, digest: str, source: BinaryIO) -> bool:
+        """
+        Stream a CSV into the store batch by batch.
+
+        Column types are inferred from the first block. If a later block doesn't fit
+        them, the file is re-read with every column as a string.
+
+        Args:
+            digest: Content digest the dataset is stored under
+            source: Seekable binary handle positioned at the start of the CSV
+
+        Returns:
+            True if the dataset was stored, False if the CSV had no columns to store
+        """
+        pa = _require_pyarrow()
+        path = self.path(digest)
+        partial_path = f'{path}.{os.getpid()}.{threading.get_ident()}.part'
+        start = source.tell()
+        try:
+            try:
+                self._write_ipc(source, partial_path)
+            except pa.ArrowInvalid as e:
+                if 'Empty CSV file' in str(e):
+                    logger.warning(f"Not storing empty dataset {digest[:12]}")
+                    return False
+                logger.info(f"Type inference failed for {digest[:12]}, storing as strings: {e}")
+                source.seek(start)
+                self._write_ipc(source, partial_path, all_strings=True)
+            os.replace(partial_path, path)
+            return True
+        finally:
+            source.seek(start)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    @staticmethod
+    def _write_ipc(source: BinaryIO, path: str, all_strings: bool = False) -> None:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        import pyarrow.ipc as ipc
+
+        read_options = pacsv.ReadOptions(block_size=BLOCK_SIZE)
+        # Empty and NA-like cells are null in every column, as they are when pandas reads the CSV
+        convert_options = pacsv.ConvertOptions(strings_can_be_null=True)
+        if all_strings:
+            start = source.tell()
+            column_names = pacsv.open_csv(source, read_options=read_options).schema.names
+            source.seek(start)
+            convert_options.column_types = {name: pa.string() for name in column_names}
+
+        reader = pacsv.open_csv(source, read_options=read_options, convert_options=convert_options)
+        with pa.OSFile(path, 'wb') as sink, ipc.new_file(sink, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+
+    def open(self, digest: str):
+        """Open a stored dataset as a memory-mapped ``pyarrow.ipc.RecordBatchFileReader``."""
+        pa = _require_pyarrow()
+        import pyarrow.ipc as ipc
+        return ipc.open_file(pa.memory_map(self.path(digest), 'r'))
+
+    def iter_batches(self, digest: str) -> Iterator[Any]:
+        """Yield the stored record batches in order, straight from the memory map."""
+        reader = self.open(digest)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+
+    def scan(self, digest: str, columns: Optional[List[str]] = None, filter: Any = None):
+        """
+        Read a stored dataset as a ``pyarrow.Table``.
+
+        Args:
+            digest: Content digest of the dataset
+            columns: Only read these columns
+            filter: A ``pyarrow.dataset`` expression applied while scanning
+
+        Returns:
+            The projected, filtered table
+        """
+        _require_pyarrow()
+        import pyarrow.dataset as ds
+        return ds.dataset(self.path(digest), format='ipc').to_table(columns=columns, filter=filter)
+
+    def write_csv(self, digest: str, target: BinaryIO) -> None:
+        """Write a stored dataset to ``target`` as CSV, one record batch at a time."""
+        _require_pyarrow()
+        import pyarrow.csv as pacsv
+        reader = self.open(digest)
+        with pacsv.CSVWriter(target, reader.schema, write_options=pacsv.WriteOptions(quoting_style='needed')) as writer:
+            for i in range(reader.num_record_batches):
+                writer.write_batch(reader.get_batch(i))
+
+    def remove(self, digest: str) -> None:
+        try:
+            os.remove(self.path(digest))
+        except OSError:
+            pass
@@ -0,0 +1,278 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+from google.genai import types
+
+from .conversion import CHUNK_SIZE, SPOOL_MAX_SIZE, convert_to_csv_stream
+from .dataset_store import DatasetStore
+from .metrics import span
+from .profiling import profile_batches, profile_csv
+from .sampling import DatasetSampler, write_sample_csv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 64
+# Uploaded files expire after 48 hours; assume slightly less when the API doesn't say
+DEFAULT_FILE_TTL = 47 * 60 * 60
+# Re-upload a handle once it is within this many seconds of expiring
+DEFAULT_REFRESH_MARGIN = 60 * 60
+
+
+def file_digest(file: BinaryIO, filename: str) -> str:
+    """
+    Hash a seekable file's content together with its extension, which decides how it is converted.
+    The file is rewound to where it started.
+    """
+    digest = hashlib.sha256(os.path.splitext(filename)[1].lower().encode())
+    start = file.tell()
+    while chunk := file.read(CHUNK_SIZE):
+        digest.update(chunk)
+    file.seek(start)
+    return digest.hexdigest()
+
+
+def safe_profile(source: Any, store: Optional[DatasetStore] = None) -> Optional[Dict[str, Any]]:
+    """
+    Profile a dataset, returning None rather than failing the upload.
+    ``source`` is a stored digest when ``store`` is given, otherwise a converted CSV.
+    """
+    try:
+        with span('profile'):
+            if store is not None:
+                return profile_batches(store.iter_batches(source))
+            return profile_csv(source)
+    except Exception as e:
+        logger.warning(f"Could not profile dataset: {e}")
+        return None
+
+
+@dataclass
+class CachedUpload:
+    digest: str
+    stored: bool
+    original_ext: str
+    file: types.File
+    expires_at: float
+    profile: Optional[Dict[str, Any]] = None
+    # Summary of the sample uploaded in place of the full dataset, if it was too large
+    sample: Optional[Dict[str, Any]] = None
+
+
+class UploadCache:
+    """
+    Content-addressed cache of converted datasets and their uploaded Gemini files.
+
+    Entries are keyed by the digest of the original upload. Each one keeps the
+    dataset in the columnar ``DatasetStore``, its column profile and the remote
+    ``types.File`` handle, so a repeat upload of the same content skips
+    conversion, profiling and upload. Handles close to expiry are re-uploaded
+    from CSV regenerated out of the store, and the least recently used entries
+    are evicted once ``max_entries`` is exceeded.
+
+    The store's directory may be shared with other workers, whose sessions can
+    still be using an evicted entry's dataset; with an ``in_use`` check, such a
+    dataset is only removed from the store once nothing refers to it (checked
+    again on later evictions).
+
+    With a ``sampler``, datasets whose CSV is past its threshold are uploaded
+    as a sample drawn from the store; the store keeps every row for local queries.
+    """
+
+    def __init__(
+        self,
+        store: Optional[DatasetStore] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+        sampler: Optional[DatasetSampler] = None,
+        in_use: Optional[Callable[[str], bool]] = None,
+    ):
+        self.store = store or DatasetStore()
+        self.in_use = in_use
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self.sampler = sampler
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._entries: "OrderedDict[str, CachedUpload]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._digest_locks: dict[str, threading.Lock] = {}
+        # Digests of evicted entries whose dataset was still in use, to remove once it isn't
+        self._retired: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_upload(
+        self,
+        source: BinaryIO,
+        filename: str,
+        upload: Callable[[BinaryIO], types.File],
+    ) -> CachedUpload:
+        """
+        Return the cached upload for ``source``, converting and uploading it on a miss.
+
+        Args:
+            source: Seekable binary handle holding the original upload
+            filename: Original filename, used to pick the converter
+            upload: Uploads a binary CSV handle to Gemini and returns the File
+
+        Returns:
+            The cache entry with a remote handle that is not about to expire
+        """
+        digest = file_digest(source, filename)
+
+        # Concurrent uploads of the same content wait for the first one instead of duplicating it
+        with self._digest_lock(digest):
+            with self._lock:
+                entry = self._entries.get(digest)
+                if entry is not None:
+                    self._entries.move_to_end(digest)
+
+            # Another worker may have removed the dataset after this one's sessions stopped using it
+            if entry is not None and entry.stored and digest not in self.store:
+                entry = None
+
+            if entry is not None:
+                if entry.expires_at - time.time() > self.refresh_margin:
+                    self.hits += 1
+                    logger.info(f"Upload cache hit for {filename} ({digest[:12]})")
+                    return entry
+                if entry.stored:
+                    self.refreshes += 1
+                    logger.info(f"Refreshing expiring upload for {filename} ({digest[:12]})")
+                    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+b') as csv_file:
+                        self._write_upload_csv(entry, csv_file)
+                        csv_file.seek(0)
+                        self._set_file(entry, upload(csv_file))
+                    return entry
+
+            self.misses += 1
+            try:
+                entry = self._convert_and_upload(digest, source, filename, upload)
+            except Exception:
+                # Nothing is cached for content that failed, so its lock needn't be kept either
+                with self._lock:
+                    if digest not in self._entries:
+                        self._digest_locks.pop(digest, None)
+                raise
+            with self._lock:
+                self._entries[digest] = entry
+                self._retired.discard(digest)
+                self._evict()
+        self._remove_unused()
+        return entry
+
+    def _convert_and_upload(
+        self, digest: str, source: BinaryIO, filename: str, upload: Callable[[BinaryIO], types.File],
+    ) -> CachedUpload:
+        csv_file, original_ext = convert_to_csv_stream(source, filename)
+        with csv_file:
+            stored = self._ingest(digest, csv_file)
+            sample = self._sample(digest, csv_file) if stored else None
+            if sample is not None:
+                with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+b') as sample_file:
+                    write_sample_csv(sample, sample_file)
+                    sample_file.seek(0)
+                    uploaded_file = upload(sample_file)
+            else:
+                uploaded_file = upload(csv_file)
+            csv_file.seek(0)
+            if stored:
+                profile = safe_profile(digest, self.store)
+            else:
+                csv_file.seek(0)
+                profile = safe_profile(csv_file)
+
+        entry = CachedUpload(
+            digest=digest,
+            stored=stored,
+            original_ext=original_ext,
+            file=uploaded_file,
+            expires_at=0,
+            profile=profile,
+            sample=sample.summary() if sample is not None else None,
+        )
+        self._set_file(entry, uploaded_file)
+        return entry
+
+    def _ingest(self, digest: str, csv_file: BinaryIO) -> bool:
+        """Store the converted CSV in columnar form; the upload still succeeds if this fails."""
+        try:
+            return self.store.ingest_csv(digest, csv_file)
+        except Exception as e:
+            logger.warning(f"Could not store dataset {digest[:12]}: {e}")
+            return False
+
+    def _sample(self, digest: str, csv_file: BinaryIO):
+        """Sample a stored dataset whose CSV is past the sampler's threshold; None sends it whole."""
+        size = csv_file.seek(0, os.SEEK_END)
+        csv_file.seek(0)
+        if self.sampler is None or not self.sampler.should_sample(size):
+            return None
+        try:
+            with span('sample'):
+                return self.sampler.sample(lambda: self.store.iter_batches(digest))
+        except Exception as e:
+            logger.warning(f"Could not sample dataset {digest[:12]}, uploading it whole: {e}")
+            return None
+
+    def _write_upload_csv(self, entry: CachedUpload, target: BinaryIO) -> None:
+        """Regenerate the CSV an entry was uploaded from: its sample (drawn again, with the same seed) or the whole dataset."""
+        if entry.sample is not None and self.sampler is not None:
+            sample = self.sampler.sample(lambda: self.store.iter_batches(entry.digest))
+            if sample is not None:
+                write_sample_csv(sample, target)
+                return
+        self.store.write_csv(entry.digest, target)
+
+    def _digest_lock(self, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._digest_locks.setdefault(digest, threading.Lock())
+
+    @staticmethod
+    def _set_file(entry: CachedUpload, uploaded_file: types.File) -> None:
+        entry.file = uploaded_file
+        if uploaded_file.expiration_time is not None:
+            entry.expires_at = uploaded_file.expiration_time.timestamp()
+        else:
+            entry.expires_at = time.time() + DEFAULT_FILE_TTL
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used entries over capacity, leaving their datasets for ``_remove_unused``.
+        Caller must hold ``self._lock``.
+        """
+        while len(self._entries) > self.max_entries:
+            digest, entry = self._entries.popitem(last=False)
+            self._digest_locks.pop(digest, None)
+            if entry.stored:
+                self._retired.add(digest)
+            logger.info(f"Evicted cached upload {digest[:12]}")
+
+    def _remove_unused(self) -> None:
+        """Remove the stored datasets of evicted entries that no session refers to any more."""
+        with self._lock:
+            retired = list(self._retired)
+        for digest in retired:
+            # Checked outside the lock: it may query the session store
+            if self.in_use is not None and self.in_use(digest):
+                continue
+            with self._lock:
+                # Cached again since it was evicted, or removed by another thread
+                if digest in self._entries or digest not in self._retired:
+                    continue
+                self._retired.discard(digest)
+                # An upload of this content in progress is about to use the dataset
+                lock = self._digest_locks.get(digest)
+                if lock is not None and lock.locked():
+                    continue
+                self.store.remove(digest)
+            logger.info(f"Removed unused dataset {digest[:12]}")
@@ -1,111 +1,143 @@
 from google import genai
 from google.genai import types
 import logging
-from typing import List, Optional, BinaryIO, Generator, Dict, Any
+from typing import List, Optional, BinaryIO, Generator, AsyncGenerator, AsyncIterator, Dict, Any, Iterator, Tuple
+import asyncio
 import os
-import io
 import json
-import csv
 import base64
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager, contextmanager
+
+from .backends import ModelBackend
+from .cancellation import Cancellation, TurnCancelled
+from .conversion import SUPPORTED_EXTENSIONS, MIME_TYPES, convert_to_csv, convert_to_csv_stream
+from .file_cache import UploadCache, safe_profile
+from .history import PLOT_PLACEHOLDER, HistoryCompactor, format_summary, split_turns
+from .history_pages import DEFAULT_PAGE_TURNS, HistoryPages
+from .image_store import ImageStore
+from .metrics import CHUNKS, TOKENS, TURNS_CANCELLED, Trace, observe, span
+from .profiling import format_profile
+from .resilience import CallPolicy, CircuitOpenError, ConcurrencyLimitError
+from .response_cache import CachedResponse, ResponseCache, normalize_message, response_key
+from .sampling import format_sample
+from .session_files import DEFAULT_MAX_FILES, DEFAULT_UPLOAD_WORKERS, SessionFile, attachment_parts, select_files
+from .transport import HttpPool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 GEMINI_DEFAULT_MODEL = "gemini-3-flash-preview"
 TOOLS = [{"code_execution": {}}]
+# Format of GeminiChatSession.to_state(); states saved in another are discarded
+STATE_VERSION = 1
+# Closes a reply that was cut short in the history, so the model knows it never finished it
+CUT_SHORT_NOTE = "[The user stopped this response here.]"
 
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+# Built on first use by get_client(), so importing this module (e.g. in a preloading gunicorn master)
+# opens no connection pools; benchmarks assign their own client here
+client: Optional[genai.Client] = None
+# Connection pools for the client, set by configure_client()
+http_pool: Optional[HttpPool] = None
+_client_lock = threading.Lock()
 
-SUPPORTED_EXTENSIONS = {'.csv', '.tsv', '.json', '.xlsx', '.xls', '.txt'}
-MIME_TYPES = {
-    '.csv': 'text/csv',
-    '.tsv': 'text/tab-separated-values',
-    '.json': 'application/json',
-    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    '.xls': 'application/vnd.ms-excel',
-    '.txt': 'text/plain',
-}
 
+def configure_client(pool: Optional[HttpPool]) -> None:
+    """Route the process-wide client through ``pool``; the client is rebuilt on next use."""
+    global client, http_pool
+    with _client_lock:
+        http_pool = pool
+        client = None
 
-def convert_to_csv(file_content: bytes, filename: str) -> tuple[bytes, str]:
-    """
-    Convert various file formats to CSV for Gemini processing.
+
+def get_client() -> genai.Client:
+    """The process-wide Gemini client, created on first use."""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                client = genai.Client(
+                    api_key=os.getenv("GOOGLE_API_KEY"),
+                    http_options=http_pool.http_options() if http_pool else None,
+                )
+    return client
+
+
+def _reset_client() -> None:
+    # A forked worker must not share the parent's connection pools
+    global client, _client_lock
+    client = None
+    _client_lock = threading.Lock()
+    if http_pool is not None:
+        http_pool.reset()
+
+
+os.register_at_fork(after_in_child=_reset_client)
+
+
+class GeminiBackend(ModelBackend):
+    """The Gemini API, through the process-wide client."""
+
+    def create_chat(self, model, config, history=None):
+        return get_client().chats.create(model=model, config=config, history=history)
+
+    def create_async_chat(self, model, config, history=None):
+        return get_client().aio.chats.create(model=model, config=config, history=history)
+
+    def upload_file(self, file, config):
+        return get_client().files.upload(file=file, config=config)
+
+
+def stream_error_chunk(error: Exception) -> Dict[str, Any]:
+    """Map an exception raised while streaming to a user-facing error chunk."""
+    if isinstance(error, (CircuitOpenError, ConcurrencyLimitError)):
+        logger.warning(f"Gemini call not attempted: {error}")
+        return {"type": "error", "content": "The model is unavailable or busy right now. Please try again in a moment."}
     
-    Args:
-        file_content: Raw file bytes
-        filename: Original filename to determine format
-        
-    Returns:
-        Tuple of (csv_bytes, original_extension)
+    if isinstance(error, json.JSONDecodeError):
+        logger.error(f"Gemini API returned invalid JSON: {str(error)}")
+        return {"type": "error", "content": "The API returned an invalid response. This may be due to server overload. Please try again."}
+    
+    error_msg = str(error)
+    logger.error(f"Gemini streaming error: {error_msg}")
+    
+    # Provide more helpful error messages
+    if "overloaded" in error_msg.lower() or "capacity" in error_msg.lower():
+        return {"type": "error", "content": "The model is currently overloaded. Please try again in a moment."}
+    if "quota" in error_msg.lower():
+        return {"type": "error", "content": "API quota exceeded. Please try again later."}
+    return {"type": "error", "content": f"Sorry, I ran into an error: {error_msg}"}
+
+
+class TurnTimer:
     """
-    ext = os.path.splitext(filename)[1].lower()
-    
-    if ext == '.csv':
-        return file_content, ext
-    
-    if ext == '.tsv':
-        content = file_content.decode('utf-8')
-        output = io.StringIO()
-        reader = csv.reader(io.StringIO(content), delimiter='\t')
-        writer = csv.writer(output)
-        for row in reader:
-            writer.writerow(row)
-        return output.getvalue().encode('utf-8'), ext
-    
-    if ext == '.json':
-        data = json.loads(file_content.decode('utf-8'))
-        output = io.StringIO()
-        if isinstance(data, list) and len(data) > 0:
-            if isinstance(data[0], dict):
-                writer = csv.DictWriter(output, fieldnames=data[0].keys())
-                writer.writeheader()
-                writer.writerows(data)
-            else:
-                writer = csv.writer(output)
-                for item in data:
-                    writer.writerow([item] if not isinstance(item, list) else item)
-        elif isinstance(data, dict):
-            writer = csv.writer(output)
-            writer.writerow(data.keys())
-            writer.writerow(data.values())
-        return output.getvalue().encode('utf-8'), ext
-    
-    if ext in ('.xlsx', '.xls'):
-        try:
-            import pandas as pd
-            df = pd.read_excel(io.BytesIO(file_content))
-            return df.to_csv(index=False).encode('utf-8'), ext
-        except ImportError:
-            logger.error("pandas not available for Excel conversion")
-            raise ValueError("Excel file support requires pandas with openpyxl")
-    
-    if ext == '.txt':
-        content = file_content.decode('utf-8')
-        lines = content.strip().split('\n')
-        if lines:
-            first_line = lines[0]
-            if '\t' in first_line:
-                delimiter = '\t'
-            elif ',' in first_line:
-                delimiter = ','
-            elif ';' in first_line:
-                delimiter = ';'
-            else:
-                output = io.StringIO()
-                writer = csv.writer(output)
-                for line in lines:
-                    writer.writerow([line])
-                return output.getvalue().encode('utf-8'), ext
-            
-            output = io.StringIO()
-            reader = csv.reader(io.StringIO(content), delimiter=delimiter)
-            writer = csv.writer(output)
-            for row in reader:
-                writer.writerow(row)
-            return output.getvalue().encode('utf-8'), ext
-        return file_content, ext
-    
-    raise ValueError(f"Unsupported file type: {ext}")
+    Times one streamed turn as its chunks are yielded: time to the first chunk,
+    gaps between chunks, and code execution in the sandbox (code to result).
+    """
+    
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self.start = self.last = time.perf_counter()
+        self.chunks = 0
+        self.code_at: Optional[float] = None
+    
+    def chunk(self, part: Dict[str, Any]) -> None:
+        now = time.perf_counter()
+        observe("chunk_gap" if self.chunks else "first_chunk", now - self.last, self.trace)
+        self.last = now
+        self.chunks += 1
+        CHUNKS.inc(type=part["type"])
+        if part["type"] == "code":
+            self.code_at = now
+        elif part["type"] == "result" and self.code_at is not None:
+            observe("sandbox", now - self.code_at, self.trace)
+            self.code_at = None
+    
+    def finish(self) -> None:
+        observe("turn", time.perf_counter() - self.start, self.trace)
 
 
 class GeminiChatSession:
@@ -113,24 +145,244 @@ class GeminiChatSession:
     Wrapper around the Gemini Chat API that manages a conversation session.
     """
     
-    def __init__(self, system_prompt: str, model: str = GEMINI_DEFAULT_MODEL):
+    def __init__(
+        self,
+        system_prompt: str,
+        model: str = GEMINI_DEFAULT_MODEL,
+        upload_cache: Optional[UploadCache] = None,
+        image_store: Optional[ImageStore] = None,
+        history_compactor: Optional[HistoryCompactor] = None,
+        response_cache: Optional[ResponseCache] = None,
+        replay_speed: float = 1.0,
+        call_policy: Optional[CallPolicy] = None,
+        backend: Optional[ModelBackend] = None,
+        max_files: int = DEFAULT_MAX_FILES,
+        upload_workers: int = DEFAULT_UPLOAD_WORKERS,
+    ):
         self.model = model
         self.system_prompt = system_prompt
-        self.uploaded_file: Optional[types.File] = None
-        self.uploaded_file_name: Optional[str] = None
-        self.has_file_uploaded: bool = False
-        self.file_sent_to_chat: bool = False
+        self.upload_cache = upload_cache
+        self.image_store = image_store
+        self.history_compactor = history_compactor or HistoryCompactor()
+        self.response_cache = response_cache
+        self.replay_speed = replay_speed
+        # Retries, hedging, circuit breaking and concurrency limits for every model call
+        self.call_policy = call_policy or CallPolicy()
+        # Where model calls and uploads go: Gemini, or a recorded replay for offline benchmarks
+        self.backend = backend or GeminiBackend()
+        self.max_files = max_files
+        self.upload_workers = upload_workers
+        # Span timings of the latest turn or upload, for per-request trace logs
+        self.last_trace: Optional[Trace] = None
+        # Normalized user messages of this conversation, which key cached responses
+        self.conversation: List[str] = []
+        self.history_summary: List[str] = []
+        self.turn_tokens: List[int] = []
+        self.last_usage: Optional[types.GenerateContentResponseUsageMetadata] = None
+        # Uploaded datasets in upload order, and the ones attached to the latest turn
+        self.files: List[SessionFile] = []
+        self.last_files: List[SessionFile] = []
+        self.dataset_profile: Optional[str] = None
+        # History API numbering: turns dropped so far, a revision bumped by every compaction
+        # and the revision at which each kept turn last changed
+        self.conversation_id = uuid.uuid4().hex
+        self.history_offset = 0
+        self.history_revision = 0
+        self.turn_revisions: List[int] = []
+        self.history_pages = HistoryPages(image_store)
         self._chat = self._create_chat()
     
-    def _create_chat(self):
+    @property
+    def has_file_uploaded(self) -> bool:
+        return bool(self.files)
+    
+    def _system_instruction(self) -> str:
+        """
+        The system prompt, followed by the profiles of the uploaded datasets once there
+        are any and a summary of turns compacted out of the history.
+        """
+        sections = [self.system_prompt]
+        if self.dataset_profile:
+            sections.append(self.dataset_profile)
+        if self.history_summary:
+            sections.append(format_summary(self.history_summary))
+        return "\n\n".join(sections)
+    
+    def _chat_config(self) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            system_instruction=self._system_instruction(),
+            tools=TOOLS
+        )
+    
+    def _create_chat(self, history: Optional[List[types.Content]] = None):
         """Create a new chat session with the configured system prompt."""
-        return client.chats.create(
-            model=self.model,
-            config=types.GenerateContentConfig(
-                system_instruction=self.system_prompt,
-                tools=TOOLS
+        return self.backend.create_chat(self.model, self._chat_config(), history)
+    
+    def _start_stream(self, message: Any) -> Iterator[types.GenerateContentResponse]:
+        """
+        Start one attempt at a streamed turn, on a chat of its own built from the history.
+        A hedged request runs alongside the first one (see ``CallPolicy.stream``), so they
+        can't share a chat: the chat of the attempt whose stream completes becomes the
+        session's, and the turn is recorded once whichever wins.
+        """
+        chat = self._create_chat(self._chat.get_history(curated=True))
+        stream = chat.send_message_stream(message)
+        
+        def adopt():
+            yield from stream
+            self._chat = chat
+        return adopt()
+    
+    def _compact_history(self, usage: Optional[types.GenerateContentResponseUsageMetadata] = None) -> None:
+        """
+        Rebuild the chat from a compacted copy of its history after a turn, so the
+        next request carries a bounded history and a single file reference.
+        """
+        compacted = self.history_compactor.compact(self._chat.get_history(curated=True), self.history_summary)
+        self.history_summary = compacted.summary
+        self.turn_tokens = compacted.turn_tokens
+        self.history_revision += 1
+        kept = self.turn_revisions[compacted.dropped:]
+        self.turn_revisions = [
+            self.history_revision if i >= len(kept) or i in compacted.shrunk else kept[i]
+            for i in range(len(compacted.turn_tokens))
+        ]
+        self.history_offset += compacted.dropped
+        if usage is not None:
+            self.last_usage = usage
+            TOKENS.inc(usage.prompt_token_count or 0, kind="prompt")
+            TOKENS.inc(usage.candidates_token_count or 0, kind="output")
+            TOKENS.inc(usage.thoughts_token_count or 0, kind="thoughts")
+            logger.info(
+                f"Turn used {usage.prompt_token_count} prompt / {usage.candidates_token_count} output tokens; "
+                f"history is now ~{compacted.tokens:,} tokens over {len(compacted.turn_tokens)} turns"
             )
-        )
+        self._chat = self._create_chat(compacted.history)
+    
+    def _response_key(self, message: str, files: List[SessionFile]) -> Optional[str]:
+        """
+        The response cache key for the reply to a user message with files, or None when
+        caching is off or a dataset's content hash is unknown.
+        """
+        if self.response_cache is None or not all(file.digest for file in files):
+            return None
+        digest = "+".join(file.digest for file in files)
+        return response_key(digest, [*self.conversation, normalize_message(message)], self.model, self.system_prompt)
+    
+    def _record_message(self, message: str) -> None:
+        """
+        Add a user message to the conversation that keys cached responses. Called once its
+        turn is in the history: a turn that failed leaves no trace the model could have seen.
+        """
+        self.conversation.append(normalize_message(message))
+    
+    def _cached_response(self, key: Optional[str]) -> Optional[CachedResponse]:
+        if key is None:
+            return None
+        cached = self.response_cache.get(key, is_valid=self._images_available)
+        if cached is not None:
+            logger.info(f"Replaying cached response {key[:12]} ({self.response_cache.stats()})")
+        return cached
+    
+    def _images_available(self, cached: CachedResponse) -> bool:
+        """Whether every image a cached response refers to by digest is still in the image store."""
+        for _, chunk in cached.chunks:
+            if chunk.get("type") == "image" and chunk.get("digest"):
+                if self.image_store is None or self.image_store.get(chunk["digest"]) is None:
+                    return False
+        return True
+    
+    def _store_response(self, key: Optional[str], recorded: List) -> None:
+        """Cache a finished live response; failed or empty turns are not cached."""
+        if key is None or not recorded or any(chunk["type"] == "error" for _, chunk in recorded):
+            return
+        try:
+            self.response_cache.put(key, recorded)
+        except OSError as e:
+            logger.warning(f"Failed to cache response: {e}")
+    
+    def _chunk_part(self, chunk: Dict[str, Any]) -> Optional[types.Part]:
+        """Rebuild the response Part a stream chunk came from."""
+        if chunk["type"] == "text":
+            return types.Part(text=chunk["content"])
+        if chunk["type"] == "code":
+            return types.Part(executable_code=types.ExecutableCode(code=chunk["content"], language="PYTHON"))
+        if chunk["type"] == "result":
+            return types.Part(code_execution_result=types.CodeExecutionResult(outcome="OUTCOME_OK", output=chunk["content"]))
+        if chunk["type"] == "image":
+            if chunk.get("digest"):
+                path, mime_type = self.image_store.get(chunk["digest"])
+                with open(path, "rb") as f:
+                    return types.Part(inline_data=types.Blob(data=f.read(), mime_type=mime_type))
+            return types.Part(inline_data=types.Blob(data=base64.b64decode(chunk["content"]), mime_type="image/png"))
+        return None
+    
+    def _record_replay(self, message: str, files: List[SessionFile], cached: CachedResponse) -> None:
+        """Append a replayed turn to the history, as if the model had just produced it."""
+        parts = [part for part in (self._chunk_part(chunk) for _, chunk in cached.chunks) if part is not None]
+        history = self._chat.get_history(curated=True) + [
+            types.Content(role="user", parts=self._message_parts(message, files)),
+            types.Content(role="model", parts=parts),
+        ]
+        self._chat = self._create_chat(history)
+        self._compact_history()
+    
+    def _record_cut_short(self, message: str, user_parts: List[types.Part], chunks: List[Dict[str, Any]]) -> None:
+        """
+        Append a turn whose reply was cut short. The chat only records turns the model finished,
+        so without this the history would lack the message and the part of the reply the user saw.
+        """
+        parts = [part for part in (self._chunk_part(chunk) for chunk in chunks) if part is not None]
+        history = self._chat.get_history(curated=True) + [
+            types.Content(role="user", parts=user_parts),
+            types.Content(role="model", parts=parts + [types.Part(text=CUT_SHORT_NOTE)]),
+        ]
+        self._chat = self._create_chat(history)
+        self._compact_history()
+        self._record_message(message)
+    
+    def _cut_short(self, cancel: Optional[Cancellation], chunks: List[Dict[str, Any]]) -> str:
+        """Count a turn stopped after ``chunks``; returns why it stopped."""
+        if cancel is not None:
+            # A no-op if it was already cancelled; otherwise the caller closed the stream
+            cancel.cancel('disconnect')
+            if cancel.requested_at is not None:
+                observe("cancel", time.monotonic() - cancel.requested_at, self.last_trace)
+        reason = cancel.reason if cancel is not None else 'disconnect'
+        TURNS_CANCELLED.inc(reason=reason)
+        logger.info(f"Turn stopped ({reason}) after {len(chunks)} chunks")
+        return reason
+    
+    @contextmanager
+    def _cancellable(self, message: str, user_parts: List[types.Part], chunks: List[Dict[str, Any]], stream, cancel: Optional[Cancellation]):
+        """
+        Wrap the loop of a streamed turn. When it is cancelled (``TurnCancelled``) or the
+        caller closes it mid-reply, close ``stream`` so the model stops generating, and
+        record the turn with ``chunks``, the reply sent so far.
+        """
+        try:
+            yield
+        except (TurnCancelled, GeneratorExit) as e:
+            self._cut_short(cancel, chunks)
+            if stream is not None:
+                stream.close()
+            self._record_cut_short(message, user_parts, chunks)
+            if isinstance(e, GeneratorExit):
+                raise
+    
+    def select_files(self, message: str) -> List[SessionFile]:
+        """The uploaded files to attach to ``message``; see ``session_files.select_files``."""
+        return select_files(self.files, message, self.last_files)
+    
+    def _message_parts(self, message: str, files: List[SessionFile]) -> List[types.Part]:
+        """
+        The message followed by its attachments - so the model sees the question before the file context.
+        Records the files as attached to this turn.
+        """
+        self.last_files = list(files)
+        for file in files:
+            file.attached = True
+        return [types.Part.from_text(text=message)] + attachment_parts(files)
     
     def send_message(self, message: str) -> List[types.Part]:
         """
@@ -144,32 +396,35 @@ class GeminiChatSession:
         """
         try:
             logger.debug(f"Sending message: {message[:100]}...")
-            response = self._chat.send_message(message)
+            with span("turn", self._new_trace("turn")):
+                response = self.call_policy.call(lambda: self._chat.send_message(message))
             logger.debug(f"Response received: {response.text[:100] if response.text else 'No text'}...")
+            self._compact_history(response.usage_metadata)
+            self._record_message(message)
             return response.candidates[0].content.parts
         except Exception as e:
             logger.error(f"Gemini API error: {str(e)}")
             return [types.Part.from_text(text=f"Sorry, I ran into an error: {str(e)}")]
     
-    def send_message_with_file(self, message: str, file: types.File) -> List[types.Part]:
+    def send_message_with_files(self, message: str, files: List[SessionFile]) -> List[types.Part]:
         """
-        Send a message along with a file reference.
+        Send a message along with references to some of the uploaded files.
         
         Args:
             message: The user's message text
-            file: The uploaded file object from Gemini
+            files: The files to attach, usually ``select_files(message)``
             
         Returns:
             List of Part objects containing the response
         """
         try:
-            logger.debug(f"Sending message with file: {message[:100]}...")
-            # Message first, then file reference - so model sees question before file context
-            response = self._chat.send_message([
-                message,
-                types.Part.from_uri(file_uri=file.uri, mime_type=file.mime_type)
-            ])
+            logger.debug(f"Sending message with {len(files)} file(s): {message[:100]}...")
+            parts = self._message_parts(message, files)
+            with span("turn", self._new_trace("turn")):
+                response = self.call_policy.call(lambda: self._chat.send_message(parts))
             logger.debug(f"Response received: {response.text[:100] if response.text else 'No text'}...")
+            self._compact_history(response.usage_metadata)
+            self._record_message(message)
             return response.candidates[0].content.parts
         except Exception as e:
             logger.error(f"Gemini API error: {str(e)}")
@@ -194,11 +449,16 @@ class GeminiChatSession:
                     yield {"type": "result", "content": part.code_execution_result.output}
                 elif hasattr(part, 'inline_data') and part.inline_data:
                     try:
-                        image_data = base64.b64encode(
-                            part.inline_data.data if isinstance(part.inline_data.data, bytes) 
-                            else part.inline_data.data
-                        ).decode("utf-8")
-                        yield {"type": "image", "content": image_data}
+                        # With an image store only the digest is streamed; the client fetches the bytes separately
+                        if self.image_store is not None:
+                            digest = self.image_store.put(part.inline_data.data, part.inline_data.mime_type)
+                            yield {"type": "image", "digest": digest}
+                        else:
+                            image_data = base64.b64encode(
+                                part.inline_data.data if isinstance(part.inline_data.data, bytes) 
+                                else part.inline_data.data
+                            ).decode("utf-8")
+                            yield {"type": "image", "content": image_data}
                     except Exception as e:
                         logger.error(f"Error encoding image: {e}")
                         yield {"type": "error", "content": f"Error encoding image: {str(e)}"}
@@ -206,114 +466,472 @@ class GeminiChatSession:
             logger.warning(f"Error processing chunk: {e}")
             # Don't yield error for individual chunk failures, continue with stream
 
-    def send_message_stream(self, message: str) -> Generator[Dict[str, Any], None, None]:
+    def send_message_stream(self, message: str, cancel: Optional[Cancellation] = None) -> Generator[Dict[str, Any], None, None]:
         """
         Stream message responses as structured chunks.
         
         Args:
             message: The user's message text
+            cancel: Checked between chunks; once set, the turn stops and is recorded with the reply so far
             
         Yields:
             Dict with 'type' and 'content' keys for each response part
         """
         try:
             logger.debug(f"Streaming message: {message[:100]}...")
-            stream = self._chat.send_message_stream(message)
+            stream = self.call_policy.stream(lambda: self._start_stream(message))
             
-            for chunk in stream:
-                yield from self._process_stream_chunk(chunk)
+            usage = None
+            sent = []
+            timer = TurnTimer(self._new_trace("turn"))
+            with self._cancellable(message, [types.Part.from_text(text=message)], sent, stream, cancel):
+                for chunk in stream:
+                    usage = chunk.usage_metadata or usage
+                    for part in self._process_stream_chunk(chunk):
+                        timer.chunk(part)
+                        sent.append(part)
+                        yield part
+                    if cancel is not None:
+                        cancel.check()
+                timer.finish()
+                self._compact_history(usage)
+                self._record_message(message)
                 
-        except json.JSONDecodeError as e:
-            logger.error(f"Gemini API returned invalid JSON: {str(e)}")
-            yield {"type": "error", "content": "The API returned an invalid response. This may be due to server overload. Please try again."}
         except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Gemini streaming error: {error_msg}")
-            
-            # Provide more helpful error messages
-            if "overloaded" in error_msg.lower() or "capacity" in error_msg.lower():
-                yield {"type": "error", "content": "The model is currently overloaded. Please try again in a moment."}
-            elif "quota" in error_msg.lower():
-                yield {"type": "error", "content": "API quota exceeded. Please try again later."}
-            else:
-                yield {"type": "error", "content": f"Sorry, I ran into an error: {error_msg}"}
+            yield stream_error_chunk(e)
 
-    def send_message_with_file_stream(self, message: str, file: types.File) -> Generator[Dict[str, Any], None, None]:
+    def send_message_with_files_stream(
+        self, message: str, files: List[SessionFile], cancel: Optional[Cancellation] = None,
+    ) -> Generator[Dict[str, Any], None, None]:
         """
-        Stream message responses with a file reference.
+        Stream message responses with references to some of the uploaded files.
+        With a response cache, a reply already produced for the same datasets and
+        conversation is replayed at its recorded pace instead of calling the model.
         
         Args:
             message: The user's message text
-            file: The uploaded file object from Gemini
+            files: The files to attach, usually ``select_files(message)``
+            cancel: Checked between chunks; once set, the turn stops and is recorded with the reply so far
             
         Yields:
             Dict with 'type' and 'content' keys for each response part
         """
         try:
-            logger.debug(f"Streaming message with file: {message[:100]}...")
-            # Message first, then file reference - so model sees question before file context
-            stream = self._chat.send_message_stream([
-                message,
-                types.Part.from_uri(file_uri=file.uri, mime_type=file.mime_type)
-            ])
+            logger.debug(f"Streaming message with {len(files)} file(s): {message[:100]}...")
+            key = self._response_key(message, files)
+            cached = self._cached_response(key)
+            if cached is not None:
+                self._new_trace("replay")
+                sent = []
+                with self._cancellable(message, self._message_parts(message, files), sent, None, cancel):
+                    for delay, part in cached.delays(self.replay_speed):
+                        if delay:
+                            time.sleep(delay)
+                        if cancel is not None:
+                            cancel.check()
+                        sent.append(part)
+                        yield part
+                    self._record_replay(message, files, cached)
+                    self._record_message(message)
+                return
             
-            for chunk in stream:
-                yield from self._process_stream_chunk(chunk)
+            parts = self._message_parts(message, files)
+            stream = self.call_policy.stream(lambda: self._start_stream(parts))
+            
+            usage = None
+            sent = []
+            recorded = []
+            start = time.monotonic()
+            timer = TurnTimer(self._new_trace("turn"))
+            with self._cancellable(message, parts, sent, stream, cancel):
+                for chunk in stream:
+                    usage = chunk.usage_metadata or usage
+                    for part in self._process_stream_chunk(chunk):
+                        timer.chunk(part)
+                        # Chunks aren't modified after this, so the response cache and the turn buffer keep them as they are
+                        sent.append(part)
+                        recorded.append((time.monotonic() - start, sent[-1]))
+                        yield part
+                    if cancel is not None:
+                        cancel.check()
+                timer.finish()
+                self._compact_history(usage)
+                self._record_message(message)
+                self._store_response(key, recorded)
                 
-        except json.JSONDecodeError as e:
-            logger.error(f"Gemini API returned invalid JSON: {str(e)}")
-            yield {"type": "error", "content": "The API returned an invalid response. This may be due to server overload. Please try again."}
         except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Gemini streaming error: {error_msg}")
-            
-            # Provide more helpful error messages
-            if "overloaded" in error_msg.lower() or "capacity" in error_msg.lower():
-                yield {"type": "error", "content": "The model is currently overloaded. Please try again in a moment."}
-            elif "quota" in error_msg.lower():
-                yield {"type": "error", "content": "API quota exceeded. Please try again later."}
-            else:
-                yield {"type": "error", "content": f"Sorry, I ran into an error: {error_msg}"}
+            yield stream_error_chunk(e)
     
     def upload_file(self, file: BinaryIO, filename: str) -> types.File:
         """
-        Upload a file to Gemini and store the reference.
-        Converts non-CSV files to CSV format before uploading.
+        Upload one file to Gemini and add it to the conversation; see ``upload_files``.
         
-        Args:
-            file: File-like object to upload
-            filename: Original filename for display
-            
         Returns:
             The uploaded File object
         """
-        if self.has_file_uploaded:
-            raise ValueError("A file has already been uploaded. Please reload to upload a new file.")
+        return self._upload_files([(file, filename)])[0].file
+    
+    def upload_files(self, uploads: List[Tuple[BinaryIO, str]]) -> List[SessionFile]:
+        """
+        Upload files to Gemini and add them to the conversation.
+        Files are converted and uploaded in parallel on a thread pool; non-CSV
+        files are converted to CSV first, streaming the conversion so a file is
+        never held in memory whole. With an upload cache, content that was
+        already uploaded reuses the existing file.
         
-        file_content = file.read()
-        csv_content, original_ext = convert_to_csv(file_content, filename)
+        Args:
+            uploads: (file-like object, original filename) of each file
+            
+        Returns:
+            The session's entry for each file, in the order given
+        """
+        return self._upload_files(uploads)
+    
+    def _upload_files(self, uploads: List[Tuple[BinaryIO, str]]) -> List[SessionFile]:
+        if len(self.files) + len(uploads) > self.max_files:
+            raise ValueError(f"A conversation can hold at most {self.max_files} files.")
         
-        self.uploaded_file = client.files.upload(
-            file=io.BytesIO(csv_content),
-            config=types.UploadFileConfig(
-                mime_type="text/csv",
-                display_name=filename
+        trace = self._new_trace("upload")
+        with span("upload", trace):
+            if len(uploads) == 1:
+                prepared = [self._prepare_file(*uploads[0], trace)]
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(uploads), self.upload_workers)) as pool:
+                    prepared = list(pool.map(lambda upload: self._prepare_file(*upload, trace), uploads))
+        return [self._add_file(file) for file in prepared]
+    
+    def _prepare_file(self, file: BinaryIO, filename: str, trace: Optional[Trace] = None) -> SessionFile:
+        """Convert, profile and upload one file without touching session state, so several can run at once."""
+        if self.upload_cache is not None:
+            cached = self.upload_cache.get_or_upload(
+                file,
+                filename,
+                lambda csv_file: self._upload_csv(csv_file, filename, trace)
             )
+            logger.info(f"File uploaded: {cached.file.name} (converted from {cached.original_ext})")
+            return self._session_file(cached.file, filename, cached.digest, cached.profile, cached.sample)
+        
+        csv_file, original_ext = convert_to_csv_stream(file, filename)
+        with csv_file:
+            uploaded_file = self._upload_csv(csv_file, filename, trace)
+            csv_file.seek(0)
+            profile = safe_profile(csv_file)
+        logger.info(f"File uploaded: {uploaded_file.name} (converted from {original_ext})")
+        return self._session_file(uploaded_file, filename, None, profile)
+    
+    @staticmethod
+    def _session_file(
+        uploaded_file: types.File,
+        filename: str,
+        digest: Optional[str],
+        profile: Optional[Dict[str, Any]] = None,
+        sample: Optional[Dict[str, Any]] = None,
+    ) -> SessionFile:
+        sections = []
+        if profile is not None:
+            sections.append(format_profile(profile, filename))
+        if sample is not None:
+            sections.append(format_sample(sample, filename))
+        return SessionFile(
+            file=uploaded_file,
+            name=filename,
+            digest=digest,
+            columns=[column["name"] for column in profile["columns"]] if profile else [],
+            description="\n\n".join(sections) or None,
         )
-        self.uploaded_file_name = filename
-        self.has_file_uploaded = True
-        logger.info(f"File uploaded: {self.uploaded_file.name} (converted from {original_ext})")
-        return self.uploaded_file
+    
+    def _upload_csv(self, csv_file: BinaryIO, filename: str, trace: Optional[Trace] = None) -> types.File:
+        with span("gemini_upload", trace):
+            return self.backend.upload_file(csv_file, self._upload_config(filename))
+    
+    def _new_trace(self, name: str) -> Trace:
+        self.last_trace = Trace(name)
+        return self.last_trace
+    
+    @staticmethod
+    def _upload_config(filename: str) -> types.UploadFileConfig:
+        return types.UploadFileConfig(mime_type="text/csv", display_name=filename)
+    
+    def _add_file(self, file: SessionFile) -> SessionFile:
+        """
+        Add an uploaded file to the conversation.
+        The dataset profiles in the system instruction are rebuilt, keeping the conversation so far.
+        """
+        self.files.append(file)
+        descriptions = [f.description for f in self.files if f.description]
+        if file.description:
+            self.dataset_profile = "\n\n".join(descriptions)
+            self._chat = self._create_chat(self.get_history())
+        return file
     
     def get_history(self) -> List[types.Content]:
         """Get the conversation history."""
         return self._chat.get_history()
     
+    @property
+    def history_etag(self) -> str:
+        """Entity tag of the history, which changes whenever the history does and between conversations."""
+        return f'"{self.conversation_id}-{self.history_revision}"'
+    
+    def history_page(self, since: Optional[int] = None, limit: int = DEFAULT_PAGE_TURNS) -> str:
+        """A page of the history as JSON; see ``HistoryPages.page``."""
+        return self.history_pages.page(
+            split_turns(self.get_history()), self.history_offset, self.turn_revisions, since, limit,
+        )
+    
+    def approx_bytes(self) -> int:
+        """
+        Rough memory held by the conversation, for the session registry's bound: the history
+        (plots at their size), what the model is told about the files, and the uploaded
+        datasets themselves, which the data grid maps into memory.
+        """
+        size = sum(len(text) for text in [self.dataset_profile or "", *self.history_summary])
+        for content in self.get_history():
+            for part in content.parts or []:
+                if part.inline_data and part.inline_data.data:
+                    size += len(part.inline_data.data)
+                elif part.text:
+                    size += len(part.text)
+                elif part.executable_code and part.executable_code.code:
+                    size += len(part.executable_code.code)
+                elif part.code_execution_result and part.code_execution_result.output:
+                    size += len(part.code_execution_result.output)
+        return size + sum(file.file.size_bytes or 0 for file in self.files)
+    
+    def to_state(self) -> Dict[str, Any]:
+        """
+        The conversation as JSON-serializable data, from which ``restore`` rebuilds it in
+        another process: the history, the uploaded files' Gemini handles and what the model
+        is told about them.
+        """
+        return {
+            "version": STATE_VERSION,
+            "history": [self._dump_content(content) for content in self.get_history()],
+            "files": [file.to_dict() for file in self.files],
+            "last_files": [i for i, file in enumerate(self.files) if file in self.last_files],
+            "dataset_profile": self.dataset_profile,
+            "history_summary": self.history_summary,
+            "turn_tokens": self.turn_tokens,
+            "conversation": self.conversation,
+            "conversation_id": self.conversation_id,
+            "history_offset": self.history_offset,
+            "history_revision": self.history_revision,
+            "turn_revisions": self.turn_revisions,
+        }
+    
+    def restore(self, state: Dict[str, Any]) -> None:
+        """
+        Replace this conversation with one saved by ``to_state``.
+    
+        Raises:
+            ValueError: If the state was saved in another format or is malformed
+        """
+        if state.get("version") != STATE_VERSION:
+            raise ValueError(f"Unsupported session state version: {state.get('version')}")
+        history = [self._load_content(content) for content in state["history"]]
+        files = [SessionFile.from_dict(file) for file in state["files"]]
+        self.files = files
+        self.last_files = [files[i] for i in state["last_files"]]
+        self.dataset_profile = state["dataset_profile"]
+        self.history_summary = list(state["history_summary"])
+        self.turn_tokens = list(state["turn_tokens"])
+        self.conversation = list(state["conversation"])
+        self.conversation_id = state.get("conversation_id") or uuid.uuid4().hex
+        self.history_offset = state.get("history_offset", 0)
+        self.history_revision = state.get("history_revision", 0)
+        self.turn_revisions = list(state.get("turn_revisions", []))
+        self.history_pages = HistoryPages(self.image_store)
+        self.last_usage = None
+        self._chat = self._create_chat(history)
+    
+    def _dump_content(self, content: types.Content) -> Dict[str, Any]:
+        """A history entry as JSON. With an image store, plots are kept there and referenced by digest."""
+        parts = []
+        for part in content.parts or []:
+            if part.inline_data and part.inline_data.data and self.image_store is not None:
+                parts.append({"image": self.image_store.put(part.inline_data.data, part.inline_data.mime_type)})
+            else:
+                parts.append(part.model_dump(mode="json", exclude_none=True))
+        return {"role": content.role, "parts": parts}
+    
+    def _load_content(self, data: Dict[str, Any]) -> types.Content:
+        parts = []
+        for part in data.get("parts", []):
+            if "image" in part:
+                parts.append(self._stored_image(part["image"]))
+            else:
+                parts.append(types.Part.model_validate(part))
+        return types.Content(role=data.get("role"), parts=parts)
+    
+    def _stored_image(self, digest: str) -> types.Part:
+        """A plot from the image store, or a placeholder once it has been evicted."""
+        found = self.image_store.get(digest) if self.image_store is not None else None
+        if found is None:
+            return types.Part(text=PLOT_PLACEHOLDER)
+        path, mime_type = found
+        with open(path, 'rb') as f:
+            return types.Part(inline_data=types.Blob(data=f.read(), mime_type=mime_type))
+    
     def reset(self):
         """Reset the chat session, clearing history and uploaded files."""
-        self.uploaded_file = None
-        self.uploaded_file_name = None
-        self.has_file_uploaded = False
-        self.file_sent_to_chat = False
+        self.files = []
+        self.last_files = []
+        self.dataset_profile = None
+        self.history_summary = []
+        self.turn_tokens = []
+        self.conversation = []
+        self.conversation_id = uuid.uuid4().hex
+        self.history_offset = 0
+        self.history_revision = 0
+        self.turn_revisions = []
+        self.history_pages = HistoryPages(self.image_store)
+        self.last_usage = None
         self._chat = self._create_chat()
         logger.info("Chat session reset")
+
+
+class AsyncGeminiChatSession(GeminiChatSession):
+    """
+    Variant of GeminiChatSession built on the async Gemini client.
+    
+    The messaging and upload methods are coroutines (or async generators for the
+    streaming ones), so an ASGI worker can hold many open conversations on one
+    event loop instead of pinning a thread per streamed turn.
+    """
+    
+    def _create_chat(self, history: Optional[List[types.Content]] = None):
+        """Create a new async chat session with the configured system prompt."""
+        return self.backend.create_async_chat(self.model, self._chat_config(), history)
+    
+    async def _start_stream(self, message: Any) -> AsyncIterator[types.GenerateContentResponse]:
+        """Async version of GeminiChatSession._start_stream."""
+        chat = self._create_chat(self._chat.get_history(curated=True))
+        stream = await chat.send_message_stream(message)
+        
+        async def adopt():
+            async with aclosing(stream):
+                async for chunk in stream:
+                    yield chunk
+            self._chat = chat
+        return adopt()
+    
+    async def send_message(self, message: str) -> List[types.Part]:
+        """Async version of GeminiChatSession.send_message."""
+        try:
+            logger.debug(f"Sending message: {message[:100]}...")
+            with span("turn", self._new_trace("turn")):
+                response = await self.call_policy.acall(lambda: self._chat.send_message(message))
+            self._compact_history(response.usage_metadata)
+            self._record_message(message)
+            return response.candidates[0].content.parts
+        except Exception as e:
+            logger.error(f"Gemini API error: {str(e)}")
+            return [types.Part.from_text(text=f"Sorry, I ran into an error: {str(e)}")]
+    
+    async def send_message_with_files(self, message: str, files: List[SessionFile]) -> List[types.Part]:
+        """Async version of GeminiChatSession.send_message_with_files."""
+        try:
+            logger.debug(f"Sending message with {len(files)} file(s): {message[:100]}...")
+            parts = self._message_parts(message, files)
+            with span("turn", self._new_trace("turn")):
+                response = await self.call_policy.acall(lambda: self._chat.send_message(parts))
+            self._compact_history(response.usage_metadata)
+            self._record_message(message)
+            return response.candidates[0].content.parts
+        except Exception as e:
+            logger.error(f"Gemini API error: {str(e)}")
+            return [types.Part.from_text(text=f"Sorry, I ran into an error: {str(e)}")]
+    
+    @asynccontextmanager
+    async def _acancellable(self, message: str, user_parts: List[types.Part], chunks: List[Dict[str, Any]], stream, cancel: Optional[Cancellation]):
+        """Async version of GeminiChatSession._cancellable; a disconnect may also arrive as task cancellation."""
+        try:
+            yield
+        except (TurnCancelled, GeneratorExit, asyncio.CancelledError) as e:
+            self._cut_short(cancel, chunks)
+            if stream is not None:
+                await stream.aclose()
+            self._record_cut_short(message, user_parts, chunks)
+            if not isinstance(e, TurnCancelled):
+                raise
+    
+    async def send_message_stream(self, message: str, cancel: Optional[Cancellation] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Async version of GeminiChatSession.send_message_stream."""
+        try:
+            logger.debug(f"Streaming message: {message[:100]}...")
+            stream = self.call_policy.astream(lambda: self._start_stream(message))
+            usage = None
+            sent = []
+            timer = TurnTimer(self._new_trace("turn"))
+            async with self._acancellable(message, [types.Part.from_text(text=message)], sent, stream, cancel):
+                async for chunk in stream:
+                    usage = chunk.usage_metadata or usage
+                    for part in self._process_stream_chunk(chunk):
+                        timer.chunk(part)
+                        sent.append(part)
+                        yield part
+                    if cancel is not None:
+                        cancel.check()
+                timer.finish()
+                self._compact_history(usage)
+                self._record_message(message)
+        except Exception as e:
+            yield stream_error_chunk(e)
+    
+    async def send_message_with_files_stream(
+        self, message: str, files: List[SessionFile], cancel: Optional[Cancellation] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Async version of GeminiChatSession.send_message_with_files_stream."""
+        try:
+            logger.debug(f"Streaming message with {len(files)} file(s): {message[:100]}...")
+            key = self._response_key(message, files)
+            cached = self._cached_response(key)
+            if cached is not None:
+                self._new_trace("replay")
+                sent = []
+                async with self._acancellable(message, self._message_parts(message, files), sent, None, cancel):
+                    for delay, part in cached.delays(self.replay_speed):
+                        if delay:
+                            await asyncio.sleep(delay)
+                        if cancel is not None:
+                            cancel.check()
+                        sent.append(part)
+                        yield part
+                    self._record_replay(message, files, cached)
+                    self._record_message(message)
+                return
+            
+            parts = self._message_parts(message, files)
+            stream = self.call_policy.astream(lambda: self._start_stream(parts))
+            usage = None
+            sent = []
+            recorded = []
+            start = time.monotonic()
+            timer = TurnTimer(self._new_trace("turn"))
+            async with self._acancellable(message, parts, sent, stream, cancel):
+                async for chunk in stream:
+                    usage = chunk.usage_metadata or usage
+                    for part in self._process_stream_chunk(chunk):
+                        timer.chunk(part)
+                        sent.append(part)
+                        recorded.append((time.monotonic() - start, sent[-1]))
+                        yield part
+                    if cancel is not None:
+                        cancel.check()
+                timer.finish()
+                self._compact_history(usage)
+                self._record_message(message)
+                self._store_response(key, recorded)
+        except Exception as e:
+            yield stream_error_chunk(e)
+    
+    async def upload_file(self, file: BinaryIO, filename: str) -> types.File:
+        """
+        Async version of GeminiChatSession.upload_file.
+        Conversion, hashing and upload are blocking file work, so the sync path runs in a worker thread.
+        """
+        return (await self.upload_files([(file, filename)]))[0].file
+    
+    async def upload_files(self, uploads: List[Tuple[BinaryIO, str]]) -> List[SessionFile]:
+        """Async version of GeminiChatSession.upload_files."""
+        return await asyncio.to_thread(self._upload_files, uploads)
@@ -0,0 +1,213 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 32_000
+# The latest turns are never shrunk or dropped
+DEFAULT_KEEP_TURNS = 2
+# Request building cost grows with the number of parts, not just tokens, so turns are capped too
+DEFAULT_MAX_TURNS = 20
+# Code output kept from older turns once the history is over budget
+MAX_OLD_OUTPUT_CHARS = 800
+# Dropped turns are summarized in the system instruction, newest last, up to this many
+MAX_SUMMARY_TURNS = 20
+SUMMARY_QUESTION_CHARS = 200
+SUMMARY_ANSWER_CHARS = 400
+
+# Rough token costs used for budgeting; the API's own usage metadata is logged per turn
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 258
+PART_OVERHEAD_TOKENS = 4
+
+PLOT_PLACEHOLDER = "[Plot omitted from history]"
+# Marks output already truncated by an earlier pass, which later passes leave alone
+_OMITTED_PATTERN = re.compile(r'\n\[\.\.\. [\d,]+ characters of output omitted \.\.\.\]$')
+
+
+def estimate_tokens(content: types.Content) -> int:
+    """Approximate the prompt tokens a history entry costs."""
+    tokens = 0
+    for part in content.parts or []:
+        tokens += PART_OVERHEAD_TOKENS
+        if part.text:
+            tokens += len(part.text) // CHARS_PER_TOKEN
+        elif part.executable_code and part.executable_code.code:
+            tokens += len(part.executable_code.code) // CHARS_PER_TOKEN
+        elif part.code_execution_result and part.code_execution_result.output:
+            tokens += len(part.code_execution_result.output) // CHARS_PER_TOKEN
+        elif part.inline_data:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+def _turn_tokens(turn: List[types.Content]) -> int:
+    return sum(estimate_tokens(content) for content in turn)
+
+
+def split_turns(history: List[types.Content]) -> List[List[types.Content]]:
+    """Group history into turns, each a user message followed by the model's responses."""
+    turns: List[List[types.Content]] = []
+    for content in history:
+        if content.role == 'user' or not turns:
+            turns.append([content])
+        else:
+            turns[-1].append(content)
+    return turns
+
+
+def _tidy_turn(turn: List[types.Content]) -> List[types.Content]:
+    """
+    Drop file references, which the current message re-attaches, and merge the
+    one-Content-per-chunk model responses left by streaming into a single Content.
+    """
+    tidied: List[types.Content] = []
+    for content in turn:
+        parts = [part for part in content.parts or [] if not part.file_data]
+        if tidied and tidied[-1].role == content.role == 'model':
+            tidied[-1] = tidied[-1].model_copy(update={"parts": [*tidied[-1].parts, *parts]})
+        else:
+            tidied.append(content.model_copy(update={"parts": parts}))
+    return tidied
+
+
+def _shrink_part(part: types.Part) -> types.Part:
+    """Truncate long code output and replace plots with a placeholder."""
+    if part.inline_data:
+        return types.Part(text=PLOT_PLACEHOLDER)
+    result = part.code_execution_result
+    if result and result.output and len(result.output) > MAX_OLD_OUTPUT_CHARS and not _OMITTED_PATTERN.search(result.output):
+        omitted = len(result.output) - MAX_OLD_OUTPUT_CHARS
+        output = f"{result.output[:MAX_OLD_OUTPUT_CHARS]}\n[... {omitted:,} characters of output omitted ...]"
+        return part.model_copy(update={"code_execution_result": result.model_copy(update={"output": output})})
+    return part
+
+
+def _shrink_turn(turn: List[types.Content]) -> Optional[List[types.Content]]:
+    """The turn with old output shrunk, or None if there was nothing left to shrink."""
+    shrunk = []
+    changed = False
+    for content in turn:
+        parts = [_shrink_part(part) for part in content.parts or []]
+        changed = changed or any(new is not old for new, old in zip(parts, content.parts or []))
+        shrunk.append(content.model_copy(update={"parts": parts}))
+    return shrunk if changed else None
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def summarize_turn(turn: List[types.Content]) -> str:
+    """One summary line for a dropped turn: the question and the model's final prose answer."""
+    question = " ".join(part.text for part in turn[0].parts or [] if part.text) if turn[0].role == 'user' else ""
+    answer = ""
+    for content in reversed(turn[1:]):
+        texts = [part.text for part in content.parts or [] if part.text and part.text != PLOT_PLACEHOLDER]
+        if texts:
+            answer = " ".join(texts)
+            break
+    line = f"- User: {_clip(question, SUMMARY_QUESTION_CHARS)}"
+    if answer:
+        line += f" | You: {_clip(answer, SUMMARY_ANSWER_CHARS)}"
+    return line
+
+
+@dataclass
+class CompactedHistory:
+    history: List[types.Content]
+    # Summary lines for turns that were dropped, oldest first
+    summary: List[str]
+    # Estimated tokens of each remaining turn
+    turn_tokens: List[int] = field(default_factory=list)
+    # Turns dropped from the front by this pass
+    dropped: int = 0
+    # Remaining turns shrunk by this pass, by position in the compacted history
+    shrunk: List[int] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return sum(self.turn_tokens)
+
+
+class HistoryCompactor:
+    """
+    Keeps a chat history within a token budget so each turn's request stays bounded.
+
+    Every pass removes file references from past turns (the current message
+    carries the file) and merges streamed model chunks. When the estimate is
+    still over ``token_budget``, older turns (all but the latest ``keep_turns``)
+    have their code output truncated and plots replaced, oldest first; if that
+    isn't enough, the oldest turns are dropped and summarized in one line each.
+    Turns beyond ``max_turns`` are dropped the same way whatever their size.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        keep_turns: int = DEFAULT_KEEP_TURNS,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        max_summary_turns: int = MAX_SUMMARY_TURNS,
+    ):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.max_turns = max(max_turns, keep_turns)
+        self.max_summary_turns = max_summary_turns
+
+    def compact(self, history: List[types.Content], summary: Optional[List[str]] = None) -> CompactedHistory:
+        """
+        Compact a history.
+
+        Args:
+            history: The chat's curated history
+            summary: Summary lines of turns dropped by earlier passes
+
+        Returns:
+            The compacted history, the updated summary and per-turn token estimates
+        """
+        summary = list(summary or [])
+        turns = [_tidy_turn(turn) for turn in split_turns(history)]
+        tokens = [_turn_tokens(turn) for turn in turns]
+        old = max(len(turns) - self.keep_turns, 0)
+
+        shrunk = []
+        for i in range(old):
+            if sum(tokens) <= self.token_budget:
+                break
+            smaller = _shrink_turn(turns[i])
+            if smaller is not None:
+                turns[i] = smaller
+                tokens[i] = _turn_tokens(smaller)
+                shrunk.append(i)
+
+        dropped = 0
+        while dropped < old and (sum(tokens) > self.token_budget or len(turns) - dropped > self.max_turns):
+            summary.append(summarize_turn(turns[dropped]))
+            tokens[dropped] = 0
+            dropped += 1
+        if dropped:
+            logger.info(f"Dropped {dropped} old turn(s) from the chat history")
+
+        return CompactedHistory(
+            history=[content for turn in turns[dropped:] for content in turn],
+            summary=summary[-self.max_summary_turns:],
+            turn_tokens=tokens[dropped:],
+            dropped=dropped,
+            shrunk=[i - dropped for i in shrunk if i >= dropped],
+        )
+
+
+def format_summary(summary: List[str]) -> str:
+    """Render dropped-turn summaries as a section of the system instruction."""
+    return "\n".join([
+        "# Earlier Conversation",
+        "Older turns were removed from the chat history to keep requests small. "
+        "They are summarized here, oldest first; re-run code if you need their exact output.",
+        "",
+        *summary,
+    ])
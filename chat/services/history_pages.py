@@ -0,0 +1,117 @@
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.genai import types
+
+from .image_store import ImageStore
+
+DEFAULT_PAGE_TURNS = 20
+MAX_PAGE_TURNS = 100
+
+
+def encode_part(part: types.Part, image_store: Optional[ImageStore] = None) -> Optional[Dict[str, Any]]:
+    """
+    A history part in the shape of a streamed chunk, or None for parts the chat doesn't show.
+    With an image store, plots are referenced by digest instead of inlined as base64.
+    """
+    if part.text:
+        return {"type": "text", "content": part.text}
+    if part.executable_code:
+        return {"type": "code", "content": part.executable_code.code}
+    if part.code_execution_result:
+        return {"type": "result", "content": part.code_execution_result.output}
+    if part.inline_data and part.inline_data.data:
+        if image_store is not None:
+            return {"type": "image", "digest": image_store.put(part.inline_data.data, part.inline_data.mime_type)}
+        return {"type": "image", "content": base64.b64encode(part.inline_data.data).decode()}
+    if part.file_data:
+        return {"type": "file", "uri": part.file_data.file_uri, "mime_type": part.file_data.mime_type}
+    return None
+
+
+def encode_turn(turn: List[types.Content], image_store: Optional[ImageStore] = None) -> List[Dict[str, Any]]:
+    """
+    The messages of one turn, each a role and its encoded parts. Runs of text parts
+    (one per streamed chunk) are joined into one.
+    """
+    messages = []
+    for content in turn:
+        parts: List[Dict[str, Any]] = []
+        for part in content.parts or []:
+            encoded = encode_part(part, image_store)
+            if encoded is None:
+                continue
+            if encoded["type"] == "text" and parts and parts[-1]["type"] == "text":
+                parts[-1]["content"] += encoded["content"]
+            else:
+                parts.append(encoded)
+        messages.append({"role": content.role, "parts": parts})
+    return messages
+
+
+class HistoryPages:
+    """
+    Pages of one conversation's history for the history API.
+
+    Turns are numbered from the start of the conversation, so a number keeps
+    meaning the same turn after older ones are dropped from the history. Each
+    turn is serialized once and kept as JSON until the history compactor
+    changes it (its revision moves on) or drops it, so polling clients and
+    reconnects only pay for turns they haven't been sent yet.
+    """
+
+    def __init__(self, image_store: Optional[ImageStore] = None):
+        self.image_store = image_store
+        # Turn number -> (revision, JSON)
+        self._encoded: Dict[int, Tuple[int, str]] = {}
+
+    def page(
+        self,
+        turns: List[List[types.Content]],
+        first: int,
+        revisions: List[int],
+        since: Optional[int] = None,
+        limit: int = DEFAULT_PAGE_TURNS,
+    ) -> str:
+        """
+        Serialize a page of turns.
+
+        Args:
+            turns: The history split into turns
+            first: Number of the first of ``turns``; earlier ones were dropped
+            revisions: Revision of each turn; turns past its end (still settling) aren't cached
+            since: Number of the first turn to return; defaults to the oldest kept
+            limit: Maximum turns to return, capped at MAX_PAGE_TURNS
+
+        Returns:
+            JSON object with the ``first`` turn kept, the ``total`` turns so far, the page's
+            ``since`` and ``next`` turn numbers, and the ``turns`` with their ``messages``
+
+        Raises:
+            ValueError: If ``since`` is negative or ``limit`` isn't positive
+        """
+        if limit < 1 or (since is not None and since < 0):
+            raise ValueError("since must not be negative and limit must be positive")
+        limit = min(limit, MAX_PAGE_TURNS)
+        total = first + len(turns)
+        start = first if since is None else min(max(since, first), total)
+        end = min(start + limit, total)
+
+        for number in [number for number in self._encoded if number < first]:
+            self._encoded.pop(number, None)
+        encoded = [
+            self._turn(number, turns[number - first], revisions[number - first] if number - first < len(revisions) else None)
+            for number in range(start, end)
+        ]
+        header = json.dumps({"first": first, "total": total, "since": start, "next": end})
+        return f'{header[:-1]}, "turns": [{", ".join(encoded)}]}}'
+
+    def _turn(self, number: int, turn: List[types.Content], revision: Optional[int]) -> str:
+        cached = self._encoded.get(number)
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+        encoded = json.dumps({"turn": number, "messages": encode_turn(turn, self.image_store)})
+        if revision is not None:
+            self._encoded[number] = (revision, encoded)
+        return encoded
@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Seconds an image this worker stored or touched is taken to still be there without checking the disk
+DEFAULT_TOUCH_INTERVAL = 60.0
+# Images remembered as recently touched, before the record is started over
+_MAX_TOUCHED = 4096
+
+# Raster formats only: images are served from the app's origin, and an SVG could carry script
+EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+MIME_TYPES = {ext: mime for mime, ext in EXTENSIONS.items()}
+_DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ImageStore:
+    """
+    Content-addressed store for images generated by code execution.
+
+    Images are written once under the sha256 of their bytes, so the digest is
+    both the key clients fetch them by and a strong ETag. Files live in a
+    directory shared by every worker on the host, so any worker can serve an
+    image another one stored. Once the directory grows past ``max_bytes`` the
+    least recently used images are deleted.
+
+    Every save of a conversation puts all of its plots again, so an image this
+    worker stored or touched within ``touch_interval`` seconds is not looked
+    up on disk again: each lookup is a system call that gives up the GIL.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        touch_interval: float = DEFAULT_TOUCH_INTERVAL,
+    ):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'eda-images')
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        # Path -> when this worker last stored or touched it
+        self._touched: Dict[str, float] = {}
+        self._bytes = self._usage()
+
+    def put(self, data: bytes, mime_type: Optional[str] = 'image/png') -> str:
+        """
+        Store an image, returning its digest. Storing the same bytes again is a no-op.
+
+        Args:
+            data: Raw image bytes
+            mime_type: MIME type reported by Gemini; other types (including SVG) are stored and served as PNG
+
+        Returns:
+            Hex sha256 digest of ``data``
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, digest + EXTENSIONS.get(mime_type, '.png'))
+        now = time.monotonic()
+        touched = self._touched.get(path)
+        if touched is not None and now - touched < self.touch_interval:
+            return digest
+        if os.path.exists(path):
+            os.utime(path)
+            self._remember(path, now)
+            return digest
+
+        partial_path = f'{path}.{os.getpid()}.{threading.get_ident()}.part'
+        with open(partial_path, 'wb') as f:
+            f.write(data)
+        os.replace(partial_path, path)
+        self._remember(path, now)
+
+        with self._lock:
+            self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict(keep=path)
+        return digest
+
+    def get(self, digest: str) -> Optional[Tuple[str, str]]:
+        """
+        Look up a stored image.
+
+        Returns:
+            (path, mime_type), or None if the digest is malformed or not stored
+        """
+        if not _DIGEST_PATTERN.match(digest):
+            return None
+        for ext, mime_type in MIME_TYPES.items():
+            path = os.path.join(self.directory, digest + ext)
+            try:
+                os.utime(path)
+            except OSError:
+                continue
+            return path, mime_type
+        return None
+
+    def _remember(self, path: str, now: float) -> None:
+        if len(self._touched) >= _MAX_TOUCHED:
+            self._touched.clear()
+        self._touched[path] = now
+
+    def _usage(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def _evict(self, keep: str) -> None:
+        """
+        Delete least recently used images until under ``max_bytes``. Caller must hold ``self._lock``.
+        Usage is re-read from disk because other workers write to the same directory.
+        """
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and not entry.name.endswith('.part')
+        )
+        self._bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._touched.pop(path, None)
+            self._bytes -= size
+            logger.info(f"Evicted image {os.path.basename(path)}")
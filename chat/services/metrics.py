@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import repeat
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a fast render up to a long agentic turn
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+_SUFFIX = '.json'
+
+
+def _label_key(labelnames: Sequence[str], labels: Dict[str, str]) -> str:
+    return _encode_labels(tuple(map(labels.get, labelnames, repeat(''))))
+
+
+@lru_cache(maxsize=1024)
+def _encode_labels(values: Tuple[str, ...]) -> str:
+    # Recorded per streamed chunk from a handful of label sets, so each set is encoded once
+    return json.dumps([str(value) for value in values])
+
+
+def _format_labels(labelnames: Sequence[str], key: str, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, json.loads(key)))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count, optionally split by labels."""
+
+    kind = 'counter'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[str, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.maybe_flush()
+
+    def merge(self, values: Dict[str, float], into: Dict[str, float]) -> None:
+        for key, value in values.items():
+            into[key] = into.get(key, 0) + value
+
+    def render(self, values: Dict[str, float]) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}' for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Distribution of observed values in fixed buckets, optionally split by labels."""
+
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        registry: 'MetricsRegistry',
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket plus one for +Inf, then the sum
+        self.values: Dict[str, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+        self.registry.maybe_flush()
+
+    def merge(self, values: Dict[str, List[float]], into: Dict[str, List[float]]) -> None:
+        for key, state in values.items():
+            if len(state) != len(self.buckets) + 2:
+                continue  # Written with different buckets by an older deployment
+            current = into.setdefault(key, [0] * len(state))
+            for i, value in enumerate(state):
+                current[i] += value
+
+    def render(self, values: Dict[str, List[float]]) -> List[str]:
+        lines = []
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, float('inf')], state):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_number(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", le))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(state[-1])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process metrics rendered in the Prometheus text format.
+
+    Each worker process keeps its own values. With a ``directory`` shared by
+    the workers on a host, every worker writes a snapshot of its values there
+    at most every ``flush_interval`` seconds, and ``render`` sums all
+    snapshots, so a scrape that lands on any worker reports the whole host.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Counter | Histogram] = {}
+        self.configure(directory, flush_interval)
+
+    def configure(self, directory: Optional[str], flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> None:
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._flushed_at = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self.lock:
+            return {name: json.loads(json.dumps(metric.values)) for name, metric in self.metrics.items()}
+
+    def maybe_flush(self) -> None:
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write this worker's values to the shared directory."""
+        if not self.directory:
+            return
+        self._flushed_at = time.monotonic()
+        path = os.path.join(self.directory, f'{os.getpid()}{_SUFFIX}')
+        partial_path = f'{path}.{threading.get_ident()}.part'
+        try:
+            with open(partial_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(partial_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {e}")
+
+    def _snapshots(self) -> Iterator[Dict[str, dict]]:
+        if not self.directory:
+            yield self.snapshot()
+            return
+        self.flush()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(_SUFFIX):
+                continue
+            try:
+                with open(entry.path) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format, summed over workers."""
+        merged: Dict[str, dict] = {name: {} for name in self.metrics}
+        for snapshot in self._snapshots():
+            for name, values in snapshot.items():
+                if name in self.metrics:
+                    self.metrics[name].merge(values, merged[name])
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.render(merged[name]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+SPAN_SECONDS = registry.histogram(
+    'eda_span_duration_seconds',
+    "Duration of instrumented steps: conversion, upload, first_chunk, chunk_gap, sandbox, turn, render, sse_turn, "
+    "cancel (from a cancel reaching the streaming worker to the turn stopping)",
+    ['span'],
+)
+TOKENS = registry.counter('eda_gemini_tokens_total', "Tokens reported by Gemini usage metadata", ['kind'])
+BYTES = registry.counter('eda_bytes_total', "Bytes handled: received uploads, converted CSV and SSE sent to clients", ['kind'])
+CHUNKS = registry.counter('eda_stream_chunks_total', "Structured chunks streamed to clients", ['type'])
+TURNS_CANCELLED = registry.counter(
+    'eda_turns_cancelled_total', "Streamed turns stopped before the model finished, by reason: request or disconnect", ['reason'],
+)
+HTTP_EVENTS = registry.counter(
+    'eda_gemini_http_events_total', "Gemini HTTP requests and new connections by pool: request, connect, tls_handshake, connect_failed",
+    ['pool', 'event'],
+)
+
+
+class Trace:
+    """Per-request record of span durations, for optional trace logs."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans: List[Tuple[str, float]] = []
+
+    def add(self, span: str, seconds: float) -> None:
+        self.spans.append((span, seconds))
+
+    def as_dict(self) -> Dict[str, object]:
+        """Durations in milliseconds; repeated spans such as chunk gaps are summed and counted."""
+        totals: Dict[str, float] = {}
+        counts: Dict[str, int] = {}
+        for span, seconds in self.spans:
+            totals[span] = totals.get(span, 0.0) + seconds
+            counts[span] = counts.get(span, 0) + 1
+        return {
+            'trace': self.name,
+            **{f'{span}_ms': round(total * 1000, 1) for span, total in totals.items()},
+            **{f'{span}_count': count for span, count in counts.items() if count > 1},
+        }
+
+
+def observe(span: str, seconds: float, trace: Optional[Trace] = None) -> None:
+    SPAN_SECONDS.observe(seconds, span=span)
+    if trace is not None:
+        trace.add(span, seconds)
+
+
+@contextmanager
+def span(name: str, trace: Optional[Trace] = None) -> Iterator[None]:
+    """Time a block into the span histogram (and ``trace``, if given), whether or not it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, trace)
@@ -0,0 +1,172 @@
+import logging
+from typing import Any, Dict, Iterable, Iterator, Optional, Union, BinaryIO
+
+logger = logging.getLogger(__name__)
+
+# Rows kept in the uniform sample used for quantiles and top values
+SAMPLE_ROWS = 100_000
+CHUNK_ROWS = 50_000
+# Distinct values are counted exactly up to this many per column
+DISTINCT_CAP = 10_000
+TOP_K = 5
+MAX_PROFILED_COLUMNS = 100
+
+
+def profile_csv(
+    source: Union[str, BinaryIO],
+    sample_rows: int = SAMPLE_ROWS,
+    chunk_rows: int = CHUNK_ROWS,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Compute a compact column profile of a CSV in a single chunked pass.
+
+    Args:
+        source: Path or binary handle of the CSV
+        sample_rows: Size of the uniform sample
+        chunk_rows: Rows parsed per chunk
+
+    Returns:
+        See ``profile_frames``
+    """
+    import pandas as pd
+    return profile_frames(pd.read_csv(source, chunksize=chunk_rows, low_memory=False), sample_rows, seed)
+
+
+def profile_batches(batches: Iterable[Any], sample_rows: int = SAMPLE_ROWS, seed: int = 0) -> Dict[str, Any]:
+    """
+    Compute a column profile from Arrow record batches, e.g. a memory-mapped dataset.
+
+    Returns:
+        See ``profile_frames``
+    """
+    return profile_frames((batch.to_pandas() for batch in batches), sample_rows, seed)
+
+
+def profile_frames(frames: Iterator[Any], sample_rows: int = SAMPLE_ROWS, seed: int = 0) -> Dict[str, Any]:
+    """
+    Compute a compact column profile from a stream of DataFrame chunks in one pass.
+
+    Row counts, null counts, min/max and distinct counts (up to DISTINCT_CAP) are
+    exact. Quantiles, mean/std and top values come from a uniform random sample
+    of ``sample_rows`` rows, which is the whole dataset when it is small enough.
+
+    Returns:
+        Dict with ``rows``, ``sampled`` and a ``columns`` list of per-column stats
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    rows = 0
+    sample: Optional[pd.DataFrame] = None
+    nulls: Optional[pd.Series] = None
+    distinct: Dict[str, Optional[set]] = {}
+    minimum: Dict[str, Any] = {}
+    maximum: Dict[str, Any] = {}
+
+    for chunk in frames:
+        chunk = chunk.iloc[:, :MAX_PROFILED_COLUMNS]
+        rows += len(chunk)
+        chunk_nulls = chunk.isna().sum()
+        nulls = chunk_nulls if nulls is None else nulls.add(chunk_nulls, fill_value=0)
+
+        for name in chunk.columns:
+            column = chunk[name]
+            if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+                lo, hi = column.min(), column.max()
+                if pd.notna(lo):
+                    minimum[name] = lo if name not in minimum else min(minimum[name], lo)
+                    maximum[name] = hi if name not in maximum else max(maximum[name], hi)
+            seen = distinct.setdefault(name, set())
+            if seen is not None:
+                seen.update(column.dropna().unique().tolist())
+                if len(seen) > DISTINCT_CAP:
+                    distinct[name] = None
+
+        # Bottom-k by random key keeps a uniform sample without replacement in one pass
+        keyed = chunk.assign(_sample_key=rng.random(len(chunk)))
+        sample = keyed if sample is None else pd.concat([sample, keyed], ignore_index=True)
+        if len(sample) > sample_rows:
+            sample = sample.nsmallest(sample_rows, '_sample_key')
+
+    if sample is None:
+        return {"rows": 0, "sampled": False, "sample_rows": 0, "columns": []}
+
+    sample = sample.drop(columns='_sample_key')
+    columns = []
+    for name in sample.columns:
+        column = sample[name]
+        stats: Dict[str, Any] = {
+            "name": str(name),
+            "dtype": str(column.dtype),
+            "nulls": int(nulls[name]),
+            "distinct": len(distinct[name]) if distinct[name] is not None else None,
+        }
+        values = column.dropna()
+        numeric = pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column)
+        if numeric and name in minimum and not values.empty:
+            quantiles = values.quantile([0.25, 0.5, 0.75])
+            stats.update({
+                "min": _scalar(minimum[name]),
+                "p25": _scalar(quantiles[0.25]),
+                "median": _scalar(quantiles[0.5]),
+                "p75": _scalar(quantiles[0.75]),
+                "max": _scalar(maximum[name]),
+                "mean": _scalar(values.mean()),
+                "std": _scalar(values.std()) if len(values) > 1 else None,
+            })
+        elif not values.empty:
+            counts = values.astype(str).value_counts().head(TOP_K)
+            stats["top"] = [(value, int(count)) for value, count in counts.items()]
+        columns.append(stats)
+
+    return {
+        "rows": rows,
+        "sampled": rows > len(sample),
+        "sample_rows": len(sample),
+        "columns": columns,
+    }
+
+
+def _scalar(value: Any) -> Any:
+    """Convert numpy scalars to plain Python numbers."""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _number(value: Any) -> str:
+    if value is None:
+        return "n/a"
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def format_profile(profile: Dict[str, Any], file_name: str = "input_file_0.csv") -> str:
+    """Render a profile as a compact markdown section for the model's system instruction."""
+    lines = [
+        "# Uploaded Dataset Profile",
+        f"The following profile of `{file_name}` was computed locally when the file was uploaded. "
+        "Use it instead of re-running code to discover shape, types, missing values and basic statistics.",
+        "",
+        f"Rows: {profile['rows']:,}  Columns: {len(profile['columns'])}",
+    ]
+    if profile["sampled"]:
+        lines.append(
+            f"Row, null, min/max and distinct counts are exact; quantiles, mean/std and top values "
+            f"are estimated from a uniform sample of {profile['sample_rows']:,} rows."
+        )
+    for column in profile["columns"]:
+        distinct = f"{column['distinct']:,}" if column["distinct"] is not None else f">{DISTINCT_CAP:,}"
+        line = f"- `{column['name']}` ({column['dtype']}): {column['nulls']:,} nulls, {distinct} distinct"
+        if "min" in column:
+            line += (
+                f"; min {_number(column['min'])}, p25 {_number(column['p25'])}, median {_number(column['median'])}, "
+                f"p75 {_number(column['p75'])}, max {_number(column['max'])}, mean {_number(column['mean'])}, "
+                f"std {_number(column['std'])}"
+            )
+        elif column.get("top"):
+            top = ", ".join(f"{value[:40]!r} ({count:,})" for value, count in column["top"])
+            line += f"; top values: {top}"
+        lines.append(line)
+    return "\n".join(lines)
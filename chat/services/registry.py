@@ -0,0 +1,502 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from .cancellation import DEFAULT_POLL_INTERVAL, Cancellation
+from .gemini import GeminiChatSession
+from .session_store import SessionStore
+from .turn_buffer import DEFAULT_MAX_EVENTS, TurnBuffer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 500
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_IDLE_TTL = 60 * 60
+# Seconds a copy of another worker's turn keeps following the store with no client following it
+COPY_IDLE = 5.0
+
+
+class SessionLock:
+    """
+    Reentrant lock guarding one chat session, like ``threading.RLock``, whose hold can also pass
+    from the thread that took it to another: the holder calls ``hand_off`` and the other thread
+    ``take_over``. A streamed turn starts on the request's thread and finishes on one of its own,
+    holding the session throughout.
+    """
+
+    def __init__(self):
+        self._block = threading.Lock()
+        # Thread holding the lock; None while it is free, or handed off and not taken over yet
+        self._owner: Optional[int] = None
+        self._count = 0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        me = threading.get_ident()
+        if self._owner == me:
+            self._count += 1
+            return True
+        if not self._block.acquire(blocking, timeout):
+            return False
+        self._owner, self._count = me, 1
+        return True
+
+    def release(self) -> None:
+        if self._owner != threading.get_ident():
+            raise RuntimeError("cannot release un-acquired lock")
+        self._count -= 1
+        if self._count == 0:
+            self._owner = None
+            self._block.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    def hand_off(self) -> None:
+        """Keep the lock held, by no thread until another calls ``take_over``."""
+        if self._owner != threading.get_ident():
+            raise RuntimeError("cannot hand off un-acquired lock")
+        self._owner = None
+
+    def take_over(self) -> None:
+        """Hold the lock another thread handed off, as it held it."""
+        self._owner = threading.get_ident()
+
+
+@dataclass
+class _RegistryEntry:
+    session: GeminiChatSession
+    lock: SessionLock = field(default_factory=SessionLock)
+    async_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_access: float = field(default_factory=time.monotonic)
+    # Stamp of the stored state the session matches; None until it is first saved or restored
+    stamp: Optional[str] = None
+    # Events of the session's latest streamed turn, until a client has been sent all of them
+    turn_buffer: Optional[TurnBuffer] = None
+    # Approximate memory the session holds, as of its latest save
+    size: int = 0
+
+
+class SessionRegistry:
+    """
+    Process-wide registry of chat sessions keyed by the user's session key.
+
+    Entries are kept in least-recently-used order. Sessions idle for longer than
+    ``idle_ttl`` seconds are dropped, and once more than ``max_sessions`` are
+    held, or their sizes (``GeminiChatSession.approx_bytes``, measured on each
+    ``save``) add up to more than ``max_bytes``, the least recently used ones
+    are evicted, which bounds the memory a worker spends on conversations. Each
+    session carries its own lock so that concurrent requests from the same
+    user are serialized without blocking anyone else.
+
+    With a ``store``, conversations outlive the worker holding them: ``save``
+    records a session's state after each change, and a session this worker
+    doesn't hold, or holds an older copy of (another worker having answered
+    the user since), is restored from the store on first access. Checking
+    for a newer copy is one stamp lookup; the session is only rebuilt when
+    the stamp has changed. Only ``get`` and ``asession`` look: the
+    other accessors (``lock``, ``open_turn_buffer``, ...) are followed by one
+    of them, so a request pays for one lookup. Any worker can then serve any request without
+    sticky sessions. When two workers change one conversation at once, the
+    later save wins. Async code goes through ``asession`` and ``asave``,
+    which run the store lookups and writes in a worker thread so they never
+    block the event loop.
+
+    Streamed turns are registered with ``begin_turn`` so ``cancel`` can stop
+    them: directly when this worker is streaming the turn, otherwise through
+    the store. While turns are streaming, a background thread asks the store
+    every ``poll_interval`` seconds, in one query for all of them not already
+    cancelled here, whether any was asked to stop, so a turn itself only ever
+    reads a flag; the thread sleeps while none are streaming. Each streamed
+    turn also records its events in a ``TurnBuffer`` (``open_turn_buffer``) of
+    at most ``replay_events``, so a client whose connection dropped can pick
+    the turn up again (``turn_buffer``). With a store the buffer is logged
+    there too, and a worker asked to resume a turn it isn't streaming follows
+    a copy the same thread fills from the log, so the reconnect may reach any
+    worker.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], GeminiChatSession],
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        store: Optional[SessionStore] = None,
+        replay_events: int = DEFAULT_MAX_EVENTS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.store = store
+        self.replay_events = replay_events
+        self.poll_interval = poll_interval
+        self._entries: "OrderedDict[str, _RegistryEntry]" = OrderedDict()
+        # Key -> cancellation of the turn this worker is streaming for it
+        self._turns: Dict[str, Cancellation] = {}
+        # Key -> copy of a turn another worker is streaming, filled from the store's log for resumed streams
+        self._copies: Dict[str, TurnBuffer] = {}
+        # Thread checking the store for cancel requests and new events, woken while turns are streaming or copied
+        self._poller: Optional[threading.Thread] = None
+        self._poller_pid: Optional[int] = None
+        self._polling = threading.Event()
+        # Sum of the entries' sizes
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @property
+    def total_bytes(self) -> int:
+        """Approximate memory held by the sessions, as of their latest saves."""
+        return self._bytes
+
+    def _entry(self, key: str, holding: bool = False, restore: bool = True) -> _RegistryEntry:
+        """
+        Get or create the entry for ``key``, marking it as most recently used, and
+        (with ``restore``) restore its session if the store holds a newer state (see ``_restore``).
+        """
+        stored = self.store.stamp(key) if self.store is not None and restore else None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.last_access > self.idle_ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                entry = _RegistryEntry(session=self.factory())
+                self._entries[key] = entry
+            else:
+                self._entries.move_to_end(key)
+            entry.last_access = now
+            self._evict(now, keep=key)
+        if stored is not None and stored != entry.stamp:
+            self._restore(key, entry, holding)
+        return entry
+
+    def _restore(self, key: str, entry: _RegistryEntry, holding: bool = False) -> None:
+        """
+        Bring the entry's session up to the state stored for ``key``, in place, under its lock
+        (so after any sync turn using it). A session an async turn is using is left alone unless
+        the caller is that turn (``holding`` the async lock): the turn's own save supersedes the state.
+        """
+        with entry.lock:
+            if entry.async_lock.locked() and not holding:
+                return
+            # Restored by another thread while this one waited for the lock
+            if self.store.stamp(key) == entry.stamp:
+                return
+            loaded = self.store.load(key)
+            if loaded is None:
+                return
+            stamp, state = loaded
+            try:
+                entry.session.restore(state)
+                logger.info(f"Restored chat session with {len(state['turn_tokens'])} turns and {len(state['files'])} files")
+            except (ValueError, KeyError, TypeError, IndexError) as e:
+                logger.warning(f"Discarding unreadable chat session state: {e}")
+                entry.session.reset()
+            entry.stamp = stamp
+            self._measure(key, entry)
+
+    def get(self, key: str) -> GeminiChatSession:
+        """Get the chat session for ``key``, creating one if needed."""
+        return self._entry(key).session
+
+    def lock(self, key: str) -> SessionLock:
+        """Get the lock guarding the chat session for ``key``; ``get`` it under the lock."""
+        return self._entry(key, restore=False).lock
+
+    def async_lock(self, key: str) -> asyncio.Lock:
+        """Get the lock guarding the chat session for ``key`` from async code."""
+        return self._entry(key, restore=False).async_lock
+
+    @asynccontextmanager
+    async def asession(self, key: str) -> AsyncIterator[GeminiChatSession]:
+        """
+        Hold the chat session for ``key`` from async code (its ``async_lock``) and yield it, up to
+        date with the store. The store lookups and any restore run in a worker thread.
+        """
+        entry = await asyncio.to_thread(self._entry, key)
+        async with entry.async_lock:
+            # Another worker may have moved the conversation on while this one waited for the lock
+            yield (await asyncio.to_thread(self._entry, key, True)).session
+
+    async def asave(self, key: str) -> None:
+        """Async version of save; encoding the state runs in a worker thread."""
+        await asyncio.to_thread(self.save, key)
+
+    def reset(self, key: str) -> GeminiChatSession:
+        """
+        Replace the chat session for ``key`` with a fresh one.
+        A turn streaming for it is cancelled first, rather than waited for to the end.
+        """
+        with self._lock:
+            cancellation = self._turns.get(key)
+        if cancellation is not None:
+            cancellation.cancel('request')
+        entry = self._entry(key)
+        with entry.lock:
+            entry.session = self.factory()
+            # Only a conversation that was ever stored needs replacing in the store
+            if entry.stamp is not None:
+                self.save(key)
+            else:
+                self._measure(key, entry)
+        return entry.session
+
+    def save(self, key: str) -> None:
+        """
+        Record the current state of the chat session for ``key`` in the store, if there is one,
+        and its new size. Call after a change (a turn, an upload) while holding the session's lock.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        self._measure(key, entry)
+        if self.store is None:
+            return
+        # Not uuid4: reading the OS's randomness gives up the GIL, which a loaded worker is slow to get back
+        entry.stamp = f'{random.getrandbits(128):032x}'
+        digests = [file.digest for file in entry.session.files if file.digest]
+        self.store.save(key, entry.stamp, entry.session.to_state(), digests)
+
+    def dataset_in_use(self, digest: str) -> bool:
+        """Whether a session held here, or saved by any worker, refers to the stored dataset ``digest``."""
+        with self._lock:
+            entries = list(self._entries.values())
+        if any(file.digest == digest for entry in entries for file in entry.session.files):
+            return True
+        return self.store is not None and self.store.dataset_in_use(digest)
+
+    def begin_turn(self, key: str) -> Cancellation:
+        """Register a streamed turn for ``key``; call ``end_turn`` with the result once it has finished."""
+        cancellation = Cancellation()
+        with self._lock:
+            self._turns[key] = cancellation
+            if self.store is not None:
+                self._start_poller()
+        return cancellation
+
+    def end_turn(self, key: str, cancellation: Cancellation) -> None:
+        with self._lock:
+            if self._turns.get(key) is cancellation:
+                del self._turns[key]
+
+    def continue_turn(self, turn: Iterator[Any], lock: SessionLock) -> None:
+        """
+        Run the rest of ``turn``, which this thread started holding the session's ``lock``, on a thread
+        of its own that takes the lock over.
+        """
+        lock.hand_off()
+        threading.Thread(target=_finish_turn, args=(turn, lock), name='chat-turn', daemon=True).start()
+
+    def _start_poller(self) -> None:
+        """
+        Wake the store poller, starting it if it isn't running. Caller must hold ``self._lock``.
+        Started lazily, and again in a forked worker, whose parent's thread didn't survive the fork.
+        """
+        self._polling.set()
+        if self._poller is None or self._poller_pid != os.getpid():
+            self._poller = threading.Thread(target=self._poll_store, name='store-poller', daemon=True)
+            self._poller_pid = os.getpid()
+            self._poller.start()
+
+    def _poll_store(self) -> None:
+        """
+        Pass cancel requests made on other workers, and clients following there, to this worker's turns,
+        and copy the events logged since the last pass into the turn copies (reporting the clients
+        following them to the streaming worker); waits while no turn is streaming or copied.
+        """
+        while True:
+            self._polling.wait()
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._turns and not self._copies:
+                    self._polling.clear()
+                # A turn already cancelled here has nothing to learn from the store
+                turns = {key: turn for key, turn in self._turns.items() if not turn.cancelled}
+                copies = dict(self._copies)
+                buffers = {
+                    entry.turn_buffer.turn_id: entry.turn_buffer
+                    for entry in (self._entries.get(key) for key in turns)
+                    if entry is not None and entry.turn_buffer is not None
+                }
+            if not turns and not copies:
+                continue
+            try:
+                if turns:
+                    for key in self.store.cancels_requested({key: turn.started_at for key, turn in turns.items()}):
+                        turns[key].cancel('request')
+                    # A client resuming the turn on another worker keeps it from being abandoned
+                    for turn_id, followed_at in self.store.turns_followed(buffers).items():
+                        buffers[turn_id].followed_elsewhere(followed_at)
+                for key, copy in copies.items():
+                    if copy.followed:
+                        self.store.follow_turn(copy.turn_id)
+                    if self._copy(key, copy) or copy.abandoned(COPY_IDLE):
+                        with self._lock:
+                            if self._copies.get(key) is copy:
+                                del self._copies[key]
+            except Exception as e:
+                logger.warning(f"Failed to poll the session store: {e}")
+
+    def _copy(self, key: str, copy: TurnBuffer) -> bool:
+        """Bring a copy of another worker's turn up to date with the store's log; returns whether it has finished."""
+        # Read before the events: once the turn is logged as finished, its last events are logged too
+        stored = self.store.turn(key)
+        if stored is None or stored[0] != copy.turn_id:
+            # Released or replaced, so nothing more will be logged for it
+            copy.finish()
+            return True
+        for seq, event in self.store.turn_events(copy.turn_id, copy.next_seq):
+            copy.replicate(seq, event)
+        if stored[2]:
+            copy.finish()
+        return stored[2]
+
+    def cancel(self, key: str) -> bool:
+        """
+        Cancel the turn streaming for ``key``.
+
+        Returns:
+            True if the turn was cancelled here or the request was passed on through the store
+            (whether or not another worker is streaming one), False if there was nothing to cancel
+        """
+        with self._lock:
+            cancellation = self._turns.get(key)
+        if cancellation is not None:
+            cancellation.cancel('request')
+            return True
+        if self.store is not None:
+            self.store.request_cancel(key)
+            return True
+        return False
+
+    def open_turn_buffer(self, key: str) -> TurnBuffer:
+        """Start recording the events of a streamed turn for ``key``, replacing the previous turn's."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entry(key, restore=False)
+        turn_id = f'{random.getrandbits(48):012x}'
+        if self.store is not None:
+            self.store.open_turn(key, turn_id)
+        entry.turn_buffer = TurnBuffer(turn_id, self.replay_events, store=self.store, key=key)
+        return entry.turn_buffer
+
+    def turn_buffer(self, key: str, turn_id: Optional[str] = None) -> Optional[TurnBuffer]:
+        """
+        The events of the latest streamed turn for ``key`` (of turn ``turn_id``, if given), if still kept.
+        A turn another worker logged in the store is followed through a copy, which takes store lookups.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            for buffer in (entry.turn_buffer if entry is not None else None, self._copies.get(key)):
+                if buffer is not None and turn_id in (None, buffer.turn_id):
+                    return buffer
+        if self.store is None:
+            return None
+        stored = self.store.turn(key)
+        if stored is None or turn_id not in (None, stored[0]):
+            return None
+        copy = TurnBuffer(stored[0], self.replay_events)
+        copy.file_names = stored[1]
+        self._copy(key, copy)
+        with self._lock:
+            # Another request may have made a copy meanwhile; its followers and this one's share it
+            current = self._copies.get(key)
+            if current is not None and current.turn_id == copy.turn_id:
+                return current
+            if not copy.finished:
+                self._copies[key] = copy
+                self._start_poller()
+        return copy
+
+    def release_turn_buffer(self, key: str, buffer: TurnBuffer) -> None:
+        """Drop a finished turn's events, here and in the store, once a client has been sent all of them."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.turn_buffer is buffer:
+                entry.turn_buffer = None
+            if self._copies.get(key) is buffer:
+                del self._copies[key]
+        if self.store is not None:
+            self.store.delete_turn(key, buffer.turn_id)
+
+    def discard(self, key: str) -> None:
+        """Drop the chat session for ``key`` if one exists, here and in the store."""
+        with self._lock:
+            self._drop(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def _measure(self, key: str, entry: _RegistryEntry) -> None:
+        """Update the entry's size after its session changed, evicting others if the registry is now too large."""
+        size = entry.session.approx_bytes()
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return
+            self._bytes += size - entry.size
+            entry.size = size
+            self._evict(time.monotonic(), keep=key)
+
+    def _drop(self, key: str) -> None:
+        """Remove the entry for ``key`` if there is one. Caller must hold ``self._lock``."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self, now: float, keep: Optional[str] = None) -> None:
+        """Drop idle entries and trim to capacity. Caller must hold ``self._lock``."""
+        # Entries are ordered by last access, so idle ones are always at the front
+        expired = 0
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if key == keep or now - entry.last_access <= self.idle_ttl:
+                break
+            self._drop(key)
+            expired += 1
+
+        evicted = 0
+        if len(self._entries) > self.max_sessions or self._bytes > self.max_bytes:
+            for key in list(self._entries):
+                if len(self._entries) <= self.max_sessions and self._bytes <= self.max_bytes:
+                    break
+                entry = self._entries[key]
+                # Never evict a session that is in the middle of a turn
+                if key == keep or entry.async_lock.locked() or not entry.lock.acquire(blocking=False):
+                    continue
+                try:
+                    self._drop(key)
+                    evicted += 1
+                finally:
+                    entry.lock.release()
+
+        if expired or evicted:
+            logger.info(f"Evicted {expired} idle and {evicted} least recently used chat sessions")
+
+
+def _finish_turn(turn: Iterator[Any], lock: SessionLock) -> None:
+    """Run a turn started on another thread to the end, taking over its hold on the session."""
+    lock.take_over()
+    for _ in turn:
+        pass
@@ -0,0 +1,397 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, Tuple, TypeVar
+
+import httpx
+from google.genai import errors
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# HTTP statuses worth retrying: timeouts, rate limiting and upstream overload
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 8.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_ACQUIRE_TIMEOUT = 30.0
+
+# Marks a stream that ended before yielding anything
+_END = object()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Gemini while the circuit breaker is open."""
+
+
+class ConcurrencyLimitError(Exception):
+    """Raised when no call slot frees up within the limiter's acquire timeout."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed if repeated: overload, rate limits, timeouts and dropped connections."""
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt ``n`` waits a random time up to ``base_delay * 2**n``."""
+
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number ``attempt`` (starting at 0)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while the upstream is degraded.
+
+    After ``failure_threshold`` consecutive retryable failures the circuit
+    opens and calls raise CircuitOpenError without reaching Gemini. Once
+    ``reset_timeout`` seconds have passed a single trial call is let through
+    (half-open): its success closes the circuit, its failure opens it again.
+    Errors that are not retryable, e.g. a rejected request, count as success
+    since the upstream answered.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go ahead."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            # A trial call that never reports back (e.g. the client went away) doesn't block others for good
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                logger.info("Gemini circuit half-open, sending a trial call")
+                return
+            raise CircuitOpenError("Gemini is failing repeatedly; not calling it for now")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Gemini circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                logger.warning(f"Gemini circuit opened after {self.failures} consecutive failure(s)")
+
+
+class ConcurrencyLimiter:
+    """
+    Process-wide cap on concurrent Gemini calls: sync calls share a thread
+    semaphore, async calls a semaphore per event loop.
+
+    A call that can't get a slot within ``acquire_timeout`` seconds raises
+    ConcurrencyLimitError rather than queueing indefinitely.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        # asyncio semaphores belong to one event loop, so there is one per running loop
+        self._async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self.active = 0
+        self.rejected = 0
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        if not self._semaphore.acquire(timeout=self.acquire_timeout):
+            self.rejected += 1
+            raise ConcurrencyLimitError("Too many requests to Gemini are in progress")
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[None]:
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ConcurrencyLimitError("Too many requests to Gemini are in progress")
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            semaphore.release()
+
+
+def _first(start: Callable[[], Iterator[T]]) -> Tuple[Iterator[T], object]:
+    stream = iter(start())
+    return stream, next(stream, _END)
+
+
+def _close_loser(future: Future) -> None:
+    """Close the stream of a hedged request that lost the race, once it has one."""
+    if future.exception() is None:
+        stream, _ = future.result()
+        close = getattr(stream, 'close', None)
+        if close:
+            close()
+
+
+async def _afirst(start: Callable[[], Awaitable[AsyncIterator[T]]]) -> Tuple[AsyncIterator[T], object]:
+    stream = (await start()).__aiter__()
+    try:
+        return stream, await stream.__anext__()
+    except StopAsyncIteration:
+        return stream, _END
+
+
+class CallPolicy:
+    """
+    Retries, hedging, circuit breaking and concurrency limiting for Gemini calls.
+
+    A streamed call is retried with backoff while it fails before its first
+    chunk: nothing has reached the user and the chat only records a turn once
+    its stream completes, so repeating the request is invisible. Failures
+    after the first chunk are raised as they are. With ``hedge_after`` set,
+    a stream whose first chunk takes longer than that many seconds gets a
+    second identical request, and whichever answers first is used. The two
+    run at once, so each must be a request of its own (for a chat, on a copy
+    of it) rather than continue shared state.
+    """
+
+    def __init__(
+        self,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        limiter: Optional[ConcurrencyLimiter] = None,
+        hedge_after: Optional[float] = None,
+    ):
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or ConcurrencyLimiter()
+        self.hedge_after = hedge_after
+        self.retries = 0
+        self.hedges = 0
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._hedge_pool_lock = threading.Lock()
+
+    def _should_retry(self, error: BaseException, attempt: int) -> bool:
+        """Record a failed attempt with the breaker and decide whether to try again."""
+        if not is_retryable(error):
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        if attempt + 1 >= self.retry.max_attempts:
+            return False
+        self.retries += 1
+        logger.info(f"Gemini call failed ({error}); retrying (attempt {attempt + 2} of {self.retry.max_attempts})")
+        return True
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """Run a unary call, retrying retryable failures."""
+        with self.limiter.slot():
+            for attempt in range(self.retry.max_attempts):
+                self.breaker.before_call()
+                try:
+                    result = fn()
+                except Exception as e:
+                    if not self._should_retry(e, attempt):
+                        raise
+                    time.sleep(self.retry.delay(attempt))
+                    continue
+                self.breaker.record_success()
+                return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async version of call."""
+        async with self.limiter.async_slot():
+            for attempt in range(self.retry.max_attempts):
+                self.breaker.before_call()
+                try:
+                    result = await fn()
+                except Exception as e:
+                    if not self._should_retry(e, attempt):
+                        raise
+                    await asyncio.sleep(self.retry.delay(attempt))
+                    continue
+                self.breaker.record_success()
+                return result
+
+    def stream(self, start: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """
+        Iterate a streamed call.
+
+        Args:
+            start: Starts a new, independent request and returns its chunk iterator; called once
+                per attempt, and from a hedge thread while an earlier attempt may still be running
+        """
+        with self.limiter.slot():
+            for attempt in range(self.retry.max_attempts):
+                self.breaker.before_call()
+                try:
+                    stream, first = self._open(start)
+                    break
+                except Exception as e:
+                    if not self._should_retry(e, attempt):
+                        raise
+                    time.sleep(self.retry.delay(attempt))
+
+            if first is not _END:
+                yield first
+                try:
+                    yield from stream
+                except Exception as e:
+                    if is_retryable(e):
+                        self.breaker.record_failure()
+                    raise
+            self.breaker.record_success()
+
+    async def astream(self, start: Callable[[], Awaitable[AsyncIterator[T]]]) -> AsyncIterator[T]:
+        """Async version of stream; ``start`` is a coroutine function returning an async iterator."""
+        async with self.limiter.async_slot():
+            for attempt in range(self.retry.max_attempts):
+                self.breaker.before_call()
+                try:
+                    stream, first = await self._aopen(start)
+                    break
+                except Exception as e:
+                    if not self._should_retry(e, attempt):
+                        raise
+                    await asyncio.sleep(self.retry.delay(attempt))
+
+            if first is not _END:
+                yield first
+                try:
+                    async for chunk in stream:
+                        yield chunk
+                except Exception as e:
+                    if is_retryable(e):
+                        self.breaker.record_failure()
+                    raise
+            self.breaker.record_success()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        """
+        Threads that wait for first chunks on behalf of hedged sync streams: two per
+        call slot, so a request never queues behind another stream's stalled one.
+        """
+        with self._hedge_pool_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=2 * self.limiter.max_concurrency, thread_name_prefix='gemini-hedge',
+                )
+            return self._hedge_pool
+
+    def _open(self, start: Callable[[], Iterator[T]]) -> Tuple[Iterator[T], object]:
+        """Start a stream and wait for its first chunk, hedging with a second request if it is slow."""
+        if not self.hedge_after:
+            return _first(start)
+
+        primary = self._pool().submit(_first, start)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self.hedges += 1
+        logger.info(f"No first chunk from Gemini after {self.hedge_after}s; sending a hedged request")
+        pending = [primary, self._pool().submit(_first, start)]
+        error: Optional[BaseException] = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is None:
+                error = error or next(iter(done)).exception()
+                pending = [future for future in pending if future not in done]
+                continue
+            for loser in pending:
+                # One still queued for a hedge thread never starts; a running one is closed once it yields
+                if loser is not winner and not loser.cancel():
+                    loser.add_done_callback(_close_loser)
+            return winner.result()
+        raise error
+
+    async def _aopen(self, start: Callable[[], Awaitable[AsyncIterator[T]]]) -> Tuple[AsyncIterator[T], object]:
+        """Async version of _open."""
+        if not self.hedge_after:
+            return await _afirst(start)
+
+        primary = asyncio.ensure_future(_afirst(start))
+        done, _ = await asyncio.wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self.hedges += 1
+        logger.info(f"No first chunk from Gemini after {self.hedge_after}s; sending a hedged request")
+        pending = {primary, asyncio.ensure_future(_afirst(start))}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winners = [task for task in done if task.exception() is None]
+            if not winners:
+                error = error or next(iter(done)).exception()
+                continue
+            for loser in pending:
+                loser.cancel()
+            for loser in winners[1:]:
+                stream, _ = loser.result()
+                if hasattr(stream, 'aclose'):
+                    await stream.aclose()
+            return winners[0].result()
+        raise error
+
+    def stats(self) -> dict:
+        return {
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'circuit': self.breaker.state,
+            'circuit_trips': self.breaker.trips,
+            'active_calls': self.limiter.active,
+            'rejected_calls': self.limiter.rejected,
+        }
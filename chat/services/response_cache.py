@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Replay reproduces the recorded pacing, but no single gap (e.g. a long sandbox run) waits longer than this
+MAX_REPLAY_GAP = 1.0
+
+_SUFFIX = '.json'
+
+
+def normalize_message(message: str) -> str:
+    """Case- and whitespace-insensitive form of a user message, so trivially different phrasings share a key."""
+    return " ".join(message.lower().split())
+
+
+def response_key(dataset_digest: str, conversation: List[str], model: str, system_prompt: str) -> str:
+    """
+    Cache key for the next reply in a conversation.
+
+    Args:
+        dataset_digest: Content hash of the uploaded dataset
+        conversation: Normalized user messages so far, ending with the current one
+        model: Gemini model name
+        system_prompt: The session's system prompt
+
+    Returns:
+        Hex sha256 of the combined inputs
+    """
+    payload = json.dumps({
+        'dataset': dataset_digest,
+        'conversation': conversation,
+        'model': model,
+        'system_prompt': hashlib.sha256(system_prompt.encode()).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    # (seconds since the turn started, chunk) for every chunk the live turn yielded
+    chunks: List[Tuple[float, Dict[str, Any]]]
+
+    def delays(self, speed: float = 1.0):
+        """
+        Yield (delay before the chunk, chunk) pairs reproducing the recorded pacing.
+
+        Args:
+            speed: Replay speed-up; 0 replays without waiting
+        """
+        previous = 0.0
+        for offset, chunk in self.chunks:
+            gap = min(offset - previous, MAX_REPLAY_GAP) / speed if speed > 0 else 0.0
+            previous = offset
+            yield max(gap, 0.0), dict(chunk)
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of complete streamed replies.
+
+    Opening questions such as "summarize this data" on the same dataset (the
+    demo file especially) are each a full agentic run with code execution. A
+    reply is stored once the live stream finishes cleanly, as the sequence of
+    structured chunks it yielded with their timing, so it can be replayed at
+    a realistic pace. Entries are JSON files in a directory shared by every
+    worker on the host; past ``max_bytes`` the least recently used are deleted.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'eda-responses')
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._bytes = self._usage()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key: str, is_valid: Optional[Callable[[CachedResponse], bool]] = None) -> Optional[CachedResponse]:
+        """
+        Look up a stored reply.
+
+        Args:
+            key: Key from response_key
+            is_valid: Optional check, e.g. that referenced images still exist; failing entries are removed
+
+        Returns:
+            The cached reply, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = CachedResponse(chunks=[(offset, chunk) for offset, chunk in json.load(f)['chunks']])
+            os.utime(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            cached = None
+        if cached is not None and is_valid is not None and not is_valid(cached):
+            logger.info(f"Discarding stale cached response {key[:12]}")
+            self.remove(key)
+            cached = None
+
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+    def put(self, key: str, chunks: List[Tuple[float, Dict[str, Any]]]) -> None:
+        """
+        Store a finished reply.
+
+        Args:
+            key: Key from response_key
+            chunks: (seconds since the turn started, chunk) pairs in stream order
+        """
+        data = json.dumps({'chunks': chunks}).encode('utf-8')
+        path = self._path(key)
+        partial_path = f'{path}.{os.getpid()}.{threading.get_ident()}.part'
+        with open(partial_path, 'wb') as f:
+            f.write(data)
+        os.replace(partial_path, path)
+
+        with self._lock:
+            self.stores += 1
+            self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict(keep=path)
+
+    def remove(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss, store and eviction counts for this worker, and the directory's size in bytes."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'bytes': self._bytes,
+            }
+
+    def _usage(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def _evict(self, keep: str) -> None:
+        """
+        Delete least recently used replies until under ``max_bytes``. Caller must hold ``self._lock``.
+        Usage is re-read from disk because other workers write to the same directory.
+        """
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith(_SUFFIX)
+        )
+        self._bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._bytes -= size
+            self.evictions += 1
+            logger.info(f"Evicted cached response {os.path.basename(path)}")
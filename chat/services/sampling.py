@@ -0,0 +1,349 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional
+
+from .profiling import MAX_PROFILED_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Converted CSVs larger than this many bytes are replaced by a sample when sent to the model
+DEFAULT_THRESHOLD_BYTES = 32 * 1024 * 1024
+DEFAULT_TARGET_ROWS = 100_000
+# A text or boolean column with at most this many distinct values can stratify the sample
+MAX_STRATA = 50
+# Every stratum keeps at least this many rows (or all of its rows), however rare it is
+MIN_STRATUM_ROWS = 100
+# Numeric columns whose exact per-stratum means are reported
+MAX_GROUP_COLUMNS = 8
+MAX_LISTED_VALUES = 20
+
+
+@dataclass
+class DatasetSample:
+    """
+    A subset of a dataset and the exact aggregates of the whole.
+
+    ``method`` is ``time`` (evenly spaced rows, ordered by ``column``),
+    ``stratified`` (per-value random samples of ``column``) or ``reservoir``
+    (a uniform random sample). ``table`` is the sampled ``pyarrow.Table``.
+    """
+    method: str
+    column: Optional[str]
+    rows: int
+    sample_rows: int
+    aggregates: Dict[str, Dict[str, Any]]
+    groups: List[Dict[str, Any]] = field(default_factory=list)
+    table: Any = None
+
+    def summary(self) -> Dict[str, Any]:
+        """Everything but the table, for caching alongside the uploaded file."""
+        return {
+            "method": self.method,
+            "column": self.column,
+            "rows": self.rows,
+            "sample_rows": self.sample_rows,
+            "aggregates": self.aggregates,
+            "groups": self.groups,
+        }
+
+
+def _exact(value: Any) -> str:
+    """Format an exact aggregate without the rounding the profile uses."""
+    if value is None:
+        return "n/a"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() and abs(value) < 1e15 else f"{value:.10g}"
+    return str(value)
+
+
+def _kind(data_type) -> Optional[str]:
+    import pyarrow as pa
+    if pa.types.is_boolean(data_type) or pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return "categorical"
+    if pa.types.is_integer(data_type) or pa.types.is_floating(data_type) or pa.types.is_decimal(data_type):
+        return "numeric"
+    if pa.types.is_timestamp(data_type) or pa.types.is_date(data_type):
+        return "temporal"
+    return None
+
+
+class DatasetSampler:
+    """
+    Reduces datasets too large to send to the model whole to a representative sample.
+
+    Works on Arrow record batches (e.g. a memory-mapped ``DatasetStore``
+    entry) in two passes. The first computes exact aggregates of every column:
+    null counts, sums, means and ranges, and value counts of low-cardinality
+    columns. The second draws the sample, picking the method from the data:
+
+    - with a date or timestamp column, evenly spaced rows sorted by it, so
+      trends and seasonality survive;
+    - with a text or boolean column of at most ``MAX_STRATA`` values, a random
+      sample of each value in proportion to its frequency (rare values keep
+      at least ``MIN_STRATUM_ROWS`` rows), plus exact per-value means;
+    - otherwise a uniform random sample (bottom-k by random key, one pass).
+
+    Sampling is seeded, so the same dataset always yields the same sample.
+    """
+
+    def __init__(
+        self,
+        threshold_bytes: int = DEFAULT_THRESHOLD_BYTES,
+        target_rows: int = DEFAULT_TARGET_ROWS,
+        seed: int = 0,
+    ):
+        self.threshold_bytes = threshold_bytes
+        self.target_rows = target_rows
+        self.seed = seed
+
+    def should_sample(self, size: int) -> bool:
+        """Whether a converted CSV of ``size`` bytes is sampled; a threshold of 0 turns sampling off."""
+        return 0 < self.threshold_bytes < size
+
+    def sample(self, batches: Callable[[], Iterable[Any]]) -> Optional[DatasetSample]:
+        """
+        Sample a dataset.
+
+        Args:
+            batches: Returns a fresh iterator over the dataset's record batches; called once per pass
+
+        Returns:
+            The sample, or None if the dataset has no more rows than the target
+        """
+        rows, aggregates, counts = self._aggregate(batches())
+        if rows <= self.target_rows:
+            return None
+
+        temporal = [name for name, stats in aggregates.items() if stats["kind"] == "temporal" and stats["count"]]
+        strata = [
+            (len(values), name) for name, values in counts.items()
+            if values is not None and 2 <= len(values) <= MAX_STRATA
+        ]
+        if temporal:
+            method, column = "time", temporal[0]
+            table = self._evenly_spaced(batches(), rows, column)
+            groups = []
+        else:
+            method, column = ("stratified", max(strata, key=lambda s: s[0])[1]) if strata else ("reservoir", None)
+            table, groups = self._random(batches(), rows, aggregates, counts.get(column), column)
+
+        for name, values in counts.items():
+            if values is not None:
+                aggregates[name]["values"] = sorted(values.items(), key=lambda item: -item[1])
+        logger.info(f"Sampled {table.num_rows:,} of {rows:,} rows ({method}{f' on {column}' if column else ''})")
+        return DatasetSample(
+            method=method,
+            column=column,
+            rows=rows,
+            sample_rows=table.num_rows,
+            aggregates=aggregates,
+            groups=groups,
+            table=table,
+        )
+
+    @staticmethod
+    def _aggregate(batches: Iterable[Any]) -> tuple:
+        """(rows, exact per-column aggregates, value counts of columns with at most MAX_STRATA values)."""
+        import pyarrow.compute as pc
+
+        rows = 0
+        aggregates: Dict[str, Dict[str, Any]] = {}
+        counts: Dict[str, Optional[Dict[Any, int]]] = {}
+        for batch in batches:
+            rows += batch.num_rows
+            for name, column in zip(batch.schema.names[:MAX_PROFILED_COLUMNS], batch.columns):
+                kind = _kind(column.type)
+                stats = aggregates.setdefault(name, {"kind": kind, "count": 0, "nulls": 0})
+                stats["nulls"] += column.null_count
+                stats["count"] += len(column) - column.null_count
+                if kind in ("numeric", "temporal") and len(column) > column.null_count:
+                    bounds = pc.min_max(column).as_py()
+                    stats["min"] = bounds["min"] if "min" not in stats else min(stats["min"], bounds["min"])
+                    stats["max"] = bounds["max"] if "max" not in stats else max(stats["max"], bounds["max"])
+                    if kind == "numeric":
+                        stats["sum"] = stats.get("sum", 0) + pc.sum(column).as_py()
+                if kind == "categorical" and counts.get(name, {}) is not None:
+                    seen = counts.setdefault(name, {})
+                    for item in pc.value_counts(column).to_pylist():
+                        if item["values"] is not None:
+                            seen[item["values"]] = seen.get(item["values"], 0) + item["counts"]
+                    if len(seen) > MAX_STRATA:
+                        counts[name] = None
+
+        for stats in aggregates.values():
+            if "sum" in stats:
+                stats["mean"] = stats["sum"] / stats["count"]
+        return rows, aggregates, counts
+
+    def _evenly_spaced(self, batches: Iterable[Any], rows: int, column: str):
+        import numpy as np
+        import pyarrow as pa
+
+        positions = np.unique(np.linspace(0, rows - 1, self.target_rows).round().astype(np.int64))
+        taken = []
+        offset = 0
+        for batch in batches:
+            start, stop = np.searchsorted(positions, [offset, offset + batch.num_rows])
+            if stop > start:
+                taken.append(batch.take(pa.array(positions[start:stop] - offset)))
+            offset += batch.num_rows
+        return pa.Table.from_batches(taken).sort_by([(column, "ascending")]).combine_chunks()
+
+    def _random(
+        self,
+        batches: Iterable[Any],
+        rows: int,
+        aggregates: Dict[str, Dict[str, Any]],
+        values: Optional[Dict[Any, int]],
+        column: Optional[str],
+    ) -> tuple:
+        """
+        Draw a random sample, per value of ``column`` when given, keeping each
+        stratum's rows with the smallest random keys. Returns (table, per-value means).
+        """
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        rng = np.random.default_rng(self.seed)
+        strata = list(values) if column else []
+        # The last stratum holds rows whose value is null
+        sizes = np.array([values[v] for v in strata] + [rows - sum(values.values())] if column else [rows])
+        quota = np.minimum(sizes, np.maximum(np.round(sizes * self.target_rows / rows), MIN_STRATUM_ROWS)).astype(np.int64)
+        threshold = np.ones(len(sizes))
+        numeric = [name for name, stats in aggregates.items() if stats["kind"] == "numeric" and name != column]
+        numeric = numeric[:MAX_GROUP_COLUMNS] if column else []
+        sums = {name: np.zeros(len(sizes)) for name in numeric}
+        present = {name: np.zeros(len(sizes)) for name in numeric}
+
+        kept = None
+        kept_keys = np.empty(0)
+        kept_codes = np.empty(0, dtype=np.int64)
+        kept_positions = np.empty(0, dtype=np.int64)
+        pending: List[tuple] = []
+        pending_rows = 0
+        offset = 0
+
+        def prune():
+            nonlocal kept, kept_keys, kept_codes, kept_positions, pending, pending_rows
+            tables = ([kept] if kept is not None else []) + [p[0] for p in pending]
+            keys = np.concatenate([kept_keys] + [p[1] for p in pending])
+            codes = np.concatenate([kept_codes] + [p[2] for p in pending])
+            positions = np.concatenate([kept_positions] + [p[3] for p in pending])
+            order = np.lexsort((keys, codes))
+            sorted_codes = codes[order]
+            rank = np.arange(len(order)) - np.searchsorted(sorted_codes, sorted_codes)
+            keep = order[rank < quota[sorted_codes]]
+            kept = pa.concat_tables(tables).take(pa.array(keep))
+            kept_keys, kept_codes, kept_positions = keys[keep], codes[keep], positions[keep]
+            pending, pending_rows = [], 0
+            # A full stratum only admits rows with keys below its current largest
+            largest = np.zeros(len(sizes))
+            np.maximum.at(largest, kept_codes, kept_keys)
+            full = np.bincount(kept_codes, minlength=len(sizes)) >= quota
+            threshold[:] = np.where(full, largest, 1.0)
+
+        for batch in batches:
+            keys = rng.random(batch.num_rows)
+            if column:
+                stratum = batch.column(batch.schema.get_field_index(column))
+                value_set = pa.array(strata, type=stratum.type)
+                codes = pc.fill_null(pc.index_in(stratum, value_set=value_set), len(strata)).to_numpy().astype(np.int64)
+                for name in numeric:
+                    data = pc.cast(batch.column(batch.schema.get_field_index(name)), pa.float64()).to_numpy(zero_copy_only=False)
+                    valid = ~np.isnan(data)
+                    sums[name] += np.bincount(codes[valid], weights=data[valid], minlength=len(sizes))
+                    present[name] += np.bincount(codes[valid], minlength=len(sizes))
+            else:
+                codes = np.zeros(batch.num_rows, dtype=np.int64)
+            mask = keys < threshold[codes]
+            if mask.any():
+                selected = np.flatnonzero(mask)
+                pending.append((
+                    pa.Table.from_batches([batch.take(pa.array(selected))]),
+                    keys[selected],
+                    codes[selected],
+                    selected + offset,
+                ))
+                pending_rows += len(selected)
+                if pending_rows > self.target_rows:
+                    prune()
+            offset += batch.num_rows
+        prune()
+
+        # Back in file order, so the sample reads like the original
+        table = kept.take(pa.array(np.argsort(kept_positions, kind="stable"))).combine_chunks()
+        groups = []
+        for code, value in enumerate(strata + [None] if column else []):
+            if sizes[code]:
+                groups.append({
+                    "value": value,
+                    "rows": int(sizes[code]),
+                    "sample_rows": int(quota[code]),
+                    "means": {
+                        name: float(sums[name][code] / present[name][code]) if present[name][code] else None
+                        for name in numeric
+                    },
+                })
+        groups.sort(key=lambda group: -group["rows"])
+        return table, groups
+
+
+def write_sample_csv(sample: DatasetSample, target: BinaryIO) -> None:
+    """Write the sampled rows to ``target`` as CSV."""
+    import pyarrow.csv as pacsv
+    pacsv.write_csv(sample.table, target, write_options=pacsv.WriteOptions(quoting_style='needed'))
+
+
+def format_sample(sample: Dict[str, Any], file_name: str = "input_file_0.csv") -> str:
+    """Render a sample summary as a markdown section for the model's system instruction."""
+    method = sample["method"]
+    described = {
+        "time": f"evenly spaced sample ordered by `{sample['column']}`",
+        "stratified": f"sample stratified by `{sample['column']}`",
+        "reservoir": "uniform random sample",
+    }[method]
+    lines = [
+        "# Dataset Sample",
+        f"The dataset was too large to send whole: `{file_name}` is a {described} of "
+        f"{sample['sample_rows']:,} of its {sample['rows']:,} rows. Use it for distributions, relationships "
+        "and charts, but answer questions about totals, counts, sums, means and ranges from the exact "
+        "aggregates below, which cover every row. Say so when a result is estimated from the sample.",
+    ]
+    if method == "stratified":
+        lines.append(
+            f"Each `{sample['column']}` value was sampled in proportion to its frequency, with rare values "
+            f"kept at {MIN_STRATUM_ROWS:,} rows or more; weight by the exact counts below when combining values."
+        )
+    else:
+        lines.append(f"Scale counts from the sample by about {sample['rows'] / sample['sample_rows']:.1f}x.")
+
+    lines += ["", "Exact aggregates:"]
+    for name, stats in sample["aggregates"].items():
+        line = f"- `{name}`: {stats['count']:,} values, {stats['nulls']:,} nulls"
+        if "sum" in stats:
+            line += f"; sum {_exact(stats['sum'])}, mean {_exact(stats['mean'])}"
+        if "min" in stats:
+            line += f"; min {_exact(stats['min'])}, max {_exact(stats['max'])}"
+        if stats.get("values"):
+            listed = ", ".join(f"{str(value)[:40]!r} ({count:,})" for value, count in stats["values"][:MAX_LISTED_VALUES])
+            more = len(stats["values"]) - MAX_LISTED_VALUES
+            line += f"; counts: {listed}{f' and {more} more' if more > 0 else ''}"
+        lines.append(line)
+
+    groups = sample["groups"]
+    if groups:
+        numeric = list(groups[0]["means"])
+        lines += [
+            "",
+            f"Exact per-`{sample['column']}` row counts and means:",
+            "| " + " | ".join([sample["column"], "rows", "sample rows"] + [f"mean {name}" for name in numeric]) + " |",
+            "|" + "---|" * (3 + len(numeric)),
+        ]
+        for group in groups:
+            value = "(null)" if group["value"] is None else str(group["value"])[:40]
+            cells = [value, f"{group['rows']:,}", f"{group['sample_rows']:,}"] + [
+                _exact(group["means"][name]) for name in numeric
+            ]
+            lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
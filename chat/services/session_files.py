@@ -0,0 +1,99 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+
+DEFAULT_MAX_FILES = 5
+# Files of one upload request converted and uploaded at the same time
+DEFAULT_UPLOAD_WORKERS = 4
+# Shorter column names ("id", "x") are too common in messages to mean a dataset was asked for
+MIN_COLUMN_MENTION = 3
+
+
+# Compared by identity: two uploads of the same content are still two files
+@dataclass(eq=False)
+class SessionFile:
+    """One dataset in a conversation: its Gemini file handle and what the model is told about it."""
+    file: types.File
+    name: str
+    # Content hash of the original upload, when it went through the upload cache
+    digest: Optional[str] = None
+    columns: List[str] = field(default_factory=list)
+    # Profile (and sample summary) for the system instruction
+    description: Optional[str] = None
+    # Whether the file has been attached to a turn yet
+    attached: bool = False
+
+    def mentioned_in(self, text: str) -> bool:
+        """Whether lower-cased message ``text`` names this file or one of its columns."""
+        stem = os.path.splitext(self.name)[0].lower()
+        names = {self.name.lower(), stem, re.sub(r'[_\-]+', ' ', stem)}
+        names.update(column.lower() for column in self.columns if len(column) >= MIN_COLUMN_MENTION)
+        return any(re.search(rf'(?<!\w){re.escape(name)}(?!\w)', text) for name in names if name)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable form, for the session store."""
+        return {
+            "file": self.file.model_dump(mode="json", exclude_none=True),
+            "name": self.name,
+            "digest": self.digest,
+            "columns": self.columns,
+            "description": self.description,
+            "attached": self.attached,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionFile":
+        return cls(
+            file=types.File.model_validate(data["file"]),
+            name=data["name"],
+            digest=data.get("digest"),
+            columns=list(data.get("columns") or []),
+            description=data.get("description"),
+            attached=bool(data.get("attached")),
+        )
+
+
+def sandbox_name(index: int) -> str:
+    """Name of the ``index``-th file attached to a message, as code execution sees it."""
+    return f'input_file_{index}.csv'
+
+
+def sandbox_names(files: List[SessionFile]) -> Dict[str, str]:
+    """Sandbox name to original filename for the files attached to one message."""
+    return {sandbox_name(i): file.name for i, file in enumerate(files)}
+
+
+def select_files(files: List[SessionFile], message: str, previous: List[SessionFile]) -> List[SessionFile]:
+    """
+    Pick the files to attach to a message.
+
+    Files the message names (by filename or column) are attached. A message
+    that names none continues with the previous turn's files, plus any file
+    that hasn't been attached yet, e.g. one uploaded since.
+
+    Args:
+        files: The session's files, in upload order
+        message: The user's message
+        previous: Files attached to the previous turn
+
+    Returns:
+        The files to attach, in upload order
+    """
+    if len(files) <= 1:
+        return list(files)
+    text = message.lower()
+    mentioned = [file for file in files if file.mentioned_in(text)]
+    if mentioned:
+        return mentioned
+    return [file for file in files if file in previous or not file.attached] or list(files)
+
+
+def attachment_parts(files: List[SessionFile]) -> List[types.Part]:
+    """Parts that attach ``files`` to a message, after a note mapping sandbox names to filenames."""
+    mapping = "; ".join(f"`{sandbox_name(i)}` is `{file.name}`" for i, file in enumerate(files))
+    return [types.Part.from_text(text=f"[Attached: {mapping}]")] + [
+        types.Part.from_uri(file_uri=file.file.uri, mime_type=file.file.mime_type) for file in files
+    ]
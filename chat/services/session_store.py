@@ -0,0 +1,445 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .turn_buffer import TurnBuffer
+
+logger = logging.getLogger(__name__)
+
+# Saved states wait at most this long (seconds) before they are written
+DEFAULT_FLUSH_INTERVAL = 0.5
+# Once this many states are waiting they are written without waiting for the interval
+DEFAULT_MAX_PENDING = 64
+DEFAULT_IDLE_TTL = 60 * 60
+# How often (seconds) states idle for longer than the TTL are deleted
+PURGE_INTERVAL = 60
+# Seconds a connection waits for another worker's write to finish
+BUSY_TIMEOUT = 5.0
+COMPRESSION_LEVEL = 1
+# Keys looked up per query when checking on a worker's turns
+LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    stamp TEXT NOT NULL,
+    state BLOB NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+# Turns a user asked to stop, for whichever worker is streaming them
+_CANCELS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cancels (
+    key TEXT PRIMARY KEY,
+    requested_at REAL NOT NULL
+)
+"""
+# Datasets (by content digest) each stored session refers to, so no worker deletes one still in use
+_DATASETS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    key TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (key, digest)
+)
+"""
+_DATASETS_INDEX = "CREATE INDEX IF NOT EXISTS datasets_digest ON datasets (digest)"
+# The latest streamed turn of each session and its events, so a client can resume it on any worker
+_TURNS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    key TEXT PRIMARY KEY,
+    turn_id TEXT NOT NULL,
+    file_names TEXT,
+    finished INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    -- When a client last followed the turn on a worker other than the one streaming it
+    followed_at REAL
+)
+"""
+# Logged in batches: the JSON list of events seq, seq + 1, ..., seq + count - 1
+_TURN_EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turn_event_batches (
+    turn_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    events TEXT NOT NULL,
+    PRIMARY KEY (turn_id, seq)
+)
+"""
+# A worker whose write was delayed must not overwrite a newer state written by another
+_UPSERT = """
+INSERT INTO sessions (key, stamp, state, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET stamp = excluded.stamp, state = excluded.state, updated_at = excluded.updated_at
+WHERE excluded.updated_at >= sessions.updated_at
+"""
+
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """Compressed JSON of a session state."""
+    return zlib.compress(json.dumps(state, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def decode_state(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data))
+
+
+class SessionStore:
+    """
+    Chat session states in a SQLite database shared by every worker on the host.
+
+    Each state is saved with a stamp, a token that changes on every save, so a
+    worker can tell with one indexed lookup whether the copy of a conversation
+    it holds in memory is still the latest or another worker has moved it on.
+    Saves are write-behind: ``save`` only records the state, and a background
+    thread writes everything recorded in one transaction every
+    ``flush_interval`` seconds (sooner once ``max_pending`` are waiting).
+    Until then the pending state answers this worker's own lookups, so a
+    worker never mistakes its own unwritten save for a newer one elsewhere.
+    The database runs in WAL mode, so lookups don't wait for the writes of
+    other workers. States not saved for ``idle_ttl`` seconds are deleted.
+
+    A worker killed outright loses at most the last ``flush_interval`` of saves;
+    pending states are flushed when the process exits normally.
+
+    Cancel requests for a streaming turn go through the same database, written
+    straight away, since the worker streaming the turn may not be the one the
+    request reached. So do the datasets each session refers to
+    (``dataset_in_use``), since the workers share one dataset directory.
+
+    The events of each session's latest streamed turn are logged here too
+    (``open_turn``, ``log_turn``, ``finish_turn``), written behind with the
+    states, so a client that reconnects to another worker can resume the turn
+    from the log (``turn``, ``turn_events``). A turn's events are taken from
+    its buffer at each flush and logged as one batch, so a streamed chunk
+    costs the store nothing.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+    ):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'eda-sessions.sqlite3')
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.idle_ttl = idle_ttl
+        # key -> (stamp, encoded state, saved at, dataset digests); a state of None deletes the key
+        self._pending: Dict[str, Tuple[str, Optional[bytes], float, FrozenSet[str]]] = {}
+        # Statements logging streamed turns, in the order they were made
+        self._turn_writes: List[Tuple[str, Tuple[Any, ...]]] = []
+        # Buffers of streamed turns holding events not logged yet
+        self._turn_logs: List["TurnBuffer"] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._local = threading.local()
+        # The flusher is started on first save, in the process that saves (not a preloading master)
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+        self._purged_at = 0.0
+        self.flushes = 0
+        self.written = 0
+
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(_SCHEMA)
+            connection.execute(_CANCELS_SCHEMA)
+            connection.execute(_DATASETS_SCHEMA)
+            connection.execute(_DATASETS_INDEX)
+            connection.execute(_TURNS_SCHEMA)
+            connection.execute(_TURN_EVENTS_SCHEMA)
+            connection.commit()
+        finally:
+            connection.close()
+        atexit.register(self.flush)
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection; a forked child opens its own rather than reuse the parent's."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def stamp(self, key: str) -> Optional[str]:
+        """Stamp of the latest state saved for ``key``, or None if there is none."""
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            return pending[0] if pending[1] is not None else None
+        row = self._connection().execute('SELECT stamp FROM sessions WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        The latest state saved for ``key``.
+
+        Returns:
+            (stamp, state), or None if there is none
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            return (pending[0], decode_state(pending[1])) if pending[1] is not None else None
+        row = self._connection().execute('SELECT stamp, state FROM sessions WHERE key = ?', (key,)).fetchone()
+        return (row[0], decode_state(row[1])) if row else None
+
+    def save(self, key: str, stamp: str, state: Dict[str, Any], digests: Iterable[str] = ()) -> None:
+        """
+        Record ``state`` as the latest for ``key``; it is written by the background flusher.
+        The state is encoded now, so the session can change again straight away.
+
+        Args:
+            key: The user's session key
+            stamp: Token identifying this save
+            state: JSON-serializable session state
+            digests: Content digests of the stored datasets the session refers to
+        """
+        self._queue(key, stamp, encode_state(state), frozenset(digests))
+
+    def delete(self, key: str) -> None:
+        """Forget the state of ``key``."""
+        self._queue(key, '', None, frozenset())
+
+    def dataset_in_use(self, digest: str) -> bool:
+        """Whether any saved session, on any worker, refers to the stored dataset ``digest``."""
+        with self._lock:
+            if any(digest in pending[3] for pending in self._pending.values()):
+                return True
+        row = self._connection().execute('SELECT 1 FROM datasets WHERE digest = ? LIMIT 1', (digest,)).fetchone()
+        return row is not None
+
+    def request_cancel(self, key: str) -> None:
+        """Ask the worker streaming a turn for ``key`` to stop it."""
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT INTO cancels (key, requested_at) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET requested_at = excluded.requested_at',
+                (key, time.time()),
+            )
+
+    def cancel_requested(self, key: str, since: float) -> bool:
+        """Whether a cancel was requested for ``key`` at or after ``since`` (a ``time.time()``)."""
+        row = self._connection().execute('SELECT requested_at FROM cancels WHERE key = ?', (key,)).fetchone()
+        return row is not None and row[0] >= since
+
+    def cancels_requested(self, since: Dict[str, float]) -> List[str]:
+        """
+        Batch version of cancel_requested: one query for the turns a worker is streaming.
+
+        Args:
+            since: Key -> the ``time.time()`` its turn started
+
+        Returns:
+            The keys whose turns were asked to stop
+        """
+        rows = self._select_keys('SELECT key, requested_at FROM cancels WHERE key IN ({})', list(since))
+        return [key for key, requested_at in rows if requested_at >= since[key]]
+
+    def _select_keys(self, query: str, keys: List[str]) -> List[Tuple[Any, ...]]:
+        """Rows of ``query``, whose ``{}`` is filled with placeholders for ``keys``, run in batches."""
+        rows = []
+        connection = self._connection()
+        # SQLite limits the number of parameters in one statement
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            rows.extend(connection.execute(query.format(', '.join('?' * len(batch))), batch).fetchall())
+        return rows
+
+    def open_turn(self, key: str, turn_id: str) -> None:
+        """Start logging a streamed turn for ``key``, replacing the log of its previous turn."""
+        self._queue_turn_writes([
+            ('DELETE FROM turn_event_batches WHERE turn_id IN (SELECT turn_id FROM turns WHERE key = ?)', (key,)),
+            (
+                'INSERT INTO turns (key, turn_id, file_names, finished, updated_at) VALUES (?, ?, NULL, 0, ?) '
+                'ON CONFLICT(key) DO UPDATE SET turn_id = excluded.turn_id, file_names = NULL, finished = 0, '
+                'updated_at = excluded.updated_at',
+                (key, turn_id, time.time()),
+            ),
+        ])
+
+    def set_turn_file_names(self, key: str, turn_id: str, file_names: Optional[Dict[str, str]]) -> None:
+        """Log the sandbox name -> filename mapping a resumed stream of the turn writes with."""
+        self._queue_turn_writes([(
+            'UPDATE turns SET file_names = ? WHERE key = ? AND turn_id = ?',
+            (json.dumps(file_names) if file_names is not None else None, key, turn_id),
+        )])
+
+    def log_turn(self, buffer: "TurnBuffer") -> None:
+        """
+        Log the events of ``buffer`` that aren't logged yet at the next flush, as one batch.
+        A turn calls this once per flush at most, when the first event after the last one arrives.
+        """
+        with self._lock:
+            self._turn_logs.append(buffer)
+            self._start_flusher()
+
+    @staticmethod
+    def _turn_log_writes(buffer: "TurnBuffer") -> List[Tuple[str, Tuple[Any, ...]]]:
+        """Statements logging the events of ``buffer`` since the last batch, keeping the batches holding its newest."""
+        seq, events = buffer.unlogged()
+        if not events:
+            return []
+        end = seq + len(events)
+        return [
+            ('INSERT OR REPLACE INTO turn_event_batches (turn_id, seq, count, events) VALUES (?, ?, ?, ?)',
+             (buffer.turn_id, seq, len(events), json.dumps(events, separators=(',', ':')))),
+            ('DELETE FROM turn_event_batches WHERE turn_id = ? AND seq + count <= ?',
+             (buffer.turn_id, end - buffer.max_events)),
+        ]
+
+    def finish_turn(self, key: str, turn_id: str) -> None:
+        self._queue_turn_writes([(
+            'UPDATE turns SET finished = 1, updated_at = ? WHERE key = ? AND turn_id = ?', (time.time(), key, turn_id),
+        )])
+
+    def delete_turn(self, key: str, turn_id: str) -> None:
+        """Drop a turn's log, unless a newer turn has replaced it already."""
+        with self._lock:
+            # Events not logged yet needn't be, and their buffer can go now
+            self._turn_logs = [buffer for buffer in self._turn_logs if buffer.turn_id != turn_id]
+        self._queue_turn_writes([
+            ('DELETE FROM turn_event_batches WHERE turn_id = ?', (turn_id,)),
+            ('DELETE FROM turns WHERE key = ? AND turn_id = ?', (key, turn_id)),
+        ])
+
+    def follow_turn(self, turn_id: str) -> None:
+        """Log that a client is following the turn on this worker, which isn't the one streaming it."""
+        self._queue_turn_writes([('UPDATE turns SET followed_at = ? WHERE turn_id = ?', (time.time(), turn_id))])
+
+    def turns_followed(self, turn_ids: Iterable[str]) -> Dict[str, float]:
+        """Turn ID -> when a client last followed it on another worker (a ``time.time()``), for those that were."""
+        rows = self._select_keys(
+            'SELECT turn_id, followed_at FROM turns WHERE followed_at IS NOT NULL AND turn_id IN ({})', list(turn_ids),
+        )
+        return dict(rows)
+
+    def turn(self, key: str) -> Optional[Tuple[str, Optional[Dict[str, str]], bool]]:
+        """(turn ID, file names, finished) of the latest logged turn for ``key``, or None."""
+        row = self._connection().execute(
+            'SELECT turn_id, file_names, finished FROM turns WHERE key = ?', (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        turn_id, file_names, finished = row
+        return turn_id, json.loads(file_names) if file_names is not None else None, bool(finished)
+
+    def turn_events(self, turn_id: str, start: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """The logged events of a turn from sequence number ``start`` on, in order, as (seq, event) pairs."""
+        rows = self._connection().execute(
+            'SELECT seq, events FROM turn_event_batches WHERE turn_id = ? AND seq + count > ? ORDER BY seq',
+            (turn_id, start),
+        ).fetchall()
+        return [
+            (seq + i, event)
+            for seq, events in rows for i, event in enumerate(json.loads(events)) if seq + i >= start
+        ]
+
+    def _queue(self, key: str, stamp: str, state: Optional[bytes], digests: FrozenSet[str]) -> None:
+        with self._lock:
+            self._pending[key] = (stamp, state, time.time(), digests)
+            pending = len(self._pending)
+            self._start_flusher()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def _queue_turn_writes(self, writes: List[Tuple[str, Tuple[Any, ...]]]) -> None:
+        with self._lock:
+            self._turn_writes.extend(writes)
+            self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        """Start the flusher if this process hasn't yet. Caller must hold ``self._lock``."""
+        if self._flusher is None or self._flusher_pid != os.getpid():
+            self._flusher = threading.Thread(target=self._run, name='session-store-flusher', daemon=True)
+            self._flusher_pid = os.getpid()
+            self._flusher.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._purged_at > PURGE_INTERVAL:
+                    self._purged_at = time.monotonic()
+                    self.remove_expired()
+            except Exception as e:
+                logger.error(f"Session store flusher error: {e}")
+
+    def flush(self) -> int:
+        """Write every pending state and turn log entry now, in one transaction; returns how many states were written."""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.items())
+                turn_writes, self._turn_writes = self._turn_writes, []
+                turn_logs, self._turn_logs = self._turn_logs, []
+            # Taken after the statements, so a turn logged as finished among them has its last events logged too
+            turn_writes[:0] = [write for buffer in turn_logs for write in self._turn_log_writes(buffer)]
+            if not batch and not turn_writes:
+                return 0
+            deleted = [(key,) for key, (_, state, _, _) in batch if state is None]
+            connection = self._connection()
+            try:
+                with connection:
+                    for key, (stamp, state, saved_at, digests) in batch:
+                        # A state that lost to a newer one written by another worker leaves that one's datasets alone
+                        if state is None or not connection.execute(_UPSERT, (key, stamp, state, saved_at)).rowcount:
+                            continue
+                        connection.execute('DELETE FROM datasets WHERE key = ?', (key,))
+                        connection.executemany(
+                            'INSERT INTO datasets (key, digest) VALUES (?, ?)', [(key, digest) for digest in digests],
+                        )
+                    connection.executemany('DELETE FROM sessions WHERE key = ?', deleted)
+                    connection.executemany('DELETE FROM datasets WHERE key = ?', deleted)
+                    for statement, parameters in turn_writes:
+                        connection.execute(statement, parameters)
+            except sqlite3.Error as e:
+                # Left pending, so the next flush retries them
+                logger.warning(f"Failed to write {len(batch)} chat session states: {e}")
+                with self._lock:
+                    self._turn_writes[:0] = turn_writes
+                return 0
+            # States saved again while this batch was written stay pending
+            with self._lock:
+                for key, value in batch:
+                    if self._pending.get(key) is value:
+                        del self._pending[key]
+            self.flushes += 1
+            self.written += len(batch)
+            return len(batch)
+
+    def remove_expired(self) -> int:
+        """Delete states not saved for ``idle_ttl`` seconds; returns how many were deleted."""
+        cutoff = time.time() - self.idle_ttl
+        connection = self._connection()
+        with connection:
+            deleted = connection.execute('DELETE FROM sessions WHERE updated_at < ?', (cutoff,)).rowcount
+            connection.execute('DELETE FROM cancels WHERE requested_at < ?', (cutoff,))
+            connection.execute('DELETE FROM datasets WHERE key NOT IN (SELECT key FROM sessions)')
+            connection.execute(
+                'DELETE FROM turn_event_batches WHERE turn_id IN (SELECT turn_id FROM turns WHERE updated_at < ?)', (cutoff,),
+            )
+            connection.execute('DELETE FROM turns WHERE updated_at < ?', (cutoff,))
+        if deleted:
+            logger.info(f"Removed {deleted} idle chat session states")
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending = len(self._pending)
+        return {"pending": pending, "flushes": self.flushes, "written": self.written}
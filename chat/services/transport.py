@@ -0,0 +1,234 @@
+import logging
+import math
+import threading
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional
+
+import httpx
+from google.genai import types
+
+from .metrics import HTTP_EVENTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+# httpcore matches every queued request against every pooled connection whenever a request starts or
+# finishes, so one large pool spends more time on that scan than on I/O under many concurrent streams.
+# Pools are split into shards of at most this many connections
+DEFAULT_SHARD_SIZE = 8
+
+# httpcore trace events counted per pool, by the name they're reported under
+_TRACED_EVENTS = {
+    'connection.connect_tcp.complete': 'connect',
+    'connection.start_tls.complete': 'tls_handshake',
+    'connection.connect_tcp.failed': 'connect_failed',
+}
+
+
+class PoolStats:
+    """Counts of requests and connection events on one pool, fed by httpcore's trace hook."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts: Dict[str, int] = {'request': 0, 'connect': 0, 'tls_handshake': 0, 'connect_failed': 0}
+        self._lock = threading.Lock()
+
+    def count(self, event: str) -> None:
+        with self._lock:
+            self.counts[event] += 1
+        HTTP_EVENTS.inc(pool=self.name, event=event)
+
+    def trace(self, name: str, info: Dict[str, Any]) -> None:
+        event = _TRACED_EVENTS.get(name)
+        if event:
+            self.count(event)
+
+    async def atrace(self, name: str, info: Dict[str, Any]) -> None:
+        self.trace(name, info)
+
+
+class _Shard:
+    """One httpcore pool and the number of responses it is serving."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.active = 0
+
+
+class _ShardStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Response body that releases its shard when closed."""
+
+    def __init__(self, stream, shard: _Shard, lock: threading.Lock):
+        self._stream = stream
+        self._shard = shard
+        self._lock = lock
+        self._released = False
+
+    def _release(self) -> None:
+        with self._lock:
+            if not self._released:
+                self._released = True
+                self._shard.active -= 1
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class _ShardedPool:
+    """Routes each request to the shard serving the fewest responses."""
+
+    def __init__(self, transport_class, stats: PoolStats, shards: int, limits: httpx.Limits, http2: bool):
+        self.stats = stats
+        self.shards: List[_Shard] = [_Shard(transport_class(limits=limits, http2=http2)) for _ in range(shards)]
+        self._lock = threading.Lock()
+
+    def acquire(self, request: httpx.Request, trace) -> _Shard:
+        self.stats.count('request')
+        request.extensions = {**request.extensions, 'trace': trace}
+        with self._lock:
+            shard = min(self.shards, key=lambda s: s.active)
+            shard.active += 1
+        return shard
+
+    def attach(self, response: httpx.Response, shard: _Shard) -> httpx.Response:
+        response.stream = _ShardStream(response.stream, shard, self._lock)
+        return response
+
+    def release(self, shard: _Shard) -> None:
+        with self._lock:
+            shard.active -= 1
+
+    def connections(self) -> list:
+        return [connection for shard in self.shards for connection in shard.transport._pool.connections]
+
+
+class _PooledTransport(httpx.BaseTransport):
+    def __init__(self, pool: _ShardedPool):
+        self.pool = pool
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        shard = self.pool.acquire(request, self.pool.stats.trace)
+        try:
+            response = shard.transport.handle_request(request)
+        except BaseException:
+            self.pool.release(shard)
+            raise
+        return self.pool.attach(response, shard)
+
+    def close(self) -> None:
+        for shard in self.pool.shards:
+            shard.transport.close()
+
+
+class _AsyncPooledTransport(httpx.AsyncBaseTransport):
+    def __init__(self, pool: _ShardedPool):
+        self.pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        shard = self.pool.acquire(request, self.pool.stats.atrace)
+        try:
+            response = await shard.transport.handle_async_request(request)
+        except BaseException:
+            self.pool.release(shard)
+            raise
+        return self.pool.attach(response, shard)
+
+    async def aclose(self) -> None:
+        for shard in self.pool.shards:
+            await shard.transport.aclose()
+
+
+class HttpPool:
+    """
+    Keep-alive connection pools shared by every Gemini call in the process.
+
+    One pool serves the sync client and one the async client. Each holds up to
+    ``max_connections`` connections and keeps all of them alive between calls
+    for ``keepalive_expiry`` seconds, so concurrent sessions reuse warm
+    connections instead of paying a TCP and TLS handshake per call (httpx's
+    default keeps only 20 idle connections). Each pool is split into shards
+    of ``shard_size`` connections and a request goes to the least busy shard.
+    With ``http2``, calls are multiplexed over fewer connections; that needs
+    the ``h2`` package.
+
+    Transports are built on first use, in the process that makes the calls,
+    so a pool configured before a fork shares no sockets with its children.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        http2: bool = False,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+    ):
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.error("h2 not available for HTTP/2 Gemini connections")
+                raise ValueError("HTTP/2 connections to Gemini require the h2 package")
+        self.shards = max(1, math.ceil(max_connections / shard_size))
+        per_shard = math.ceil(max_connections / self.shards)
+        self.limits = httpx.Limits(
+            max_connections=per_shard,
+            max_keepalive_connections=per_shard,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.sync_stats = PoolStats('sync')
+        self.async_stats = PoolStats('async')
+        self._pools: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    def _build(self) -> tuple:
+        with self._lock:
+            if self._pools is None:
+                self._pools = (
+                    _ShardedPool(httpx.HTTPTransport, self.sync_stats, self.shards, self.limits, self.http2),
+                    _ShardedPool(httpx.AsyncHTTPTransport, self.async_stats, self.shards, self.limits, self.http2),
+                )
+            return self._pools
+
+    def reset(self) -> None:
+        """Forget the transports without closing them, e.g. in a forked child that must not use the parent's sockets."""
+        self._pools = None
+        self._lock = threading.Lock()
+
+    def http_options(self, **options) -> types.HttpOptions:
+        """HTTP options that route a ``genai.Client`` through these pools."""
+        sync_pool, async_pool = self._build()
+        return types.HttpOptions(
+            client_args={'transport': _PooledTransport(sync_pool)},
+            async_client_args={'transport': _AsyncPooledTransport(async_pool)},
+            **options,
+        )
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per pool: request and connection event counts, plus currently open and idle connections."""
+        result = {}
+        pools = self._pools or (None, None)
+        for stats, pool in zip((self.sync_stats, self.async_stats), pools):
+            connections = pool.connections() if pool is not None else []
+            result[stats.name] = {
+                **stats.counts,
+                'open': len(connections),
+                'idle': sum(1 for connection in connections if connection.is_idle()),
+            }
+        return result
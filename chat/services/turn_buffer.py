@@ -0,0 +1,413 @@
+import asyncio
+import functools
+import itertools
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .session_store import SessionStore
+
+# Most events of one turn kept for resuming; a long agentic turn streams about a thousand
+DEFAULT_MAX_EVENTS = 4096
+
+
+class ResumeError(Exception):
+    """Raised when a stream can't be resumed from the given event: another turn's, or no longer buffered."""
+
+
+def turn_id_of(event_id: str) -> str:
+    """The turn an event ID (``<turn>-<n>``, maybe with ``+<k>``) belongs to."""
+    return event_id.rpartition('-')[0]
+
+
+class TurnBuffer:
+    """
+    The events of one streamed turn, kept so a client whose connection dropped can resume.
+
+    The turn ``append``s each chunk as it streams, which gives it an event ID
+    (``<turn>-<n>``), and calls ``finish`` after the last one. ``follow``
+    (``afollow`` from async code) yields the events after a client's last
+    event ID, then waits for new ones until the turn finishes, so a resumed
+    stream continues live. Only the newest ``max_events`` are kept; a
+    follower that falls further behind than that is sent an error event and
+    a done event instead.
+
+    An SSE writer holding back the last ``k`` characters of text when it sent
+    the event ``<turn>-<n>`` tags its frame ``<turn>-<n>+<k>``; resuming from
+    such an ID sends those characters again first.
+
+    Followers are counted (``follow`` counts its caller until the iterator
+    ends or is closed; a stream fed straight from the turn calls ``attach``
+    and ``detach``), so the turn can tell when no client has been following
+    it for a while (``abandoned``) and stop.
+
+    With a ``store``, the turn is also logged there under ``key``, so another
+    worker can resume it: that worker follows a copy of this buffer that it
+    fills from the log (``replicate``). The store takes the events at its
+    next flush (``unlogged``), so appending one is no slower with a store.
+    """
+
+    def __init__(
+        self,
+        turn_id: str,
+        max_events: int = DEFAULT_MAX_EVENTS,
+        store: Optional["SessionStore"] = None,
+        key: Optional[str] = None,
+    ):
+        if max_events < 1:
+            raise ValueError("max_events must be at least 1")
+        self.turn_id = turn_id
+        self.max_events = max_events
+        self.store = store
+        self.key = key
+        self._file_names: Optional[Dict[str, str]] = None
+        self.finished = False
+        # The chunks as appended; the last has sequence number _next - 1
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self._next = 0
+        # Sequence number after the latest event that isn't text
+        self._next_other = 0
+        # Sequence number of the first event the store hasn't logged, and whether it will at its next flush
+        self._logged = 0
+        self._log_queued = False
+        self._followers = 0
+        self._unfollowed_at = time.monotonic()
+        self._cond = threading.Condition(threading.Lock())
+        # Sync followers waiting for the next event, those waiting for one that isn't text, and wake-ups of async ones
+        self._sleepers = 0
+        self._lazy_sleepers = 0
+        self._waiters: List[Callable[[], None]] = []
+
+    @property
+    def file_names(self) -> Optional[Dict[str, str]]:
+        """Sandbox name -> filename, for the writer of a resumed stream."""
+        return self._file_names
+
+    @file_names.setter
+    def file_names(self, file_names: Optional[Dict[str, str]]) -> None:
+        self._file_names = file_names
+        if self.store is not None:
+            self.store.set_turn_file_names(self.key, self.turn_id, file_names)
+
+    @property
+    def next_seq(self) -> int:
+        """Sequence number of the next event."""
+        return self._next
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.turn_id}-{seq}"
+
+    def append(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """Record the next chunk of the turn and return it with its ``id``."""
+        with self._cond:
+            seq = self._next
+            self._add(chunk)
+            if self.store is not None and not self._log_queued:
+                self._log_queued = True
+                self.store.log_turn(self)
+        return {**chunk, 'id': self.event_id(seq)}
+
+    def _add(self, chunk: Dict[str, Any]) -> None:
+        """Record the next event and wake the followers waiting for it. Caller holds the lock."""
+        self._events.append(chunk)
+        self._next += 1
+        text = chunk.get('type') == 'text'
+        if not text:
+            self._next_other = self._next
+        self._wake(text)
+
+    def unlogged(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """(sequence number of the first, events) appended since the last call, for the store's log."""
+        with self._cond:
+            count = min(self._next - self._logged, len(self._events))
+            events = list(itertools.islice(self._events, len(self._events) - count, None))
+            self._logged = self._next
+            self._log_queued = False
+            return self._next - count, events
+
+    def replicate(self, seq: int, chunk: Dict[str, Any]) -> None:
+        """Record event ``seq`` of the turn as the worker streaming it logged it; events already held are skipped."""
+        with self._cond:
+            if seq < self._next:
+                return
+            if seq > self._next:
+                # The events in between were dropped from the log; those before them can't be resumed from
+                self._events.clear()
+                self._next = seq
+            self._add(chunk)
+
+    def finish(self) -> None:
+        """Mark the turn as over, ending every follower once it has the last event."""
+        with self._cond:
+            self.finished = True
+            if self.store is not None:
+                self.store.finish_turn(self.key, self.turn_id)
+            self._wake()
+
+    def _wake(self, text: bool = False) -> None:
+        if self._sleepers or (self._lazy_sleepers and not text):
+            self._cond.notify_all()
+        if self._waiters:
+            waiters, self._waiters = self._waiters, []
+            for wake in waiters:
+                wake()
+
+    def attach(self) -> None:
+        """Count a client following the turn; call ``detach`` when it stops."""
+        with self._cond:
+            self._followers += 1
+
+    def detach(self) -> None:
+        with self._cond:
+            self._followers -= 1
+            if self._followers == 0:
+                self._unfollowed_at = time.monotonic()
+
+    @property
+    def followed(self) -> bool:
+        """Whether a client is following the turn here."""
+        return self._followers > 0
+
+    def followed_elsewhere(self, at: float) -> None:
+        """Count a client that followed the turn on another worker at ``at`` (a ``time.time()``)."""
+        with self._cond:
+            self._unfollowed_at = max(self._unfollowed_at, time.monotonic() - (time.time() - at))
+
+    def abandoned(self, grace: float) -> bool:
+        """Whether no client has followed the turn for ``grace`` seconds."""
+        # Checked after every chunk; a stale read only delays the answer to the next one
+        return self._followers == 0 and time.monotonic() - self._unfollowed_at >= grace
+
+    def _position(self, last_event_id: Optional[str]) -> Tuple[int, int]:
+        """(sequence number of the next event to send, characters of text to resend before it)."""
+        if last_event_id is None:
+            return 0, 0
+        turn, _, position = last_event_id.rpartition('-')
+        seq, _, held = position.partition('+')
+        if turn != self.turn_id:
+            raise ResumeError("The stream belongs to a turn that is no longer running")
+        try:
+            seq, held = int(seq), int(held or 0)
+        except ValueError:
+            raise ResumeError(f"Invalid event ID: {last_event_id}")
+        if seq < 0 or held < 0 or seq >= self._next:
+            raise ResumeError(f"Invalid event ID: {last_event_id}")
+        return seq + 1, held
+
+    def _take(self, start: int, held: int = 0) -> List[Dict[str, Any]]:
+        """Events from ``start`` on, led by the last ``held`` characters of text before it. Caller holds the lock."""
+        if start < self._next - len(self._events):
+            raise ResumeError("Too much of the response was missed to resume it")
+        newest = reversed(self._events)
+        events = [
+            {**chunk, 'id': self.event_id(seq)}
+            for seq, chunk in zip(range(self._next - 1, start - 1, -1), newest)
+        ]
+        events.reverse()
+        if held:
+            # Text chunks right before ``start``, newest first
+            text = ''
+            for chunk in newest:
+                if chunk.get('type') != 'text' or len(text) >= held:
+                    break
+                text = (chunk.get('content') or '') + text
+            if len(text) < held:
+                raise ResumeError("Too much of the response was missed to resume it")
+            events.insert(0, {'type': 'text', 'content': text[-held:], 'id': self.event_id(start - 1)})
+        return events
+
+    def follow(
+        self, last_event_id: Optional[str] = None, on_end: Optional[Callable[[], None]] = None,
+        on_idle: Optional[Callable[[], None]] = None,
+    ) -> "Follower":
+        """
+        Events after ``last_event_id`` (all of them for None), then each new one until the turn finishes.
+        The caller counts as following the turn from now until the follower ends or is closed.
+
+        Args:
+            last_event_id: The ID of the last event the client received
+            on_end: Called once the follower has been given every event of the finished turn
+            on_idle: Called once, the first time the follower has to wait for an event, or on
+                closing it if that comes first; for a turn driven by the follower's own thread
+                until then, to hand the rest of it on
+
+        Raises:
+            ResumeError: If the events can't be resumed from ``last_event_id``
+        """
+        events, start = self._resume(last_event_id)
+        return Follower(self, events, start, on_end, on_idle)
+
+    def afollow(
+        self, last_event_id: Optional[str] = None, on_end: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Async version of ``follow``."""
+        events, start = self._resume(last_event_id)
+        return self._afollow(events, start, on_end)
+
+    def _resume(self, last_event_id: Optional[str]) -> Tuple[List[Dict[str, Any]], int]:
+        with self._cond:
+            start, held = self._position(last_event_id)
+            events = self._take(start, held)
+            self._followers += 1
+            return events, self._next
+
+    async def _afollow(
+        self, events: List[Dict[str, Any]], start: int, on_end: Optional[Callable[[], None]],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                for event in events:
+                    yield event
+                while True:
+                    with self._cond:
+                        if self._next != start or self.finished:
+                            break
+                        waiter = loop.create_future()
+                        self._waiters.append(functools.partial(loop.call_soon_threadsafe, _wake_waiter, waiter))
+                    await waiter
+                with self._cond:
+                    if self._next == start:
+                        break
+                    try:
+                        events, start = self._take(start), self._next
+                    except ResumeError as e:
+                        events, start = _fell_behind(e), None
+                if start is None:
+                    for event in events:
+                        yield event
+                    return
+            if on_end is not None:
+                on_end()
+        finally:
+            self.detach()
+
+
+class Follower:
+    """
+    A client following a turn (see ``TurnBuffer.follow``).
+
+    Iterating it yields the turn's events, waiting for new ones until the turn
+    finishes. ``poll`` takes the events that arrived since the last call
+    instead, waiting at most a given time, for a caller with other things to do
+    meanwhile (an SSE writer's timers), so no thread is needed to wait on the
+    turn. ``close`` stops following, and may be called from another thread: a
+    wait in progress returns at once.
+    """
+
+    def __init__(
+        self, buffer: TurnBuffer, events: List[Dict[str, Any]], start: int, on_end: Optional[Callable[[], None]],
+        on_idle: Optional[Callable[[], None]] = None,
+    ):
+        self._buffer = buffer
+        # Events taken from the buffer, not handed out yet
+        self._events: Deque[Dict[str, Any]] = deque(events)
+        # Sequence number of the next event to take
+        self._start = start
+        self._on_end = on_end
+        # Until it has been called
+        self._on_idle = on_idle
+        self._closed = False
+        # Whether every event has been taken: the turn finished, or the follower fell behind
+        self.ended = False
+
+    def __iter__(self) -> "Follower":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        while not self._events:
+            if self.ended or self._closed:
+                raise StopIteration
+            self._events = deque(self.poll())
+        return self._events.popleft()
+
+    def poll(self, timeout: Optional[float] = None, text: bool = True) -> List[Dict[str, Any]]:
+        """
+        The events that arrived since the last call, waiting for one if there are none yet.
+
+        Args:
+            timeout: Most seconds to wait, or None to wait however long
+            text: Whether a text event ends the wait; without it only another kind of event,
+                the end of the turn or the timeout does, and text waits to be taken with it
+
+        Returns:
+            The events in order; empty if none came in time, or after the follower ended or was closed
+        """
+        if self.ended or self._closed:
+            return []
+        events, self._events = list(self._events), deque()
+        buffer = self._buffer
+        if not events and self._on_idle is not None and not self._ready(text):
+            self._idle()
+        with buffer._cond:
+            if not events:
+                self._wait(timeout, text)
+                if self._closed:
+                    return []
+            on_end = self._on_end
+            try:
+                events += buffer._take(self._start)
+            except ResumeError as e:
+                # Not the whole turn, so not the end of it for on_end either
+                events += _fell_behind(e)
+                self.ended, on_end = True, None
+            else:
+                self._start = buffer._next
+                self.ended = buffer.finished
+        if self.ended:
+            buffer.detach()
+            if on_end is not None:
+                on_end()
+        return events
+
+    def _wait(self, timeout: Optional[float], text: bool) -> None:
+        """Wait until the follower has something to take, or is closed. Caller holds the buffer's lock."""
+        buffer = self._buffer
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not (self._closed or self._ready(text)):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return
+            if text:
+                buffer._sleepers += 1
+            else:
+                buffer._lazy_sleepers += 1
+            try:
+                buffer._cond.wait(remaining)
+            finally:
+                if text:
+                    buffer._sleepers -= 1
+                else:
+                    buffer._lazy_sleepers -= 1
+
+    def _ready(self, text: bool) -> bool:
+        """Whether the follower has something to take (see ``poll``)."""
+        buffer = self._buffer
+        return buffer.finished or (buffer._next if text else buffer._next_other) > self._start
+
+    def _idle(self) -> None:
+        on_idle, self._on_idle = self._on_idle, None
+        if on_idle is not None:
+            on_idle()
+
+    def close(self) -> None:
+        """Stop following the turn, ending a wait in progress on another thread."""
+        self._idle()
+        with self._buffer._cond:
+            if self._closed or self.ended:
+                return
+            self._closed = True
+            self._buffer._cond.notify_all()
+        self._buffer.detach()
+
+
+def _fell_behind(error: ResumeError) -> List[Dict[str, Any]]:
+    """The events ending the stream of a follower that fell behind by more than the buffer holds."""
+    return [{'type': 'error', 'content': str(error)}, {'type': 'done'}]
+
+
+def _wake_waiter(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,52 @@
+"""
+Process warm-up, run when the WSGI/ASGI application is loaded.
+
+Django imports the URLconf (and with it the chat views, google-genai and the
+session services) on the first request, and the data libraries are imported
+by the first upload or grid query that needs them. ``warm_up`` does all of
+that up front, so a worker is fully loaded before it accepts traffic, and a
+preloading gunicorn master (see ``gunicorn.conf.py``) pays for it once for
+all of its workers.
+"""
+import logging
+import time
+from importlib import import_module
+
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Optional dependencies imported lazily by the services
+DATA_MODULES = (
+    'pyarrow',
+    'pyarrow.compute',
+    'pyarrow.csv',
+    'pyarrow.dataset',
+    'pyarrow.ipc',
+    'pandas',
+    'openpyxl',
+)
+
+
+def warm_up() -> float:
+    """
+    Import the URLconf and the optional data libraries, and render one response
+    so markdown and code highlighting are loaded.
+
+    Returns:
+        Seconds spent warming up
+    """
+    start = time.perf_counter()
+    get_resolver().url_patterns
+    for name in DATA_MODULES:
+        try:
+            import_module(name)
+        except ImportError:
+            logger.debug(f"Skipping warm-up of {name}: not installed")
+
+    from .utils.markdown import render_markdown
+    render_markdown("Warm-up\n\n```python\nprint('ok')\n```")
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Warmed up in {elapsed * 1000:.0f} ms")
+    return elapsed
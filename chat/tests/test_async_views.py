@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, override_settings
+from django.urls import path, reverse
+from google.genai import types
+
+from chat import async_views, views
+from chat.services.backends import ReplayBackend
+from chat.services.gemini import AsyncGeminiChatSession
+
+REPLY = [(0.0, types.Part(text=f'part {i} ')) for i in range(40)]
+CSV = b'region,sales\nnorth,10\nsouth,20\n'
+
+# The API served as under ASGI with CHAT_ASYNC, which picks the views when chat.urls is imported
+urlpatterns = [
+    path('api/chat/stream/', async_views.stream_chat_response, name='stream_chat_response'),
+    path('api/chat/cancel/', views.cancel_chat_response, name='cancel_chat_response'),
+    path('api/chat/upload/', async_views.upload_file, name='upload_file'),
+    path('api/chat/upload/start/', views.start_chunked_upload, name='start_chunked_upload'),
+    path('api/chat/upload/complete/', async_views.complete_chunked_uploads, name='complete_chunked_uploads'),
+    path('api/chat/upload/<str:upload_id>/parts/<int:index>/', views.upload_part, name='upload_part'),
+    path('api/chat/upload/<str:upload_id>/complete/', async_views.complete_chunked_upload, name='complete_chunked_upload'),
+]
+
+
+@pytest.fixture(autouse=True)
+def async_api(monkeypatch):
+    # Sessions are created for each new client's key, by the registry's factory, from these
+    monkeypatch.setattr(views, 'SESSION_CLASS', AsyncGeminiChatSession)
+    monkeypatch.setattr(views, 'model_backend', ReplayBackend([REPLY], speed=0))
+    with override_settings(ROOT_URLCONF=__name__):
+        yield
+
+
+def _slow_replies(monkeypatch):
+    monkeypatch.setattr(views, 'model_backend', ReplayBackend([REPLY], first_chunk_delay=0, chunk_delay=0.02))
+
+
+def _events(frames: list) -> list:
+    """The events in SSE frames, each with its ``id`` if it had one."""
+    events = []
+    for frame in b''.join(frames).decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in frame.splitlines() if not line.startswith(':'))
+        if 'data' in fields:
+            events.append(json.loads(fields['data']) | ({'id': fields['id']} if 'id' in fields else {}))
+    return events
+
+
+def _text(events: list) -> str:
+    return ''.join(event['content'] for event in events if event['type'] == 'text')
+
+
+async def _read_until_dropped(response, frames: list, received: asyncio.Event) -> None:
+    async for frame in response.streaming_content:
+        frames.append(frame)
+        if _events(frames):
+            received.set()
+
+
+async def _drop_after_first_event(response) -> list:
+    """
+    Read the stream up to its first event, then go away like a client whose connection drops:
+    the ASGI handler cancels the task sending the response.
+    """
+    frames = []
+    received = asyncio.Event()
+    reading = asyncio.ensure_future(_read_until_dropped(response, frames, received))
+    await received.wait()
+    reading.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await reading
+    return _events(frames)
+
+
+async def _turns_finished(timeout: float = 5) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while async_views._running_turns:
+        assert asyncio.get_running_loop().time() < deadline, "the turn didn't finish"
+        await asyncio.sleep(0.01)
+
+
+def test_streams_a_turn():
+    async def run():
+        response = await AsyncClient().post(reverse('stream_chat_response'), {'message': 'Hello'})
+        return response, _events([frame async for frame in response.streaming_content])
+
+    response, events = asyncio.run(run())
+    assert response['Content-Type'] == 'text/event-stream'
+    assert _text(events) == ''.join(part.text for _, part in REPLY)
+    assert events[-1]['type'] == 'done' and all('id' in event for event in events)
+
+
+def test_a_dropped_stream_resumes_with_last_event_id():
+    async def run():
+        client = AsyncClient()
+        url = reverse('stream_chat_response')
+        first = await _drop_after_first_event(await client.post(url, {'message': 'Hello'}))
+        # The turn goes on without the client, which reconnects for the rest
+        response = await client.post(url, headers={'Last-Event-ID': first[-1]['id']})
+        return first, _events([frame async for frame in response.streaming_content])
+
+    first, rest = asyncio.run(run())
+    assert _text(first + rest) == ''.join(part.text for _, part in REPLY)
+    assert rest[-1]['type'] == 'done' and not any(event['type'] == 'error' for event in rest)
+
+
+def test_resuming_an_unknown_turn_ends_with_an_error():
+    async def run():
+        response = await AsyncClient().post(reverse('stream_chat_response'), headers={'Last-Event-ID': 'gone-3'})
+        return _events([frame async for frame in response.streaming_content])
+
+    assert [event['type'] for event in asyncio.run(run())] == ['error', 'done']
+
+
+def test_cancel_stops_the_stream(monkeypatch):
+    _slow_replies(monkeypatch)
+
+    async def run():
+        client = AsyncClient()
+        response = await client.post(reverse('stream_chat_response'), {'message': 'Hello'})
+        frames = response.streaming_content.__aiter__()
+        first = await frames.__anext__()
+        cancel = await client.post(reverse('cancel_chat_response'))
+        return cancel.json(), _events([first] + [frame async for frame in frames])
+
+    cancel, events = asyncio.run(run())
+    assert cancel == {'cancelled': True}
+    assert [event['type'] for event in events[-2:]] == ['cancelled', 'done']
+    assert len(_text(events)) < len(''.join(part.text for _, part in REPLY))
+
+
+@override_settings(SSE_RESUME_GRACE=0.05)
+def test_a_turn_nobody_follows_is_stopped_after_the_grace_period(monkeypatch):
+    _slow_replies(monkeypatch)
+
+    async def run():
+        client = AsyncClient()
+        url = reverse('stream_chat_response')
+        first = await _drop_after_first_event(await client.post(url, {'message': 'Hello'}))
+        await _turns_finished()
+        response = await client.post(url, headers={'Last-Event-ID': first[-1]['id']})
+        return _events([frame async for frame in response.streaming_content])
+
+    events = asyncio.run(run())
+    assert [event['type'] for event in events[-2:]] == ['cancelled', 'done']
+
+
+def test_upload_file():
+    async def run():
+        upload = SimpleUploadedFile('sales.csv', CSV, content_type='text/csv')
+        return await AsyncClient().post(reverse('upload_file'), {'file': upload})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.json()['files'] == ['sales.csv']
+
+
+async def _chunked_upload(client: AsyncClient, filename: str, data: bytes, send: bool = True) -> str:
+    """Start a chunked upload of ``data`` and send its parts (unless not ``send``); returns its ID."""
+    started = (await client.post(reverse('start_chunked_upload'), {'filename': filename, 'size': len(data)})).json()
+    if send:
+        size = started['part_size']
+        for index in range(started['part_count']):
+            part = data[index * size:(index + 1) * size]
+            response = await client.put(
+                reverse('upload_part', args=[started['upload_id'], index]), part,
+                content_type='application/octet-stream', headers={'X-Part-Sha256': hashlib.sha256(part).hexdigest()},
+            )
+            assert response.status_code == 200
+    return started['upload_id']
+
+
+def test_complete_chunked_uploads():
+    async def run():
+        client = AsyncClient()
+        first = await _chunked_upload(client, 'north.csv', CSV)
+        second = await _chunked_upload(client, 'south.csv', CSV)
+        return await client.post(reverse('complete_chunked_uploads'), {'upload_id': [first, second]})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.json()['files'] == ['north.csv', 'south.csv']
+
+
+def test_completing_an_unfinished_chunked_upload_is_rejected():
+    async def run():
+        client = AsyncClient()
+        upload_id = await _chunked_upload(client, 'sales.csv', CSV, send=False)
+        return await client.post(reverse('complete_chunked_upload', args=[upload_id]))
+
+    response = asyncio.run(run())
+    assert response.status_code == 400 and 'error' in response.json()
@@ -0,0 +1,71 @@
+import asyncio
+import io
+import json
+
+import pytest
+from google.genai import types
+
+from chat.services.backends import PLACEHOLDER_PNG, ReplayBackend, load_transcript
+
+
+def _write_transcript(path, events) -> str:
+    path.write_text(json.dumps([{'t': t, 'event': event} for t, event in events]))
+    return str(path)
+
+
+def test_loads_turns_split_at_done_events(tmp_path):
+    path = _write_transcript(tmp_path / 'transcript.json', [
+        (100, {'type': 'text', 'content': 'Hello'}),
+        (250, {'type': 'code', 'content': 'print(1)'}),
+        (300, {'type': 'done'}),
+        (400, {'type': 'image', 'digest': 'abc'}),
+        (450, {'type': 'heartbeat'}),
+    ])
+    first, second = load_transcript(path)
+    assert [(t, part.text or part.executable_code.code) for t, part in first] == [(0.1, 'Hello'), (0.25, 'print(1)')]
+    # Times restart at each turn; plots recorded by digest only are replaced by a placeholder
+    assert second[0][0] == pytest.approx(0.1)
+    assert second[0][1].inline_data.data == PLACEHOLDER_PNG
+
+
+def test_rejects_an_empty_transcript(tmp_path):
+    with pytest.raises(ValueError):
+        load_transcript(_write_transcript(tmp_path / 'empty.json', [(0, {'type': 'done'})]))
+
+
+def test_schedule_follows_the_recording_or_fixed_delays():
+    turn = [(0.2, types.Part(text='a')), (0.5, types.Part(text='b'))]
+    assert [delay for delay, _ in ReplayBackend([turn], speed=2).schedule(turn)] == pytest.approx([0.1, 0.15])
+    assert [delay for delay, _ in ReplayBackend([turn], speed=0).schedule(turn)] == [0.0, 0.0]
+    fixed = ReplayBackend([turn], first_chunk_delay=1.0, chunk_delay=0.01)
+    assert [delay for delay, _ in fixed.schedule(turn)] == [1.0, 0.01]
+
+
+def test_chats_rotate_turns_and_record_them():
+    backend = ReplayBackend([[(0.0, types.Part(text='one'))], [(0.0, types.Part(text='two'))]], speed=0)
+    chat = backend.create_chat('model', types.GenerateContentConfig())
+    chunks = list(chat.send_message_stream('first'))
+    assert [chunk.text for chunk in chunks] == ['one']
+    assert chunks[-1].usage_metadata.candidates_token_count > 0
+    assert chat.send_message('second').text == 'two'
+    assert [content.role for content in chat.get_history()] == ['user', 'model', 'user', 'model']
+
+
+def test_async_chat_records_a_turn_once_streamed():
+    backend = ReplayBackend([[(0.0, types.Part(text='a')), (0.0, types.Part(text='b'))]], speed=0)
+
+    async def run():
+        chat = backend.create_async_chat('model', types.GenerateContentConfig())
+        stream = await chat.send_message_stream('question')
+        return chat, [chunk.text async for chunk in stream]
+
+    chat, texts = asyncio.run(run())
+    assert texts == ['a', 'b']
+    assert len(chat.get_history()) == 2
+
+
+def test_upload_returns_a_local_handle():
+    backend = ReplayBackend([[(0.0, types.Part(text='a'))]])
+    uploaded = backend.upload_file(io.BytesIO(b'a,b\n1,2\n'), types.UploadFileConfig(mime_type='text/csv', display_name='d.csv'))
+    assert uploaded.size_bytes == 8 and uploaded.uri.startswith('replay://')
+    assert backend.uploads == 1
@@ -0,0 +1,101 @@
+import time
+
+import pytest
+from google.genai import types
+
+from chat.services.backends import ReplayBackend
+from chat.services.cancellation import Cancellation, TurnCancelled
+from chat.services.gemini import GeminiChatSession
+from chat.services.registry import SessionRegistry
+from chat.services.session_store import SessionStore
+
+BACKEND = ReplayBackend([[(0.0, types.Part(text='an answer'))]], speed=0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(str(tmp_path / 'sessions.sqlite3'), flush_interval=60)
+
+
+def _worker(store: SessionStore) -> SessionRegistry:
+    return SessionRegistry(lambda: GeminiChatSession('system prompt', backend=BACKEND), store=store, poll_interval=0.01)
+
+
+def _wait(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_check_raises_once_cancelled_and_keeps_the_first_reason():
+    cancellation = Cancellation()
+    cancellation.check()
+    cancellation.cancel('disconnect')
+    cancellation.cancel('request')
+    assert cancellation.reason == 'disconnect' and cancellation.requested_at is not None
+    with pytest.raises(TurnCancelled):
+        cancellation.check()
+
+
+def test_a_cancel_on_another_worker_is_noticed_without_querying_from_the_turn(store):
+    streaming, other = _worker(store), _worker(store)
+    cancellation = streaming.begin_turn('k')
+    queried = []
+    original = store.cancels_requested
+
+    def cancels_requested(since):
+        queried.append(since)
+        return original(since)
+    store.cancels_requested = cancels_requested
+
+    # The turn's checks only read a flag
+    assert not cancellation.cancelled and not queried
+    assert other.cancel('k')
+    assert _wait(lambda: cancellation.cancelled)
+    assert cancellation.reason == 'request' and 'k' in queried[-1]
+
+    # A request made before a turn started is not for it
+    streaming.end_turn('k', cancellation)
+    later = streaming.begin_turn('k')
+    time.sleep(0.1)
+    assert not later.cancelled
+    streaming.end_turn('k', later)
+
+
+def test_the_poller_queries_only_for_turns_not_cancelled_here(store):
+    registry = _worker(store)
+    queried = []
+    original = store.cancels_requested
+
+    def cancels_requested(since):
+        queried.append(since)
+        return original(since)
+    store.cancels_requested = cancels_requested
+
+    cancellation = registry.begin_turn('k')
+    poller = registry._poller
+    assert _wait(lambda: queried)
+    cancellation.cancel('disconnect')
+    time.sleep(0.05)
+    count = len(queried)
+    time.sleep(0.05)
+    assert len(queried) == count
+
+    # Once no turn is streaming the thread waits, and the next turn reuses it
+    registry.end_turn('k', cancellation)
+    assert _wait(lambda: not registry._polling.is_set())
+    later = registry.begin_turn('k')
+    assert registry._poller is poller and poller.is_alive()
+    registry.end_turn('k', later)
+
+
+def test_batched_lookup_covers_many_turns(store):
+    since = time.time()
+    for i in range(0, 1200, 2):
+        store.request_cancel(f'k{i}')
+    requested = store.cancels_requested({f'k{i}': since for i in range(1200)})
+    assert sorted(requested) == sorted(f'k{i}' for i in range(0, 1200, 2))
+    assert store.cancels_requested({'k0': time.time() + 1}) == []
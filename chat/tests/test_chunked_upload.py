@@ -0,0 +1,80 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from chat.services.chunked_upload import ChunkedUploadStore, UploadError
+
+DATA = b'a,b\n' + b'1,2\n' * 10
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkedUploadStore(str(tmp_path), part_size=16, max_bytes=1024)
+
+
+def _parts(upload):
+    return [DATA[i * upload.part_size:(i + 1) * upload.part_size] for i in range(upload.part_count)]
+
+
+def test_assembles_parts_received_out_of_order(store):
+    upload = store.start('session', 'data.csv', len(DATA))
+    parts = _parts(upload)
+    assert upload.part_count == 3 and upload.part_length(2) == len(DATA) - 32
+    for index in reversed(range(upload.part_count)):
+        store.write_part(upload, index, io.BytesIO(parts[index]), hashlib.sha256(parts[index]).hexdigest())
+    with store.open(upload) as assembled:
+        assert assembled.read() == DATA
+
+
+def test_resumes_with_the_missing_parts(store):
+    upload = store.start('session', 'data.csv', len(DATA))
+    parts = _parts(upload)
+    store.write_part(upload, 0, io.BytesIO(parts[0]))
+    with pytest.raises(UploadError):
+        store.open(upload)
+    assert store.received_parts(upload) == [0]
+    for index in (1, 2):
+        store.write_part(upload, index, io.BytesIO(parts[index]))
+    assert store.received_parts(upload) == [0, 1, 2]
+
+
+def test_rejects_parts_of_the_wrong_size_or_checksum(store):
+    upload = store.start('session', 'data.csv', len(DATA))
+    with pytest.raises(UploadError):
+        store.write_part(upload, 0, io.BytesIO(DATA[:10]))
+    with pytest.raises(UploadError):
+        store.write_part(upload, 0, io.BytesIO(DATA[:17]))
+    with pytest.raises(UploadError):
+        store.write_part(upload, 0, io.BytesIO(DATA[:16]), '0' * 64)
+    with pytest.raises(UploadError):
+        store.write_part(upload, 3, io.BytesIO(b''))
+    assert store.received_parts(upload) == []
+
+
+def test_uploads_belong_to_their_session(store):
+    upload = store.start('session', '../../etc/data.csv', len(DATA))
+    assert upload.filename == 'data.csv'
+    assert store.get(upload.upload_id, 'session') == upload
+    for upload_id, owner in [(upload.upload_id, 'other'), ('../' + upload.upload_id, 'session')]:
+        with pytest.raises(UploadError):
+            store.get(upload_id, owner)
+
+
+def test_enforces_the_size_limit(store):
+    for size in (0, 1025):
+        with pytest.raises(UploadError):
+            store.start('session', 'data.csv', size)
+
+
+def test_removes_expired_uploads(store):
+    stale = store.start('session', 'data.csv', len(DATA))
+    meta = os.path.join(store.directory, stale.upload_id, 'meta.json')
+    old = time.time() - store.ttl - 1
+    os.utime(meta, (old, old))
+    fresh = store.start('session', 'data.csv', len(DATA))
+    with pytest.raises(UploadError):
+        store.get(stale.upload_id, 'session')
+    assert store.get(fresh.upload_id, 'session') == fresh
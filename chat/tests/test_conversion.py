@@ -0,0 +1,107 @@
+import csv
+import datetime
+import io
+import json
+
+import pytest
+
+from chat.services import conversion
+from chat.services.conversion import convert_to_csv, convert_to_csv_stream
+
+
+def _rows(data: bytes, filename: str) -> list:
+    csv_bytes, _ = convert_to_csv(data, filename)
+    return list(csv.reader(io.StringIO(csv_bytes.decode('utf-8'))))
+
+
+RECORDS = [{'id': i, 'name': f'row {i}', 'score': i / 2} for i in range(3000)]
+EXPECTED = [['id', 'name', 'score']] + [[str(i), f'row {i}', str(i / 2)] for i in range(3000)]
+
+
+def test_array_of_objects():
+    assert _rows(json.dumps(RECORDS).encode(), 'data.json') == EXPECTED
+
+
+def test_ndjson():
+    data = '\n'.join(json.dumps(record) for record in RECORDS).encode()
+    assert _rows(data, 'data.jsonl') == EXPECTED
+
+
+def test_single_object():
+    assert _rows(b'{"a": 1, "b": "x"}', 'data.json') == [['a', 'b'], ['1', 'x']]
+
+
+def test_array_of_arrays_and_scalars():
+    assert _rows(b'[[1, 2], [3, 4]]', 'data.json') == [['1', '2'], ['3', '4']]
+    assert _rows(b'[1, 2]', 'data.json') == [['1'], ['2']]
+
+
+def test_number_split_across_chunks(monkeypatch):
+    monkeypatch.setattr(conversion, 'CHUNK_SIZE', 7)
+    assert _rows(b'[1234567890123, 42]', 'data.json') == [['1234567890123'], ['42']]
+
+
+def test_empty_and_malformed_json():
+    assert _rows(b'  ', 'data.json') == []
+    assert _rows(b'[]', 'data.json') == []
+    with pytest.raises(json.JSONDecodeError):
+        _rows(b'[1, 2', 'data.json')
+    with pytest.raises(ValueError):
+        _rows(b'[{"a": 1}, {"a": 2, "b": 3}]', 'data.json')
+
+
+class _CountingDecoder(json.JSONDecoder):
+    """Counts the characters ``raw_decode`` reads, up to the end of the value or the error."""
+    scanned = 0
+
+    def raw_decode(self, s, idx=0):
+        try:
+            value, end = super().raw_decode(s, idx)
+        except json.JSONDecodeError as e:
+            _CountingDecoder.scanned += e.pos - idx
+            raise
+        _CountingDecoder.scanned += end - idx
+        return value, end
+
+
+@pytest.mark.parametrize('wrap', [lambda records: {'data': records}, lambda records: records])
+def test_large_document_is_decoded_in_linear_time(monkeypatch, wrap):
+    # A top-level object is one value spanning every chunk; decoding it again after each chunk was quadratic
+    data = json.dumps(wrap(RECORDS * 20)).encode()
+    monkeypatch.setattr(conversion.json, 'JSONDecoder', _CountingDecoder)
+    _CountingDecoder.scanned = 0
+    output, _ = convert_to_csv_stream(io.BytesIO(data), 'data.json')
+    output.close()
+    assert _CountingDecoder.scanned <= 4 * len(data)
+
+
+def test_unsupported_extension():
+    with pytest.raises(ValueError):
+        convert_to_csv(b'', 'data.parquet')
+
+
+def test_xlsx_cells_are_written_as_stored_and_empty_rows_skipped():
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for row in (
+        ['id', 'when', 'score', 'flag'],
+        [1, datetime.datetime(2024, 1, 2), 1.5, True],
+        [],
+        [2, datetime.datetime(2024, 1, 3, 12, 30), None, False],
+        [3, None, 2, None],
+    ):
+        sheet.append(row)
+    data = io.BytesIO()
+    workbook.save(data)
+    assert _rows(data.getvalue(), 'data.xlsx') == [
+        ['id', 'when', 'score', 'flag'],
+        ['1', '2024-01-02', '1.5', 'True'],
+        ['2', '2024-01-03 12:30:00', '', 'False'],
+        ['3', '', '2', ''],
+    ]
+
+
+def test_tsv_and_txt():
+    assert _rows(b'a\tb\n1\t2\n', 'data.tsv') == [['a', 'b'], ['1', '2']]
+    assert _rows(b'\na;b\n1;2\n', 'data.txt') == [['a', 'b'], ['1', '2']]
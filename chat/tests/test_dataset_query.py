@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from chat.services.dataset_query import DatasetQuery, RowFilter, parse_filter, parse_sort
+from chat.services.dataset_store import DatasetStore
+
+
+@pytest.fixture
+def query(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    rows = ''.join(f'{i},{"even" if i % 2 == 0 else "odd"},{i * 1.5 if i % 5 else ""}\n' for i in range(100))
+    store.ingest_csv('d', io.BytesIO(f'id,parity,score\n{rows}'.encode()))
+    return DatasetQuery(store)
+
+
+def test_parse_filter_and_sort():
+    assert parse_filter('price:gt:10') == RowFilter('price', 'gt', '10')
+    assert parse_filter('a:b:eq:x:y') == RowFilter('a:b', 'eq', 'x:y')
+    assert parse_filter('score:null') == RowFilter('score', 'null')
+    with pytest.raises(ValueError):
+        parse_filter('price>10')
+    assert parse_sort('-price, name') == (('price', 'descending'), ('name', 'ascending'))
+
+
+def test_schema(query):
+    schema = query.schema('d')
+    assert schema['rows'] == 100
+    assert [column['name'] for column in schema['columns']] == ['id', 'parity', 'score']
+
+
+def test_unfiltered_page(query):
+    page = query.rows('d', offset=95, limit=10, columns=['id'])
+    assert page['total'] == 100
+    assert page['row_ids'] == [95, 96, 97, 98, 99]
+    assert page['rows'] == [[95], [96], [97], [98], [99]]
+
+
+def test_filtered_and_sorted_pages(query):
+    filters = [parse_filter('parity:eq:odd'), parse_filter('id:lt:20')]
+    first = query.rows('d', limit=3, columns=['id'], filters=filters, sort=parse_sort('-id'))
+    assert first['total'] == 10
+    assert first['rows'] == [[19], [17], [15]]
+    second = query.rows('d', offset=3, limit=3, columns=['id'], filters=filters, sort=parse_sort('-id'))
+    assert second['rows'] == [[13], [11], [9]]
+
+
+def test_null_filter_and_json_safe_values(query):
+    page = query.rows('d', columns=['id', 'score'], filters=[parse_filter('score:null')], limit=3)
+    assert page['total'] == 20
+    assert page['rows'] == [[0, None], [5, None], [10, None]]
+
+
+def test_errors(query):
+    with pytest.raises(ValueError):
+        query.rows('d', columns=['missing'])
+    with pytest.raises(ValueError):
+        query.rows('d', offset=-1)
+    with pytest.raises(KeyError):
+        query.rows('unknown')
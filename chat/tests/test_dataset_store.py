@@ -0,0 +1,31 @@
+import csv
+import io
+
+from chat.services.dataset_store import DatasetStore
+
+
+def test_round_trip_through_arrow(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    assert store.ingest_csv('d1', io.BytesIO(b'a,b\n1,x\n2,y\n'))
+    assert 'd1' in store
+    assert store.scan('d1', columns=['b']).column('b').to_pylist() == ['x', 'y']
+    out = io.BytesIO()
+    store.write_csv('d1', out)
+    assert list(csv.reader(io.StringIO(out.getvalue().decode()))) == [['a', 'b'], ['1', 'x'], ['2', 'y']]
+
+
+def test_types_that_change_later_are_stored_as_strings(tmp_path, monkeypatch):
+    # A column that looks numeric in the first block but isn't in a later one
+    from chat.services import dataset_store
+    monkeypatch.setattr(dataset_store, 'BLOCK_SIZE', 64)
+    rows = ''.join(f'{i}\n' for i in range(40)) + 'not a number\n'
+    store = DatasetStore(str(tmp_path))
+    assert store.ingest_csv('d2', io.BytesIO(f'n\n{rows}'.encode()))
+    assert store.scan('d2').column('n').to_pylist()[-1] == 'not a number'
+
+
+def test_empty_csv_is_not_stored(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    assert not store.ingest_csv('empty', io.BytesIO(b''))
+    assert 'empty' not in store
+    store.remove('empty')
@@ -0,0 +1,71 @@
+import io
+
+import pytest
+from google.genai import types
+
+from chat.services.dataset_store import DatasetStore
+from chat.services.file_cache import UploadCache
+from chat.services.session_store import SessionStore
+
+
+def _upload(csv_file) -> types.File:
+    return types.File(name='files/test', uri='https://example.com/files/test', mime_type='text/csv')
+
+
+def _csv(n: int) -> io.BytesIO:
+    return io.BytesIO(f'a,b\n{n},{n * 2}\n'.encode())
+
+
+def test_repeat_upload_is_a_hit(tmp_path):
+    cache = UploadCache(store=DatasetStore(str(tmp_path)))
+    first = cache.get_or_upload(_csv(1), 'data.csv', _upload)
+    second = cache.get_or_upload(_csv(1), 'again.csv', _upload)
+    assert second is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert first.profile['columns'][0]['name'] == 'a'
+
+
+def test_eviction_removes_unused_datasets(tmp_path):
+    cache = UploadCache(store=DatasetStore(str(tmp_path)), max_entries=1)
+    first = cache.get_or_upload(_csv(1), 'data.csv', _upload)
+    cache.get_or_upload(_csv(2), 'data.csv', _upload)
+    assert first.digest not in cache.store
+
+
+def test_eviction_keeps_datasets_a_session_on_another_worker_uses(tmp_path):
+    # Two workers share the dataset directory and the session store
+    datasets = str(tmp_path / 'datasets')
+    store = SessionStore(path=str(tmp_path / 'sessions.sqlite3'))
+    ours = UploadCache(store=DatasetStore(datasets), max_entries=1, in_use=store.dataset_in_use)
+    theirs = UploadCache(store=DatasetStore(datasets), max_entries=1, in_use=store.dataset_in_use)
+
+    shared = theirs.get_or_upload(_csv(1), 'data.csv', _upload)
+    store.save('their-user', 'stamp', {}, [shared.digest])
+    store.flush()
+    ours.get_or_upload(_csv(1), 'data.csv', _upload)
+    ours.get_or_upload(_csv(2), 'data.csv', _upload)
+    assert shared.digest in ours.store
+
+    # Once the session is gone, the next eviction removes it
+    store.delete('their-user')
+    store.flush()
+    ours.get_or_upload(_csv(3), 'data.csv', _upload)
+    assert shared.digest not in ours.store
+
+
+def test_hit_on_a_dataset_removed_elsewhere_converts_again(tmp_path):
+    cache = UploadCache(store=DatasetStore(str(tmp_path)))
+    entry = cache.get_or_upload(_csv(1), 'data.csv', _upload)
+    cache.store.remove(entry.digest)
+    cache.get_or_upload(_csv(1), 'data.csv', _upload)
+    assert entry.digest in cache.store
+    assert cache.misses == 2
+
+
+def test_failed_conversion_drops_its_digest_lock(tmp_path):
+    cache = UploadCache(store=DatasetStore(str(tmp_path)))
+    for n in range(3):
+        with pytest.raises(Exception):
+            cache.get_or_upload(io.BytesIO(b'[1, 2' + str(n).encode()), 'data.json', _upload)
+    assert cache._digest_locks == {}
+    assert len(cache) == 0
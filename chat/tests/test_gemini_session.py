@@ -0,0 +1,67 @@
+from google.genai import types
+
+from chat.services.backends import ReplayBackend
+from chat.services.gemini import GeminiChatSession
+from chat.services.resilience import CallPolicy, RetryPolicy
+from chat.services.response_cache import ResponseCache
+from chat.services.session_files import SessionFile
+
+
+def _session(tmp_path, **kwargs) -> GeminiChatSession:
+    backend = ReplayBackend([[(0.0, types.Part(text='an answer'))]], speed=0)
+    return GeminiChatSession(
+        'system prompt',
+        backend=backend,
+        response_cache=ResponseCache(str(tmp_path / 'responses')),
+        call_policy=CallPolicy(retry=RetryPolicy(max_attempts=1)),
+        **kwargs,
+    )
+
+
+def _file() -> SessionFile:
+    return SessionFile(file=types.File(name='files/a', uri='replay://files/a', mime_type='text/csv'), name='a.csv', digest='d1')
+
+
+def _fail_next_stream(session: GeminiChatSession) -> None:
+    backend = session.backend
+    next_turn = backend.next_turn
+
+    def fail_once():
+        backend.next_turn = next_turn
+        raise ValueError('upstream rejected the request')
+    backend.next_turn = fail_once
+
+
+def test_failed_turn_leaves_the_conversation_unchanged(tmp_path):
+    session = _session(tmp_path)
+    _fail_next_stream(session)
+    chunks = list(session.send_message_with_files_stream('Summarize it', [_file()]))
+    assert chunks[-1]['type'] == 'error'
+    assert session.conversation == []
+    assert session._chat.get_history() == []
+
+    list(session.send_message_with_files_stream('Summarize it', [_file()]))
+    assert session.conversation == ['summarize it']
+    assert len(session._chat.get_history()) == 2
+
+
+def test_retried_question_after_a_failure_replays_the_cached_reply(tmp_path):
+    retried = _session(tmp_path)
+    _fail_next_stream(retried)
+    list(retried.send_message_with_files_stream('Summarize it', [_file()]))
+
+    # Another conversation answers the same question; the failed attempt mustn't change the retry's key
+    list(_session(tmp_path).send_message_with_files_stream('Summarize it', [_file()]))
+    chunks = list(retried.send_message_with_files_stream('Summarize it', [_file()]))
+    assert [chunk['content'] for chunk in chunks] == ['an answer']
+    assert retried.response_cache.hits == 1
+    assert retried.conversation == ['summarize it']
+
+
+def test_cancelled_turn_is_recorded_in_the_conversation(tmp_path):
+    session = _session(tmp_path)
+    stream = session.send_message_stream('Plot the columns')
+    next(stream)
+    stream.close()
+    assert session.conversation == ['plot the columns']
+    assert len(session._chat.get_history()) == 2
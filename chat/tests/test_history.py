@@ -0,0 +1,53 @@
+from google.genai import types
+
+from chat.services.history import PLOT_PLACEHOLDER, HistoryCompactor, split_turns
+
+
+def _turn(question: str, answer: str, output: str = '', image: bool = False) -> list:
+    parts = [types.Part(text=answer)]
+    if output:
+        parts.append(types.Part(code_execution_result=types.CodeExecutionResult(outcome='OUTCOME_OK', output=output)))
+    if image:
+        parts.append(types.Part(inline_data=types.Blob(data=b'png', mime_type='image/png')))
+    return [
+        types.Content(role='user', parts=[
+            types.Part(text=question),
+            types.Part.from_uri(file_uri='https://example.com/f', mime_type='text/csv'),
+        ]),
+        types.Content(role='model', parts=parts[:1]),
+        types.Content(role='model', parts=parts[1:]),
+    ]
+
+
+def test_tidies_file_references_and_streamed_chunks():
+    compacted = HistoryCompactor().compact(_turn('q', 'a', output='1'))
+    user, model = compacted.history
+    assert all(not part.file_data for part in user.parts)
+    assert len(model.parts) == 2
+    assert compacted.dropped == 0
+
+
+def test_shrinks_old_output_before_dropping_turns():
+    history = _turn('q1', 'a1', output='x' * 10_000, image=True) + _turn('q2', 'a2') + _turn('q3', 'a3')
+    compacted = HistoryCompactor(token_budget=500, keep_turns=2).compact(history)
+    assert compacted.dropped == 0 and compacted.shrunk == [0]
+    old_parts = split_turns(compacted.history)[0][1].parts
+    assert len(old_parts[1].code_execution_result.output) < 1000
+    assert old_parts[2].text == PLOT_PLACEHOLDER
+    assert compacted.tokens <= 500
+
+
+def test_drops_and_summarizes_the_oldest_turns():
+    history = []
+    for i in range(5):
+        history += _turn(f'question {i}', f'answer {i}')
+    compacted = HistoryCompactor(max_turns=3, keep_turns=2).compact(history, ['- earlier'])
+    assert compacted.dropped == 2
+    assert len(split_turns(compacted.history)) == 3
+    assert compacted.summary == ['- earlier', '- User: question 0 | You: answer 0', '- User: question 1 | You: answer 1']
+
+
+def test_never_drops_the_latest_turns():
+    history = _turn('q1', 'a' * 40_000) + _turn('q2', 'b' * 40_000)
+    compacted = HistoryCompactor(token_budget=100, keep_turns=2).compact(history)
+    assert compacted.dropped == 0 and len(split_turns(compacted.history)) == 2
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+from google.genai import types
+
+from chat.services.history_pages import HistoryPages, encode_turn
+
+
+def _turn(question: str, *answer: str) -> list:
+    return [
+        types.Content(role='user', parts=[types.Part(text=question)]),
+        types.Content(role='model', parts=[types.Part(text=text) for text in answer]),
+    ]
+
+
+def test_joins_streamed_text_and_skips_hidden_parts():
+    turn = _turn('q', 'Hel', 'lo')
+    turn[1].parts.append(types.Part(code_execution_result=types.CodeExecutionResult(outcome='OUTCOME_OK', output='1')))
+    turn[1].parts.append(types.Part())
+    assert encode_turn(turn)[1]['parts'] == [{'type': 'text', 'content': 'Hello'}, {'type': 'result', 'content': '1'}]
+
+
+def test_pages_are_numbered_from_the_start_of_the_conversation():
+    pages = HistoryPages()
+    turns = [_turn(f'q{i}', f'a{i}') for i in range(5)]
+    # Two turns were dropped by compaction, so the kept ones are numbered 2 to 6
+    page = json.loads(pages.page(turns, 2, [1] * 5, since=3, limit=2))
+    assert (page['first'], page['total'], page['since'], page['next']) == (2, 7, 3, 5)
+    assert [turn['turn'] for turn in page['turns']] == [3, 4]
+    assert page['turns'][0]['messages'][0]['parts'][0]['content'] == 'q1'
+
+    # A cursor from before the dropped turns starts at the oldest kept one
+    assert json.loads(pages.page(turns, 2, [1] * 5, since=0))['since'] == 2
+    with pytest.raises(ValueError):
+        pages.page(turns, 2, [1] * 5, limit=0)
+
+
+def test_turns_are_reencoded_only_when_their_revision_changes():
+    pages = HistoryPages()
+    turns = [_turn('q0', 'a0'), _turn('q1', 'a1')]
+    pages.page(turns, 0, [1, 1])
+    turns[0][1].parts[0].text = 'shrunk'
+    assert 'shrunk' not in pages.page(turns, 0, [1, 1])
+    assert 'shrunk' in pages.page(turns, 0, [2, 1])
+
+
+def test_history_api_revalidates_with_etags():
+    client = Client()
+    url = reverse('get_chat_history')
+    client.post(reverse('stream_chat_response'), {'message': 'Hello'}).getvalue()
+
+    response = client.get(url)
+    assert response.status_code == 200 and json.loads(response.content)['total'] == 1
+    etag = response['ETag']
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert client.get(url, {'since': 1}).json()['turns'] == []
+    assert client.get(url, {'limit': 'x'}).status_code == 400
+
+    client.post(reverse('stream_chat_response'), {'message': 'Again'}).getvalue()
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
@@ -0,0 +1,56 @@
+import os
+
+from django.test import Client
+from django.urls import reverse
+
+from chat import views
+from chat.services.image_store import ImageStore
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(document.cookie)</script></svg>'
+
+
+def test_put_is_content_addressed(tmp_path):
+    store = ImageStore(str(tmp_path))
+    digest = store.put(PNG, 'image/png')
+    assert store.put(PNG, 'image/png') == digest
+    path, mime_type = store.get(digest)
+    assert mime_type == 'image/png'
+    assert open(path, 'rb').read() == PNG
+    assert store.get('not-a-digest') is None
+
+
+def test_recently_stored_images_are_not_looked_up_again(tmp_path):
+    store = ImageStore(str(tmp_path))
+    path, _ = store.get(store.put(PNG))
+    os.remove(path)
+    store.put(PNG)
+    assert not os.path.exists(path)
+    # Once the interval has passed, the disk is checked and the image written again
+    store.touch_interval = 0
+    store.put(PNG)
+    assert os.path.exists(path)
+
+
+def test_svg_is_never_stored_as_svg(tmp_path):
+    store = ImageStore(str(tmp_path))
+    _, mime_type = store.get(store.put(SVG, 'image/svg+xml'))
+    assert mime_type == 'image/png'
+
+
+def test_evicts_least_recently_used_past_max_bytes(tmp_path):
+    store = ImageStore(str(tmp_path), max_bytes=100)
+    first = store.put(b'a' * 60)
+    second = store.put(b'b' * 60)
+    assert store.get(first) is None
+    assert store.get(second) is not None
+
+
+def test_images_are_served_with_nosniff_and_a_sandbox():
+    digest = views.image_store.put(SVG, 'image/svg+xml')
+    response = Client().get(reverse('chat_image', args=[digest]))
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'image/png'
+    assert response['X-Content-Type-Options'] == 'nosniff'
+    assert 'sandbox' in response['Content-Security-Policy']
+    assert response['ETag'] == f'"{digest}"'
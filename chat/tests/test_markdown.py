@@ -0,0 +1,38 @@
+from google.genai import types
+
+from chat.utils.markdown import render_html_response, render_markdown, replace_input_file_names
+
+
+def test_render_markdown_is_memoized():
+    render_markdown.cache_clear()
+    first = render_markdown('**bold** and `code`')
+    assert '<strong>bold</strong>' in first
+    assert render_markdown('**bold** and `code`') is first
+    assert render_markdown.cache_info().hits == 1
+
+
+def test_repeated_latex_renders_stay_correct():
+    # The latex extra kept code spans in a class-level dict that grew with every conversion
+    for i in range(3):
+        html = render_markdown(f'`span {i}` and $x^{i}$')
+        assert f'span {i}' in html
+
+
+def test_sandbox_names_are_replaced():
+    names = {'input_file_0.csv': 'sales.csv'}
+    assert replace_input_file_names("pd.read_csv('input_file_0.csv')", names) == "pd.read_csv('sales.csv')"
+    assert replace_input_file_names('input_file_1.csv', names) == 'input_file_1.csv'
+
+
+def test_render_html_response_parts():
+    parts = [
+        types.Part(text='Hello'),
+        types.Part(executable_code=types.ExecutableCode(code="open('input_file_0.csv')", language='PYTHON')),
+        types.Part(code_execution_result=types.CodeExecutionResult(outcome='OUTCOME_OK', output='42')),
+        types.Part(inline_data=types.Blob(data=b'png', mime_type='image/png')),
+    ]
+    html = render_html_response(parts, {'input_file_0.csv': 'sales.csv'}, lambda blob: '/img/1')
+    assert '<p>Hello</p>' in html
+    assert 'sales.csv' in html and 'input_file_0.csv' not in html
+    assert '<pre>42</pre>' in html
+    assert 'src="/img/1"' in html
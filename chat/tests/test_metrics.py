@@ -0,0 +1,73 @@
+import json
+
+import pytest
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from chat.services.metrics import MetricsRegistry, Trace, span
+
+
+def test_renders_counters_and_histograms():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', ['kind'])
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    requests.inc(kind='sse')
+    requests.inc(2, kind='sse')
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    lines = registry.render().splitlines()
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{kind="sse"} 3' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in lines
+    assert 'latency_seconds_count 2' in lines
+
+
+def test_sums_the_snapshots_of_every_worker(tmp_path):
+    registry = MetricsRegistry(str(tmp_path), flush_interval=0)
+    uploads = registry.counter('uploads_total', 'Uploads')
+    uploads.inc()
+    # A snapshot written by another worker on the host, and one a worker was still writing
+    other = MetricsRegistry()
+    other.counter('uploads_total', 'Uploads').inc(4)
+    (tmp_path / '99999.json').write_text(json.dumps(other.snapshot()))
+    (tmp_path / '99999.json.1.part').write_text('{"uploads_total"')
+
+    assert 'uploads_total 5' in registry.render().splitlines()
+
+
+def test_rejects_duplicate_names():
+    registry = MetricsRegistry()
+    registry.counter('dup', 'First')
+    with pytest.raises(ValueError):
+        registry.counter('dup', 'Second')
+
+
+def test_trace_sums_repeated_spans():
+    trace = Trace('turn')
+    for _ in range(2):
+        with span('chunk_gap', trace):
+            pass
+    recorded = trace.as_dict()
+    assert recorded['trace'] == 'turn'
+    assert 'chunk_gap_ms' in recorded and recorded['chunk_gap_count'] == 2
+
+
+def test_metrics_endpoint():
+    url = reverse('metrics')
+    assert Client().get(url).status_code == 404
+    with override_settings(METRICS_ENABLED=True):
+        response = Client().get(url)
+        assert response.status_code == 200
+        assert '# TYPE eda_span_duration_seconds histogram' in response.content.decode()
+        assert Client().post(url).status_code == 405
+
+
+def test_metrics_endpoint_with_a_token():
+    url = reverse('metrics')
+    with override_settings(METRICS_ENABLED=True, METRICS_TOKEN='secret'):
+        assert Client().get(url).status_code == 401
+        assert Client().get(url, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert Client().get(url, headers={'Authorization': 'Bearer secret'}).status_code == 200
@@ -0,0 +1,27 @@
+import io
+
+from chat.services.profiling import format_profile, profile_csv
+
+CSV = b'price,city,flag\n1,Paris,true\n2,Lyon,false\n3,Paris,\n,Nice,true\n'
+
+
+def test_exact_counts_and_quantiles():
+    profile = profile_csv(io.BytesIO(CSV))
+    assert profile['rows'] == 4 and not profile['sampled']
+    price, city, _ = profile['columns']
+    assert price['nulls'] == 1 and price['distinct'] == 3
+    assert (price['min'], price['median'], price['max']) == (1.0, 2.0, 3.0)
+    assert city['top'][0] == ('Paris', 2)
+
+
+def test_min_and_max_are_exact_when_sampled():
+    rows = '\n'.join(str(i) for i in range(10_000))
+    profile = profile_csv(io.BytesIO(f'n\n{rows}\n'.encode()), sample_rows=100, chunk_rows=1000)
+    column = profile['columns'][0]
+    assert profile['sampled'] and profile['sample_rows'] == 100
+    assert (column['min'], column['max'], column['distinct']) == (0, 9999, 10_000)
+
+
+def test_format_profile_names_the_file_and_columns():
+    text = format_profile(profile_csv(io.BytesIO(CSV)), 'sales.csv')
+    assert '`sales.csv`' in text and '`price`' in text and 'Rows: 4' in text
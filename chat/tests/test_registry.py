@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from chat.services.registry import SessionRegistry
+
+
+class FakeSession:
+    """Stands in for GeminiChatSession: a size and the state the registry saves and restores."""
+
+    def __init__(self, size: int = 0):
+        self.size = size
+        self.files = []
+
+    def approx_bytes(self) -> int:
+        return self.size
+
+    def to_state(self):
+        return {'size': self.size}
+
+    def restore(self, state):
+        self.size = state['size']
+
+    def reset(self):
+        self.size = 0
+
+
+def test_evicts_least_recently_used_past_max_sessions():
+    registry = SessionRegistry(FakeSession, max_sessions=2)
+    registry.get('a')
+    registry.get('b')
+    registry.get('a')
+    registry.get('c')
+    assert 'a' in registry and 'c' in registry and 'b' not in registry
+
+
+def test_evicts_by_total_size():
+    registry = SessionRegistry(FakeSession, max_sessions=100, max_bytes=1000)
+    for key in ('a', 'b', 'c'):
+        registry.get(key).size = 400
+        registry.save(key)
+    # a + b + c = 1200 bytes, so the least recently used one goes
+    assert 'a' not in registry
+    assert 'b' in registry and 'c' in registry
+    assert registry.total_bytes == 800
+
+
+def test_keeps_an_oversized_session_being_used():
+    registry = SessionRegistry(FakeSession, max_bytes=1000)
+    registry.get('small').size = 10
+    registry.save('small')
+    registry.get('big').size = 5000
+    registry.save('big')
+    assert 'big' in registry and 'small' not in registry
+
+
+def test_does_not_evict_a_session_in_a_turn():
+    registry = SessionRegistry(FakeSession, max_bytes=1000)
+    registry.get('busy').size = 600
+    registry.save('busy')
+    held = threading.Event()
+    release = threading.Event()
+
+    def turn():
+        with registry.lock('busy'):
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=turn)
+    thread.start()
+    held.wait()
+    try:
+        registry.get('other').size = 600
+        registry.save('other')
+        assert 'busy' in registry
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_size_is_released_on_discard():
+    registry = SessionRegistry(FakeSession)
+    registry.get('a').size = 300
+    registry.save('a')
+    registry.discard('a')
+    assert registry.total_bytes == 0
+
+
+def test_reset_cancels_the_running_turn_instead_of_waiting():
+    registry = SessionRegistry(FakeSession)
+    started = threading.Event()
+
+    def turn():
+        # A sync streamed turn holds the session lock until it notices the cancellation
+        with registry.lock('a'):
+            cancellation = registry.begin_turn('a')
+            started.set()
+            try:
+                while not cancellation.cancelled:
+                    time.sleep(0.01)
+            finally:
+                registry.end_turn('a', cancellation)
+
+    thread = threading.Thread(target=turn)
+    thread.start()
+    started.wait()
+    done = threading.Event()
+    threading.Thread(target=lambda: (registry.reset('a'), done.set())).start()
+    assert done.wait(5), "reset waited for the turn instead of cancelling it"
+    thread.join()
+
+
+def test_a_session_lock_can_be_handed_to_another_thread():
+    lock = SessionRegistry(FakeSession).lock('a')
+    lock.acquire()
+    lock.hand_off()
+    # Held by no thread until taken over: neither this one nor another can take it meanwhile
+    with pytest.raises(RuntimeError):
+        lock.release()
+    taken = []
+    thread = threading.Thread(target=lambda: taken.append(lock.acquire(blocking=False)))
+    thread.start()
+    thread.join()
+    assert taken == [False]
+    thread = threading.Thread(target=lambda: (lock.take_over(), lock.release()))
+    thread.start()
+    thread.join()
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_max_sessions_must_be_positive():
+    with pytest.raises(ValueError):
+        SessionRegistry(FakeSession, max_sessions=0)
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from google.genai import types
+
+from chat.services.backends import ReplayBackend
+from chat.services.gemini import AsyncGeminiChatSession, GeminiChatSession
+from chat.services.resilience import (
+    CallPolicy,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimitError,
+    ConcurrencyLimiter,
+    RetryPolicy,
+)
+
+# The first request answers after this long, the hedged one straight away
+SLOW_FIRST_CHUNK = 0.5
+
+
+def _no_wait_retry(max_attempts: int = 3) -> RetryPolicy:
+    return RetryPolicy(max_attempts=max_attempts, base_delay=0, max_delay=0)
+
+
+class CountingReplayBackend(ReplayBackend):
+    """Counts the streamed requests sent on each chat it creates."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = []
+
+    def _counted(self, chat):
+        send = chat.send_message_stream
+        index = len(self.requests)
+        self.requests.append(0)
+
+        def send_message_stream(message):
+            self.requests[index] += 1
+            return send(message)
+        chat.send_message_stream = send_message_stream
+        return chat
+
+    def create_chat(self, model, config, history=None):
+        return self._counted(super().create_chat(model, config, history))
+
+    def create_async_chat(self, model, config, history=None):
+        return self._counted(super().create_async_chat(model, config, history))
+
+
+def _hedged_backend() -> CountingReplayBackend:
+    # Turns rotate, so the primary request gets the slow one and the hedge the fast one
+    return CountingReplayBackend([
+        [(SLOW_FIRST_CHUNK, types.Part(text='slow answer'))],
+        [(0.0, types.Part(text='fast answer'))],
+    ])
+
+
+def _hedged_policy() -> CallPolicy:
+    return CallPolicy(retry=_no_wait_retry(1), hedge_after=0.05)
+
+
+def _model_texts(history) -> list:
+    return [part.text for content in history if content.role == 'model' for part in content.parts]
+
+
+def test_retries_retryable_failures():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise httpx.ConnectError('connection reset')
+        return 'ok'
+
+    policy = CallPolicy(retry=_no_wait_retry())
+    assert policy.call(flaky) == 'ok'
+    assert policy.retries == 2
+
+
+def test_does_not_retry_rejected_requests():
+    policy = CallPolicy(retry=_no_wait_retry())
+
+    def rejected():
+        raise ValueError('bad request')
+
+    with pytest.raises(ValueError):
+        policy.call(rejected)
+    assert policy.retries == 0 and policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    policy = CallPolicy(retry=_no_wait_retry(1), breaker=breaker)
+
+    def down():
+        raise TimeoutError()
+
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            policy.call(down)
+    with pytest.raises(CircuitOpenError):
+        policy.call(lambda: 'ok')
+    time.sleep(0.06)
+    assert policy.call(lambda: 'ok') == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_stream_retries_failures_before_the_first_chunk():
+    attempts = []
+
+    def start():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise httpx.ReadTimeout('no response')
+        return iter(['a', 'b'])
+
+    policy = CallPolicy(retry=_no_wait_retry())
+    assert list(policy.stream(start)) == ['a', 'b']
+    assert len(attempts) == 2
+
+
+def test_limiter_rejects_calls_past_its_capacity():
+    policy = CallPolicy(limiter=ConcurrencyLimiter(max_concurrency=1, acquire_timeout=0.01))
+    stream = policy.stream(lambda: iter(['a', 'b']))
+    next(stream)
+    with pytest.raises(ConcurrencyLimitError):
+        policy.call(lambda: 'ok')
+    stream.close()
+    assert policy.call(lambda: 'ok') == 'ok'
+
+
+def test_hedged_turn_is_recorded_once():
+    session = GeminiChatSession('system prompt', backend=_hedged_backend(), call_policy=_hedged_policy())
+    chunks = list(session.send_message_stream('Describe the data'))
+    assert [chunk['content'] for chunk in chunks] == ['fast answer']
+    assert session.call_policy.hedges == 1
+
+    # The slow request is closed once it answers, without touching the session's chat
+    time.sleep(SLOW_FIRST_CHUNK + 0.1)
+    history = session._chat.get_history(curated=True)
+    assert len(history) == 2
+    assert _model_texts(history) == ['fast answer']
+    # The two requests ran on chats of their own
+    assert max(session.backend.requests) == 1
+
+
+def test_async_hedged_turn_is_recorded_once():
+    async def run():
+        session = AsyncGeminiChatSession('system prompt', backend=_hedged_backend(), call_policy=_hedged_policy())
+        chunks = [chunk async for chunk in session.send_message_stream('Describe the data')]
+        await asyncio.sleep(SLOW_FIRST_CHUNK + 0.1)
+        return session, chunks
+
+    session, chunks = asyncio.run(run())
+    assert [chunk['content'] for chunk in chunks] == ['fast answer']
+    assert session.call_policy.hedges == 1
+    history = session._chat.get_history(curated=True)
+    assert len(history) == 2
+    assert _model_texts(history) == ['fast answer']
+    # The two requests ran on chats of their own
+    assert max(session.backend.requests) == 1
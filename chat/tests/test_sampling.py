@@ -0,0 +1,68 @@
+import datetime
+import io
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from chat.services.sampling import MIN_STRATUM_ROWS, DatasetSampler, format_sample, write_sample_csv
+
+ROWS = 5_000
+
+
+def _batches(table: pa.Table):
+    return lambda: iter(table.to_batches(max_chunksize=512))
+
+
+def test_small_datasets_are_not_sampled():
+    table = pa.table({'x': list(range(100))})
+    assert DatasetSampler(target_rows=100).sample(_batches(table)) is None
+    assert not DatasetSampler(threshold_bytes=0).should_sample(10 ** 9)
+
+
+def test_uniform_sample_keeps_exact_aggregates():
+    table = pa.table({'x': list(range(ROWS)), 'y': [float(i) / 2 for i in range(ROWS)]})
+    sample = DatasetSampler(target_rows=500).sample(_batches(table))
+    assert sample.method == 'reservoir'
+    assert sample.rows == ROWS and sample.sample_rows == 500
+    assert sample.aggregates['x']['sum'] == sum(range(ROWS))
+    assert (sample.aggregates['x']['min'], sample.aggregates['x']['max']) == (0, ROWS - 1)
+
+
+def test_time_sample_is_evenly_spaced_and_ordered():
+    start = datetime.datetime(2024, 1, 1)
+    table = pa.table({
+        'when': [start + datetime.timedelta(hours=i) for i in reversed(range(ROWS))],
+        'value': list(range(ROWS)),
+    })
+    sample = DatasetSampler(target_rows=250).sample(_batches(table))
+    assert (sample.method, sample.column) == ('time', 'when')
+    times = sample.table.column('when').to_pylist()
+    assert times == sorted(times) and times[0] == start
+
+
+def test_stratified_sample_keeps_rare_values_and_exact_group_means():
+    cities = ['Paris'] * (ROWS - 150) + ['Nice'] * 150
+    table = pa.table({'city': cities, 'amount': [1.0] * (ROWS - 150) + [3.0] * 150})
+    sample = DatasetSampler(target_rows=500).sample(_batches(table))
+    assert (sample.method, sample.column) == ('stratified', 'city')
+    kept = sample.table.column('city').to_pylist()
+    assert kept.count('Nice') >= min(150, MIN_STRATUM_ROWS)
+    nice = next(group for group in sample.groups if group['value'] == 'Nice')
+    assert nice['rows'] == 150 and nice['means']['amount'] == 3.0
+
+
+def test_sampling_is_repeatable():
+    table = pa.table({'x': list(range(ROWS))})
+    first, second = (DatasetSampler(target_rows=100, seed=7).sample(_batches(table)) for _ in range(2))
+    assert first.table.equals(second.table)
+
+
+def test_writes_the_sample_and_describes_it():
+    table = pa.table({'x': list(range(ROWS))})
+    sample = DatasetSampler(target_rows=100).sample(_batches(table))
+    target = io.BytesIO()
+    write_sample_csv(sample, target)
+    target.seek(0)
+    assert pacsv.read_csv(target).num_rows == 100
+    text = format_sample(sample.summary(), 'big.csv')
+    assert '`big.csv`' in text and f'{ROWS:,}' in text
@@ -0,0 +1,43 @@
+from google.genai import types
+
+from chat.services.session_files import SessionFile, attachment_parts, sandbox_names, select_files
+
+
+def _file(name: str, columns=(), attached: bool = True) -> SessionFile:
+    handle = types.File(name=f'files/{name}', uri=f'replay://files/{name}', mime_type='text/csv')
+    return SessionFile(file=handle, name=name, digest=name, columns=list(columns), attached=attached)
+
+
+def test_attaches_the_files_a_message_names():
+    sales, weather = _file('sales_2024.csv', ['revenue']), _file('weather.csv', ['temperature'])
+    files = [sales, weather]
+    assert select_files(files, 'Plot the sales 2024 data', []) == [sales]
+    assert select_files(files, 'How does temperature vary?', [sales]) == [weather]
+    assert select_files(files, 'Compare weather.csv with revenue', []) == files
+
+
+def test_short_column_names_are_not_matched():
+    ids, other = _file('a.csv', ['id']), _file('b.csv')
+    assert select_files([ids, other], 'Is the id unique?', [other]) == [other]
+
+
+def test_follow_ups_keep_the_previous_files_plus_new_uploads():
+    sales, weather, fresh = _file('sales.csv'), _file('weather.csv'), _file('new.csv', attached=False)
+    assert select_files([sales, weather, fresh], 'And the trend?', [weather]) == [weather, fresh]
+    assert select_files([sales, weather], 'And the trend?', []) == [sales, weather]
+
+
+def test_attachment_parts_map_sandbox_names():
+    files = [_file('sales.csv'), _file('weather.csv')]
+    note, *uris = attachment_parts(files)
+    assert '`input_file_1.csv` is `weather.csv`' in note.text
+    assert [part.file_data.file_uri for part in uris] == ['replay://files/sales.csv', 'replay://files/weather.csv']
+    assert sandbox_names(files) == {'input_file_0.csv': 'sales.csv', 'input_file_1.csv': 'weather.csv'}
+
+
+def test_round_trips_through_the_session_store():
+    file = _file('sales.csv', ['revenue'])
+    restored = SessionFile.from_dict(file.to_dict())
+    assert restored.to_dict() == file.to_dict()
+    # Files compare by identity, so two uploads of the same content stay apart
+    assert restored != file
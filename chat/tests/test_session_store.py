@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from google.genai import types
+
+from chat.services.backends import ReplayBackend
+from chat.services.gemini import AsyncGeminiChatSession, GeminiChatSession
+from chat.services.registry import SessionRegistry
+from chat.services.session_store import SessionStore
+
+BACKEND = ReplayBackend([[(0.0, types.Part(text='an answer'))]], speed=0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(str(tmp_path / 'sessions.sqlite3'), flush_interval=60)
+
+
+def _worker(store: SessionStore, session_class=GeminiChatSession) -> SessionRegistry:
+    """A registry as one worker process holds it, sharing ``store`` with the others."""
+    return SessionRegistry(lambda: session_class('system prompt', backend=BACKEND), store=store)
+
+
+def test_pending_saves_answer_lookups_until_flushed(store):
+    store.save('k', 's1', {'n': 1}, ['d1'])
+    assert store.stamp('k') == 's1' and store.load('k') == ('s1', {'n': 1})
+    assert store.dataset_in_use('d1')
+    assert store.flush() == 1
+    assert store.load('k') == ('s1', {'n': 1}) and store.stats()['pending'] == 0
+    store.delete('k')
+    assert store.stamp('k') is None
+    store.flush()
+    assert store.load('k') is None and not store.dataset_in_use('d1')
+
+
+def test_a_delayed_write_does_not_overwrite_a_newer_state(store):
+    other = SessionStore(store.path, flush_interval=60)
+    store.save('k', 'old', {'n': 1}, ['old-data'])
+    time.sleep(0.01)
+    other.save('k', 'new', {'n': 2}, ['new-data'])
+    other.flush()
+    store.flush()
+    assert store.load('k') == ('new', {'n': 2})
+    assert store.dataset_in_use('new-data') and not store.dataset_in_use('old-data')
+
+
+def test_removes_expired_states(store):
+    store.save('k', 's1', {'n': 1}, ['d1'])
+    store.flush()
+    store.idle_ttl = -1
+    assert store.remove_expired() == 1
+    assert store.stamp('k') is None and not store.dataset_in_use('d1')
+
+
+def test_cancel_requests_reach_other_workers(store):
+    since = time.time()
+    assert not store.cancel_requested('k', since)
+    SessionStore(store.path).request_cancel('k')
+    assert store.cancel_requested('k', since)
+    assert not store.cancel_requested('k', time.time() + 1)
+
+
+def test_another_worker_restores_the_conversation(store):
+    first, second = _worker(store), _worker(store)
+    list(first.get('k').send_message_stream('Describe the data'))
+    first.save('k')
+
+    restored = second.get('k')
+    assert restored.conversation == ['describe the data']
+    assert len(restored.get_history()) == 2
+
+    # Only a changed stamp rebuilds the session
+    assert second.get('k') is restored
+    list(restored.send_message_stream('And now?'))
+    second.save('k')
+    assert first.get('k').conversation == ['describe the data', 'and now?']
+
+
+def test_a_request_looks_up_the_stamp_once(store):
+    registry = _worker(store)
+    lookups = []
+    original = store.stamp
+
+    def stamp(key):
+        lookups.append(key)
+        return original(key)
+    store.stamp = stamp
+
+    with registry.lock('k'):
+        registry.get('k')
+    registry.open_turn_buffer('k')
+    assert lookups == ['k']
+
+
+def test_restore_waits_for_a_turn_holding_the_session(store):
+    first, second = _worker(store), _worker(store)
+    session = second.get('k')
+    restored = threading.Event()
+    with second.lock('k'):
+        # A turn in progress on this worker while another worker answers; a request from
+        # another thread must not swap the state under it
+        list(first.get('k').send_message_stream('Describe the data'))
+        first.save('k')
+        thread = threading.Thread(target=lambda: (second.get('k'), restored.set()))
+        thread.start()
+        assert not restored.wait(0.1)
+        assert session.conversation == []
+    thread.join(1)
+    assert restored.is_set() and session.conversation == ['describe the data']
+
+
+def test_async_sessions_restore_off_the_event_loop(store):
+    first, second = _worker(store), _worker(store, AsyncGeminiChatSession)
+    list(first.get('k').send_message_stream('Describe the data'))
+    first.save('k')
+
+    async def run():
+        loop_thread = threading.get_ident()
+        threads = []
+        original = store.load
+
+        def load(key):
+            threads.append(threading.get_ident())
+            return original(key)
+        store.load = load
+
+        async with second.asession('k') as session:
+            # Another request's lookup while the turn holds the session leaves it alone
+            list(first.get('k').send_message_stream('Meanwhile'))
+            first.save('k')
+            await asyncio.to_thread(second.get, 'k')
+            assert session.conversation == ['describe the data']
+            [chunk async for chunk in session.send_message_stream('And now?')]
+            await second.asave('k')
+        return loop_thread, threads, session
+
+    loop_thread, threads, session = asyncio.run(run())
+    assert threads and loop_thread not in threads
+    assert session.conversation == ['describe the data', 'and now?']
+    assert store.stamp('k') == second._entries['k'].stamp
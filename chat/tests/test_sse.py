@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+import zlib
+
+from chat.services.turn_buffer import TurnBuffer
+from chat.utils.sse import HEARTBEAT, SSEWriter, choose_encoding
+
+
+def _frames(data: bytes) -> list:
+    """The events of an SSE byte stream, as (payload, event ID) pairs; comments are skipped."""
+    frames = []
+    for block in data.decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'data' in fields:
+            frames.append((json.loads(fields['data']), fields.get('id')))
+    return frames
+
+
+def _text(content: str, event_id: str) -> dict:
+    return {'type': 'text', 'content': content, 'id': event_id}
+
+
+def _untimed(**kwargs) -> SSEWriter:
+    return SSEWriter(flush_window=0, heartbeat_interval=0, **kwargs)
+
+
+def test_coalesces_text_within_the_window():
+    def chunks():
+        for i in range(5):
+            yield _text(f'{i} ', f't-{i}')
+        yield {'type': 'done', 'id': 't-5'}
+
+    writer = SSEWriter(flush_window=60, heartbeat_interval=0)
+    frames = _frames(b''.join(writer.stream(chunks())))
+    # The first delta goes out at once, the rest wait for the next non-text chunk
+    assert frames == [
+        ({'type': 'text', 'content': '0 '}, 't-0'),
+        ({'type': 'text', 'content': '1 2 3 4 '}, 't-4'),
+        ({'type': 'done'}, 't-5'),
+    ]
+
+
+def test_replaces_sandbox_names_cut_by_a_chunk_boundary():
+    writer = SSEWriter(file_names={'input_file_0.csv': 'sales.csv'}, flush_window=60, heartbeat_interval=0)
+    chunks = [_text('Start. ', 't-0'), _text('Reading input_fi', 't-1'), _text('le_0.csv now', 't-2'), {'type': 'done', 'id': 't-3'}]
+    frames = _frames(b''.join(writer.stream(chunks)))
+    assert ''.join(payload['content'] for payload, _ in frames if payload['type'] == 'text') == 'Start. Reading sales.csv now'
+
+
+def test_holds_back_only_tails_that_can_only_start_a_filename():
+    writer = SSEWriter(file_names={'input_file_0.csv': 'sales.csv'}, flush_window=0, heartbeat_interval=0)
+    chunks = [_text('Taxi in', 't-0'), _text(' an inp', 't-1'), {'type': 'done', 'id': 't-2'}]
+    assert _frames(b''.join(writer.stream(chunks)))[:2] == [
+        ({'type': 'text', 'content': 'Taxi in'}, 't-0'),
+        ({'type': 'text', 'content': ' an '}, 't-1+3'),
+    ]
+
+
+def test_text_held_back_is_marked_in_the_event_id():
+    def chunks():
+        yield _text('Start. ', 't-0')
+        yield _text('Read input_', 't-1')
+        # The window passes with a possible filename start held back
+        time.sleep(0.2)
+        yield {'type': 'done', 'id': 't-2'}
+
+    writer = SSEWriter(file_names={'input_file_0.csv': 'sales.csv'}, flush_window=0.02, heartbeat_interval=0)
+    frames = _frames(b''.join(writer.stream(chunks())))
+    assert ({'type': 'text', 'content': 'Read '}, 't-1+6') in frames
+    assert ({'type': 'text', 'content': 'input_'}, 't-1') in frames
+
+
+def test_sends_heartbeats_while_waiting():
+    def chunks():
+        yield {'type': 'text', 'content': 'a'}
+        time.sleep(0.25)
+        yield {'type': 'done'}
+
+    data = b''.join(SSEWriter(flush_window=0, heartbeat_interval=0.05).stream(chunks()))
+    assert HEARTBEAT in data
+    assert [payload['type'] for payload, _ in _frames(data)] == ['text', 'done']
+
+
+def test_closing_a_followed_stream_returns_while_the_turn_is_idle():
+    buffer = TurnBuffer('t')
+    buffer.append({'type': 'text', 'content': 'a'})
+    response = SSEWriter(heartbeat_interval=0.05).response(buffer.follow())
+    frames = iter(response.streaming_content)
+    assert _frames(next(frames)) == [({'type': 'text', 'content': 'a'}, 't-0')]
+    assert next(frames) == HEARTBEAT
+    # The client went away while the turn is waiting on the model
+    start = time.monotonic()
+    response.close()
+    assert time.monotonic() - start < 0.5
+    assert not buffer.followed
+
+
+def test_gzip_stream_decodes_frame_by_frame():
+    writer = _untimed(encoding='gzip')
+    decoder = zlib.decompressobj(31)
+    received = b''
+    for data in writer.stream([{'type': 'text', 'content': 'hello'}, {'type': 'done'}]):
+        # Every write is flushed, so each piece decodes on arrival
+        received += decoder.decompress(data)
+        assert received.endswith(b'\n\n')
+    assert [payload['type'] for payload, _ in _frames(received)] == ['text', 'done']
+    assert writer.bytes_sent > 0
+
+
+def test_async_stream_matches_the_sync_one():
+    chunks = [_text('a', 't-0'), _text('b', 't-1'), {'type': 'done', 'id': 't-2'}]
+
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return b''.join([data async for data in SSEWriter(flush_window=60, heartbeat_interval=0).astream(source())])
+
+    assert _frames(asyncio.run(collect())) == _frames(b''.join(SSEWriter(flush_window=60, heartbeat_interval=0).stream(chunks)))
+
+
+def test_chooses_an_accepted_encoding():
+    assert choose_encoding('gzip, deflate') == 'gzip'
+    assert choose_encoding('gzip;q=0, identity') is None
+    assert choose_encoding('') is None
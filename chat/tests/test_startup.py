@@ -0,0 +1,29 @@
+import subprocess
+import sys
+
+from chat.services import gemini
+from chat.startup import warm_up
+
+
+def test_light_services_do_not_import_google_genai():
+    code = "import sys, chat.services.conversion, chat.services.metrics; print('google.genai' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+def test_package_exports_resolve_lazily():
+    import chat.services
+    assert chat.services.GeminiChatSession is gemini.GeminiChatSession
+
+
+def test_client_is_created_once_and_reset_for_forked_workers(monkeypatch):
+    monkeypatch.setattr(gemini, 'client', None)
+    first = gemini.get_client()
+    assert gemini.get_client() is first
+    gemini._reset_client()
+    assert gemini.get_client() is not first
+
+
+def test_warm_up_loads_the_urlconf():
+    assert warm_up() >= 0
+    assert 'chat.views' in sys.modules
@@ -0,0 +1,117 @@
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+RENDERER = Path(__file__).resolve().parents[2] / 'static' / 'js' / 'stream_renderer.js'
+
+# Replies whose blocks a cut at blank lines, or at a fence marker only counted as ```, would break
+REPLIES = [
+    '- one\n\n- two\n\n  still two\n\nAfter the list.',
+    'Steps:\n\n1. Load\n\n    continued in 1\n\n2. Plot\n',
+    '~~~python\nx = 1\n\n\ny = 2\n~~~\n\nDone.',
+    'Use `` ``` `` to open a fence.\n\nNext paragraph.\n\nLast.',
+    'Math:\n\n$$\na = b\n\nc = d\n$$\n\nEnd.',
+    'See [the docs][docs].\n\nMore text.\n\n[docs]: https://example.com',
+]
+
+# Streams each reply in chunks of several sizes, and with a code part between two halves,
+# through StreamRenderer in a bare DOM, and prints the renders differing from a one-shot render.
+# marked is the real one when node can resolve it, else a stand-in whose output depends on the whole text.
+_DRIVER = r'''
+const fs = require('fs');
+const vm = require('vm');
+
+class Node {
+    constructor() { this.innerHTML = ''; this.className = ''; this.parent = null; }
+    remove() {
+        if (this.parent) {
+            this.parent.children.splice(this.parent.children.indexOf(this), 1);
+            this.parent = null;
+        }
+    }
+}
+class Container {
+    constructor() { this.children = []; }
+    appendChild(node) { node.remove(); node.parent = this; this.children.push(node); return node; }
+    insertBefore(node, ref) {
+        node.remove();
+        node.parent = this;
+        this.children.splice(this.children.indexOf(ref), 0, node);
+        return node;
+    }
+}
+
+let frames = [];
+global.document = { createElement: () => new Node() };
+global.requestAnimationFrame = (callback) => frames.push(callback);
+global.cancelAnimationFrame = () => {};
+global.DOMPurify = { sanitize: (html) => html };
+global.hljs = { highlight: (code) => ({ value: code }), highlightAuto: (code) => ({ value: code }), getLanguage: () => null };
+try {
+    global.marked = require('marked');
+} catch (e) {
+    global.marked = {
+        setOptions: () => {},
+        parse: (text) => `<md>${text}</md>`,
+        lexer: (text) => text.split(/(?<=\n\n)(?=\S)/).map((raw) => ({ type: 'paragraph', raw })),
+    };
+}
+const [path, replies] = process.argv.slice(-2);
+// Declares StreamRenderer, renderMarkdown, ... in the global scope this script shares
+vm.runInThisContext(fs.readFileSync(path, 'utf8'));
+
+function stream(events, size) {
+    const container = new Container();
+    const renderer = new StreamRenderer(container);
+    for (const [type, content] of events) {
+        if (type !== 'text') {
+            renderer.appendPart(type, content);
+            continue;
+        }
+        for (let i = 0; i < content.length; i += size) {
+            renderer.appendText(content.slice(i, i + size));
+            // Some animation frames run mid-stream, as in a browser
+            if (i % (3 * size) === 0) {
+                const pending = frames;
+                frames = [];
+                pending.forEach((callback) => callback());
+            }
+        }
+    }
+    renderer.finish();
+    return container.children.map((node) => node.innerHTML);
+}
+
+const failures = [];
+for (const reply of JSON.parse(replies)) {
+    const half = reply.length >> 1;
+    const cases = [
+        [[['text', reply]], [renderMarkdown(reply)]],
+        [
+            [['text', reply.slice(0, half)], ['code', 'x = 1'], ['text', reply.slice(half)]],
+            [renderMarkdown(reply.slice(0, half)), renderCodeBlock('x = 1'), renderMarkdown(reply.slice(half))],
+        ],
+    ];
+    for (const [events, expected] of cases) {
+        for (const size of [1, 3, 7, reply.length]) {
+            const rendered = stream(events, size);
+            if (JSON.stringify(rendered) !== JSON.stringify(expected)) {
+                failures.push({ reply, size, rendered, expected });
+            }
+        }
+    }
+}
+console.log(JSON.stringify(failures));
+'''
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+def test_a_streamed_reply_renders_like_a_one_shot_render():
+    result = subprocess.run(
+        ['node', '-e', _DRIVER, '--', str(RENDERER), json.dumps(REPLIES)],
+        capture_output=True, text=True, check=True,
+    )
+    assert json.loads(result.stdout) == []
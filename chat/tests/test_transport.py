@@ -0,0 +1,71 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from chat.services.transport import HttpPool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+def _client(pool: HttpPool) -> httpx.Client:
+    return httpx.Client(transport=pool.http_options().client_args['transport'])
+
+
+def test_splits_connections_into_shards():
+    pool = HttpPool(max_connections=20, shard_size=8)
+    assert pool.shards == 3 and pool.limits.max_connections == 7
+
+
+def test_reuses_kept_alive_connections(server_url):
+    pool = HttpPool(max_connections=4, shard_size=4)
+    with _client(pool) as client:
+        for _ in range(3):
+            assert client.get(server_url).text == 'ok'
+    stats = pool.stats()['sync']
+    assert stats['request'] == 3 and stats['connect'] == 1
+
+
+def test_routes_concurrent_responses_to_the_least_busy_shard(server_url):
+    pool = HttpPool(max_connections=4, shard_size=2)
+    client = _client(pool)
+    streams = [client.stream('GET', server_url) for _ in range(2)]
+    for stream in streams:
+        stream.__enter__()
+    sync_pool, _ = pool._build()
+    assert [shard.active for shard in sync_pool.shards] == [1, 1]
+    for stream in streams:
+        stream.__exit__(None, None, None)
+    assert [shard.active for shard in sync_pool.shards] == [0, 0]
+    client.close()
+
+
+def test_reset_builds_new_transports():
+    pool = HttpPool()
+    before = pool._build()
+    pool.reset()
+    assert pool._build() is not before
+    assert pool.stats()['async']['open'] == 0
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+from google.genai import types
+
+from chat.services.backends import ReplayBackend
+from chat.services.gemini import GeminiChatSession
+from chat.services.registry import SessionRegistry
+from chat.services.session_store import SessionStore
+from chat.services.turn_buffer import ResumeError, TurnBuffer, turn_id_of
+
+BACKEND = ReplayBackend([[(0.0, types.Part(text='an answer'))]], speed=0)
+
+
+def _text(content: str) -> dict:
+    return {'type': 'text', 'content': content}
+
+
+def test_resumes_after_the_last_event_received():
+    buffer = TurnBuffer('t')
+    ids = [buffer.append(_text(c))['id'] for c in 'abc']
+    buffer.finish()
+    assert ids == ['t-0', 't-1', 't-2'] and turn_id_of('t-1+3') == 't'
+    assert [event['content'] for event in buffer.follow('t-0')] == ['b', 'c']
+    assert list(buffer.follow('t-2')) == []
+
+
+def test_resending_held_back_text():
+    buffer = TurnBuffer('t')
+    buffer.append(_text('Read '))
+    buffer.append(_text('input_'))
+    buffer.append({'type': 'done'})
+    buffer.finish()
+    # The writer sent 't-1' holding back 'input_'
+    events = list(buffer.follow('t-1+6'))
+    assert events[0] == {'type': 'text', 'content': 'input_', 'id': 't-1'}
+    assert events[1:] == [{'type': 'done', 'id': 't-2'}]
+
+
+@pytest.mark.parametrize('event_id', ['other-0', 't-x', 't-5', 't--1'])
+def test_rejects_unknown_event_ids(event_id):
+    buffer = TurnBuffer('t')
+    buffer.append(_text('a'))
+    with pytest.raises(ResumeError):
+        buffer.follow(event_id)
+
+
+def test_events_dropped_from_the_ring_cannot_be_resumed():
+    buffer = TurnBuffer('t', max_events=2)
+    for c in 'abcd':
+        buffer.append(_text(c))
+    buffer.finish()
+    with pytest.raises(ResumeError):
+        buffer.follow('t-0')
+    assert [event['content'] for event in buffer.follow('t-1')] == ['c', 'd']
+
+
+def test_followers_wait_for_new_events_until_the_turn_finishes():
+    buffer = TurnBuffer('t')
+    buffer.append(_text('a'))
+    received = []
+    thread = threading.Thread(target=lambda: received.extend(buffer.follow()))
+    thread.start()
+    time.sleep(0.05)
+    buffer.append(_text('b'))
+    buffer.finish()
+    thread.join(1)
+    assert [event['content'] for event in received] == ['a', 'b']
+
+    async def follow():
+        return [event['content'] async for event in buffer.afollow('t-0')]
+    assert asyncio.run(follow()) == ['b']
+
+
+def test_a_poll_can_wait_for_an_event_other_than_text():
+    buffer = TurnBuffer('t')
+    events = buffer.follow()
+    buffer.append(_text('a'))
+    assert [event['content'] for event in events.poll(0)] == ['a']
+    buffer.append(_text('b'))
+    start = time.monotonic()
+    assert [event['content'] for event in events.poll(0.1, text=False)] == ['b']
+    assert time.monotonic() - start >= 0.1
+    threading.Timer(0.05, buffer.append, [{'type': 'done'}]).start()
+    start = time.monotonic()
+    assert [event['type'] for event in events.poll(5, text=False)] == ['done']
+    assert time.monotonic() - start < 1
+
+
+def test_closing_a_follower_ends_its_wait():
+    buffer = TurnBuffer('t')
+    events = buffer.follow()
+    threading.Timer(0.05, events.close).start()
+    assert list(events) == []
+    assert not buffer.followed
+
+
+def test_on_idle_is_called_once_the_follower_has_to_wait():
+    buffer = TurnBuffer('t')
+    calls = []
+    events = buffer.follow(on_idle=lambda: (calls.append(1), buffer.append(_text('b')), buffer.finish()))
+    buffer.append(_text('a'))
+    assert events.poll() == [_text('a') | {'id': 't-0'}] and calls == []
+    assert [event['content'] for event in events] == ['b'] and calls == [1]
+
+
+def test_on_idle_is_called_on_closing_an_unread_follower():
+    buffer = TurnBuffer('t')
+    calls = []
+    buffer.follow(on_idle=lambda: calls.append(1)).close()
+    assert calls == [1]
+
+
+def test_abandoned_once_nobody_follows_for_the_grace_period():
+    buffer = TurnBuffer('t')
+    buffer.append(_text('a'))
+    events = buffer.follow()
+    next(events)
+    assert not buffer.abandoned(0)
+    events.close()
+    assert buffer.abandoned(0) and not buffer.abandoned(60)
+    buffer.followed_elsewhere(time.time())
+    assert not buffer.abandoned(1)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(str(tmp_path / 'sessions.sqlite3'), flush_interval=60)
+
+
+def _worker(store: SessionStore) -> SessionRegistry:
+    return SessionRegistry(lambda: GeminiChatSession('system prompt', backend=BACKEND), store=store, poll_interval=0.01)
+
+
+def test_a_turn_streaming_on_one_worker_resumes_on_another(store):
+    streaming, other = _worker(store), _worker(store)
+    buffer = streaming.open_turn_buffer('k')
+    cancellation = streaming.begin_turn('k')
+    buffer.file_names = {'input_file_0.csv': 'sales.csv'}
+    first = buffer.append(_text('a'))
+    buffer.append(_text('b'))
+    store.flush()
+
+    # Only the turn the client was following is resumed
+    assert other.turn_buffer('k', 'another-turn') is None
+    copy = other.turn_buffer('k', turn_id_of(first['id']))
+    assert copy.file_names == {'input_file_0.csv': 'sales.csv'}
+    received = []
+    follower = threading.Thread(target=lambda: received.extend(copy.follow(first['id'])))
+    follower.start()
+
+    buffer.append(_text('c'))
+    buffer.append({'type': 'done'})
+    buffer.finish()
+    streaming.end_turn('k', cancellation)
+    store.flush()
+    follower.join(2)
+    assert [event.get('content') for event in received] == ['b', 'c', None]
+    assert [event['id'] for event in received] == [buffer.event_id(seq) for seq in (1, 2, 3)]
+
+    # Sent in full, so the log is dropped for every worker
+    other.release_turn_buffer('k', copy)
+    store.flush()
+    assert store.turn('k') is None and other.turn_buffer('k') is None
+
+
+def test_a_client_following_on_another_worker_keeps_the_turn_going(store):
+    streaming, other = _worker(store), _worker(store)
+    buffer = streaming.open_turn_buffer('k')
+    cancellation = streaming.begin_turn('k')
+    event = buffer.append(_text('a'))
+    store.flush()
+    time.sleep(0.05)
+    assert buffer.abandoned(0.05)
+
+    events = other.turn_buffer('k', turn_id_of(event['id'])).follow()
+    assert next(events)['id'] == event['id']
+    deadline = time.monotonic() + 2
+    while buffer.abandoned(0.05) and time.monotonic() < deadline:
+        store.flush()
+        time.sleep(0.01)
+    assert not buffer.abandoned(0.05)
+    events.close()
+    streaming.end_turn('k', cancellation)
+
+
+def test_events_are_logged_in_a_batch_per_flush(store):
+    buffer = _worker(store).open_turn_buffer('k')
+    buffer.append(_text('a'))
+    buffer.append(_text('b'))
+    store.flush()
+    buffer.append(_text('c'))
+    store.flush()
+    rows = store._connection().execute(
+        'SELECT seq, count FROM turn_event_batches WHERE turn_id = ? ORDER BY seq', (buffer.turn_id,),
+    )
+    assert rows.fetchall() == [(0, 2), (2, 1)]
+    assert store.turn_events(buffer.turn_id, 1) == [(1, _text('b')), (2, _text('c'))]
+
+
+def test_a_new_turn_replaces_the_logged_one(store):
+    registry = _worker(store)
+    old = registry.open_turn_buffer('k')
+    old.append(_text('a'))
+    new = registry.open_turn_buffer('k')
+    store.flush()
+    assert store.turn('k')[0] == new.turn_id
+    assert store.turn_events(old.turn_id) == []
+
+
+def test_a_dropped_stream_resumes_with_last_event_id():
+    client = Client()
+    url = reverse('stream_chat_response')
+    response = client.post(url, {'message': 'Hello'})
+    frames = iter(response.streaming_content)
+    event_id = next(line for frame in frames for line in frame.decode().splitlines() if line.startswith('id: '))[4:]
+    # The turn goes on without the client, which reconnects for the rest
+    response.close()
+    resumed = b''.join(client.post(url, HTTP_LAST_EVENT_ID=event_id).streaming_content)
+    assert b'"type": "done"' in resumed and b'"type": "error"' not in resumed
@@ -1,13 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Session-bound API views come from async_views when serving async sessions over ASGI
+api_views = async_views if settings.CHAT_ASYNC else views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('about/', views.about, name='about'),
     path('chat/', views.chat, name='chat'),
-    path('api/chat/response/', views.get_chat_response, name='get_chat_response'),
-    path('api/chat/stream/', views.stream_chat_response, name='stream_chat_response'),
-    path('api/chat/upload/', views.upload_file, name='upload_file'),
+    path('api/chat/response/', api_views.get_chat_response, name='get_chat_response'),
+    path('api/chat/stream/', api_views.stream_chat_response, name='stream_chat_response'),
+    path('api/chat/cancel/', views.cancel_chat_response, name='cancel_chat_response'),
+    path('api/chat/upload/', api_views.upload_file, name='upload_file'),
+    path('api/chat/upload/start/', views.start_chunked_upload, name='start_chunked_upload'),
+    path('api/chat/upload/complete/', api_views.complete_chunked_uploads, name='complete_chunked_uploads'),
+    path('api/chat/upload/<str:upload_id>/', views.chunked_upload_status, name='chunked_upload_status'),
+    path('api/chat/upload/<str:upload_id>/parts/<int:index>/', views.upload_part, name='upload_part'),
+    path('api/chat/upload/<str:upload_id>/complete/', api_views.complete_chunked_upload, name='complete_chunked_upload'),
+    path('api/chat/image/<str:digest>/', views.chat_image, name='chat_image'),
+    path('api/chat/data/schema/', views.dataset_schema, name='dataset_schema'),
+    path('api/chat/data/rows/', views.dataset_rows, name='dataset_rows'),
     path('api/chat/history/', views.get_chat_history, name='get_chat_history'),
     path('api/chat/clear_history/', views.clear_history, name='clear_history'),
-] 
\ No newline at end of file
+    path('metrics', views.metrics_view, name='metrics'),
+]
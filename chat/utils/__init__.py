@@ -1,3 +1,4 @@
 from .markdown import render_html_response
+from .sse import SSEWriter, format_sse, sse_response
 
-__all__ = ['render_html_response'] 
\ No newline at end of file
+__all__ = ['render_html_response', 'SSEWriter', 'format_sse', 'sse_response']
@@ -1,22 +1,68 @@
 import base64
+import re
+import threading
+from functools import lru_cache
 import markdown2
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 from google.genai import types
 
-def replace_input_file_name(text: str, uploaded_file_name: str | None) -> str:
-    if uploaded_file_name:
-        return text.replace('input_file_0.csv', uploaded_file_name)
+MARKDOWN_EXTRAS = ['fenced-code-blocks', 'code-friendly', 'tables', 'latex']
+CODE_EXTRAS = ['fenced-code-blocks', 'code-friendly']
+# Rendered text and code parts kept per process; history re-renders and repeated code blocks hit this
+RENDER_CACHE_SIZE = 2048
+# Files attached to a message are input_file_0.csv, input_file_1.csv, ... in the code execution sandbox
+SANDBOX_FILE_PATTERN = re.compile(r'input_file_\d+\.csv')
+
+class _Markdown(markdown2.Markdown):
+    """
+    markdown2.Markdown whose latex extra keeps its escaped code spans per conversion.
+    The extra stores them in a class-level dict that is never cleared, so otherwise
+    every conversion in the process grows it and gets slower.
+    """
+    def reset(self):
+        super().reset()
+        latex = self.extra_classes.get('latex')
+        if latex is not None:
+            latex.code_blocks = {}
+
+# markdown2.Markdown instances are reusable but keep per-conversion state, so each thread gets its own
+_renderers = threading.local()
+
+def _markdown_renderer(name: str, extras: List[str]) -> markdown2.Markdown:
+    renderer = getattr(_renderers, name, None)
+    if renderer is None:
+        renderer = _Markdown(extras=extras)
+        setattr(_renderers, name, renderer)
+    return renderer
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_markdown(text: str) -> str:
+    """Render a markdown text part to HTML, memoized by content."""
+    return str(_markdown_renderer('text', MARKDOWN_EXTRAS).convert(text))
+
+def replace_input_file_names(text: str, file_names: Dict[str, str] | None) -> str:
+    """Show the original filenames in place of the sandbox names they map to in ``file_names``."""
+    if file_names:
+        return SANDBOX_FILE_PATTERN.sub(lambda match: file_names.get(match.group(0), match.group(0)), text)
     return text
 
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
 def highlight_code(code: str) -> str:
-    return markdown2.markdown("```python\n" + code + "\n```", extras=['fenced-code-blocks', 'code-friendly'])
+    return str(_markdown_renderer('code', CODE_EXTRAS).convert("```python\n" + code + "\n```"))
 
-def render_html_response(bot_response: Dict[str, str] | List[types.Part], uploaded_file_name: str | None = None) -> str:
+def render_html_response(
+    bot_response: Dict[str, str] | List[types.Part],
+    file_names: Dict[str, str] | None = None,
+    image_url: Optional[Callable[[types.Blob], str]] = None,
+) -> str:
     """
     Render bot response to HTML with proper formatting.
     
     Args:
         bot_response: Either a dictionary with error message or list of response parts
+        file_names: Original filenames by the sandbox names (input_file_0.csv, ...) they are shown in place of
+        image_url: Stores a generated image and returns the URL to load it from;
+            without it images are inlined as base64 data URIs
         
     Returns:
         str: HTML formatted response
@@ -27,28 +73,29 @@ def render_html_response(bot_response: Dict[str, str] | List[types.Part], upload
     if type(bot_response) != list:
         return f"<p><strong>Error:</strong> Unparsable response type {type(bot_response)}</p>"
 
-    bot_response_html = ""
+    html_parts = []
     
     for part in bot_response:
         if part.text:
-            bot_response_html += markdown2.markdown(
-                part.text,
-                extras=['fenced-code-blocks', 'code-friendly', 'tables', "latex"]
-            )
+            html_parts.append(render_markdown(part.text))
 
         elif part.executable_code:
-            bot_response_html += f"<br/>Python Code:{highlight_code(replace_input_file_name(part.executable_code.code, uploaded_file_name))}<br/>"
+            html_parts.append(f"<br/>Python Code:{highlight_code(replace_input_file_names(part.executable_code.code, file_names))}<br/>")
         elif part.code_execution_result:
-            bot_response_html += f"<br/>Code Output:<pre>{replace_input_file_name(part.code_execution_result.output, uploaded_file_name)}</pre><br/>"
+            html_parts.append(f"<br/>Code Output:<pre>{replace_input_file_names(part.code_execution_result.output, file_names)}</pre><br/>")
         elif part.inline_data:
             try:
-                base64_data = base64.b64encode(
-                    part.inline_data.data).decode("utf-8") if isinstance(
-                        part.inline_data.data,
-                        bytes) else part.inline_data.data
-                bot_response_html += f'<img src="data:image/png;base64,{base64_data}" alt="Generated Image" style="max-width: 100%; height: auto;"/>'
+                if image_url is not None:
+                    src = image_url(part.inline_data)
+                else:
+                    base64_data = base64.b64encode(
+                        part.inline_data.data).decode("utf-8") if isinstance(
+                            part.inline_data.data,
+                            bytes) else part.inline_data.data
+                    src = f"data:image/png;base64,{base64_data}"
+                html_parts.append(f'<img src="{src}" alt="Generated Image" style="max-width: 100%; height: auto;"/>')
             except Exception as e:
-                bot_response_html += f"<p><strong>Error:</strong> {part.inline_data}<br/>{e}</p>"
+                html_parts.append(f"<p><strong>Error:</strong> {part.inline_data}<br/>{e}</p>")
         else:
-            bot_response_html += f"<p><strong>Error:</strong> Unknown part type {part}</p>"
-    return bot_response_html 
\ No newline at end of file
+            html_parts.append(f"<p><strong>Error:</strong> Unknown part type {part}</p>")
+    return "".join(html_parts) 
\ No newline at end of file
@@ -0,0 +1,447 @@
+import asyncio
+import json
+import re
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .markdown import replace_input_file_names
+
+# Text deltas arriving within this many seconds of the last write are sent together
+DEFAULT_FLUSH_WINDOW = 0.04
+# A comment frame is sent after this many seconds without a write, so proxies keep idle streams open
+DEFAULT_HEARTBEAT_INTERVAL = 15.0
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+HEARTBEAT = b": heartbeat\n\n"
+# A tail of streamed text that may be the start of a sandbox filename (input_file_0.csv) cut by a chunk boundary.
+# Shorter tails than "inp" end too many words to be held back for it (model tokens rarely split "input" anyway)
+_PARTIAL_FILE_NAME = re.compile(
+    r'(?:' + '|'.join(re.escape('input_file_'[:i]) for i in range(len('input_file_'), 2, -1))
+    + r')$|input_file_\d+(?:\.c?s?)?$'
+)
+
+
+def format_sse(payload: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    """Format a payload as a single Server-Sent Events data frame, with an event ID if given."""
+    if event_id is None:
+        return f"data: {json.dumps(payload)}\n\n"
+    return f"data: {json.dumps(payload)}\nid: {event_id}\n\n"
+
+
+def sse_response(
+    stream: Iterable[str | bytes] | AsyncIterable[str | bytes], content_encoding: Optional[str] = None,
+) -> StreamingHttpResponse:
+    """Wrap an iterator of SSE frames in an unbuffered streaming response."""
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable nginx buffering
+    if content_encoding:
+        response['Content-Encoding'] = content_encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Content coding for a stream from the request's Accept-Encoding: ``br`` when the
+    brotli package is installed and the client accepts it, else ``gzip``, else None.
+    """
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q=') and q[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    if 'br' in accepted and _brotli() is not None:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    """Streaming compressor whose every write is flushed, so the client can decode each frame on arrival."""
+
+    def __init__(self, encoding: str):
+        if encoding == 'gzip':
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._brotli = None
+        elif encoding == 'br':
+            brotli = _brotli()
+            if brotli is None:
+                raise ValueError("Brotli compression requires the brotli package")
+            self._zlib = None
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+
+    def write(self, data: bytes) -> bytes:
+        if self._zlib is not None:
+            return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+        return self._brotli.process(data) + self._brotli.flush()
+
+    def finish(self) -> bytes:
+        if self._zlib is not None:
+            return self._zlib.flush(zlib.Z_FINISH)
+        return self._brotli.finish()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+def _is_text(item: Any) -> bool:
+    return isinstance(item, dict) and item.get('type') == 'text'
+
+
+def _merge_text(items: list) -> list:
+    """Consecutive text deltas as one, with the ID of the last, so a burst is written (or held) as one."""
+    merged = []
+    for item in items:
+        if _is_text(item) and merged and _is_text(merged[-1]):
+            merged[-1] = {**item, 'content': (merged[-1].get('content') or '') + (item.get('content') or '')}
+        else:
+            merged.append(item)
+    return merged
+
+
+class _Handoff:
+    """
+    Chunks passed from a reader thread to the writer, taken like a ``TurnBuffer``
+    follower's (``poll``). The writer is only woken for a chunk it would write
+    straight away: any chunk while it holds no text, or a non-text one; text
+    arriving within the window waits for the window to close.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._items: list = []
+        self._ready = False
+        self._eager = True
+        self._done = False
+        # Whether every chunk has been taken
+        self.ended = False
+
+    def put(self, item: Any) -> None:
+        with self._cond:
+            self._items.append(item)
+            if self._eager or not _is_text(item):
+                self._ready = True
+                self._cond.notify()
+
+    def end(self) -> None:
+        with self._cond:
+            self._done = self._ready = True
+            self._cond.notify()
+
+    def poll(self, timeout: Optional[float] = None, text: bool = True) -> list:
+        """Everything put since the last call, waiting up to ``timeout`` seconds for a chunk worth waking for."""
+        with self._cond:
+            self._eager = text
+            if not self._ready and not (text and self._items):
+                self._cond.wait(timeout)
+            items, self._items = self._items, []
+            self._ready = False
+            self.ended = self._done
+            return items
+
+
+class _ClosingStream:
+    """Frames from ``frames``, calling ``on_close`` too when closed (after closing ``frames``)."""
+
+    def __init__(self, frames: Iterator[bytes], on_close: Callable[[], None]):
+        self._frames = frames
+        self._on_close = on_close
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self
+
+    def __next__(self) -> bytes:
+        return next(self._frames)
+
+    def close(self) -> None:
+        try:
+            self._frames.close()
+        finally:
+            self._on_close()
+
+
+class SSEWriter:
+    """
+    Turns a stream of chunks (``{"type": ..., "content": ...}`` dicts) into SSE bytes.
+
+    Text deltas are coalesced: the first one after ``flush_window`` seconds
+    without a write goes out at once, later ones are held until the window
+    since the last write has passed and sent as one frame, so a long answer
+    costs a few writes a second instead of one per model chunk. Any other
+    chunk flushes the held text and is written straight away. Sandbox
+    filenames (``input_file_0.csv``) are replaced with ``file_names`` on the
+    held text, keeping back a tail that may be a name cut by a chunk
+    boundary. With an ``encoding`` (``gzip`` or ``br``) the stream is
+    compressed and flushed on every write. A heartbeat comment is sent after
+    ``heartbeat_interval`` seconds without a write.
+
+    A chunk's ``id`` (see ``TurnBuffer``) becomes the event ID of its frame. A
+    frame of coalesced text takes the ID of its last delta, with ``+k``
+    appended when the last ``k`` characters of that delta were held back, so a
+    client resuming from it is sent exactly what it missed.
+
+    A window or heartbeat needs a timer while waiting for the next chunk: async
+    streams wait on the pending chunk with a timeout, and a ``TurnBuffer``
+    follower is polled with one, then closed when the writer's stream is.
+    Other sync streams are read on a helper thread after the first chunk (so
+    heartbeats start from there), and have finished when the writer's stream
+    does. With both disabled, chunks are written inline as they come.
+    """
+
+    def __init__(
+        self,
+        file_names: Optional[Dict[str, str]] = None,
+        flush_window: float = DEFAULT_FLUSH_WINDOW,
+        heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+        encoding: Optional[str] = None,
+        on_finish: Optional[Callable[["SSEWriter"], None]] = None,
+    ):
+        # Sandbox name -> filename; the chunk stream may set this before its first chunk
+        self.file_names = file_names
+        self.flush_window = flush_window
+        self.heartbeat_interval = heartbeat_interval
+        self.encoding = encoding
+        self.on_finish = on_finish
+        self.chunks = 0
+        self.writes = 0
+        self.bytes_sent = 0
+        self._compressor = _Compressor(encoding) if encoding else None
+        self._text = ""
+        # Event ID of the last text delta taken in
+        self._text_id: Optional[str] = None
+        self._started = time.monotonic()
+        self._last_write = float('-inf')
+
+    def response(self, chunks: Iterable[Dict[str, Any]] | AsyncIterable[Dict[str, Any]]) -> StreamingHttpResponse:
+        """A streaming response writing ``chunks``, sync or async to match them."""
+        if hasattr(chunks, '__aiter__'):
+            stream = self.astream(chunks)
+        elif hasattr(chunks, 'poll'):
+            # Closing a generator that never ran skips its cleanup, so a response closed unread closes the source itself
+            stream = _ClosingStream(self.stream(chunks), chunks.close)
+        else:
+            stream = self.stream(chunks)
+        return sse_response(stream, self.encoding)
+
+    def _timed(self) -> bool:
+        return self.flush_window > 0 or self.heartbeat_interval > 0
+
+    def stream(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        """Write a sync stream of chunks."""
+        self._started = time.monotonic()
+        try:
+            if not self._timed():
+                for chunk in chunks:
+                    if data := self._add(chunk, time.monotonic()):
+                        yield data
+            elif hasattr(chunks, 'poll'):
+                try:
+                    yield from self._stream_polled(chunks)
+                finally:
+                    chunks.close()
+            else:
+                yield from self._stream_threaded(chunks)
+            if data := self._finish():
+                yield data
+        finally:
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+    def _stream_threaded(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        # The first chunk is read inline: nothing is held before it, and it reaches the client without a handoff
+        iterator = iter(chunks)
+        try:
+            first = next(iterator, _END)
+            if first is not _END and (data := self._add(first, time.monotonic())):
+                yield data
+        except BaseException:
+            getattr(iterator, 'close', lambda: None)()
+            raise
+        if first is _END:
+            return
+        received = _Handoff()
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read, args=(iterator, received, stop), name='sse-reader', daemon=True)
+        reader.start()
+        try:
+            yield from self._stream_polled(received)
+        finally:
+            # The reader closes the chunk stream once it sees this; wait for that, so the
+            # stream has finished (as an inline one would have) when this returns
+            stop.set()
+            reader.join()
+
+    def _stream_polled(self, source: Any) -> Iterator[bytes]:
+        """Write the chunks polled from ``source`` (a ``TurnBuffer`` follower or a ``_Handoff``) until it ends."""
+        while not source.ended:
+            now = time.monotonic()
+            # Text arriving before the window since the last write closes would only be held
+            window = self._last_write + self.flush_window - now
+            if window > 0:
+                timeout = self._timeout(now)
+                items = source.poll(window if timeout is None else min(window, timeout), text=False)
+            else:
+                items = source.poll(self._timeout(now))
+            if not items:
+                if data := self._tick(time.monotonic()):
+                    yield data
+                continue
+            # Everything that arrived meanwhile goes out together, so a burst costs one wakeup and one write
+            data = b''
+            for item in _merge_text(items):
+                if isinstance(item, _Failure):
+                    if data:
+                        yield data
+                    raise item.error
+                data += self._add(item, time.monotonic())
+            if data:
+                yield data
+
+    @staticmethod
+    def _read(chunks: Iterable[Dict[str, Any]], received: _Handoff, stop: threading.Event) -> None:
+        iterator = iter(chunks)
+        try:
+            for chunk in iterator:
+                received.put(chunk)
+                if stop.is_set():
+                    break
+        except BaseException as e:
+            received.put(_Failure(e))
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+            received.end()
+
+    async def astream(self, chunks: AsyncIterable[Dict[str, Any]]) -> AsyncIterator[bytes]:
+        """Write an async stream of chunks."""
+        self._started = time.monotonic()
+        iterator = chunks.__aiter__()
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                if self._timed():
+                    done, _ = await asyncio.wait({pending}, timeout=self._timeout(time.monotonic()))
+                    if not done:
+                        if data := self._tick(time.monotonic()):
+                            yield data
+                        continue
+                else:
+                    await asyncio.wait({pending})
+                finished, pending = pending, None
+                try:
+                    chunk = finished.result()
+                except StopAsyncIteration:
+                    break
+                if data := self._add(chunk, time.monotonic()):
+                    yield data
+            if data := self._finish():
+                yield data
+        finally:
+            if pending is not None:
+                # The client went away mid-chunk; stop the chunk stream where it is waiting
+                pending.cancel()
+                await asyncio.wait({pending})
+            elif hasattr(iterator, 'aclose'):
+                await iterator.aclose()
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+    def _timeout(self, now: float) -> Optional[float]:
+        """Seconds until held text is due or a heartbeat is, or None to wait for the next chunk however long."""
+        deadlines = []
+        # A held tail that may be a cut-off filename waits for the next chunk rather than the window
+        if self.flush_window > 0 and self._split_text(final=False)[0]:
+            deadlines.append(self._last_write + self.flush_window)
+        if self.heartbeat_interval > 0:
+            deadlines.append(max(self._last_write, self._started) + self.heartbeat_interval)
+        return max(min(deadlines) - now, 0.0) if deadlines else None
+
+    def _add(self, chunk: Dict[str, Any], now: float) -> bytes:
+        self.chunks += 1
+        event_id = chunk.get('id')
+        if chunk.get('type') == 'text':
+            self._text += chunk.get('content') or ''
+            self._text_id = event_id
+            if now - self._last_write >= self.flush_window:
+                return self._write(self._flush_text(final=False), now)
+            return b''
+        held = self._flush_text(final=True)
+        if event_id is not None:
+            chunk = {key: value for key, value in chunk.items() if key != 'id'}
+        # Images carry a digest or base64, never a filename
+        if chunk.get('type') != 'image' and isinstance(chunk.get('content'), str) and self.file_names:
+            chunk = {**chunk, 'content': replace_input_file_names(chunk['content'], self.file_names)}
+        return self._write(held + format_sse(chunk, event_id).encode(), now)
+
+    def _tick(self, now: float) -> bytes:
+        if self._text and now - self._last_write >= self.flush_window:
+            if data := self._write(self._flush_text(final=False), now):
+                return data
+        if self.heartbeat_interval > 0 and now - max(self._last_write, self._started) >= self.heartbeat_interval:
+            return self._write(HEARTBEAT, now)
+        return b''
+
+    def _finish(self) -> bytes:
+        data = self._write(self._flush_text(final=True), time.monotonic())
+        if self._compressor is not None:
+            tail = self._compressor.finish()
+            self.bytes_sent += len(tail)
+            data += tail
+        return data
+
+    def _flush_text(self, final: bool) -> bytes:
+        """A frame of the held text, keeping back a possible cut-off filename unless ``final``."""
+        text, tail = self._split_text(final)
+        self._text = tail
+        if not text:
+            return b''
+        event_id = self._text_id
+        if event_id is not None and tail:
+            event_id = f"{event_id}+{len(tail)}"
+        return format_sse({'type': 'text', 'content': replace_input_file_names(text, self.file_names)}, event_id).encode()
+
+    def _split_text(self, final: bool) -> Tuple[str, str]:
+        if final or not self.file_names:
+            return self._text, ''
+        match = _PARTIAL_FILE_NAME.search(self._text)
+        if match is None:
+            return self._text, ''
+        return self._text[:match.start()], self._text[match.start():]
+
+    def _write(self, data: bytes, now: float) -> bytes:
+        if not data:
+            return b''
+        if self._compressor is not None:
+            data = self._compressor.write(data)
+        self.writes += 1
+        self.bytes_sent += len(data)
+        self._last_write = now
+        return data
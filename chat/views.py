@@ -1,12 +1,38 @@
+import functools
+import hmac
+import json
 import logging
 import os
-import json
+import time
+import uuid
+from contextlib import ExitStack
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse, HttpRequest, StreamingHttpResponse
-from django.views.decorators.http import require_http_methods
-
-from .services.gemini import GeminiChatSession
-from .utils.markdown import render_html_response, replace_input_file_name
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse, HttpRequest, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import etag, require_http_methods
+from google.genai import types
+
+from .services import metrics
+from .services.backends import ReplayBackend
+from .services.gemini import GeminiBackend, GeminiChatSession, AsyncGeminiChatSession, configure_client
+from .services.chunked_upload import ChunkedUploadStore, UploadError
+from .services.dataset_query import DEFAULT_PAGE_ROWS, DatasetQuery, parse_filter, parse_sort
+from .services.dataset_store import DatasetStore
+from .services.file_cache import UploadCache
+from .services.history import HistoryCompactor
+from .services.history_pages import DEFAULT_PAGE_TURNS
+from .services.image_store import ImageStore
+from .services.registry import SessionRegistry
+from .services.resilience import CallPolicy, CircuitBreaker, ConcurrencyLimiter, RetryPolicy
+from .services.response_cache import ResponseCache
+from .services.sampling import DatasetSampler
+from .services.session_files import sandbox_names
+from .services.session_store import SessionStore
+from .services.transport import HttpPool
+from .services.turn_buffer import ResumeError, turn_id_of
+from .utils.markdown import render_html_response
+from .utils.sse import SSEWriter, choose_encoding, format_sse, sse_response
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,18 +40,157 @@ logger = logging.getLogger(__name__)
 CHAT_TITLE = "Exploratory Data Analysis with Google Gemini"
 WELCOME_MESSAGE = "Welcome to the EDA chatbot! Upload a file to get started, or ask me anything about data analysis!"
 
-with open("system_prompt.txt", "r") as f:
+with open(settings.SYSTEM_PROMPT_PATH, "r") as f:
     SYSTEM_PROMPT = f.read()
 
-chat_session: GeminiChatSession | None = None
-
-
-def _get_or_create_session() -> GeminiChatSession:
-    """Get the current chat session or create a new one."""
-    global chat_session
-    if chat_session is None:
-        chat_session = GeminiChatSession(system_prompt=SYSTEM_PROMPT)
-    return chat_session
+CHAT_SESSION_KEY = 'chat_session_id'
+_FINISHED = object()
+
+# Under ASGI the API views in async_views.py drive async sessions on the event loop
+SESSION_CLASS = AsyncGeminiChatSession if settings.CHAT_ASYNC else GeminiChatSession
+
+metrics.registry.configure(settings.METRICS_DIR)
+
+# Shared by every session in this worker so repeat uploads (e.g. the demo file) skip conversion and upload;
+# datasets too large to send whole are uploaded as a sample while queries still read every stored row
+upload_cache = UploadCache(
+    store=DatasetStore(directory=settings.DATASET_STORE_DIR),
+    max_entries=settings.UPLOAD_CACHE_MAX_ENTRIES,
+    sampler=DatasetSampler(
+        threshold_bytes=settings.DATASET_SAMPLE_THRESHOLD_BYTES,
+        target_rows=settings.DATASET_SAMPLE_ROWS,
+    ),
+    # The dataset directory is shared by the workers, so an evicted dataset stays while any session uses it
+    in_use=lambda digest: chat_sessions.dataset_in_use(digest),
+)
+
+# Generated plots are served by digest from /api/chat/image/ instead of being inlined as base64
+image_store = ImageStore(
+    directory=settings.IMAGE_STORE_DIR,
+    max_bytes=settings.IMAGE_STORE_MAX_BYTES,
+)
+
+# Parts of chunked uploads are streamed to disk here and assembled without holding the file in memory
+chunked_uploads = ChunkedUploadStore(
+    directory=settings.CHUNKED_UPLOAD_DIR,
+    part_size=settings.CHUNKED_UPLOAD_PART_SIZE,
+    max_bytes=settings.UPLOAD_MAX_BYTES,
+)
+
+history_compactor = HistoryCompactor(
+    token_budget=settings.CHAT_HISTORY_TOKEN_BUDGET,
+    keep_turns=settings.CHAT_HISTORY_KEEP_TURNS,
+    max_turns=settings.CHAT_HISTORY_MAX_TURNS,
+)
+
+# Replays replies to questions already answered on the same dataset, e.g. opening questions on the demo file
+response_cache = ResponseCache(
+    directory=settings.RESPONSE_CACHE_DIR,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+) if settings.RESPONSE_CACHE_ENABLED else None
+
+# One policy per worker, so the circuit breaker and concurrency limit see every session's calls
+call_policy = CallPolicy(
+    retry=RetryPolicy(
+        max_attempts=settings.GEMINI_MAX_ATTEMPTS,
+        base_delay=settings.GEMINI_RETRY_BASE_DELAY,
+        max_delay=settings.GEMINI_RETRY_MAX_DELAY,
+    ),
+    breaker=CircuitBreaker(
+        failure_threshold=settings.GEMINI_BREAKER_THRESHOLD,
+        reset_timeout=settings.GEMINI_BREAKER_RESET,
+    ),
+    limiter=ConcurrencyLimiter(
+        max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+        acquire_timeout=settings.GEMINI_ACQUIRE_TIMEOUT,
+    ),
+    hedge_after=settings.GEMINI_HEDGE_AFTER or None,
+)
+
+# Every session's Gemini calls share these keep-alive pools, so concurrent turns reuse warm connections
+http_pool = HttpPool(
+    max_connections=settings.GEMINI_HTTP_MAX_CONNECTIONS,
+    keepalive_expiry=settings.GEMINI_HTTP_KEEPALIVE_EXPIRY,
+    http2=settings.GEMINI_HTTP2,
+)
+configure_client(http_pool)
+
+if settings.MODEL_BACKEND == "replay":
+    model_backend = ReplayBackend.from_transcript(settings.REPLAY_TRANSCRIPT, speed=settings.REPLAY_SPEED)
+elif settings.MODEL_BACKEND == "gemini":
+    model_backend = GeminiBackend()
+else:
+    raise ValueError(f"Unknown MODEL_BACKEND: {settings.MODEL_BACKEND}")
+
+# Serves the data grid straight from the stored datasets, without a model round-trip
+dataset_query = DatasetQuery(upload_cache.store)
+
+chat_sessions = SessionRegistry(
+    factory=lambda: SESSION_CLASS(
+        system_prompt=SYSTEM_PROMPT,
+        upload_cache=upload_cache,
+        image_store=image_store,
+        history_compactor=history_compactor,
+        response_cache=response_cache,
+        replay_speed=settings.RESPONSE_CACHE_REPLAY_SPEED,
+        call_policy=call_policy,
+        backend=model_backend,
+        max_files=settings.CHAT_MAX_FILES,
+        upload_workers=settings.UPLOAD_WORKERS,
+    ),
+    max_sessions=settings.CHAT_SESSION_MAX,
+    max_bytes=settings.CHAT_SESSION_MAX_BYTES,
+    idle_ttl=settings.CHAT_SESSION_IDLE_TTL,
+    # Shared by the workers, so a user's next request needn't land on the worker that served the last one
+    store=SessionStore(
+        path=settings.CHAT_SESSION_STORE_PATH,
+        flush_interval=settings.CHAT_SESSION_FLUSH_INTERVAL,
+        idle_ttl=settings.CHAT_SESSION_IDLE_TTL,
+    ) if settings.CHAT_SESSION_STORE_ENABLED else None,
+    replay_events=settings.SSE_REPLAY_EVENTS,
+)
+
+
+def _session_key(request: HttpRequest) -> str:
+    """Get the key identifying this user's chat session, assigning one if needed."""
+    key = request.session.get(CHAT_SESSION_KEY)
+    if not key:
+        key = uuid.uuid4().hex
+        request.session[CHAT_SESSION_KEY] = key
+    return key
+
+
+def _get_or_create_session(request: HttpRequest) -> GeminiChatSession:
+    """Get the current user's chat session or create a new one."""
+    return chat_sessions.get(_session_key(request))
+
+
+def _image_url(blob: types.Blob) -> str:
+    """Store a generated image and return the URL it is served from."""
+    return reverse('chat_image', args=[image_store.put(blob.data, blob.mime_type)])
+
+
+def _log_trace(session: GeminiChatSession, trace: metrics.Trace | None = None) -> None:
+    """Log the span timings of a request when trace logging is on."""
+    trace = trace or session.last_trace
+    if settings.METRICS_TRACE_LOG and trace is not None:
+        logger.info(f"trace {json.dumps(trace.as_dict())}")
+
+
+def _sse_writer(request: HttpRequest) -> SSEWriter:
+    """A writer for one chat stream, compressed if the client accepts it."""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', '')) if settings.SSE_COMPRESSION else None
+    return SSEWriter(
+        flush_window=settings.SSE_FLUSH_WINDOW,
+        heartbeat_interval=settings.SSE_HEARTBEAT_INTERVAL,
+        encoding=encoding,
+        on_finish=lambda writer: metrics.BYTES.inc(writer.bytes_sent, kind='sse'),
+    )
+
+
+def _render_bot_response(session: GeminiChatSession, bot_response: list, file_names: dict[str, str]) -> str:
+    with metrics.span('render', session.last_trace):
+        return render_html_response(bot_response, file_names, _image_url)
 
 
 def index(request: HttpRequest) -> HttpResponse:
@@ -33,15 +198,18 @@ def index(request: HttpRequest) -> HttpResponse:
 
 
 def about(request: HttpRequest) -> HttpResponse:
-    return render(request, 'pages/about.html')
+    return render(request, 'pages/about.html', {
+        'max_upload_mb': settings.UPLOAD_MAX_BYTES // (1024 * 1024),
+    })
 
 
 def chat(request: HttpRequest) -> HttpResponse:
-    global chat_session
-    chat_session = GeminiChatSession(system_prompt=SYSTEM_PROMPT)
+    chat_sessions.reset(_session_key(request))
     return render(request, 'chat/chat.html', {
         'chat_title': CHAT_TITLE,
         'welcome_message': WELCOME_MESSAGE,
+        'max_upload_mb': settings.UPLOAD_MAX_BYTES // (1024 * 1024),
+        'max_files': settings.CHAT_MAX_FILES,
     })
 
 
@@ -51,17 +219,22 @@ def get_chat_response(request: HttpRequest) -> HttpResponse:
     if not message:
         return HttpResponse("No message provided", status=400)
 
-    session = _get_or_create_session()
+    key = _session_key(request)
     
     logger.debug(f"User message: {message}")
     
-    # Always include file when one is uploaded (code execution sandbox needs it each turn)
-    if session.uploaded_file:
-        bot_response = session.send_message_with_file(message, session.uploaded_file)
-    else:
-        bot_response = session.send_message(message)
+    with chat_sessions.lock(key):
+        session = chat_sessions.get(key)
+        # Attach the uploaded files this message is about (the code execution sandbox needs them each turn)
+        files = session.select_files(message)
+        if files:
+            bot_response = session.send_message_with_files(message, files)
+        else:
+            bot_response = session.send_message(message)
+        chat_sessions.save(key)
     
-    bot_response_html = render_html_response(bot_response, session.uploaded_file_name)
+    bot_response_html = _render_bot_response(session, bot_response, sandbox_names(files))
+    _log_trace(session)
 
     return render(request, 'chat/bot_message.html', {
         'bot_response_html': bot_response_html,
@@ -70,80 +243,353 @@ def get_chat_response(request: HttpRequest) -> HttpResponse:
 
 @require_http_methods(["POST"])
 def stream_chat_response(request: HttpRequest) -> StreamingHttpResponse:
-    """Stream chat responses using Server-Sent Events (SSE)."""
+    """
+    Stream chat responses using Server-Sent Events (SSE).
+    With a Last-Event-ID header, resume the latest turn's stream after that event instead.
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        return _resume_stream(request, last_event_id)
+
     message = request.POST.get('message')
     if not message:
         def error_stream():
-            yield f"data: {json.dumps({'type': 'error', 'content': 'No message provided'})}\n\n"
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
-        return StreamingHttpResponse(error_stream(), content_type='text/event-stream')
-
-    session = _get_or_create_session()
-    uploaded_file_name = session.uploaded_file_name
+            yield format_sse({'type': 'error', 'content': 'No message provided'})
+            yield format_sse({'type': 'done'})
+        return sse_response(error_stream())
+
+    key = _session_key(request)
+    session_lock = chat_sessions.lock(key)
+    writer = _sse_writer(request)
+    # Events are recorded with IDs, so a client whose connection drops can resume the stream
+    buffer = chat_sessions.open_turn_buffer(key)
+    grace = settings.SSE_RESUME_GRACE
     
     logger.debug(f"Streaming user message: {message}")
     
-    def event_stream():
-        try:
-            # Always include file when one is uploaded (code execution sandbox needs it each turn)
-            if session.uploaded_file:
-                stream = session.send_message_with_file_stream(message, session.uploaded_file)
-            else:
-                stream = session.send_message_stream(message)
-            
-            for chunk in stream:
-                # Replace input_file_0.csv with actual filename in content
-                if chunk.get('content') and uploaded_file_name:
-                    chunk['content'] = replace_input_file_name(chunk['content'], uploaded_file_name)
-                
-                yield f"data: {json.dumps(chunk)}\n\n"
-            
-            # Signal completion
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
-            
-        except Exception as e:
-            logger.error(f"Streaming error: {str(e)}")
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
-    
-    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
-    response['Cache-Control'] = 'no-cache'
-    response['X-Accel-Buffering'] = 'no'  # Disable nginx buffering
-    return response
+    def run_turn():
+        # Paused after each event: the request's thread runs it up to the first one (see below)
+        start = time.perf_counter()
+        session = None
+        # Hold this user's session for the whole turn so overlapping messages can't interleave history
+        with session_lock:
+            # Stopped by api/chat/cancel/, or when no client has followed the stream for SSE_RESUME_GRACE seconds
+            cancellation = chat_sessions.begin_turn(key)
+            try:
+                session = chat_sessions.get(key)
+
+                # Attach the uploaded files this message is about (the code execution sandbox needs them each turn)
+                files = session.select_files(message)
+                # The writer replaces input_file_0.csv, ... with the actual filenames in content
+                writer.file_names = buffer.file_names = sandbox_names(files)
+                if files:
+                    stream = session.send_message_with_files_stream(message, files, cancellation)
+                else:
+                    stream = session.send_message_stream(message, cancellation)
+
+                for chunk in stream:
+                    buffer.append(chunk)
+                    if buffer.abandoned(grace):
+                        cancellation.cancel('disconnect')
+                    yield
+                if cancellation.reason is not None:
+                    buffer.append({'type': 'cancelled'})
+
+                # Signal completion
+                buffer.append({'type': 'done'})
+
+            except Exception as e:
+                logger.error(f"Streaming error: {str(e)}")
+                buffer.append({'type': 'error', 'content': str(e)})
+                buffer.append({'type': 'done'})
+            finally:
+                # The stream ends once the turn is saved, so a next message, on any worker, finds it there
+                try:
+                    chat_sessions.end_turn(key, cancellation)
+                    if session is not None:
+                        chat_sessions.save(key)
+                        metrics.observe('sse_turn', time.perf_counter() - start, session.last_trace)
+                        _log_trace(session)
+                finally:
+                    buffer.finish()
+
+    # The turn starts on this thread, so its first event reaches the client without a thread switch, and
+    # goes on on a thread of its own, holding the session, once the response is waiting for the next one
+    # (or is closed unread). A client going away frees this thread at once and leaves the turn running for
+    # a reconnect
+    turn = run_turn()
+    on_end = functools.partial(chat_sessions.release_turn_buffer, key, buffer)
+    on_idle = None
+    if next(turn, _FINISHED) is not _FINISHED:
+        on_idle = functools.partial(chat_sessions.continue_turn, turn, session_lock)
+    return writer.response(buffer.follow(on_end=on_end, on_idle=on_idle))
+
+
+def _resume_stream(request: HttpRequest, last_event_id: str) -> StreamingHttpResponse:
+    """Stream the latest turn's events after ``last_event_id``, following the turn live if it is still running."""
+    key = _session_key(request)
+    # Possibly streaming on another worker, followed through the store
+    buffer = chat_sessions.turn_buffer(key, turn_id_of(last_event_id))
+    writer = _sse_writer(request)
+    try:
+        if buffer is None:
+            raise ResumeError("The response is no longer available to resume")
+        events = buffer.follow(last_event_id, functools.partial(chat_sessions.release_turn_buffer, key, buffer))
+    except ResumeError as e:
+        logger.info(f"Could not resume stream: {e}")
+        return writer.response(iter([{'type': 'error', 'content': str(e)}, {'type': 'done'}]))
+    writer.file_names = buffer.file_names
+    return writer.response(events)
+
+
+@require_http_methods(["POST"])
+def cancel_chat_response(request: HttpRequest) -> JsonResponse:
+    """
+    Stop the response streaming for this user, e.g. before sending a new message or when the page closes.
+    The stream ends with a ``cancelled`` event, and the history keeps the reply up to that point.
+    """
+    cancelled = chat_sessions.cancel(_session_key(request))
+    return JsonResponse({'cancelled': cancelled})
 
 
 @require_http_methods(["POST"])
 def upload_file(request: HttpRequest) -> HttpResponse:
+    """Upload one or more files (``file``, repeated); several are converted and uploaded in parallel."""
     try:
-        file = request.FILES.get('file')
-        if not file:
+        files = request.FILES.getlist('file')
+        if not files:
             return JsonResponse({"error": "No file provided"}, status=400)
 
-        session = _get_or_create_session()
+        key = _session_key(request)
         
-        session.upload_file(file.file, file.name)
+        metrics.BYTES.inc(sum(file.size for file in files), kind='upload')
+        with chat_sessions.lock(key):
+            session = chat_sessions.get(key)
+            session.upload_files([(file.file, file.name) for file in files])
+            chat_sessions.save(key)
+        _log_trace(session)
         
-        return JsonResponse({
-            "success": True,
-            "filename": file.name,
-            "message": f"Uploaded: {file.name}"
-        })
+        return _uploaded_response(session, [file.name for file in files])
     except Exception as e:
         logger.error(f"Error uploading file: {e}")
         return JsonResponse({"error": str(e)}, status=400)
 
 
+def _uploaded_response(session: GeminiChatSession, filenames: list[str]) -> JsonResponse:
+    return JsonResponse({
+        "success": True,
+        "filename": ", ".join(filenames),
+        "message": f"Uploaded: {', '.join(filenames)}",
+        # Every file in the conversation so far, by the index the data grid takes
+        "files": [file.name for file in session.files],
+        "max_files": session.max_files,
+    })
+
+
+@require_http_methods(["POST"])
+def start_chunked_upload(request: HttpRequest) -> JsonResponse:
+    """Begin a chunked upload of the file named ``filename`` with ``size`` bytes."""
+    try:
+        upload = chunked_uploads.start(
+            _session_key(request), request.POST.get('filename', ''), int(request.POST.get('size', 0)),
+        )
+    except (UploadError, ValueError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({
+        "upload_id": upload.upload_id,
+        "part_size": upload.part_size,
+        "part_count": upload.part_count,
+    })
+
+
 @require_http_methods(["GET"])
-def get_chat_history(request: HttpRequest) -> JsonResponse:
-    session = _get_or_create_session()
-    history = session.get_history()
-    return JsonResponse([msg.to_json_dict() for msg in history], safe=False)
+def chunked_upload_status(request: HttpRequest, upload_id: str) -> JsonResponse:
+    """Parts received so far, for resuming an interrupted upload."""
+    try:
+        upload = chunked_uploads.get(upload_id, _session_key(request))
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=404)
+    return JsonResponse({
+        "upload_id": upload.upload_id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "part_size": upload.part_size,
+        "part_count": upload.part_count,
+        "received": chunked_uploads.received_parts(upload),
+    })
+
+
+@require_http_methods(["PUT"])
+def upload_part(request: HttpRequest, upload_id: str, index: int) -> JsonResponse:
+    """
+    Receive one part as the raw request body, streamed to disk.
+    An ``X-Part-Sha256`` header with the part's hex sha256 is verified before the part is accepted.
+    """
+    try:
+        upload = chunked_uploads.get(upload_id, _session_key(request))
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=404)
+    try:
+        chunked_uploads.write_part(upload, index, request, request.headers.get('X-Part-Sha256'))
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    metrics.BYTES.inc(upload.part_length(index), kind='upload')
+    return JsonResponse({"received": index})
+
+
+@require_http_methods(["POST"])
+def complete_chunked_upload(request: HttpRequest, upload_id: str) -> JsonResponse:
+    """Convert and upload the assembled file once every part has arrived."""
+    return _complete_chunked_uploads(request, [upload_id])
+
+
+@require_http_methods(["POST"])
+def complete_chunked_uploads(request: HttpRequest) -> JsonResponse:
+    """Complete several uploads (``upload_id``, repeated) at once; their files are converted and uploaded in parallel."""
+    return _complete_chunked_uploads(request, request.POST.getlist('upload_id'))
+
+
+def _open_chunked_uploads(key: str, upload_ids: list[str], stack: ExitStack) -> list:
+    """(upload, assembled file) for each id, closed with ``stack``; raises UploadError if any isn't complete."""
+    if not upload_ids:
+        raise UploadError("No upload to complete")
+    uploads = [chunked_uploads.get(upload_id, key) for upload_id in upload_ids]
+    return [(upload, stack.enter_context(chunked_uploads.open(upload))) for upload in uploads]
+
+
+def _complete_chunked_uploads(request: HttpRequest, upload_ids: list[str]) -> JsonResponse:
+    key = _session_key(request)
+    with ExitStack() as stack:
+        try:
+            opened = _open_chunked_uploads(key, upload_ids, stack)
+        except UploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        try:
+            with chat_sessions.lock(key):
+                session = chat_sessions.get(key)
+                session.upload_files([(file, upload.filename) for upload, file in opened])
+                chat_sessions.save(key)
+        except Exception as e:
+            logger.error(f"Error uploading file: {e}")
+            return JsonResponse({"error": str(e)}, status=400)
+    for upload, _ in opened:
+        chunked_uploads.remove(upload)
+    _log_trace(session)
+    return _uploaded_response(session, [upload.filename for upload, _ in opened])
+
+
+@require_http_methods(["GET"])
+@etag(lambda request, digest: digest)
+def chat_image(request: HttpRequest, digest: str) -> FileResponse:
+    """
+    Serve a generated image by content digest.
+    The content never changes for a digest, so clients may cache it indefinitely and revalidate by ETag.
+    """
+    stored = image_store.get(digest)
+    if stored is None:
+        raise Http404("Image not found")
+    path, mime_type = stored
+    response = FileResponse(open(path, 'rb'), content_type=mime_type)
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    # The bytes come from model-written code: never sniff them as another type or run anything they hold
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Content-Security-Policy'] = "default-src 'none'; sandbox"
+    return response
+
+
+@require_http_methods(["GET"])
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Prometheus metrics for this host's workers, for a scrape bearing METRICS_TOKEN when one is set."""
+    if not settings.METRICS_ENABLED:
+        raise Http404("Metrics are disabled")
+    if settings.METRICS_TOKEN is not None:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+            return HttpResponse("Unauthorized", status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_http_methods(["GET"])
+@etag(lambda request: _get_or_create_session(request).history_etag)
+def get_chat_history(request: HttpRequest) -> HttpResponse:
+    """
+    A page of the conversation history: ``limit`` turns (DEFAULT_PAGE_TURNS by default) from turn
+    ``since`` on, or from the oldest turn still kept. Pass the previous page's ``next`` as ``since``
+    to fetch only newer turns. Revalidate with If-None-Match; the ETag changes with the history.
+    """
+    session = _get_or_create_session(request)
+    try:
+        since = int(request.GET['since']) if 'since' in request.GET else None
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_TURNS))
+    except ValueError:
+        return JsonResponse({"error": "since and limit must be integers"}, status=400)
+    try:
+        page = session.history_page(since, limit)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    response = HttpResponse(page, content_type='application/json')
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _session_dataset(request: HttpRequest) -> str | None:
+    """
+    Digest of one of the current user's stored datasets, or None if there is no such dataset.
+    The ``file`` query parameter picks it by upload order; the latest upload is the default.
+    """
+    files = _get_or_create_session(request).files
+    try:
+        digest = files[int(request.GET.get('file', -1))].digest
+    except (ValueError, IndexError):
+        return None
+    if digest is None or digest not in upload_cache.store:
+        return None
+    return digest
+
+
+@require_http_methods(["GET"])
+def dataset_schema(request: HttpRequest) -> JsonResponse:
+    digest = _session_dataset(request)
+    if digest is None:
+        return JsonResponse({"error": "No dataset uploaded"}, status=404)
+    try:
+        return JsonResponse(dataset_query.schema(digest))
+    except KeyError:
+        return JsonResponse({"error": "Dataset is no longer available"}, status=404)
+
+
+@require_http_methods(["GET"])
+def dataset_rows(request: HttpRequest) -> JsonResponse:
+    """
+    Serve a page of the uploaded dataset.
+
+    Query parameters: ``file`` (see ``_session_dataset``), ``offset``, ``limit``, ``columns`` (comma-separated),
+    ``sort`` (comma-separated, ``-`` prefix for descending) and any number of
+    ``filter`` values of the form ``column:op:value``.
+    """
+    digest = _session_dataset(request)
+    if digest is None:
+        return JsonResponse({"error": "No dataset uploaded"}, status=404)
+    try:
+        columns = request.GET.get('columns')
+        page = dataset_query.rows(
+            digest,
+            offset=int(request.GET.get('offset', 0)),
+            limit=int(request.GET.get('limit', DEFAULT_PAGE_ROWS)),
+            columns=columns.split(',') if columns else None,
+            filters=[parse_filter(text) for text in request.GET.getlist('filter')],
+            sort=parse_sort(request.GET.get('sort', '')),
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except KeyError:
+        return JsonResponse({"error": "Dataset is no longer available"}, status=404)
+    return JsonResponse(page)
 
 
 @require_http_methods(["GET"])
 def clear_history(request: HttpRequest) -> JsonResponse:
-    global chat_session
-    chat_session = GeminiChatSession(system_prompt=SYSTEM_PROMPT)
+    chat_sessions.reset(_session_key(request))
     return JsonResponse({"message": "Chat history cleared"})
 
 
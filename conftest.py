@@ -0,0 +1,18 @@
+"""Test setup: the chat app's services and views, configured as the benchmarks are, without an API key."""
+import os
+import tempfile
+
+os.environ.setdefault('GOOGLE_API_KEY', 'fake-key')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eda_project.settings.development')
+os.environ.setdefault('MODEL_BACKEND', 'replay')
+os.environ.setdefault('REPLAY_SPEED', '0')
+os.environ.setdefault('METRICS_ENABLED', 'false')
+# Stores the views write to, kept out of the shared defaults under the system temp directory
+_data = tempfile.mkdtemp(prefix='eda-tests-')
+os.environ.setdefault('CHAT_SESSION_STORE_PATH', os.path.join(_data, 'sessions.sqlite3'))
+for name in ('DATASET_STORE_DIR', 'IMAGE_STORE_DIR', 'CHUNKED_UPLOAD_DIR', 'RESPONSE_CACHE_DIR'):
+    os.environ.setdefault(name, os.path.join(_data, name.lower()))
+
+import django  # noqa: E402
+
+django.setup()
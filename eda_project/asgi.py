@@ -8,8 +8,13 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eda_project.settings.production')
 
 application = get_asgi_application()
+
+if settings.WARM_UP_ON_LOAD:
+    from chat.startup import warm_up
+    warm_up()
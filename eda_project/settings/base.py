@@ -89,3 +89,107 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # MEDIA_ROOT = os.path.join(BASE_DIR, 'uploads')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Chat sessions are identified by a key stored in a signed cookie, so no session table is needed
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+# Per-worker cap on live chat sessions in memory, on the (approximate) bytes their histories and
+# datasets add up to, and how long an idle one is kept (seconds)
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "500"))
+CHAT_SESSION_MAX_BYTES = int(os.getenv("CHAT_SESSION_MAX_BYTES", str(1024 * 1024 * 1024)))
+CHAT_SESSION_IDLE_TTL = int(os.getenv("CHAT_SESSION_IDLE_TTL", "3600"))
+# Conversations are saved to a SQLite database the workers share (write-behind, every
+# CHAT_SESSION_FLUSH_INTERVAL seconds) so any worker can pick one up, e.g. after a restart
+CHAT_SESSION_STORE_ENABLED = os.getenv("CHAT_SESSION_STORE_ENABLED", "true").lower() == "true"
+CHAT_SESSION_STORE_PATH = os.getenv("CHAT_SESSION_STORE_PATH") or None
+CHAT_SESSION_FLUSH_INTERVAL = float(os.getenv("CHAT_SESSION_FLUSH_INTERVAL", "0.5"))
+# Datasets one conversation can hold, and how many files of one upload are converted and uploaded at once
+CHAT_MAX_FILES = int(os.getenv("CHAT_MAX_FILES", "5"))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+
+# Uploaded datasets are stored on disk as Arrow IPC files, keyed by content hash
+DATASET_STORE_DIR = os.getenv("DATASET_STORE_DIR") or None
+# Number of uploads whose dataset and Gemini file handle are kept for reuse
+UPLOAD_CACHE_MAX_ENTRIES = int(os.getenv("UPLOAD_CACHE_MAX_ENTRIES", "64"))
+# Datasets whose converted CSV is larger than this many bytes are sent to the model as a sample of
+# about DATASET_SAMPLE_ROWS rows with exact aggregates of the whole; 0 always sends the full dataset
+DATASET_SAMPLE_THRESHOLD_BYTES = int(os.getenv("DATASET_SAMPLE_THRESHOLD_BYTES", str(32 * 1024 * 1024)))
+DATASET_SAMPLE_ROWS = int(os.getenv("DATASET_SAMPLE_ROWS", "100000"))
+
+# Chat history is compacted after each turn to stay within this many (estimated) tokens and
+# CHAT_HISTORY_MAX_TURNS turns, never touching the latest CHAT_HISTORY_KEEP_TURNS turns
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "32000"))
+CHAT_HISTORY_KEEP_TURNS = int(os.getenv("CHAT_HISTORY_KEEP_TURNS", "2"))
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", "20"))
+
+# Chunked, resumable uploads: the browser sends files in parts of CHUNKED_UPLOAD_PART_SIZE bytes, streamed
+# into a file under CHUNKED_UPLOAD_DIR (shared by the workers) and converted once every part has arrived
+CHUNKED_UPLOAD_DIR = os.getenv("CHUNKED_UPLOAD_DIR") or None
+CHUNKED_UPLOAD_PART_SIZE = int(os.getenv("CHUNKED_UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Generated plots are stored on disk by content hash and served from /api/chat/image/
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR") or None
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Opt-in cache of complete streamed replies, keyed by dataset content hash and the conversation so far.
+# Hits are replayed at the recorded pace sped up by RESPONSE_CACHE_REPLAY_SPEED (0 replays instantly)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR") or None
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_REPLAY_SPEED = float(os.getenv("RESPONSE_CACHE_REPLAY_SPEED", "1.0"))
+
+# Gemini call policy: retryable failures (overload, rate limits, timeouts) before the first streamed chunk
+# are retried with jittered exponential backoff; GEMINI_HEDGE_AFTER > 0 sends a second request when the
+# first chunk takes longer than that many seconds. GEMINI_BREAKER_THRESHOLD consecutive failures stop
+# calls for GEMINI_BREAKER_RESET seconds, and each worker makes at most GEMINI_MAX_CONCURRENCY calls at once
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "8"))
+GEMINI_HEDGE_AFTER = float(os.getenv("GEMINI_HEDGE_AFTER", "0"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_RESET = float(os.getenv("GEMINI_BREAKER_RESET", "30"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "64"))
+GEMINI_ACQUIRE_TIMEOUT = float(os.getenv("GEMINI_ACQUIRE_TIMEOUT", "30"))
+
+# Keep-alive connection pools shared by every Gemini call in a worker (one sync, one async). The default
+# leaves room for a hedged second request per call; GEMINI_HTTP2 multiplexes calls and needs the h2 package
+GEMINI_HTTP_MAX_CONNECTIONS = int(os.getenv("GEMINI_HTTP_MAX_CONNECTIONS", str(2 * GEMINI_MAX_CONCURRENCY)))
+GEMINI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_HTTP_KEEPALIVE_EXPIRY", "60"))
+GEMINI_HTTP2 = os.getenv("GEMINI_HTTP2", "false").lower() == "true"
+
+# Chat SSE streams: text deltas within SSE_FLUSH_WINDOW seconds of the last write are sent as one frame
+# (0 sends every delta as it comes), a comment heartbeat goes out after SSE_HEARTBEAT_INTERVAL idle seconds
+# (0 disables), and SSE_COMPRESSION gzips streams for clients that accept it (brotli if the package is installed)
+SSE_FLUSH_WINDOW = float(os.getenv("SSE_FLUSH_WINDOW", "0.04"))
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+SSE_COMPRESSION = os.getenv("SSE_COMPRESSION", "true").lower() == "true"
+# Each streamed turn keeps its last SSE_REPLAY_EVENTS events so a client that lost its connection can resume
+# with Last-Event-ID; a turn nobody has followed for SSE_RESUME_GRACE seconds is stopped
+SSE_REPLAY_EVENTS = int(os.getenv("SSE_REPLAY_EVENTS", "4096"))
+SSE_RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "30"))
+
+# Prometheus metrics at /metrics, off unless METRICS_ENABLED; with METRICS_TOKEN set, a scrape must send it as
+# "Authorization: Bearer <token>". Under several workers, set METRICS_DIR to a directory the workers share
+# (emptied on deploy) so every scrape reports the whole host. METRICS_TRACE_LOG logs span timings per request
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_TRACE_LOG = os.getenv("METRICS_TRACE_LOG", "false").lower() == "true"
+
+# Model backend: "gemini", or "replay" to answer every message from a recorded transcript (offline load tests
+# and benchmarks; no API key needed). REPLAY_SPEED scales the recorded pace (0 replays instantly)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini").lower()
+REPLAY_TRANSCRIPT = os.getenv("REPLAY_TRANSCRIPT") or str(BASE_DIR / 'benchmarks' / 'browser' / 'long_transcript.json')
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1.0"))
+
+# Read at startup; resolved from the project root rather than the working directory
+SYSTEM_PROMPT_PATH = os.getenv("SYSTEM_PROMPT_PATH") or str(BASE_DIR / 'system_prompt.txt')
+
+# Import the chat views and the data libraries (pyarrow, pandas, openpyxl) when the WSGI/ASGI app is loaded
+# instead of on the first requests that need them. Under gunicorn with preload_app (gunicorn.conf.py) this
+# happens once in the master and forked workers share the loaded modules copy-on-write
+WARM_UP_ON_LOAD = os.getenv("WARM_UP_ON_LOAD", "true").lower() == "true"
+
+# Serve the chat API with async sessions and views. Only enable when running under ASGI
+CHAT_ASYNC = os.getenv("CHAT_ASYNC", "false").lower() == "true"
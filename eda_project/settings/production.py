@@ -7,4 +7,7 @@ ALLOWED_HOSTS = ["exploratory-data-analysis.replit.app", "127.0.0.1", "0.0.0.0"]
 CSRF_TRUSTED_ORIGINS = ["https://exploratory-data-analysis.replit.app", "http://127.0.0.1"]
 
 MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
\ No newline at end of file
+STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+# Production is served by eda_project.asgi under uvicorn workers
+CHAT_ASYNC = os.getenv("CHAT_ASYNC", "true").lower() == "true"
\ No newline at end of file
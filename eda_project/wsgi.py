@@ -1,6 +1,11 @@
 import os
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eda_project.settings.production')
 
-application = get_wsgi_application() 
\ No newline at end of file
+application = get_wsgi_application()
+
+if settings.WARM_UP_ON_LOAD:
+    from chat.startup import warm_up
+    warm_up() 
@@ -0,0 +1,21 @@
+"""
+Gunicorn settings, picked up from the working directory:
+
+    gunicorn eda_project.asgi:application -k uvicorn_worker.UvicornWorker
+
+The application is loaded once in the master (``preload_app``) and workers
+are forked from it, so the Django setup, the chat views, google-genai and the
+data libraries imported by ``chat.startup.warm_up`` are shared copy-on-write
+instead of being imported again by every worker. Nothing that must not cross
+a fork is created at import: the Gemini client and the hedging thread pool
+are built on first use in each worker. Set ``GUNICORN_PRELOAD=false`` to load
+the application in each worker instead (e.g. to reload code on HUP).
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+# Streamed turns with code execution can run for minutes
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
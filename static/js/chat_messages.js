@@ -1,20 +1,13 @@
-// Configure marked.js for markdown rendering
-marked.setOptions({
-    highlight: function(code, lang) {
-        if (lang && hljs.getLanguage(lang)) {
-            try {
-                return hljs.highlight(code, { language: lang }).value;
-            } catch (e) {}
-        }
-        return hljs.highlightAuto(code).value;
-    },
-    breaks: true,
-    gfm: true
-});
-
 // Chat container reference
 const chatContainer = document.getElementById('chat-container');
 
+// The response being streamed, if any; a new message or leaving the page cancels it
+let activeStream = null;
+
+// Reconnects to a stream whose connection dropped, waiting a little longer before each
+const RESUME_ATTEMPTS = 5;
+const RESUME_DELAY_MS = 1000;
+
 // Auto-scroll state management
 let userScrolledAway = false;
 const SCROLL_THRESHOLD = 100;
@@ -160,114 +153,162 @@ function removeCodeExecutionIndicator(indicator) {
 }
 
 /**
- * Render markdown content with syntax highlighting
+ * Ask the server to stop the response being streamed. The stream then ends with a 'cancelled' event
+ * and the conversation keeps the reply up to that point.
  */
-function renderMarkdown(content) {
-    const html = marked.parse(content);
-    return DOMPurify.sanitize(html, {
-        ADD_TAGS: ['pre', 'code', 'span', 'math', 'semantics', 'mrow', 'mi', 'mo', 'mn', 'msup', 'msub', 'mfrac', 'msqrt', 'mroot', 'mover', 'munder', 'mtable', 'mtr', 'mtd', 'annotation'],
-        ADD_ATTR: ['class', 'style', 'aria-hidden', 'encoding']
-    });
-}
-
-/**
- * Render LaTeX in a container using KaTeX
- */
-function renderLatex(container) {
-    if (typeof renderMathInElement !== 'undefined') {
-        renderMathInElement(container, {
-            delimiters: [
-                {left: '$$', right: '$$', display: true},
-                {left: '$', right: '$', display: false},
-                {left: '\\[', right: '\\]', display: true},
-                {left: '\\(', right: '\\)', display: false}
-            ],
-            throwOnError: false,
-            errorColor: '#cc0000'
-        });
+async function cancelActiveStream(csrfToken) {
+    if (!activeStream) return;
+    const formData = new FormData();
+    formData.append('csrfmiddlewaretoken', csrfToken);
+    try {
+        await fetch('/api/chat/cancel/', { method: 'POST', body: formData });
+    } catch (error) {
+        console.error('Cancel request failed:', error);
     }
 }
 
-/**
- * Render code block with syntax highlighting
- */
-function renderCodeBlock(code, label = 'Python Code:') {
-    const highlighted = hljs.highlight(code, { language: 'python' }).value;
-    return `
-        <div class="code-block mt-2 mb-2">
-            <small class="text-muted">${label}</small>
-            <pre><code class="hljs language-python">${highlighted}</code></pre>
-        </div>
-    `;
-}
-
-/**
- * Render code execution result (plain text, no syntax highlighting)
- */
-function renderCodeResult(output) {
-    return `
-        <div class="code-result mt-2 mb-2">
-            <small class="text-muted">Code Output:</small>
-            <pre class="output-pre"><code class="output-code">${DOMPurify.sanitize(output)}</code></pre>
-        </div>
-    `;
-}
-
-/**
- * Render inline image
- */
-function renderImage(base64Data) {
-    return `<img src="data:image/png;base64,${base64Data}" alt="Generated Image" class="img-fluid mt-2 mb-2" style="max-width: 100%; height: auto;"/>`;
-}
-
 /**
  * Stream chat response using fetch with SSE
  */
 async function streamChatResponse(message, csrfToken) {
     // Create message container
     const contentContainer = createBotMessageContainer();
+    const stream = {};
+    activeStream = stream;
     
-    // State for building the response
-    // We maintain separate arrays for different content types to properly order them
-    let contentParts = []; // Array of {type: 'text'|'code'|'result'|'image', content: string}
-    let currentTextContent = ''; // Accumulator for streaming text
     let codeExecutionIndicator = null;
     let hasReceivedContent = false; // Track if we've received any content yet
-    let seenImageData = new Set(); // Track seen images to prevent duplicates
+    let seenImageData = new Set(); // Track seen image digests to prevent duplicates
+    let lastEventId = null; // ID of the last event received, to resume from after a dropped connection
+    let finished = false;
+    
+    // Finished parts are appended once; only the streaming paragraph is re-rendered, once per frame
+    const renderer = new StreamRenderer(contentContainer, { onRender: smartAutoScroll });
     
-    // Function to rebuild the entire content from parts
-    function rebuildContent() {
-        // Remove thinking indicator on first content
+    // Remove thinking indicator on first content
+    function startContent() {
         if (!hasReceivedContent) {
             removeThinkingIndicator(contentContainer);
             hasReceivedContent = true;
         }
-        
-        let html = '';
-        for (const part of contentParts) {
-            switch (part.type) {
-                case 'text':
-                    html += renderMarkdown(part.content);
-                    break;
-                case 'code':
-                    html += renderCodeBlock(part.content);
-                    break;
-                case 'result':
-                    html += renderCodeResult(part.content);
-                    break;
-                case 'image':
-                    html += renderImage(part.content);
+    }
+    
+    // Handle one event from the stream
+    function handleEvent(data) {
+        switch (data.type) {
+            case 'text':
+                // Remove code execution indicator if present
+                removeCodeExecutionIndicator(codeExecutionIndicator);
+                codeExecutionIndicator = null;
+                
+                startContent();
+                renderer.appendText(data.content);
+                break;
+                
+            case 'code':
+                // Finalizes any current text before the code block
+                startContent();
+                renderer.appendPart('code', data.content);
+                
+                // Show code execution indicator
+                codeExecutionIndicator = showCodeExecutionIndicator(contentContainer);
+                break;
+                
+            case 'result':
+                // Remove code execution indicator
+                removeCodeExecutionIndicator(codeExecutionIndicator);
+                codeExecutionIndicator = null;
+                
+                startContent();
+                renderer.appendPart('result', data.content);
+                break;
+                
+            case 'image':
+                // Remove code execution indicator if present
+                removeCodeExecutionIndicator(codeExecutionIndicator);
+                codeExecutionIndicator = null;
+                
+                // Images arrive as a digest to fetch from the image endpoint (base64 only without an image store)
+                const imageKey = data.digest || data.content;
+                if (imageKey && seenImageData.has(imageKey)) {
                     break;
-            }
-        }
-        // Add current streaming text if any
-        if (currentTextContent) {
-            html += renderMarkdown(currentTextContent);
+                } else {
+                    if (imageKey) {
+                        seenImageData.add(imageKey);
+                    }
+                    
+                    startContent();
+                    renderer.appendPart('image', imageSource(data));
+                }
+                break;
+                
+            case 'cancelled':
+                removeCodeExecutionIndicator(codeExecutionIndicator);
+                codeExecutionIndicator = null;
+                startContent();
+                renderer.appendHtml('<p class="text-muted fst-italic">Response stopped.</p>');
+                break;
+                
+            case 'error':
+                startContent();
+                renderer.appendHtml(`<p class="text-danger"><strong>Error:</strong> ${DOMPurify.sanitize(data.content)}</p>`);
+                break;
+                
+            case 'done':
+                finished = true;
+                // Finalize any remaining text
+                renderer.finish();
+                
+                // Apply final syntax highlighting to code blocks (but not output blocks)
+                contentContainer.querySelectorAll('pre code:not(.hljs):not(.output-code)').forEach((block) => {
+                    hljs.highlightElement(block);
+                });
+                break;
         }
-        contentContainer.innerHTML = html;
+    }
+    
+    // Read events until the response ends; returns whether any arrived
+    async function readEvents(response) {
+        if (!response || !response.ok) return false;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let received = false;
         
-        // Render LaTeX expressions
-        renderLatex(contentContainer);
+        while (true) {
+            const { done, value } = await reader.read();
+            
+            if (done) return received;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Process complete SSE events; an event's ID counts as received once its data is handled
+            const events = buffer.split('\n\n');
+            buffer = events.pop() || ''; // Keep incomplete event in buffer
+            
+            for (const event of events) {
+                let data = null;
+                let id = null;
+                for (const line of event.split('\n')) {
+                    if (line.startsWith('data: ')) {
+                        data = line.slice(6);
+                    } else if (line.startsWith('id: ')) {
+                        id = line.slice(4);
+                    }
+                }
+                if (data !== null) {
+                    try {
+                        handleEvent(JSON.parse(data));
+                        received = true;
+                    } catch (e) {
+                        console.error('Error parsing SSE data:', e, data);
+                    }
+                }
+                if (id !== null) {
+                    lastEventId = id;
+                }
+            }
+        }
     }
     
     try {
@@ -275,7 +316,7 @@ async function streamChatResponse(message, csrfToken) {
         formData.append('message', message);
         formData.append('csrfmiddlewaretoken', csrfToken);
         
-        const response = await fetch('/api/chat/stream/', {
+        let response = await fetch('/api/chat/stream/', {
             method: 'POST',
             body: formData
         });
@@ -298,111 +339,34 @@ async function streamChatResponse(message, csrfToken) {
             return;
         }
         
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
-        
+        let attempts = 0;
         while (true) {
-            const { done, value } = await reader.read();
-            
-            if (done) break;
-            
-            buffer += decoder.decode(value, { stream: true });
-            
-            // Process complete SSE messages
-            const lines = buffer.split('\n');
-            buffer = lines.pop() || ''; // Keep incomplete line in buffer
-            
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    try {
-                        const data = JSON.parse(line.slice(6));
-                        
-                        switch (data.type) {
-                            case 'text':
-                                // Remove code execution indicator if present
-                                removeCodeExecutionIndicator(codeExecutionIndicator);
-                                codeExecutionIndicator = null;
-                                
-                                // Accumulate text and re-render
-                                currentTextContent += data.content;
-                                rebuildContent();
-                                smartAutoScroll();
-                                break;
-                                
-                            case 'code':
-                                // Finalize any current text as a part
-                                if (currentTextContent) {
-                                    contentParts.push({ type: 'text', content: currentTextContent });
-                                    currentTextContent = '';
-                                }
-                                
-                                // Add code block
-                                contentParts.push({ type: 'code', content: data.content });
-                                rebuildContent();
-                                
-                                // Show code execution indicator
-                                codeExecutionIndicator = showCodeExecutionIndicator(contentContainer);
-                                break;
-                                
-                            case 'result':
-                                // Remove code execution indicator
-                                removeCodeExecutionIndicator(codeExecutionIndicator);
-                                codeExecutionIndicator = null;
-                                
-                                // Add result
-                                contentParts.push({ type: 'result', content: data.content });
-                                rebuildContent();
-                                smartAutoScroll();
-                                break;
-                                
-                            case 'image':
-                                // Remove code execution indicator if present
-                                removeCodeExecutionIndicator(codeExecutionIndicator);
-                                codeExecutionIndicator = null;
-                                
-                                // Finalize any current text
-                                if (currentTextContent) {
-                                    contentParts.push({ type: 'text', content: currentTextContent });
-                                    currentTextContent = '';
-                                }
-                                if (data.content && seenImageData.has(data.content)) {
-                                    break;
-                                } else {
-                                    if (data.content) {
-                                        seenImageData.add(data.content);
-                                    }
-                                    
-                                    // Add image
-                                    contentParts.push({ type: 'image', content: data.content });
-                                    rebuildContent();
-                                    smartAutoScroll();
-                                }
-                                break;
-                                
-                            case 'error':
-                                contentContainer.innerHTML += `<p class="text-danger"><strong>Error:</strong> ${DOMPurify.sanitize(data.content)}</p>`;
-                                smartAutoScroll();
-                                break;
-                                
-                            case 'done':
-                                // Finalize any remaining text
-                                if (currentTextContent) {
-                                    contentParts.push({ type: 'text', content: currentTextContent });
-                                    currentTextContent = '';
-                                    rebuildContent();
-                                }
-                                
-                                // Apply final syntax highlighting to code blocks (but not output blocks)
-                                contentContainer.querySelectorAll('pre code:not(.hljs):not(.output-code)').forEach((block) => {
-                                    hljs.highlightElement(block);
-                                });
-                                break;
-                        }
-                    } catch (e) {
-                        console.error('Error parsing SSE data:', e, line);
-                    }
+            try {
+                if (await readEvents(response)) {
+                    attempts = 0;
                 }
+            } catch (error) {
+                console.warn('Stream interrupted:', error);
+            }
+            if (finished || lastEventId === null || activeStream !== stream) break;
+            
+            // The connection dropped mid-answer: reconnect and pick up after the last event received,
+            // while the server keeps the turn running
+            if (++attempts > RESUME_ATTEMPTS) {
+                throw new Error('Lost the connection to the server.');
+            }
+            await new Promise((resolve) => setTimeout(resolve, RESUME_DELAY_MS * attempts));
+            const resumeData = new FormData();
+            resumeData.append('csrfmiddlewaretoken', csrfToken);
+            try {
+                response = await fetch('/api/chat/stream/', {
+                    method: 'POST',
+                    headers: { 'Last-Event-ID': lastEventId },
+                    body: resumeData
+                });
+            } catch (error) {
+                console.warn('Reconnect failed:', error);
+                response = null;
             }
         }
         
@@ -410,9 +374,13 @@ async function streamChatResponse(message, csrfToken) {
         console.error('Streaming error:', error);
         // Remove thinking indicator if still present
         removeThinkingIndicator(contentContainer);
-        contentContainer.innerHTML += `<p class="text-danger"><strong>Error:</strong> ${DOMPurify.sanitize(error.message)}</p>`;
+        renderer.appendHtml(`<p class="text-danger"><strong>Error:</strong> ${DOMPurify.sanitize(error.message)}</p>`);
     } finally {
+        if (activeStream === stream) {
+            activeStream = null;
+        }
         // Always clean up indicators regardless of success/failure
+        renderer.finish();
         removeThinkingIndicator(contentContainer);
         removeCodeExecutionIndicator(codeExecutionIndicator);
         smartAutoScroll();
@@ -439,24 +407,24 @@ async function handleStreamSubmit(event) {
     // Clear input
     messageInput.value = '';
     
+    // Stop the previous answer first, so the model isn't left generating a reply nobody reads
+    await cancelActiveStream(csrfToken);
+    
     // Start streaming response (thinking indicator is shown in the message container)
     await streamChatResponse(message, csrfToken);
 }
 
-// File validation function
-function validateFileSize() {
-    const fileInput = document.querySelector("input[name='file']");
-    const file = fileInput.files[0];
-    const maxSize = 2 * 1024 * 1024; // 2 MB
-
-    if (file && file.size > maxSize) {
-        alert('File size exceeds 2 MB. Please upload a smaller file.');
-        return false;
-    }
-    return true;
-}
-
 // Initialize on DOM ready
 document.addEventListener('DOMContentLoaded', function() {
     scrollToBottom();
 });
+
+// Closing or leaving the page stops the response being streamed
+window.addEventListener('pagehide', function() {
+    const csrfInput = document.querySelector('input[name="csrfmiddlewaretoken"]');
+    if (activeStream && csrfInput) {
+        const formData = new FormData();
+        formData.append('csrfmiddlewaretoken', csrfInput.value);
+        navigator.sendBeacon('/api/chat/cancel/', formData);
+    }
+});
@@ -0,0 +1,134 @@
+/**
+ * Chunked, resumable file uploads.
+ * The file is sent in fixed-size parts (a few in parallel) that the server streams
+ * to disk, each with its SHA-256 so corrupted parts are rejected and resent. The
+ * upload id is kept in sessionStorage, so uploading the same file again after a
+ * failure or a reload only sends the parts the server doesn't have yet. Several
+ * files are sent side by side and completed together.
+ */
+const CHUNKED_UPLOAD_CONCURRENCY = 4;
+const CHUNKED_UPLOAD_ATTEMPTS = 3;
+
+async function sha256Hex(buffer) {
+    // crypto.subtle only exists in secure contexts; parts are then sent without a checksum
+    if (!window.crypto || !window.crypto.subtle) return null;
+    const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadErrorMessage(response, fallback) {
+    try {
+        return (await response.json()).error || fallback;
+    } catch (error) {
+        return fallback;
+    }
+}
+
+async function resumeChunkedUpload(resumeKey) {
+    const uploadId = sessionStorage.getItem(resumeKey);
+    if (!uploadId) return null;
+    const response = await fetch(`/api/chat/upload/${uploadId}/`);
+    if (!response.ok) {
+        sessionStorage.removeItem(resumeKey);
+        return null;
+    }
+    return response.json();
+}
+
+async function startChunkedUpload(file, csrfToken) {
+    const formData = new FormData();
+    formData.append('filename', file.name);
+    formData.append('size', file.size);
+    formData.append('csrfmiddlewaretoken', csrfToken);
+    const response = await fetch('/api/chat/upload/start/', { method: 'POST', body: formData });
+    if (!response.ok) {
+        throw new Error(await uploadErrorMessage(response, 'Could not start the upload'));
+    }
+    return { ...(await response.json()), received: [] };
+}
+
+async function sendUploadPart(file, upload, index, csrfToken) {
+    const start = index * upload.part_size;
+    const body = await file.slice(start, Math.min(file.size, start + upload.part_size)).arrayBuffer();
+    const headers = { 'X-CSRFToken': csrfToken, 'Content-Type': 'application/octet-stream' };
+    const checksum = await sha256Hex(body);
+    if (checksum) headers['X-Part-Sha256'] = checksum;
+
+    for (let attempt = 1; ; attempt++) {
+        let message = 'Part upload failed';
+        try {
+            const response = await fetch(`/api/chat/upload/${upload.upload_id}/parts/${index}/`, {
+                method: 'PUT', headers, body,
+            });
+            if (response.ok) return;
+            message = await uploadErrorMessage(response, message);
+        } catch (error) {
+            message = 'Connection lost during upload';
+        }
+        if (attempt >= CHUNKED_UPLOAD_ATTEMPTS) throw new Error(message);
+        await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+    }
+}
+
+/**
+ * Send every part of a file the server doesn't have yet, without completing the upload.
+ * @param {File} file
+ * @param {string} csrfToken
+ * @param {function(number)} onProgress - called with the fraction of parts received
+ * @returns {Promise<{uploadId: string, resumeKey: string}>}
+ */
+async function sendChunkedUpload(file, csrfToken, onProgress) {
+    const resumeKey = `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+    const upload = await resumeChunkedUpload(resumeKey) || await startChunkedUpload(file, csrfToken);
+    sessionStorage.setItem(resumeKey, upload.upload_id);
+
+    const received = new Set(upload.received);
+    const queue = [...Array(upload.part_count).keys()].filter(index => !received.has(index));
+    let done = received.size;
+    onProgress(done / upload.part_count);
+
+    const worker = async () => {
+        while (queue.length) {
+            await sendUploadPart(file, upload, queue.shift(), csrfToken);
+            onProgress(++done / upload.part_count);
+        }
+    };
+    await Promise.all(Array.from({ length: CHUNKED_UPLOAD_CONCURRENCY }, worker));
+    return { uploadId: upload.upload_id, resumeKey };
+}
+
+/**
+ * Upload files in parts, all at once, then complete them in one request so the
+ * server converts and uploads them to the model in parallel.
+ * @param {File[]} files
+ * @param {string} csrfToken
+ * @param {function(number)} onProgress - called with the fraction of bytes received across all files
+ * @returns {Promise<object>} the server's upload response ({success, filename, message, files} or {error})
+ */
+async function uploadFilesChunked(files, csrfToken, onProgress) {
+    const total = files.reduce((sum, file) => sum + file.size, 0) || 1;
+    const fractions = files.map(() => 0);
+    const sent = await Promise.all(files.map((file, i) => sendChunkedUpload(file, csrfToken, fraction => {
+        fractions[i] = fraction;
+        onProgress(files.reduce((sum, f, j) => sum + f.size * fractions[j], 0) / total);
+    })));
+
+    const formData = new FormData();
+    formData.append('csrfmiddlewaretoken', csrfToken);
+    sent.forEach(({ uploadId }) => formData.append('upload_id', uploadId));
+    const response = await fetch('/api/chat/upload/complete/', { method: 'POST', body: formData });
+    const data = await response.json();
+    if (data.success) sent.forEach(({ resumeKey }) => sessionStorage.removeItem(resumeKey));
+    return data;
+}
+
+/**
+ * Upload a file in parts and complete the upload.
+ * @param {File} file
+ * @param {string} csrfToken
+ * @param {function(number)} onProgress - called with the fraction of parts received
+ * @returns {Promise<object>} the server's upload response ({success, filename, message, files} or {error})
+ */
+async function uploadFileChunked(file, csrfToken, onProgress) {
+    return uploadFilesChunked([file], csrfToken, onProgress);
+}
@@ -0,0 +1,199 @@
+/**
+ * Data grid for browsing the uploaded datasets, one at a time.
+ * Pages are served by /api/chat/data/rows/ straight from the local dataset store,
+ * so paging, sorting and filtering never go through the model.
+ */
+const DATA_GRID_PAGE_ROWS = 50;
+
+const dataGrid = {
+    // Index of the shown dataset in upload order, and every uploaded filename
+    file: 0,
+    files: [],
+    columns: [],
+    offset: 0,
+    total: 0,
+    sort: '',
+    filters: [],
+    requestId: 0,
+};
+
+function dataGridElements() {
+    return {
+        modal: document.getElementById('data-grid-modal'),
+        title: document.getElementById('data-grid-title'),
+        fileSelect: document.getElementById('data-grid-file'),
+        head: document.getElementById('data-grid-head'),
+        body: document.getElementById('data-grid-body'),
+        status: document.getElementById('data-grid-status'),
+        prev: document.getElementById('data-grid-prev'),
+        next: document.getElementById('data-grid-next'),
+        filterInput: document.getElementById('data-grid-filter'),
+        filterList: document.getElementById('data-grid-filters'),
+    };
+}
+
+/**
+ * Record the uploaded filenames; with more than one, the grid offers a choice between them
+ * @param {string[]} files - filenames in upload order
+ */
+function setDataGridFiles(files) {
+    const els = dataGridElements();
+    dataGrid.files = files;
+    els.fileSelect.replaceChildren(...files.map((name, index) => new Option(name, index)));
+    els.fileSelect.classList.toggle('d-none', files.length < 2);
+}
+
+/**
+ * Open the grid on the first page of a dataset
+ * @param {number} [file] - index of the dataset in upload order; the latest upload by default
+ */
+async function openDataGrid(file) {
+    const els = dataGridElements();
+    bootstrap.Modal.getOrCreateInstance(els.modal).show();
+    els.status.textContent = 'Loading...';
+    dataGrid.file = Number.isInteger(file) ? file : Math.max(0, dataGrid.files.length - 1);
+    els.fileSelect.value = dataGrid.file;
+    els.title.textContent = dataGrid.files[dataGrid.file] || 'Dataset';
+
+    const response = await fetch(`/api/chat/data/schema/?file=${dataGrid.file}`);
+    const schema = await response.json();
+    if (!response.ok) {
+        els.status.textContent = schema.error || 'Could not load dataset';
+        return;
+    }
+    dataGrid.columns = schema.columns;
+    dataGrid.offset = 0;
+    dataGrid.sort = '';
+    dataGrid.filters = [];
+    renderDataGridFilters();
+    await loadDataGridPage();
+}
+
+/**
+ * Fetch and render the page at dataGrid.offset
+ */
+async function loadDataGridPage() {
+    const els = dataGridElements();
+    const params = new URLSearchParams({
+        file: dataGrid.file,
+        offset: dataGrid.offset,
+        limit: DATA_GRID_PAGE_ROWS,
+    });
+    if (dataGrid.sort) {
+        params.set('sort', dataGrid.sort);
+    }
+    dataGrid.filters.forEach(filter => params.append('filter', filter));
+
+    // Ignore responses to requests that were superseded while in flight
+    const requestId = ++dataGrid.requestId;
+    const response = await fetch(`/api/chat/data/rows/?${params}`);
+    const page = await response.json();
+    if (requestId !== dataGrid.requestId) return;
+    if (!response.ok) {
+        els.status.textContent = page.error || 'Could not load rows';
+        return;
+    }
+
+    dataGrid.total = page.total;
+    renderDataGridHead(page.columns);
+    renderDataGridRows(page);
+
+    const first = page.total ? page.offset + 1 : 0;
+    const last = page.offset + page.rows.length;
+    els.status.textContent = `Rows ${first.toLocaleString()}–${last.toLocaleString()} of ${page.total.toLocaleString()}`;
+    els.prev.disabled = page.offset === 0;
+    els.next.disabled = last >= page.total;
+}
+
+function renderDataGridHead(columns) {
+    const els = dataGridElements();
+    const row = document.createElement('tr');
+    row.appendChild(document.createElement('th')).textContent = '#';
+    columns.forEach(name => {
+        const th = document.createElement('th');
+        let label = name;
+        if (dataGrid.sort === name) label += ' ▲';
+        if (dataGrid.sort === `-${name}`) label += ' ▼';
+        th.textContent = label;
+        th.style.cursor = 'pointer';
+        th.title = 'Click to sort';
+        th.addEventListener('click', () => sortDataGrid(name));
+        row.appendChild(th);
+    });
+    els.head.replaceChildren(row);
+}
+
+function renderDataGridRows(page) {
+    const els = dataGridElements();
+    const fragment = document.createDocumentFragment();
+    page.rows.forEach((values, i) => {
+        const row = document.createElement('tr');
+        row.appendChild(document.createElement('td')).textContent = page.row_ids[i] + 1;
+        values.forEach(value => {
+            const td = document.createElement('td');
+            if (value === null) {
+                td.textContent = 'null';
+                td.classList.add('text-muted');
+            } else {
+                td.textContent = value;
+            }
+            row.appendChild(td);
+        });
+        fragment.appendChild(row);
+    });
+    els.body.replaceChildren(fragment);
+}
+
+/**
+ * Cycle a column through ascending, descending and unsorted
+ */
+function sortDataGrid(name) {
+    if (dataGrid.sort === name) {
+        dataGrid.sort = `-${name}`;
+    } else if (dataGrid.sort === `-${name}`) {
+        dataGrid.sort = '';
+    } else {
+        dataGrid.sort = name;
+    }
+    dataGrid.offset = 0;
+    loadDataGridPage();
+}
+
+function pageDataGrid(direction) {
+    const offset = dataGrid.offset + direction * DATA_GRID_PAGE_ROWS;
+    dataGrid.offset = Math.max(0, Math.min(offset, Math.max(0, dataGrid.total - 1)));
+    loadDataGridPage();
+}
+
+function addDataGridFilter(event) {
+    event.preventDefault();
+    const els = dataGridElements();
+    const filter = els.filterInput.value.trim();
+    if (!filter) return;
+    dataGrid.filters.push(filter);
+    dataGrid.offset = 0;
+    els.filterInput.value = '';
+    renderDataGridFilters();
+    loadDataGridPage();
+}
+
+function removeDataGridFilter(index) {
+    dataGrid.filters.splice(index, 1);
+    dataGrid.offset = 0;
+    renderDataGridFilters();
+    loadDataGridPage();
+}
+
+function renderDataGridFilters() {
+    const els = dataGridElements();
+    const badges = dataGrid.filters.map((filter, i) => {
+        const badge = document.createElement('span');
+        badge.className = 'badge bg-secondary me-1';
+        badge.textContent = `${filter} ✕`;
+        badge.style.cursor = 'pointer';
+        badge.title = 'Remove filter';
+        badge.addEventListener('click', () => removeDataGridFilter(i));
+        return badge;
+    });
+    els.filterList.replaceChildren(...badges);
+}
@@ -0,0 +1,255 @@
+// Configure marked.js for markdown rendering
+marked.setOptions({
+    highlight: function(code, lang) {
+        if (lang && hljs.getLanguage(lang)) {
+            try {
+                return hljs.highlight(code, { language: lang }).value;
+            } catch (e) {}
+        }
+        return hljs.highlightAuto(code).value;
+    },
+    breaks: true,
+    gfm: true
+});
+
+/**
+ * Render markdown content with syntax highlighting
+ */
+function renderMarkdown(content) {
+    const html = marked.parse(content);
+    return DOMPurify.sanitize(html, {
+        ADD_TAGS: ['pre', 'code', 'span', 'math', 'semantics', 'mrow', 'mi', 'mo', 'mn', 'msup', 'msub', 'mfrac', 'msqrt', 'mroot', 'mover', 'munder', 'mtable', 'mtr', 'mtd', 'annotation'],
+        ADD_ATTR: ['class', 'style', 'aria-hidden', 'encoding']
+    });
+}
+
+/**
+ * Render LaTeX in a container using KaTeX
+ */
+function renderLatex(container) {
+    if (typeof renderMathInElement !== 'undefined') {
+        renderMathInElement(container, {
+            delimiters: [
+                {left: '$$', right: '$$', display: true},
+                {left: '$', right: '$', display: false},
+                {left: '\\[', right: '\\]', display: true},
+                {left: '\\(', right: '\\)', display: false}
+            ],
+            throwOnError: false,
+            errorColor: '#cc0000'
+        });
+    }
+}
+
+/**
+ * Render code block with syntax highlighting
+ */
+function renderCodeBlock(code, label = 'Python Code:') {
+    const highlighted = hljs.highlight(code, { language: 'python' }).value;
+    return `
+        <div class="code-block mt-2 mb-2">
+            <small class="text-muted">${label}</small>
+            <pre><code class="hljs language-python">${highlighted}</code></pre>
+        </div>
+    `;
+}
+
+/**
+ * Render code execution result (plain text, no syntax highlighting)
+ */
+function renderCodeResult(output) {
+    return `
+        <div class="code-result mt-2 mb-2">
+            <small class="text-muted">Code Output:</small>
+            <pre class="output-pre"><code class="output-code">${DOMPurify.sanitize(output)}</code></pre>
+        </div>
+    `;
+}
+
+/**
+ * URL of a streamed image: served by digest, or inlined when the event carries base64 data
+ */
+function imageSource(event) {
+    if (event.digest) {
+        return `/api/chat/image/${encodeURIComponent(event.digest)}/`;
+    }
+    return `data:image/png;base64,${event.content}`;
+}
+
+/**
+ * Render image
+ */
+function renderImage(src) {
+    return `<img src="${src}" alt="Generated Image" class="img-fluid mt-2 mb-2" style="max-width: 100%; height: auto;" loading="lazy"/>`;
+}
+
+const PART_RENDERERS = {
+    code: renderCodeBlock,
+    result: renderCodeResult,
+    image: renderImage,
+};
+
+/**
+ * Length of the leading part of streamed markdown that can no longer change:
+ * the top-level blocks marked's lexer finds before the last one, which may
+ * still grow (a paragraph, a list, a fence), short of any cut inside $$ math.
+ */
+function finishedMarkdownLength(text) {
+    const tokens = marked.lexer(text);
+    let last = tokens.length - 1;
+    while (last >= 0 && tokens[last].type === 'space') {
+        last--;
+    }
+    let finished = 0;
+    let length = 0;
+    let displayMath = 0;
+    for (let i = 0; i < last; i++) {
+        const raw = tokens[i].raw;
+        length += raw.length;
+        // marked doesn't know $$ blocks, so one with a blank line in it spans several tokens
+        if (tokens[i].type !== 'code') {
+            displayMath += (raw.match(/\$\$/g) || []).length;
+        }
+        if (displayMath % 2 === 0) {
+            finished = length;
+        }
+    }
+    // Lexed text is normalised (line endings), so only cut where the token text is the streamed text
+    const prefix = tokens.slice(0, last).map((token) => token.raw).join('').slice(0, finished);
+    return text.startsWith(prefix) ? finished : 0;
+}
+
+/**
+ * Incrementally renders a streamed bot message into a container.
+ *
+ * Finished content is rendered once and appended as its own node: code,
+ * results and images as they arrive, and streamed text block by block as
+ * soon as the next top-level block starts. Only the trailing, still-growing
+ * block is re-rendered, at most once per animation frame, and LaTeX is typeset
+ * in each text node once it is finished. Once the text before a part, or at
+ * the end, is complete it is rendered again in one piece, so the message ends
+ * up exactly as a one-shot render of it would be.
+ */
+class StreamRenderer {
+    constructor(container, { onRender = null } = {}) {
+        this.container = container;
+        this.onRender = onRender;
+        this.activeText = '';
+        this.activeNode = null;
+        // The finished text since the last part, and the nodes it was rendered in
+        this.segmentText = '';
+        this.segmentNodes = [];
+        this.frame = null;
+    }
+    /**
+     * Append streamed text to the active block
+     */
+    appendText(text) {
+        this.activeText += text;
+        const finished = finishedMarkdownLength(this.activeText);
+        if (finished > 0) {
+            this.appendTextNode(this.activeText.slice(0, finished));
+            this.activeText = this.activeText.slice(finished);
+        }
+        this.scheduleRender();
+    }
+
+    /**
+     * Finish the active text and append a code, result or image part after it
+     */
+    appendPart(type, content) {
+        this.finishText();
+        this.appendNode(PART_RENDERERS[type](content));
+        this.notify();
+    }
+
+    /**
+     * Append raw HTML, e.g. an error message, after everything rendered so far
+     */
+    appendHtml(html) {
+        this.finishText();
+        this.appendNode(html);
+        this.notify();
+    }
+
+    /**
+     * Render whatever text is still pending, and the text since the last part in one piece;
+     * call once the stream has ended
+     */
+    finish() {
+        this.finishText();
+        this.notify();
+    }
+
+    finishText() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        if (this.activeNode) {
+            this.activeNode.remove();
+            this.activeNode = null;
+        }
+        if (this.activeText) {
+            this.appendTextNode(this.activeText);
+            this.activeText = '';
+        }
+        // Rendered block by block, the text may differ from its one-shot render (reference links, loose lists)
+        if (this.segmentNodes.length > 1) {
+            const node = this.appendNode(renderMarkdown(this.segmentText));
+            this.container.insertBefore(node, this.segmentNodes[0]);
+            this.segmentNodes.forEach((segmentNode) => segmentNode.remove());
+            renderLatex(node);
+        }
+        this.segmentText = '';
+        this.segmentNodes = [];
+    }
+
+    appendTextNode(text) {
+        const node = this.appendNode(renderMarkdown(text));
+        // A finished node is placed before the active one, which keeps streaming after it
+        if (this.activeNode) {
+            this.container.insertBefore(node, this.activeNode);
+        }
+        this.segmentText += text;
+        this.segmentNodes.push(node);
+        renderLatex(node);
+    }
+
+    appendNode(html) {
+        const node = document.createElement('div');
+        node.className = 'stream-part';
+        node.innerHTML = html;
+        this.container.appendChild(node);
+        return node;
+    }
+
+    scheduleRender() {
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => {
+                this.frame = null;
+                this.renderActive();
+            });
+        }
+    }
+
+    renderActive() {
+        if (!this.activeText) {
+            if (this.activeNode) {
+                this.activeNode.innerHTML = '';
+            }
+            return;
+        }
+        if (!this.activeNode) {
+            this.activeNode = this.appendNode('');
+        }
+        this.activeNode.innerHTML = renderMarkdown(this.activeText);
+        this.notify();
+    }
+
+    notify() {
+        if (this.onRender) {
+            this.onRender();
+        }
+    }
+}